@@ -0,0 +1,39 @@
+"""add thumbnail_sizes to image_metadata for the thumbnail pyramid
+
+Revision ID: 20261016_1000
+Revises: 20251221_1000
+Create Date: 2026-10-16 10:00:00.000000
+
+Description:
+    Uploads now store a pyramid of WebP thumbnails per image
+    (datasets/{id}/thumbnails/{size}/foo.webp, sizes 128/512/1024) instead of
+    the single 256px JPEG (datasets/{id}/thumbnails/foo.jpg).
+
+    thumbnail_sizes records which levels exist for an image, so image
+    listings can return the level matching the requested display size:
+    - NULL: uploaded before the pyramid, only the legacy thumbnail exists
+    - "": thumbnail generation failed, listings fall back to the original
+    - "128,512,1024": pyramid levels stored
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261016_1000'
+down_revision = '20251221_1000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Add thumbnail_sizes column to image_metadata."""
+    op.add_column(
+        'image_metadata',
+        sa.Column('thumbnail_sizes', sa.String(length=50), nullable=True)
+    )
+
+
+def downgrade():
+    """Remove thumbnail_sizes column."""
+    op.drop_column('image_metadata', 'thumbnail_sizes')
@@ -0,0 +1,53 @@
+"""add thumbnail_jobs queue table
+
+Revision ID: 20261017_1000
+Revises: 20261016_1000
+Create Date: 2026-10-17 10:00:00.000000
+
+Description:
+    Thumbnail pyramids are no longer generated inside the upload request.
+    Uploads enqueue one row per image in thumbnail_jobs and return as soon
+    as the originals are stored; thumbnail workers claim due rows with
+    SELECT ... FOR UPDATE SKIP LOCKED, store the pyramid, set
+    image_metadata.thumbnail_sizes and delete the row.
+
+    - (dataset_id, image_id) is unique: enqueueing an image twice (re-upload,
+      regeneration script) resets the existing job instead of adding one
+    - run_after is the retry backoff / worker lease; ix_thumbnail_jobs_due
+      serves the claim query
+    - status 'failed' keeps jobs whose attempts are exhausted for inspection
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017_1000'
+down_revision = '20261016_1000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Create thumbnail_jobs table."""
+    op.create_table(
+        'thumbnail_jobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('dataset_id', sa.String(length=100), nullable=False),
+        sa.Column('image_id', sa.String(length=200), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('run_after', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.ForeignKeyConstraint(['dataset_id'], ['datasets.id'], ondelete='CASCADE'),
+        sa.UniqueConstraint('dataset_id', 'image_id', name='uq_thumbnail_job_image'),
+    )
+    op.create_index('ix_thumbnail_jobs_due', 'thumbnail_jobs', ['status', 'run_after'])
+
+
+def downgrade():
+    """Drop thumbnail_jobs table."""
+    op.drop_index('ix_thumbnail_jobs_due', table_name='thumbnail_jobs')
+    op.drop_table('thumbnail_jobs')
@@ -0,0 +1,74 @@
+"""add upload_sessions for direct-to-storage browser uploads
+
+Revision ID: 20261018_1000
+Revises: 20261017_1000
+Create Date: 2026-10-18 10:00:00.000000
+
+Description:
+    Upload sessions let the browser upload dataset files straight to S3/R2
+    with presigned PUT / multipart URLs instead of streaming every byte
+    through the backend. The backend only issues URLs and, on completion,
+    verifies the stored objects (size, ETag, multipart parts) and registers
+    image_metadata rows in bulk.
+
+    - upload_sessions: one per upload, with progress counters and a sliding
+      expiry
+    - upload_session_files: one per file; status 'completed' once verified,
+      so an interrupted upload resumes with the remaining files. upload_id
+      keeps the multipart upload of a large file across resumes
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_1000'
+down_revision = '20261017_1000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Create upload_sessions and upload_session_files tables."""
+    op.create_table(
+        'upload_sessions',
+        sa.Column('id', sa.String(length=50), primary_key=True),
+        sa.Column('dataset_id', sa.String(length=100), nullable=False),
+        sa.Column('created_by', sa.String(length=36), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='active'),
+        sa.Column('total_files', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_bytes', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('completed_files', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('completed_bytes', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.ForeignKeyConstraint(['dataset_id'], ['datasets.id'], ondelete='CASCADE'),
+    )
+    op.create_index('ix_upload_sessions_dataset_id', 'upload_sessions', ['dataset_id'])
+
+    op.create_table(
+        'upload_session_files',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('session_id', sa.String(length=50), nullable=False),
+        sa.Column('image_id', sa.String(length=200), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('content_type', sa.String(length=100), nullable=True),
+        sa.Column('upload_id', sa.String(length=1024), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('etag', sa.String(length=100), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['session_id'], ['upload_sessions.id'], ondelete='CASCADE'),
+        sa.UniqueConstraint('session_id', 'image_id', name='uq_upload_session_file'),
+    )
+    op.create_index(
+        'ix_upload_session_files_status', 'upload_session_files', ['session_id', 'status', 'image_id']
+    )
+
+
+def downgrade():
+    """Drop upload session tables."""
+    op.drop_index('ix_upload_session_files_status', table_name='upload_session_files')
+    op.drop_table('upload_session_files')
+    op.drop_index('ix_upload_sessions_dataset_id', table_name='upload_sessions')
+    op.drop_table('upload_sessions')
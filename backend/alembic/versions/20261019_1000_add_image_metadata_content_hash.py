@@ -0,0 +1,42 @@
+"""add content_hash to image_metadata for upload deduplication
+
+Revision ID: 20261019_1000
+Revises: 20261018_1000
+Create Date: 2026-10-19 10:00:00.000000
+
+Description:
+    Ingestion now hashes every file (SHA-256) and stores the hash, so
+    re-uploading overlapping folders skips work:
+    - same path, same hash: nothing is stored or regenerated
+    - same hash elsewhere in the dataset: the original and its thumbnails
+      are copied server-side instead of uploaded and regenerated
+
+    NULL means the hash is unknown (rows from before this revision, direct
+    browser uploads, backfilled rows); those images are uploaded normally.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_1000'
+down_revision = '20261018_1000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Add content_hash column and its per-dataset index."""
+    op.add_column(
+        'image_metadata',
+        sa.Column('content_hash', sa.String(length=64), nullable=True)
+    )
+    op.create_index(
+        'ix_image_metadata_content_hash', 'image_metadata', ['dataset_id', 'content_hash']
+    )
+
+
+def downgrade():
+    """Remove content_hash column."""
+    op.drop_index('ix_image_metadata_content_hash', table_name='image_metadata')
+    op.drop_column('image_metadata', 'content_hash')
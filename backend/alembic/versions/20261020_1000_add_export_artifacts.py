@@ -0,0 +1,55 @@
+"""add export_artifacts for fingerprint-keyed export caching
+
+Revision ID: 20261020_1000
+Revises: 20261019_1000
+Create Date: 2026-10-20 10:00:00.000000
+
+Description:
+    POST /export/projects/{id}/export used to regenerate and re-upload the
+    export on every call. export_artifacts keeps the last uploaded export per
+    (project, task_type, format, include_draft) together with a fingerprint
+    of the content it was built from; while the fingerprint still matches,
+    the stored file is returned with a fresh presigned URL.
+
+    Annotation, text label and class edits change the fingerprint, so stale
+    rows are simply replaced on the next export.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261020_1000'
+down_revision = '20261019_1000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Create export_artifacts table."""
+    op.create_table(
+        'export_artifacts',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('project_id', sa.String(length=50), nullable=False),
+        sa.Column('task_type', sa.String(length=50), nullable=False),
+        sa.Column('export_format', sa.String(length=20), nullable=False),
+        sa.Column('include_draft', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('export_path', sa.Text(), nullable=False),
+        sa.Column('file_size', sa.BigInteger(), nullable=True),
+        sa.Column('annotation_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('image_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index(
+        'ix_export_artifacts_key',
+        'export_artifacts',
+        ['project_id', 'task_type', 'export_format', 'include_draft'],
+        unique=True,
+    )
+
+
+def downgrade():
+    """Drop export_artifacts table."""
+    op.drop_index('ix_export_artifacts_key', table_name='export_artifacts')
+    op.drop_table('export_artifacts')
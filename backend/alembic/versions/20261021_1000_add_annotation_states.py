@@ -0,0 +1,74 @@
+"""add content-addressed annotation states and version membership
+
+Revision ID: 20261021_1000
+Revises: 20261020_1000
+Create Date: 2026-10-21 10:00:00.000000
+
+Description:
+    annotation_snapshots stores a full JSONB copy of every annotation for
+    every published version, although most annotations do not change
+    between versions. New versions are snapshotted copy-on-write instead:
+
+    - annotation_states: each distinct annotation state once, keyed by the
+      SHA-256 of its canonical JSON
+    - annotation_version_members: which state an annotation has in a range
+      of consecutive versions of a (project, task_type); publishing only
+      closes and opens ranges of annotations that changed
+
+    Versions published before this revision keep their annotation_snapshots
+    rows, which are still read for them.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '20261021_1000'
+down_revision = '20261020_1000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Create annotation_states and annotation_version_members tables."""
+    op.create_table(
+        'annotation_states',
+        sa.Column('hash', sa.String(length=64), primary_key=True),
+        sa.Column('snapshot_data', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+
+    op.create_table(
+        'annotation_version_members',
+        sa.Column('id', sa.BigInteger(), primary_key=True),
+        sa.Column('project_id', sa.String(length=50), nullable=False),
+        sa.Column('task_type', sa.String(length=50), nullable=False),
+        sa.Column('annotation_id', sa.BigInteger(), nullable=False),
+        sa.Column('state_hash', sa.String(length=64), nullable=False),
+        sa.Column('first_version_id', sa.Integer(), nullable=False),
+        sa.Column('end_version_id', sa.Integer(), nullable=True),
+    )
+    op.create_index(
+        'ix_annotation_version_members_range',
+        'annotation_version_members',
+        ['project_id', 'task_type', 'first_version_id'],
+    )
+    op.create_index(
+        'ix_annotation_version_members_current',
+        'annotation_version_members',
+        ['project_id', 'task_type', 'annotation_id'],
+        postgresql_where=sa.text('end_version_id IS NULL'),
+    )
+    op.create_index(
+        'ix_annotation_version_members_state_hash', 'annotation_version_members', ['state_hash']
+    )
+
+
+def downgrade():
+    """Drop annotation_version_members and annotation_states tables."""
+    op.drop_index('ix_annotation_version_members_state_hash', table_name='annotation_version_members')
+    op.drop_index('ix_annotation_version_members_current', table_name='annotation_version_members')
+    op.drop_index('ix_annotation_version_members_range', table_name='annotation_version_members')
+    op.drop_table('annotation_version_members')
+    op.drop_table('annotation_states')
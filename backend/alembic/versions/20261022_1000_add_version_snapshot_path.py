@@ -0,0 +1,33 @@
+"""add snapshot_path to annotation_versions
+
+Revision ID: 20261022_1000
+Revises: 20261021_1000
+Create Date: 2026-10-22 10:00:00.000000
+
+Description:
+    Published versions get a compressed, image-sorted snapshot blob in the
+    annotations bucket (snapshots/{project_id}/{task_type}/{version}/), with
+    an index that lets a diff read one image's annotations with a ranged
+    GET. snapshot_path is the blob's key; NULL for versions published before
+    it until scripts/migrations/migrate_snapshots_to_blobs.py has moved
+    their annotation_snapshots rows into a blob.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261022_1000'
+down_revision = '20261021_1000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Add annotation_versions.snapshot_path."""
+    op.add_column('annotation_versions', sa.Column('snapshot_path', sa.Text(), nullable=True))
+
+
+def downgrade():
+    """Drop annotation_versions.snapshot_path."""
+    op.drop_column('annotation_versions', 'snapshot_path')
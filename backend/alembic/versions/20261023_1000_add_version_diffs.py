@@ -0,0 +1,84 @@
+"""add version_diffs cache with per-image rows
+
+Revision ID: 20261023_1000
+Revises: 20261022_1000
+Create Date: 2026-10-23 10:00:00.000000
+
+Description:
+    GET version diff used to re-read both versions and re-diff every image
+    on every request. Diffs are now cached:
+
+    - version_diffs: one row per (project, task_type, older version, newer
+      version; -1 = Working) with the summary header and, for diffs against
+      a live version, a fingerprint of the live annotations
+    - version_diff_images: one row per image with the change counts and the
+      image's diff as gzip-compressed JSON, read page by page
+
+    Diffs between published versions are computed once; diffs against the
+    Working version re-diff only the images whose annotations changed.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '20261023_1000'
+down_revision = '20261022_1000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Create version_diffs and version_diff_images tables."""
+    op.create_table(
+        'version_diffs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('project_id', sa.String(length=50), nullable=False),
+        sa.Column('task_type', sa.String(length=50), nullable=False),
+        sa.Column('version_a_id', sa.Integer(), nullable=False),
+        sa.Column('version_b_id', sa.Integer(), nullable=False),
+        sa.Column('format_version', sa.Integer(), nullable=False),
+        sa.Column('live_fingerprint', sa.String(length=64), nullable=True),
+        sa.Column('summary', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('class_stats', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index(
+        'ix_version_diffs_key',
+        'version_diffs',
+        ['project_id', 'task_type', 'version_a_id', 'version_b_id'],
+        unique=True,
+    )
+
+    op.create_table(
+        'version_diff_images',
+        sa.Column(
+            'diff_id', sa.Integer(),
+            sa.ForeignKey('version_diffs.id', ondelete='CASCADE'),
+            primary_key=True,
+        ),
+        sa.Column('image_id', sa.String(length=255), primary_key=True),
+        sa.Column('added_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('removed_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('modified_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('unchanged_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_changes', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('class_stats', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('diff', sa.LargeBinary(), nullable=True),
+        sa.Column('live_fingerprint', sa.String(length=64), nullable=True),
+    )
+    op.create_index(
+        'ix_version_diff_images_changed',
+        'version_diff_images',
+        ['diff_id', 'image_id'],
+        postgresql_where=sa.text('total_changes > 0'),
+    )
+
+
+def downgrade():
+    """Drop version_diff_images and version_diffs tables."""
+    op.drop_index('ix_version_diff_images_changed', table_name='version_diff_images')
+    op.drop_table('version_diff_images')
+    op.drop_index('ix_version_diffs_key', table_name='version_diffs')
+    op.drop_table('version_diffs')
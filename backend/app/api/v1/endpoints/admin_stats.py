@@ -9,6 +9,7 @@ Endpoints:
 - GET /api/v1/admin/stats/resources - Resource usage statistics
 - GET /api/v1/admin/stats/performance - Performance metrics
 - GET /api/v1/admin/stats/sessions - Session statistics
+- GET /api/v1/admin/stats/image-cache - Image proxy disk cache counters
 
 All endpoints require admin privileges (system_role = 'admin').
 """
@@ -19,6 +20,7 @@ from sqlalchemy.orm import Session
 
 from app.core.security import get_current_admin_user
 from app.core.database import get_labeler_db
+from app.core.image_cache import get_image_cache
 from app.services import system_stats_service
 
 
@@ -184,3 +186,35 @@ async def get_session_stats(
         labeler_db=labeler_db,
         days=days
     )
+
+
+# =============================================================================
+# Image Proxy Cache
+# =============================================================================
+
+@router.get("/image-cache", response_model=Dict[str, Any])
+async def get_image_cache_stats(
+    current_user: Dict[str, Any] = Depends(get_current_admin_user),
+):
+    """
+    Get image proxy disk cache counters (summed over all workers on this host).
+
+    Requires admin privileges.
+
+    Returns:
+        {
+            "enabled": true,
+            "hits": 1200,
+            "misses": 80,
+            "coalesced": 35,
+            "revalidations": 12,
+            "evictions": 4,
+            "bytes": 734003200,
+            "max_bytes": 10737418240,
+            "hit_ratio": 0.9375
+        }
+    """
+    cache = get_image_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
@@ -6,7 +6,7 @@ import logging
 import boto3
 from botocore.client import Config
 from datetime import datetime
-from typing import List, Optional, Dict, Set, Any
+from typing import List, Optional, Dict, Set, Any, Tuple
 from fastapi import APIRouter, Depends, HTTPException, status, File, Form, UploadFile
 from sqlalchemy.orm import Session
 from sqlalchemy import select, func, or_
@@ -48,7 +48,8 @@ from app.services.annotation_import_service import (
     import_annotations_to_db,
     update_image_status,
 )
-from app.services.thumbnail_service import get_thumbnail_path
+from app.services.image_url_service import sign_image_urls
+from app.services.thumbnail_service import get_image_thumbnail_key
 from app.services.storage_folder_service import (
     get_storage_structure,
     preview_upload_structure,
@@ -107,10 +108,59 @@ def generate_distinct_color(index: int, total: int) -> str:
     return hsl_to_rgb(hue, saturation, lightness)
 
 
-def load_annotations_from_s3(annotation_path: str) -> Optional[Dict]:
-    """Load annotations.json from S3/MinIO storage."""
+def summarize_annotations_from_s3(annotation_path: str) -> Tuple[int, int, Dict[str, Dict]]:
+    """
+    Compute annotation statistics and classes from annotations.json in S3/MinIO.
+
+    Streams annotations[*] and categories[*] one element at a time, so memory
+    does not grow with the size of the file.
+
+    Returns:
+        Tuple of (total_annotations, annotated_images, classes)
+    """
+    from collections import defaultdict
     from app.core.storage import storage_client
-    return storage_client.get_json(annotation_path)
+
+    total_annotations = 0
+    annotated_image_ids: Set[int] = set()
+    class_stats = defaultdict(lambda: {'image_ids': set(), 'bbox_count': 0})
+    categories = []
+
+    for path, item in storage_client.iter_json_items(annotation_path, paths=("annotations", "categories")):
+        if path == "categories":
+            categories.append(item)
+            continue
+
+        # Extract annotation statistics
+        total_annotations += 1
+        img_id = item.get('image_id')
+        annotated_image_ids.add(img_id)
+
+        # Calculate per-class statistics
+        cat_id = item.get('category_id')
+        class_stats[cat_id]['image_ids'].add(img_id)
+        class_stats[cat_id]['bbox_count'] += 1
+
+    # Extract classes from categories with generated colors and statistics
+    # Store in legacy 'classes' field for now
+    classes = {}
+    total_categories = len(categories)
+    for idx, cat in enumerate(categories):
+        cat_id = str(cat['id'])
+        # Generate distinct color or use provided color
+        color = cat.get('color') or generate_distinct_color(idx, total_categories)
+
+        # Get statistics for this class
+        stats = class_stats.get(cat['id'], {'image_ids': set(), 'bbox_count': 0})
+
+        classes[cat_id] = {
+            'name': cat['name'],
+            'color': color,
+            'image_count': len(stats['image_ids']),
+            'bbox_count': stats['bbox_count'],
+        }
+
+    return total_annotations, len(annotated_image_ids), classes
 
 
 def calculate_class_statistics(project_id: str, labeler_db: Session) -> Dict[str, Dict]:
@@ -178,7 +228,7 @@ async def create_dataset(
         description=dataset.description,
         owner_id=current_user["sub"],
         storage_path=storage_path,
-        storage_type="s3",
+        storage_type=settings.STORAGE_BACKEND,
         format="images",
         labeled=False,
         num_images=0,
@@ -484,48 +534,12 @@ async def get_or_create_project_for_dataset(
         # If dataset is labeled, load existing annotations for statistics and classes
         # but DON'T auto-assign task types
         if dataset.labeled and dataset.annotation_path:
-            annotations_data = load_annotations_from_s3(dataset.annotation_path)
-            if annotations_data:
-                # Extract annotation statistics
-                annotations_list = annotations_data.get('annotations', [])
-                total_annotations = len(annotations_list)
-
-                # Count unique annotated images
-                annotated_image_ids: Set[int] = set()
-                for ann in annotations_list:
-                    annotated_image_ids.add(ann.get('image_id'))
-                annotated_images = len(annotated_image_ids)
-
-                # Calculate per-class statistics
-                from collections import defaultdict
-                class_stats = defaultdict(lambda: {'image_ids': set(), 'bbox_count': 0})
-
-                for ann in annotations_list:
-                    cat_id = ann.get('category_id')
-                    img_id = ann.get('image_id')
-                    class_stats[cat_id]['image_ids'].add(img_id)
-                    class_stats[cat_id]['bbox_count'] += 1
-
-                # Extract classes from categories with generated colors and statistics
-                # Store in legacy 'classes' field for now
-                categories = annotations_data.get('categories', [])
-                if categories:
-                    total_categories = len(categories)
-                    classes = {}
-                    for idx, cat in enumerate(categories):
-                        cat_id = str(cat['id'])
-                        # Generate distinct color or use provided color
-                        color = cat.get('color') or generate_distinct_color(idx, total_categories)
-
-                        # Get statistics for this class
-                        stats = class_stats.get(cat['id'], {'image_ids': set(), 'bbox_count': 0})
-
-                        classes[cat_id] = {
-                            'name': cat['name'],
-                            'color': color,
-                            'image_count': len(stats['image_ids']),
-                            'bbox_count': stats['bbox_count'],
-                        }
+            try:
+                total_annotations, annotated_images, classes = summarize_annotations_from_s3(
+                    dataset.annotation_path
+                )
+            except Exception as e:
+                logger.warning(f"Failed to load annotations from {dataset.annotation_path}: {e}")
 
         project = AnnotationProject(
             id=f"proj_{uuid.uuid4().hex[:12]}",
@@ -616,6 +630,7 @@ async def list_dataset_images(
     dataset_id: str,
     limit: int = 12,
     random: bool = True,  # Phase 2.12: Random selection for dataset summary
+    thumbnail_size: Optional[int] = None,
     labeler_db: Session = Depends(get_labeler_db),
     current_user = Depends(get_current_user),
 ):
@@ -627,6 +642,8 @@ async def list_dataset_images(
     - **dataset_id**: Dataset ID
     - **limit**: Maximum number of images to return (default 12)
     - **random**: If true, return random images; if false, return in upload order (default true)
+    - **thumbnail_size**: Displayed thumbnail size in pixels; picks the smallest pyramid
+      level that covers it (default 256)
     """
     # Verify dataset exists in Labeler DB
     dataset = labeler_db.query(Dataset).filter(Dataset.id == dataset_id).first()
@@ -656,41 +673,36 @@ async def list_dataset_images(
     if not db_images:
         return []
 
-    # Generate presigned URLs
+    # Presigned URLs for originals and thumbnails, signed in one batch (valid for 1 hour)
+    thumbnail_keys = {
+        db_img.id: get_image_thumbnail_key(db_img.s3_key, db_img.thumbnail_sizes, thumbnail_size)
+        for db_img in db_images
+    }
+    signed = sign_image_urls(
+        [(db_img.s3_key, thumbnail_keys[db_img.id]) for db_img in db_images],
+        storage_type=dataset.storage_type
+    )
+
     result = []
     for db_img in db_images:
-        try:
-            # Generate presigned URL for original image (valid for 1 hour)
-            url = storage_client.generate_presigned_url(
-                bucket=storage_client.datasets_bucket,
-                key=db_img.s3_key,
-                expiration=3600
-            )
-
-            # Generate presigned URL for thumbnail
-            thumbnail_url = None
-            try:
-                thumbnail_key = get_thumbnail_path(db_img.s3_key)
-                thumbnail_url = storage_client.generate_presigned_url(
-                    bucket=storage_client.datasets_bucket,
-                    key=thumbnail_key,
-                    expiration=3600
-                )
-            except Exception:
-                # Thumbnail might not exist for old images
-                pass
-
-            result.append(ImageResponse(
-                id=db_img.id,
-                file_name=db_img.id,  # Use relative path as file_name for display
-                width=db_img.width,
-                height=db_img.height,
-                url=url,
-                thumbnail_url=thumbnail_url
-            ))
-        except Exception as e:
-            logger.error(f"Error generating presigned URL for {db_img.id}: {e}")
-            continue
+        if db_img.s3_key not in signed:
+            continue  # Could not be signed (logged)
+        url, thumbnail_url = signed[db_img.s3_key]
+
+        result.append(ImageResponse(
+            id=db_img.id,
+            file_name=db_img.id,  # Use relative path as file_name for display
+            width=db_img.width,
+            height=db_img.height,
+            url=url,
+            thumbnail_url=thumbnail_url
+        ))
+
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to generate image URLs",
+        )
 
     return result
 
@@ -1271,10 +1283,10 @@ async def upload_dataset(
         description=dataset_description,
         owner_id=current_user["sub"],
         storage_path=storage_path,
-        storage_type="s3",
+        storage_type=settings.STORAGE_BACKEND,
         format="images",
         labeled=annotations_data is not None,
-        num_images=upload_result.images_count,
+        num_images=upload_result.new_images,
         visibility=visibility,
         status="active",
         integrity_status="valid",
@@ -1341,7 +1353,7 @@ async def upload_dataset(
         task_config=task_config,
         task_classes=task_classes,
         settings={},
-        total_images=upload_result.images_count,
+        total_images=upload_result.new_images,
         annotated_images=0,
         total_annotations=0,
         status="active",
@@ -1387,7 +1399,9 @@ async def upload_dataset(
             images_uploaded=upload_result.images_count,
             annotations_imported=annotations_imported,
             storage_bytes_used=upload_result.total_bytes,
-            folder_structure=upload_result.folder_structure
+            folder_structure=upload_result.folder_structure,
+            duplicates_skipped=upload_result.duplicates_skipped,
+            ingest_stats=upload_result.stage_stats
         )
     )
 
@@ -1436,7 +1450,8 @@ async def add_images_to_dataset(
         dataset_id=dataset_id,
         files=files,
         labeler_db=labeler_db,
-        preserve_structure=True
+        preserve_structure=True,
+        storage_type=dataset.storage_type
     )
 
     # Step 2: Handle annotations if provided
@@ -1468,8 +1483,8 @@ async def add_images_to_dataset(
         dataset.labeled = True
 
     # Step 3: Update counts
-    dataset.num_images += upload_result.images_count
-    project.total_images += upload_result.images_count
+    dataset.num_images += upload_result.new_images
+    project.total_images += upload_result.new_images
     dataset.updated_at = datetime.utcnow()
     project.updated_at = datetime.utcnow()
 
@@ -1479,7 +1494,9 @@ async def add_images_to_dataset(
         images_uploaded=upload_result.images_count,
         annotations_imported=annotations_imported,
         storage_bytes_used=upload_result.total_bytes,
-        folder_structure=upload_result.folder_structure
+        folder_structure=upload_result.folder_structure,
+        duplicates_skipped=upload_result.duplicates_skipped,
+        ingest_stats=upload_result.stage_stats
     )
 
 
@@ -1506,7 +1523,7 @@ async def get_dataset_storage_structure(
         )
 
     try:
-        structure = get_storage_structure(dataset_id)
+        structure = get_storage_structure(dataset_id, dataset.storage_type)
         return structure
     except Exception as e:
         logger.error(f"Failed to get storage structure: {e}")
@@ -1516,6 +1533,51 @@ async def get_dataset_storage_structure(
         )
 
 
+@router.get("/{dataset_id}/storage/images", tags=["Storage"])
+async def list_dataset_storage_images(
+    dataset_id: str,
+    limit: int = 200,
+    cursor: Optional[str] = None,
+    labeler_db: Session = Depends(get_labeler_db),
+    current_user = Depends(get_current_user),
+    permission = Depends(require_dataset_permission("member")),
+):
+    """
+    List the image objects stored for a dataset, one page at a time.
+
+    Keyset pagination: each page costs one or two storage listing calls (none
+    when the dataset has a manifest), however deep into the dataset it is.
+
+    - **limit**: Images per page (max 1000)
+    - **cursor**: next_cursor of the previous page (omit for the first page)
+
+    Returns:
+        - images: Image objects with presigned URLs
+        - next_cursor: Cursor of the next page, null on the last page
+        - limit: Page size
+    """
+    dataset = labeler_db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Dataset {dataset_id} not found"
+        )
+
+    try:
+        return storage_client.list_dataset_images_page(
+            dataset_id,
+            page_size=limit,
+            cursor=cursor,
+            storage_type=dataset.storage_type
+        )
+    except Exception as e:
+        logger.error(f"Failed to list storage images of dataset {dataset_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to list dataset images"
+        )
+
+
 class UploadPreviewRequest(BaseModel):
     """Request for upload preview."""
     file_mappings: List[Dict[str, Any]]
@@ -1564,7 +1626,8 @@ async def preview_dataset_upload(
         preview = preview_upload_structure(
             dataset_id=dataset_id,
             file_mappings=request.file_mappings,
-            target_folder=request.target_folder
+            target_folder=request.target_folder,
+            storage_type=dataset.storage_type
         )
         return preview
     except Exception as e:
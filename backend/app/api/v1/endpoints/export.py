@@ -6,7 +6,7 @@ import os
 import zipfile
 import logging
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Sequence
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
@@ -14,9 +14,10 @@ logger = logging.getLogger(__name__)
 
 from app.core.database import get_platform_db, get_labeler_db
 from app.core.security import get_current_user, require_project_permission
+from app.core.snapshot_blob import snapshot_blob_key
 from app.core.storage import storage_client
 # from app.db.models.user import User
-from app.db.models.labeler import AnnotationProject, AnnotationVersion, AnnotationSnapshot, Annotation
+from app.db.models.labeler import AnnotationProject, AnnotationVersion
 from app.schemas.version import (
     ExportRequest,
     ExportResponse,
@@ -24,9 +25,22 @@ from app.schemas.version import (
     VersionResponse,
     VersionListResponse,
 )
-from app.services.coco_export_service import export_to_coco, get_export_stats as get_coco_stats
-from app.services.yolo_export_service import export_to_yolo, get_export_stats as get_yolo_stats
-from app.services.dice_export_service import export_to_dice, get_export_stats as get_dice_stats
+from app.services.annotation_snapshot_service import (
+    AnnotationSnapshotWriter,
+    SnapshotBlobWriter,
+    lock_project_publishes,
+    lock_version_number,
+)
+from app.services.coco_export_service import CocoExportWriter, export_to_coco, get_export_stats as get_coco_stats
+from app.services.yolo_export_service import YoloExportWriter, export_to_yolo, get_export_stats as get_yolo_stats
+from app.services.dice_export_service import DiceExportStream
+from app.services.export_query_service import ExportWriter
+from app.services.export_cache_service import (
+    compute_export_fingerprint,
+    export_cache_task_type,
+    get_cached_export,
+    save_export_artifact,
+)
 from app.services.text_label_version_service import publish_text_labels, auto_generate_version_number
 
 router = APIRouter()
@@ -47,9 +61,12 @@ async def export_annotations(
     Requires: admin role or higher
 
     This endpoint generates an export file, uploads it to S3, and returns a presigned download URL.
+    Full-project exports are cached: while the project content is unchanged (see
+    export_cache_service), the previous upload is returned with a fresh URL.
 
     - **project_id**: Project ID to export
     - **export_format**: Format (coco, yolo, voc)
+    - **task_type**: Export one task type only (None = all)
     - **include_draft**: Include draft annotations (default: False)
     - **image_ids**: Export specific images only (None = all)
     """
@@ -66,15 +83,41 @@ async def export_annotations(
 
     # Generate export data based on format
     export_format = export_request.export_format.lower()
+    task_type = export_request.task_type
 
     try:
+        # Reuse the last export if nothing it was built from has changed
+        # (computed before generating, so concurrent edits are never cached)
+        fingerprint = None
+        if not export_request.image_ids and export_format in ("dice", "coco", "yolo"):
+            fingerprint = compute_export_fingerprint(
+                labeler_db, project, task_type, export_request.include_draft
+            )
+            artifact = get_cached_export(
+                labeler_db, project_id, task_type, export_format,
+                export_request.include_draft, fingerprint,
+            )
+            if artifact:
+                download_url, expires_at = storage_client.regenerate_presigned_url(artifact.export_path)
+                return ExportResponse(
+                    export_path=artifact.export_path,
+                    download_url=download_url,
+                    download_url_expires_at=expires_at,
+                    export_format=export_format,
+                    annotation_count=artifact.annotation_count,
+                    image_count=artifact.image_count,
+                    file_size_bytes=artifact.file_size,
+                    cached=True,
+                )
+
         if export_format == "dice":
-            export_data, stats, filename = _export_dice(
+            export_data, filename = _export_dice(
                 labeler_db=labeler_db,
                 platform_db=platform_db,
                 project_id=project_id,
                 include_draft=export_request.include_draft,
                 image_ids=export_request.image_ids,
+                task_type=task_type,
             )
         elif export_format == "coco":
             export_data, stats, filename = _export_coco(
@@ -83,6 +126,7 @@ async def export_annotations(
                 project_id=project_id,
                 include_draft=export_request.include_draft,
                 image_ids=export_request.image_ids,
+                task_type=task_type,
             )
         elif export_format == "yolo":
             export_data, stats, filename = _export_yolo(
@@ -90,6 +134,7 @@ async def export_annotations(
                 project_id=project_id,
                 include_draft=export_request.include_draft,
                 image_ids=export_request.image_ids,
+                task_type=task_type,
             )
         else:
             raise HTTPException(
@@ -101,12 +146,34 @@ async def export_annotations(
         version_number = f"export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
         s3_key, download_url, expires_at = storage_client.upload_export(
             project_id=project_id,
+            task_type=export_cache_task_type(task_type),
             version_number=version_number,
             export_data=export_data,
             export_format=export_format,
             filename=filename,
         )
 
+        if export_format == "dice":
+            # Known once the stream has been uploaded
+            stats = export_data.get_stats()
+            file_size = export_data.bytes_written
+        else:
+            file_size = len(export_data)
+
+        if fingerprint:
+            save_export_artifact(
+                labeler_db,
+                project_id=project_id,
+                task_type=task_type,
+                export_format=export_format,
+                include_draft=export_request.include_draft,
+                fingerprint=fingerprint,
+                export_path=s3_key,
+                annotation_count=stats["annotation_count"],
+                image_count=stats["image_count"],
+                file_size=file_size,
+            )
+
         # Return export response
         return ExportResponse(
             export_path=s3_key,
@@ -115,7 +182,7 @@ async def export_annotations(
             export_format=export_format,
             annotation_count=stats["annotation_count"],
             image_count=stats["image_count"],
-            file_size_bytes=len(export_data),
+            file_size_bytes=file_size,
         )
 
     except Exception as e:
@@ -133,31 +200,30 @@ def _export_dice(
     image_ids: Optional[list[str]],
     task_type: Optional[str] = None,
     version: Optional[str] = None,
-) -> tuple[bytes, dict, str]:
-    """Export to DICE format."""
-    # Generate DICE JSON
-    dice_data = export_to_dice(
+    writers: Sequence[ExportWriter] = (),
+) -> tuple[DiceExportStream, str]:
+    """
+    Export to DICE format.
+
+    Returns a stream of compact JSON chunks for upload_export; its
+    get_stats() and bytes_written are available after the upload, as are
+    the results of writers fed from the same annotation stream.
+    """
+    dice_stream = DiceExportStream(
         db=labeler_db,
         platform_db=platform_db,
-        user_db=None,  # User DB removed
         project_id=project_id,
         include_draft=include_draft,
         image_ids=image_ids,
         task_type=task_type,
         version=version,
+        writers=writers,
     )
 
-    # Convert to JSON bytes
-    json_str = json.dumps(dice_data, indent=2)
-    export_data = json_str.encode('utf-8')
-
-    # Get statistics
-    stats = get_dice_stats(dice_data)
-
     # Filename
     filename = "annotations.json"  # Standard DICE format filename
 
-    return export_data, stats, filename
+    return dice_stream, filename
 
 
 def _export_coco(
@@ -166,6 +232,7 @@ def _export_coco(
     project_id: str,
     include_draft: bool,
     image_ids: Optional[list[str]],
+    task_type: Optional[str] = None,
     version: Optional[str] = None,
 ) -> tuple[bytes, dict, str]:
     """Export to COCO format."""
@@ -176,9 +243,15 @@ def _export_coco(
         project_id=project_id,
         include_draft=include_draft,
         image_ids=image_ids,
+        task_type=task_type,
         version=version,
     )
 
+    return _coco_artifact(coco_data)
+
+
+def _coco_artifact(coco_data: dict) -> tuple[bytes, dict, str]:
+    """Encode a COCO dictionary as the uploaded export file."""
     # Convert to JSON bytes
     json_str = json.dumps(coco_data, indent=2)
     export_data = json_str.encode('utf-8')
@@ -197,16 +270,25 @@ def _export_yolo(
     project_id: str,
     include_draft: bool,
     image_ids: Optional[list[str]],
+    task_type: Optional[str] = None,
 ) -> tuple[bytes, dict, str]:
     """Export to YOLO format."""
     # Generate YOLO format (Phase 19: now includes text label files)
-    image_annotations, classes_txt, captions_files, region_descriptions_files, vqa_files = export_to_yolo(
+    yolo_files = export_to_yolo(
         db=labeler_db,
         project_id=project_id,
         include_draft=include_draft,
         image_ids=image_ids,
+        task_type=task_type,
     )
 
+    return _yolo_artifact(yolo_files)
+
+
+def _yolo_artifact(yolo_files: tuple) -> tuple[bytes, dict, str]:
+    """Zip the YOLO files (see export_to_yolo) as the uploaded export file."""
+    image_annotations, classes_txt, captions_files, region_descriptions_files, vqa_files = yolo_files
+
     # Create ZIP file with annotations
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
@@ -248,6 +330,59 @@ def _export_yolo(
 
 # ===== Version Management APIs =====
 
+def _reserve_version_number(
+    labeler_db: Session,
+    project_id: str,
+    task_type: str,
+    version_number: Optional[str],
+) -> str:
+    """
+    Choose and lock the number of a new published version (see lock_version_number).
+
+    An auto-generated number taken by a concurrent publish while waiting
+    for its lock is skipped; a requested number that exists is a 409.
+    """
+    taken = None
+    while True:
+        if version_number:
+            new_version_number = version_number
+        else:
+            # Get latest version number for this task type
+            latest_version = labeler_db.query(AnnotationVersion).filter(
+                AnnotationVersion.project_id == project_id,
+                AnnotationVersion.task_type == task_type,
+                AnnotationVersion.version_type == "published"
+            ).order_by(AnnotationVersion.created_at.desc()).first()
+
+            if latest_version:
+                # Extract version number (e.g., "v1.0" -> 1)
+                try:
+                    current_major = int(latest_version.version_number.replace('v', '').split('.')[0])
+                    new_version_number = f"v{current_major + 1}.0"
+                except:
+                    new_version_number = "v1.0"
+            else:
+                new_version_number = "v1.0"
+
+        lock_version_number(labeler_db, project_id, task_type, new_version_number)
+
+        # Check if version already exists for this task type
+        existing = labeler_db.query(AnnotationVersion).filter(
+            AnnotationVersion.project_id == project_id,
+            AnnotationVersion.task_type == task_type,
+            AnnotationVersion.version_number == new_version_number
+        ).first()
+
+        if not existing:
+            return new_version_number
+        if version_number or new_version_number == taken:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Version {new_version_number} for task {task_type} already exists",
+            )
+        taken = new_version_number
+
+
 @router.post("/projects/{project_id}/versions/publish", response_model=VersionResponse, tags=["Versions"])
 async def publish_version(
     project_id: str,
@@ -284,78 +419,41 @@ async def publish_version(
         # Phase 2.9: Get task_type from request
         task_type = publish_request.task_type
 
-        # Auto-generate version number if not provided
-        if not publish_request.version_number:
-            # Get latest version number for this task type
-            latest_version = labeler_db.query(AnnotationVersion).filter(
-                AnnotationVersion.project_id == project_id,
-                AnnotationVersion.task_type == task_type,
-                AnnotationVersion.version_type == "published"
-            ).order_by(AnnotationVersion.created_at.desc()).first()
-
-            if latest_version:
-                # Extract version number (e.g., "v1.0" -> 1)
-                try:
-                    current_major = int(latest_version.version_number.replace('v', '').split('.')[0])
-                    new_version_number = f"v{current_major + 1}.0"
-                except:
-                    new_version_number = "v1.0"
-            else:
-                new_version_number = "v1.0"
-        else:
-            new_version_number = publish_request.version_number
-
-        # Check if version already exists for this task type
-        existing = labeler_db.query(AnnotationVersion).filter(
-            AnnotationVersion.project_id == project_id,
-            AnnotationVersion.task_type == task_type,
-            AnnotationVersion.version_number == new_version_number
-        ).first()
+        # Reserve the version number until commit: the uploads below write
+        # under it, so a concurrent publish of the same number must wait
+        new_version_number = _reserve_version_number(
+            labeler_db, project_id, task_type, publish_request.version_number
+        )
 
-        if existing:
+        export_format = publish_request.export_format.lower()
+        if export_format not in ("dice", "coco", "yolo"):
             raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail=f"Version {new_version_number} for task {task_type} already exists",
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported export format: {export_format}. Supported: dice, coco, yolo",
             )
 
-        # Phase 2.9: Map task_type to annotation_types
-        # no_object is filtered by attributes.task_type for all task types
-        from sqlalchemy import or_, and_
-
-        task_to_annotation_types_map = {
-            'classification': ['classification'],
-            'detection': ['bbox'],
-            'object_detection': ['bbox'],  # Alternative name
-            'segmentation': ['polygon'],
-            'keypoints': ['keypoints'],
-            'line': ['line'],
-        }
-
-        annotation_types = task_to_annotation_types_map.get(task_type, [task_type])
-
-        # Get all annotations for this task type
-        # Include no_object filtered by attributes.task_type
-        query = labeler_db.query(Annotation).filter(
-            Annotation.project_id == project_id,
-            or_(
-                Annotation.annotation_type.in_(annotation_types),
-                and_(
-                    Annotation.annotation_type == 'no_object',
-                    Annotation.attributes['task_type'].astext == task_type
-                )
+        # Single pass: the DICE export streams the task's annotations and text
+        # labels once and feeds the snapshot writer and the additional format.
+        # The published set is selected by the Annotation.task_type column (as
+        # the DICE export and the Working side of version diffs always were),
+        # no longer by an annotation_type map plus no_object attributes: rows
+        # created through the API get task_type from exactly those, and e.g.
+        # geometry (line) annotations are now published too.
+        snapshot_writer = AnnotationSnapshotWriter(labeler_db, project_id, task_type)
+        blob_writer = SnapshotBlobWriter()
+        writers = [snapshot_writer, blob_writer]
+        additional_writer = None
+        if export_format == "coco":
+            additional_writer = CocoExportWriter(
+                labeler_db, project_id, task_type=task_type, version=new_version_number
             )
-        )
-
-        if not publish_request.include_draft:
-            query = query.filter(Annotation.annotation_state.in_(['confirmed', 'verified']))
-
-        annotations = query.all()
-
-        # Count unique images
-        unique_image_ids = list(set([ann.image_id for ann in annotations]))
+        elif export_format == "yolo":
+            additional_writer = YoloExportWriter(labeler_db, project_id, task_type=task_type)
+        if additional_writer:
+            writers.append(additional_writer)
 
         # Generate DICE export (always - this is our primary format)
-        dice_data, dice_stats, dice_filename = _export_dice(
+        dice_stream, dice_filename = _export_dice(
             labeler_db=labeler_db,
             platform_db=platform_db,
             project_id=project_id,
@@ -363,6 +461,7 @@ async def publish_version(
             image_ids=None,
             task_type=task_type,
             version=new_version_number,
+            writers=writers,
         )
 
         # Upload DICE to S3 (Phase 2.9: include task_type in path)
@@ -370,40 +469,28 @@ async def publish_version(
             project_id=project_id,
             task_type=task_type,
             version_number=new_version_number,
-            export_data=dice_data,
+            export_data=dice_stream,
             export_format='dice',
             filename=dice_filename,
         )
 
-        # Generate additional format if requested (COCO or YOLO)
-        export_format = publish_request.export_format.lower()
-        additional_s3_key = None
+        # Upload the image-indexed snapshot blob, complete now that the DICE
+        # stream has been consumed
+        snapshot_blob, snapshot_index = blob_writer.result()
+        snapshot_path = snapshot_blob_key(project_id, task_type, new_version_number)
+        try:
+            storage_client.save_snapshot_blob(snapshot_path, snapshot_blob, snapshot_index)
+        finally:
+            snapshot_blob.close()
 
+        # Upload additional format if requested (COCO or YOLO), complete
+        # now that the DICE stream has been consumed
         if export_format == "coco":
-            export_data, stats, filename = _export_coco(
-                labeler_db=labeler_db,
-                platform_db=platform_db,
-                project_id=project_id,
-                include_draft=publish_request.include_draft,
-                image_ids=None,
-                version=new_version_number,
-            )
-            additional_s3_key, _, _ = storage_client.upload_export(
-                project_id=project_id,
-                task_type=task_type,
-                version_number=new_version_number,
-                export_data=export_data,
-                export_format=export_format,
-                filename=filename,
-            )
+            export_data, _, filename = _coco_artifact(additional_writer.result())
         elif export_format == "yolo":
-            export_data, stats, filename = _export_yolo(
-                labeler_db=labeler_db,
-                project_id=project_id,
-                include_draft=publish_request.include_draft,
-                image_ids=None,
-            )
-            additional_s3_key, _, _ = storage_client.upload_export(
+            export_data, _, filename = _yolo_artifact(additional_writer.result())
+        if additional_writer:
+            storage_client.upload_export(
                 project_id=project_id,
                 task_type=task_type,
                 version_number=new_version_number,
@@ -411,13 +498,13 @@ async def publish_version(
                 export_format=export_format,
                 filename=filename,
             )
-        elif export_format != "dice":
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Unsupported export format: {export_format}. Supported: dice, coco, yolo",
-            )
 
-        # Create version record (use DICE as primary export)
+        # Serialize publishes of the project only from here to the commit:
+        # the version id must be higher than that of every version whose
+        # members were written before it
+        lock_project_publishes(labeler_db, project_id)
+
+        # Use DICE as primary export
         version = AnnotationVersion(
             project_id=project_id,
             task_type=task_type,  # Phase 2.9: Task-specific versioning
@@ -425,35 +512,19 @@ async def publish_version(
             version_type="published",
             created_by=current_user["sub"],
             description=publish_request.description,
-            annotation_count=len(annotations),
-            image_count=len(unique_image_ids),
             export_format='dice',  # Primary format
+            annotation_count=snapshot_writer.annotation_count,
+            image_count=snapshot_writer.image_count,
             export_path=dice_s3_key,
             download_url=dice_download_url,
             download_url_expires_at=dice_expires_at,
+            snapshot_path=snapshot_path,
         )
 
         labeler_db.add(version)
         labeler_db.flush()
-
-        # Create annotation snapshots
-        for annotation in annotations:
-            snapshot = AnnotationSnapshot(
-                version_id=version.id,
-                annotation_id=annotation.id,
-                snapshot_data={
-                    "annotation_type": annotation.annotation_type,
-                    "geometry": annotation.geometry,
-                    "class_id": annotation.class_id,
-                    "class_name": annotation.class_name,
-                    "attributes": annotation.attributes,
-                    "confidence": annotation.confidence,
-                    "annotation_state": annotation.annotation_state,
-                    "created_at": annotation.created_at.isoformat() if annotation.created_at else None,
-                    "updated_at": annotation.updated_at.isoformat() if annotation.updated_at else None,
-                }
-            )
-            labeler_db.add(snapshot)
+        snapshot_writer.write_members(version.id)
+        labeler_db.commit()
 
         # Phase 19.8: Publish text labels (if any exist)
         # Text labels are versioned independently from task-specific annotations
@@ -478,12 +549,14 @@ async def publish_version(
             logger.error(f"[Publish] Failed to publish text labels: {e}")
 
         # Update Platform S3 with official task-specific DICE annotations
+        # (server-side copy of the DICE export uploaded above)
         try:
             annotation_path = storage_client.update_platform_annotations(
                 dataset_id=project.dataset_id,
                 task_type=task_type,
-                dice_data=dice_data,
-                version_number=new_version_number
+                dice_data=None,
+                version_number=new_version_number,
+                export_key=dice_s3_key
             )
 
             # Update Labeler DB with new annotation_path and labeled status
@@ -501,7 +574,6 @@ async def publish_version(
                     dataset.published_task_types = dataset.published_task_types + [task_type]
                     logger.info(f"Added {task_type} to published_task_types: {dataset.published_task_types}")
 
-                # Don't commit here - will be committed with version below (line 468)
                 logger.info(f"Updated Labeler DB: annotation_path={annotation_path}, labeled=True")
             else:
                 logger.warning(f"Dataset {project.dataset_id} not found in Labeler DB")
@@ -0,0 +1,192 @@
+"""Image proxy endpoints.
+
+Serves dataset originals through the backend (IMAGE_PROXY_ENABLED) instead of
+handing out direct presigned storage URLs. StorageClient.generate_presigned_url()
+returns signed /api/v1/images URLs for originals when the proxy is enabled;
+like presigned URLs they need no session, the HMAC signature and expiry in the
+query string are the authorization.
+
+Bytes come from the shared on-disk LRU (app.core.image_cache), so annotators
+opening the same image cost one upstream fetch per host. Responses support
+single byte ranges (206), ETag / If-None-Match (304) and HEAD.
+"""
+
+import logging
+import mimetypes
+from email.utils import formatdate
+from typing import Dict, Iterator, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import get_labeler_db
+from app.core.file_response import (
+    RangeNotSatisfiable,
+    etag_matches,
+    file_response,
+    not_modified_response,
+    parse_range,
+    range_not_satisfiable_response,
+)
+from app.core.image_cache import get_image_cache
+from app.core.storage import storage_client
+from app.core.storage_backends import ObjectNotFoundError, StorageBackend
+from app.db.models.labeler import Dataset
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Bytes read from storage per chunk when streaming uncached objects
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Signed URLs are immutable for their lifetime
+CACHE_CONTROL = "private, max-age=3600"
+
+# dataset_id -> storage_type (never changes after creation)
+_storage_types: Dict[str, str] = {}
+
+
+class _ObjectTooLarge(Exception):
+    """Object exceeds IMAGE_CACHE_MAX_OBJECT_MB; stream it instead of caching."""
+
+
+def _get_backend(labeler_db: Session, dataset_id: str) -> StorageBackend:
+    storage_type = _storage_types.get(dataset_id)
+    if storage_type is None:
+        row = labeler_db.query(Dataset.storage_type).filter(Dataset.id == dataset_id).first()
+        if row is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dataset not found")
+        storage_type = _storage_types[dataset_id] = row.storage_type
+    return storage_client.get_backend(storage_type)
+
+
+def _stream_from_storage(
+    request: Request,
+    backend: StorageBackend,
+    bucket: str,
+    key: str,
+    media_type: str,
+    range_header: Optional[str],
+    if_none_match: Optional[str],
+) -> Response:
+    """Pass an object through in STREAM_CHUNK_SIZE chunks (no disk cache)."""
+    obj = backend.head_object(bucket, key)
+    if obj is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    if etag_matches(if_none_match, obj.etag):
+        return not_modified_response(obj.etag, CACHE_CONTROL)
+    try:
+        byte_range = parse_range(range_header, obj.size)
+    except RangeNotSatisfiable:
+        return range_not_satisfiable_response(obj.size)
+
+    start, end = byte_range if byte_range else (0, obj.size - 1)
+    headers = {
+        "content-length": str(end - start + 1),
+        "accept-ranges": "bytes",
+        "etag": f'"{obj.etag}"',
+        "last-modified": formatdate(obj.last_modified.timestamp(), usegmt=True),
+        "cache-control": CACHE_CONTROL,
+    }
+    if byte_range:
+        headers["content-range"] = f"bytes {start}-{end}/{obj.size}"
+    status_code = status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK
+
+    if request.method == "HEAD" or obj.size == 0:
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+
+    try:
+        body = backend.open_object(bucket, key, byte_range=byte_range)
+    except ObjectNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    def chunks() -> Iterator[bytes]:
+        try:
+            while True:
+                chunk = body.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            body.close()
+
+    return StreamingResponse(chunks(), status_code=status_code, headers=headers, media_type=media_type)
+
+
+@router.api_route("/{dataset_id}/{image_id:path}", methods=["GET", "HEAD"], tags=["Images"])
+def get_image(
+    request: Request,
+    dataset_id: str,
+    image_id: str,
+    expires: int = Query(..., description="Expiry (Unix timestamp) from the signed URL"),
+    signature: str = Query(..., description="HMAC signature from the signed URL"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    labeler_db: Session = Depends(get_labeler_db),
+):
+    """
+    Download a dataset image through the caching proxy.
+
+    - **dataset_id**: Dataset ID
+    - **image_id**: Image path under the dataset's images/ folder (e.g. train/001.jpg)
+
+    Sync endpoint on purpose: waiting for another request's upstream fetch
+    blocks on a file lock, which must happen in the threadpool.
+    """
+    if not settings.IMAGE_PROXY_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image proxy is disabled")
+
+    if not storage_client.verify_image_proxy_url(dataset_id, image_id, expires, signature):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired URL")
+
+    if any(part in ("", ".", "..") for part in image_id.split("/")):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid image path")
+
+    backend = _get_backend(labeler_db, dataset_id)
+    bucket = storage_client.datasets_bucket
+    key = f"datasets/{dataset_id}/images/{image_id}"
+    media_type = mimetypes.guess_type(image_id)[0] or "application/octet-stream"
+
+    cache = get_image_cache()
+    if cache is None:
+        return _stream_from_storage(request, backend, bucket, key, media_type, range_header, if_none_match)
+
+    max_object_bytes = settings.IMAGE_CACHE_MAX_OBJECT_MB * 1024 * 1024
+
+    def fetch(out):
+        obj = backend.head_object(bucket, key)
+        if obj is None:
+            raise ObjectNotFoundError(f"{bucket}/{key}")
+        if obj.size > max_object_bytes:
+            raise _ObjectTooLarge()
+        body = backend.open_object(bucket, key)
+        try:
+            while True:
+                chunk = body.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+        finally:
+            body.close()
+        return obj
+
+    try:
+        entry = cache.open(bucket, key, fetch=fetch, validate=lambda: backend.head_object(bucket, key))
+    except ObjectNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    except _ObjectTooLarge:
+        return _stream_from_storage(request, backend, bucket, key, media_type, range_header, if_none_match)
+
+    return file_response(
+        entry.file,
+        media_type,
+        etag=entry.etag,
+        last_modified=entry.last_modified,
+        range_header=range_header,
+        if_none_match=if_none_match,
+        cache_control=CACHE_CONTROL,
+        # No pathsend: the entry may be evicted before the server opens the path
+    )
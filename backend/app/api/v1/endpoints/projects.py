@@ -10,7 +10,6 @@ from sqlalchemy import func
 
 from app.core.database import get_platform_db, get_labeler_db
 from app.core.security import get_current_user, require_project_permission
-from app.core.storage import storage_client
 # from app.db.models.user import User
 from app.db.models.labeler import Dataset, AnnotationProject, ImageAnnotationStatus, Annotation, ProjectPermission
 from app.schemas.project import ProjectCreate, ProjectUpdate, ProjectResponse, AddTaskTypeRequest
@@ -27,7 +26,11 @@ from app.schemas.image import (
     TaskStatsResponse,
 )
 from app.schemas.class_schema import ClassCreateRequest, ClassUpdateRequest, ClassResponse
+from app.services.annotation_snapshot_service import delete_project_snapshots
+from app.services.export_cache_service import delete_project_export_artifacts
 from app.services.image_status_service import confirm_image_status, unconfirm_image_status
+from app.services.image_url_service import sign_image_urls
+from app.services.version_diff_cache_service import delete_project_diffs
 from app.api.v1.endpoints import projects_classes
 
 router = APIRouter()
@@ -143,6 +146,7 @@ async def list_project_images(
     project_id: str,
     limit: int = 50,
     offset: int = 0,
+    thumbnail_size: Optional[int] = None,
     labeler_db: Session = Depends(get_labeler_db),
     platform_db: Session = Depends(get_platform_db),
     current_user: Dict[str, Any] = Depends(get_current_user),
@@ -162,6 +166,8 @@ async def list_project_images(
         - **project_id**: Project ID
         - **limit**: Maximum number of images to return per page (default: 50, max: 200)
         - **offset**: Number of images to skip (default: 0)
+        - **thumbnail_size**: Displayed thumbnail size in pixels; picks the smallest
+          pyramid level that covers it (default: 256)
 
     Returns:
         - images: List of images with presigned URLs
@@ -206,28 +212,29 @@ async def list_project_images(
         # Apply pagination
         db_images = query.offset(offset).limit(limit).all()
 
+        # Phase 2.12: Thumbnail keys for performance (pyramid level for the display size)
+        from app.services.thumbnail_service import get_image_thumbnail_key
+        thumbnail_keys = {
+            db_img.id: get_image_thumbnail_key(db_img.s3_key, db_img.thumbnail_sizes, thumbnail_size)
+            for db_img in db_images
+        }
+
+        # Sign original + thumbnail URLs for the whole page in one batch,
+        # with the dataset's own storage backend
+        storage_type = labeler_db.query(Dataset.storage_type).filter(
+            Dataset.id == project.dataset_id
+        ).scalar()
+        signed = sign_image_urls(
+            [(db_img.s3_key, thumbnail_keys[db_img.id]) for db_img in db_images],
+            storage_type=storage_type
+        )
+
         # Convert to API response format with presigned URLs
         images = []
         for db_img in db_images:
-            # Generate presigned URL on-demand
-            presigned_url = storage_client.generate_presigned_url(
-                bucket=storage_client.datasets_bucket,
-                key=db_img.s3_key,
-                expiration=3600
-            )
-
-            # Phase 2.12: Generate thumbnail URL for performance
-            thumbnail_url = None
-            try:
-                from app.services.thumbnail_service import get_thumbnail_path
-                thumbnail_key = get_thumbnail_path(db_img.s3_key)
-                thumbnail_url = storage_client.generate_presigned_url(
-                    bucket=storage_client.datasets_bucket,
-                    key=thumbnail_key,
-                    expiration=3600
-                )
-            except Exception as e:
-                logger.debug(f"Thumbnail not available for {db_img.id}: {e}")
+            if db_img.s3_key not in signed:
+                continue  # Could not be signed (logged)
+            presigned_url, thumbnail_url = signed[db_img.s3_key]
 
             # ID now includes extension (e.g., "train/good/001.png")
             # Use it directly as display filename
@@ -244,6 +251,9 @@ async def list_project_images(
                 height=db_img.height
             ))
 
+        if db_images and not images:
+            raise Exception("Failed to generate image URLs")
+
         logger.info(f"[DB Query] Returned {len(images)} images (offset={offset}, limit={limit}, total={total})")
 
         return ImageListResponse(
@@ -352,6 +362,9 @@ async def delete_project(
 
     Requires: owner role
 
+    Version members, cached version diffs and export artifact records have
+    no foreign key to the project and are deleted in the same transaction.
+
     - **project_id**: Project ID
     """
     project = labeler_db.query(AnnotationProject).filter(AnnotationProject.id == project_id).first()
@@ -362,6 +375,9 @@ async def delete_project(
             detail=f"Project {project_id} not found",
         )
 
+    delete_project_snapshots(labeler_db, [project_id])
+    delete_project_diffs(labeler_db, [project_id])
+    delete_project_export_artifacts(labeler_db, [project_id])
     labeler_db.delete(project)
     labeler_db.commit()
 
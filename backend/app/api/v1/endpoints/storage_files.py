@@ -0,0 +1,120 @@
+"""Local storage file endpoints.
+
+Serves objects of the local filesystem storage backend (STORAGE_BACKEND=local)
+through presigned URLs generated by LocalStorageBackend.presign_get_many().
+Like S3 presigned URLs, these need no session: the HMAC signature and expiry
+in the query string are the authorization.
+
+PUT stores objects and multipart upload parts through URLs from
+presign_put() / presign_upload_parts(), so direct browser uploads (upload
+sessions) work the same against local storage as against S3.
+"""
+
+import logging
+import mimetypes
+import tempfile
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response, status
+from starlette.concurrency import run_in_threadpool
+
+from app.core.file_response import file_response
+from app.core.storage import storage_client
+from app.core.storage_backends import LOCAL_STORAGE_TYPE, ObjectNotFoundError, UploadNotFoundError
+
+# Request bodies up to this size are buffered in memory, larger ones on disk
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.api_route("/{bucket}/{key:path}", methods=["GET", "HEAD"], tags=["Storage"])
+async def get_local_object(
+    bucket: str,
+    key: str,
+    expires: int = Query(..., description="Expiry (Unix timestamp) from the presigned URL"),
+    signature: str = Query(..., description="HMAC signature from the presigned URL"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+):
+    """
+    Download an object from local filesystem storage via a presigned URL.
+
+    - **bucket**: Bucket name (e.g. datasets)
+    - **key**: Object key (e.g. datasets/{dataset_id}/images/train/001.jpg)
+
+    Supports single byte ranges (206) and If-None-Match revalidation (304).
+    """
+    backend = storage_client.get_backend(LOCAL_STORAGE_TYPE)
+
+    if not backend.verify_url(bucket, key, expires, signature):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired URL")
+
+    try:
+        obj = backend.head_object(bucket, key)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid object key")
+
+    if obj is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Object not found")
+
+    try:
+        f = backend.open_object(bucket, key)
+    except ObjectNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Object not found")
+
+    media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    return file_response(
+        f,
+        media_type,
+        etag=obj.etag,
+        last_modified=obj.last_modified.timestamp(),
+        range_header=range_header,
+        if_none_match=if_none_match,
+        # Presigned URLs are immutable for their lifetime
+        cache_control="private, max-age=3600",
+        path=backend.path_for(bucket, key),
+    )
+
+
+@router.put("/{bucket}/{key:path}", tags=["Storage"])
+async def put_local_object(
+    bucket: str,
+    key: str,
+    request: Request,
+    expires: int = Query(..., description="Expiry (Unix timestamp) from the presigned URL"),
+    signature: str = Query(..., description="HMAC signature from the presigned URL"),
+    upload_id: Optional[str] = Query(None, alias="uploadId", description="Multipart upload id (part uploads)"),
+    part_number: Optional[int] = Query(None, alias="partNumber", description="Part number (part uploads)"),
+):
+    """
+    Store an object, or one part of a multipart upload, via a presigned PUT URL.
+
+    Responds with the ETag header of the stored object / part, like S3.
+    """
+    backend = storage_client.get_backend(LOCAL_STORAGE_TYPE)
+
+    scope = ("PUT",) if upload_id is None else ("PUT", upload_id, str(part_number))
+    if not backend.verify_url(bucket, key, expires, signature, *scope):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired URL")
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as body:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+
+        try:
+            if upload_id is None:
+                etag = await run_in_threadpool(
+                    backend.put_object, bucket, key, body, request.headers.get("content-type")
+                )
+            else:
+                etag = await run_in_threadpool(backend.upload_part, bucket, key, upload_id, part_number, body)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid object key or part")
+        except UploadNotFoundError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+
+    return Response(status_code=status.HTTP_200_OK, headers={"ETag": f'"{etag}"'})
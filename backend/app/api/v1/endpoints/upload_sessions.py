@@ -0,0 +1,285 @@
+"""
+Upload session endpoints: direct-to-storage browser uploads.
+
+The browser uploads files straight to S3/R2 with presigned URLs and reports
+them back for verification, so image bytes never pass through the API.
+Sessions are resumable (see upload_session_service).
+"""
+
+import logging
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import get_labeler_db
+from app.core.security import get_current_user, require_dataset_permission
+from app.core.storage import storage_client
+from app.db.models.labeler import AnnotationProject, Dataset, UploadSession
+from app.schemas.upload_session import (
+    UploadCompleteRequest,
+    UploadCompleteResponse,
+    UploadSessionCreate,
+    UploadSessionFilesAdd,
+    UploadSessionResponse,
+    UploadUrlsRequest,
+    UploadUrlsResponse,
+)
+from app.services.upload_session_service import (
+    SESSION_ACTIVE,
+    CompletedUpload,
+    UploadFileSpec,
+    abort_upload_session,
+    add_upload_session_files,
+    complete_upload_session_files,
+    create_upload_session,
+    get_upload_targets,
+    list_pending_files,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Pending files listed in a session response
+PENDING_PAGE_SIZE = 100
+
+
+def _get_dataset(labeler_db: Session, dataset_id: str) -> Dataset:
+    dataset = labeler_db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Dataset {dataset_id} not found"
+        )
+    return dataset
+
+
+def _get_session(labeler_db: Session, dataset_id: str, session_id: str, active: bool = True) -> UploadSession:
+    session = labeler_db.query(UploadSession).filter(
+        UploadSession.id == session_id,
+        UploadSession.dataset_id == dataset_id
+    ).first()
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Upload session {session_id} not found"
+        )
+    if active:
+        if session.status != SESSION_ACTIVE:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload session {session_id} is {session.status}"
+            )
+        if session.expires_at < datetime.utcnow():
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail=f"Upload session {session_id} has expired"
+            )
+    return session
+
+
+def _session_response(labeler_db: Session, session: UploadSession) -> UploadSessionResponse:
+    response = UploadSessionResponse.model_validate(session)
+    response.pending_files = list_pending_files(labeler_db, session, limit=PENDING_PAGE_SIZE)
+    return response
+
+
+@router.post(
+    "/{dataset_id}/upload-sessions",
+    response_model=UploadSessionResponse,
+    tags=["Upload Sessions"],
+    status_code=status.HTTP_201_CREATED
+)
+async def create_session(
+    dataset_id: str,
+    request: UploadSessionCreate,
+    labeler_db: Session = Depends(get_labeler_db),
+    current_user = Depends(get_current_user),
+    permission = Depends(require_dataset_permission("member")),
+):
+    """
+    Start a direct upload to a dataset.
+
+    Requires member or owner permission.
+
+    Process:
+    1. Create the session with its file list (add more with POST .../files)
+    2. Request upload URLs (POST .../urls) and PUT the files to storage
+    3. Report finished files (POST .../complete)
+    """
+    _get_dataset(labeler_db, dataset_id)
+    try:
+        session = create_upload_session(
+            labeler_db,
+            dataset_id,
+            current_user["sub"],
+            [UploadFileSpec(f.path, f.size, f.content_type) for f in request.files]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return _session_response(labeler_db, session)
+
+
+@router.post(
+    "/{dataset_id}/upload-sessions/{session_id}/files",
+    response_model=UploadSessionResponse,
+    tags=["Upload Sessions"]
+)
+async def add_session_files(
+    dataset_id: str,
+    session_id: str,
+    request: UploadSessionFilesAdd,
+    labeler_db: Session = Depends(get_labeler_db),
+    permission = Depends(require_dataset_permission("member")),
+):
+    """Add files to an upload session. Already completed files are ignored."""
+    session = _get_session(labeler_db, dataset_id, session_id)
+    try:
+        add_upload_session_files(
+            labeler_db, session, [UploadFileSpec(f.path, f.size, f.content_type) for f in request.files]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return _session_response(labeler_db, session)
+
+
+@router.get(
+    "/{dataset_id}/upload-sessions/{session_id}",
+    response_model=UploadSessionResponse,
+    tags=["Upload Sessions"]
+)
+async def get_session(
+    dataset_id: str,
+    session_id: str,
+    labeler_db: Session = Depends(get_labeler_db),
+    permission = Depends(require_dataset_permission("member")),
+):
+    """
+    Get upload progress.
+
+    A browser resuming an interrupted upload compares pending_files with
+    its local files and continues with POST .../urls.
+    """
+    session = _get_session(labeler_db, dataset_id, session_id, active=False)
+    return _session_response(labeler_db, session)
+
+
+@router.post(
+    "/{dataset_id}/upload-sessions/{session_id}/urls",
+    response_model=UploadUrlsResponse,
+    tags=["Upload Sessions"]
+)
+async def get_session_upload_urls(
+    dataset_id: str,
+    session_id: str,
+    request: UploadUrlsRequest,
+    labeler_db: Session = Depends(get_labeler_db),
+    permission = Depends(require_dataset_permission("member")),
+):
+    """
+    Get presigned upload URLs for pending files.
+
+    Small files get a single PUT URL; large files get a multipart upload
+    with one URL per part still missing (parts stored before an interruption
+    are listed in uploaded_parts and need not be sent again).
+    """
+    dataset = _get_dataset(labeler_db, dataset_id)
+    session = _get_session(labeler_db, dataset_id, session_id)
+    backend = storage_client.get_backend(dataset.storage_type)
+
+    targets, next_after = await run_in_threadpool(
+        get_upload_targets,
+        labeler_db,
+        session,
+        backend,
+        paths=request.paths,
+        after=request.after,
+        limit=request.limit
+    )
+    return UploadUrlsResponse(
+        targets=targets,
+        next_after=next_after,
+        expires_in=settings.UPLOAD_URL_EXPIRATION_SECONDS
+    )
+
+
+@router.post(
+    "/{dataset_id}/upload-sessions/{session_id}/complete",
+    response_model=UploadCompleteResponse,
+    tags=["Upload Sessions"]
+)
+async def complete_session_files(
+    dataset_id: str,
+    session_id: str,
+    request: UploadCompleteRequest,
+    labeler_db: Session = Depends(get_labeler_db),
+    permission = Depends(require_dataset_permission("member")),
+):
+    """
+    Report finished uploads.
+
+    Process:
+    1. Complete multipart uploads (storage verifies every part ETag)
+    2. Check size / ETag of each stored object
+    3. Register verified images in bulk and queue their thumbnails
+    4. Update dataset and project image counts
+
+    Files that fail verification are returned in 'failed' and stay pending.
+    """
+    dataset = _get_dataset(labeler_db, dataset_id)
+    session = _get_session(labeler_db, dataset_id, session_id)
+    backend = storage_client.get_backend(dataset.storage_type)
+
+    completions = [
+        CompletedUpload(
+            f.path,
+            f.etag,
+            [(p.part_number, p.etag) for p in f.parts] if f.parts is not None else None
+        )
+        for f in request.files
+    ]
+    result = await run_in_threadpool(complete_upload_session_files, labeler_db, session, backend, completions)
+
+    if result.new_images:
+        project = labeler_db.query(AnnotationProject).filter(
+            AnnotationProject.dataset_id == dataset_id
+        ).first()
+        dataset.num_images = (dataset.num_images or 0) + result.new_images
+        dataset.updated_at = datetime.utcnow()
+        if project:
+            project.total_images = (project.total_images or 0) + result.new_images
+            project.updated_at = datetime.utcnow()
+        labeler_db.commit()
+
+    return UploadCompleteResponse(
+        completed=len(result.completed),
+        already_completed=result.already_completed,
+        failed=result.failed,
+        images_added=result.new_images,
+        storage_bytes_used=result.total_bytes,
+        folder_structure=result.folder_structure,
+        session=_session_response(labeler_db, session)
+    )
+
+
+@router.delete(
+    "/{dataset_id}/upload-sessions/{session_id}",
+    response_model=UploadSessionResponse,
+    tags=["Upload Sessions"]
+)
+async def abort_session(
+    dataset_id: str,
+    session_id: str,
+    labeler_db: Session = Depends(get_labeler_db),
+    permission = Depends(require_dataset_permission("member")),
+):
+    """Abort an upload session. Files already completed stay in the dataset."""
+    dataset = _get_dataset(labeler_db, dataset_id)
+    session = _get_session(labeler_db, dataset_id, session_id, active=False)
+    if session.status == SESSION_ACTIVE:
+        backend = storage_client.get_backend(dataset.storage_type)
+        await run_in_threadpool(abort_upload_session, labeler_db, session, backend)
+    return _session_response(labeler_db, session)
@@ -23,6 +23,8 @@ async def compare_versions(
     version_a_id: int,
     version_b_id: int,
     image_id: Optional[str] = Query(None, description="Optional: compare only this image"),
+    offset: int = Query(0, ge=0, description="Images with changes to skip (ordered by image_id)"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Images with changes per page (default: all)"),
     labeler_db: Session = Depends(get_labeler_db),
     current_user: Dict[str, Any] = Depends(get_current_user),
 ):
@@ -32,15 +34,21 @@ async def compare_versions(
     - **version_a_id**: Old version ID
     - **version_b_id**: New version ID
     - **image_id**: Optional - compare only specific image
+    - **offset** / **limit**: Optional - page of the images with changes
 
-    Returns complete diff data with per-image changes and summary statistics.
+    Returns per-image changes of the requested page and summary statistics of
+    the whole diff. Diffs are cached: between published versions they are
+    computed once, against the Working version only touched images are
+    re-diffed.
     """
     try:
         diff_data = VersionDiffService.calculate_version_diff(
             labeler_db,
             version_a_id,
             version_b_id,
-            image_id=image_id
+            image_id=image_id,
+            offset=offset,
+            limit=limit
         )
         return diff_data
 
@@ -80,7 +88,8 @@ async def get_diff_summary(
         diff_data = VersionDiffService.calculate_version_diff(
             labeler_db,
             version_a_id,
-            version_b_id
+            version_b_id,
+            limit=0
         )
 
         # Return summary only
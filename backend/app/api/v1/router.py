@@ -2,13 +2,14 @@
 
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import auth, datasets, projects, annotations, export, image_locks, project_permissions, users, invitations, version_diff, admin_datasets, admin_audit, admin_stats, platform_datasets, text_labels
+from app.api.v1.endpoints import auth, datasets, projects, annotations, export, image_locks, project_permissions, users, invitations, version_diff, admin_datasets, admin_audit, admin_stats, platform_datasets, text_labels, storage_files, images, upload_sessions
 
 api_router = APIRouter()
 
 # Include all endpoint routers
 api_router.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 api_router.include_router(datasets.router, prefix="/datasets", tags=["Datasets"])
+api_router.include_router(upload_sessions.router, prefix="/datasets", tags=["Upload Sessions"])
 api_router.include_router(projects.router, prefix="/projects", tags=["Projects"])
 api_router.include_router(annotations.router, prefix="/annotations", tags=["Annotations"])
 api_router.include_router(export.router, tags=["Export"])
@@ -22,3 +23,5 @@ api_router.include_router(admin_audit.router, prefix="/admin/audit-logs", tags=[
 api_router.include_router(admin_stats.router, prefix="/admin/stats", tags=["Admin"])
 api_router.include_router(platform_datasets.router, prefix="/platform/datasets", tags=["Platform Integration"])
 api_router.include_router(text_labels.router, prefix="/text-labels", tags=["Text Labels"])
+api_router.include_router(storage_files.router, prefix="/storage", tags=["Storage"])
+api_router.include_router(images.router, prefix="/images", tags=["Images"])
@@ -83,6 +83,63 @@ class Settings(BaseSettings):
     # When set, use this for public image URLs instead of presigned URLs
     R2_PUBLIC_URL: str = ""
 
+    # Cache-stable presigned URLs
+    # When > 0, URLs are signed at the start of a fixed time window (e.g. 1800 = 30 min)
+    # with expiry extended by the window, so the same object gets the same URL for the
+    # whole window and browsers can reuse cached images. 0 = fresh URL on every call.
+    S3_PRESIGN_WINDOW_SECONDS: int = 0
+    S3_PRESIGN_CACHE_SIZE: int = 50000  # Max signed URLs kept in the per-process LRU
+
+    # How long a loaded dataset object manifest is reused in-process before re-reading it
+    S3_MANIFEST_CACHE_TTL_SECONDS: int = 60
+
+    # Streaming uploads (exports): part size and parts uploaded in parallel
+    S3_MULTIPART_PART_SIZE_MB: int = 8  # S3 minimum is 5
+    S3_MULTIPART_CONCURRENCY: int = 4
+
+    # Storage backend for datasets: "s3" (S3/MinIO/R2) or "local" (NVMe/NFS volume).
+    # Datasets with storage_type="local" always use the local backend.
+    STORAGE_BACKEND: str = "s3"
+    LOCAL_STORAGE_ROOT: str = "./storage"  # Objects live at {root}/{bucket}/{key}
+    LOCAL_STORAGE_URL_BASE: str = "/api/v1/storage"  # Prefix of local presigned URLs
+    LOCAL_STORAGE_URL_SECRET: str = "local-storage-secret-change-in-production"
+
+    # Dataset ingestion pipeline (uploads / ZIP imports)
+    INGEST_UPLOAD_WORKERS: int = 16  # Threads for concurrent put_object calls
+    INGEST_MAX_IN_FLIGHT: int = 64  # Files held in memory at once (backpressure)
+    INGEST_METADATA_BATCH_SIZE: int = 500  # ImageMetadata rows per INSERT/commit
+    IMAGE_METADATA_COPY_MIN_ROWS: int = 1000  # PostgreSQL batches this large are written with COPY
+    IMAGE_PROBE_WORKERS: int = 16  # Concurrent ranged GETs when probing stored image dimensions
+    IMAGE_PROBE_HEAD_KB: int = 64  # Bytes read for a header probe before falling back to the whole object
+    INGEST_SPOOL_THRESHOLD_MB: int = 16  # Larger ZIP members are extracted to a temp file, not memory
+    INGEST_SPOOL_DIR: str = ""  # Temp dir for extracted members ("" = system default)
+
+    # Thumbnail job queue (thumbnail_jobs): uploads only enqueue, workers store the pyramids.
+    # Worker processes: scripts/maintenance/thumbnail_worker.py (docker-entrypoint.sh thumbnail-worker)
+    THUMBNAIL_WORKER_EMBEDDED: bool = False  # Opt-in worker thread in each API process (single-node dev)
+    THUMBNAIL_WORKER_THREADS: int = 4  # Jobs generated concurrently per worker
+    THUMBNAIL_WORKER_BATCH_SIZE: int = 32  # Jobs claimed per SELECT ... FOR UPDATE SKIP LOCKED
+    THUMBNAIL_WORKER_POLL_SECONDS: float = 2.0  # Idle wait before polling the queue again
+    THUMBNAIL_JOB_MAX_ATTEMPTS: int = 5  # Then the job is kept with status "failed"
+    THUMBNAIL_JOB_RETRY_SECONDS: int = 30  # First retry delay, doubled per attempt (max 1 hour)
+    THUMBNAIL_JOB_LEASE_SECONDS: int = 600  # Claimed jobs are handed to another worker after this
+
+    # Direct-to-storage browser uploads (upload sessions): the browser PUTs to S3/R2
+    UPLOAD_SESSION_TTL_HOURS: int = 72  # Idle sessions expire; extended on every URL request
+    UPLOAD_MULTIPART_THRESHOLD_MB: int = 64  # Larger files are uploaded in parts
+    UPLOAD_PART_SIZE_MB: int = 16  # Browser multipart part size (S3: min 5, max 10,000 parts)
+    UPLOAD_URL_EXPIRATION_SECONDS: int = 3600  # Lifetime of presigned PUT / part URLs
+
+    # Image proxy: serve dataset originals through /api/v1/images with an on-disk
+    # LRU cache shared by all workers on the host, instead of direct presigned URLs
+    IMAGE_PROXY_ENABLED: bool = False
+    IMAGE_PROXY_URL_BASE: str = "/api/v1/images"
+    IMAGE_PROXY_URL_SECRET: str = "image-proxy-secret-change-in-production"
+    IMAGE_CACHE_DIR: str = "./image-cache"
+    IMAGE_CACHE_MAX_MB: int = 10240  # 0 = no disk cache, stream every request from storage
+    IMAGE_CACHE_MAX_OBJECT_MB: int = 64  # Larger objects are streamed, never cached
+    IMAGE_CACHE_REVALIDATE_SECONDS: int = 300  # HEAD storage before reusing older entries
+
     # Keycloak Authentication
     KEYCLOAK_SERVER_URL: str = "http://localhost:8080"
     KEYCLOAK_REALM: str = "mvp-vision"
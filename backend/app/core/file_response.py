@@ -0,0 +1,202 @@
+"""
+File responses with HTTP caching and byte-range support.
+
+Shared by the local storage endpoint (/api/v1/storage) and the image proxy
+(/api/v1/images):
+
+- parse_range(): single-range ``Range: bytes=...`` parsing (RFC 9110)
+- etag_matches(): weak ``If-None-Match`` comparison
+- MappedFileResponse: streams an open file (or a slice of it) from the page
+  cache via mmap, or hands it to the server with ASGI "pathsend"
+"""
+
+import mmap
+import os
+from email.utils import formatdate
+from typing import BinaryIO, Optional, Tuple
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# Bytes sent per ASGI message when the server cannot sendfile
+MMAP_CHUNK_SIZE = 1024 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """The Range header does not overlap the representation (416)."""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a ``Range`` header into an inclusive ``(first, last)`` byte pair.
+
+    Only single byte ranges are honoured; a missing, malformed or multi-range
+    header returns None and the caller serves the full representation (which
+    RFC 9110 allows).
+
+    Raises:
+        RangeNotSatisfiable: For a well-formed range outside the object
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0 or size == 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if start < 0:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an ``If-None-Match`` header matches ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def not_modified_response(etag: str, cache_control: str) -> Response:
+    """304 response carrying the validators a cache needs."""
+    return Response(
+        status_code=304,
+        headers={"etag": f'"{etag}"', "cache-control": cache_control}
+    )
+
+
+def range_not_satisfiable_response(size: int) -> Response:
+    return Response(status_code=416, headers={"content-range": f"bytes */{size}"})
+
+
+class MappedFileResponse(Response):
+    """
+    Stream an open file without reading it into Python bytes objects.
+
+    Uses the ASGI "http.response.pathsend" extension for whole-file responses
+    when the server offers it and ``path`` is given (the server then
+    sendfile()s the file to the socket). Otherwise the file is mmap'ed and sent
+    in MMAP_CHUNK_SIZE slices straight from the page cache.
+
+    The response owns ``file`` and closes it when done. Passing an already
+    open file means the data stays readable even if the path is unlinked
+    (e.g. evicted from a cache) while the response is in flight.
+
+    Args:
+        file: Open binary file
+        size: Full object size in bytes
+        media_type: Content-Type
+        etag: Unquoted entity tag
+        last_modified: Unix timestamp
+        cache_control: Cache-Control header value
+        byte_range: Inclusive ``(first, last)`` pair for a 206 response
+        path: Filesystem path of ``file`` (enables pathsend)
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        size: int,
+        media_type: str,
+        etag: str,
+        last_modified: float,
+        cache_control: str = "private, max-age=3600",
+        byte_range: Optional[Tuple[int, int]] = None,
+        path: Optional[str] = None
+    ):
+        super().__init__(media_type=media_type, status_code=206 if byte_range else 200)
+        self.file = file
+        self.path = path
+        self.start, self.end = byte_range if byte_range else (0, size - 1)
+        self.whole_file = byte_range is None
+
+        self.headers["content-length"] = str(self.end - self.start + 1)
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["last-modified"] = formatdate(last_modified, usegmt=True)
+        self.headers["etag"] = f'"{etag}"'
+        self.headers["cache-control"] = cache_control
+        if byte_range:
+            self.headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self._send(scope, send)
+        finally:
+            self.file.close()
+
+    async def _send(self, scope: Scope, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        length = self.end - self.start + 1
+        if scope["method"] == "HEAD" or length <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if self.whole_file and self.path and "http.response.pathsend" in scope.get("extensions", {}):
+            await send({"type": "http.response.pathsend", "path": self.path})
+            return
+
+        with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # Never send more than the advertised Content-Length
+            end = min(len(mapped), self.end + 1)
+            for offset in range(self.start, end, MMAP_CHUNK_SIZE):
+                chunk_end = min(offset + MMAP_CHUNK_SIZE, end)
+                await send({"type": "http.response.body", "body": mapped[offset:chunk_end], "more_body": chunk_end < end})
+
+
+def file_response(
+    file: BinaryIO,
+    media_type: str,
+    etag: str,
+    last_modified: float,
+    range_header: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+    cache_control: str = "private, max-age=3600",
+    path: Optional[str] = None
+) -> Response:
+    """
+    Conditional / ranged response for an open file.
+
+    Returns 304 when ``If-None-Match`` matches, 416 for an unsatisfiable
+    range, 206 for a satisfiable range and 200 otherwise. Takes ownership of
+    ``file`` (closed here unless handed to a MappedFileResponse).
+    """
+    size = os.fstat(file.fileno()).st_size
+    try:
+        if etag_matches(if_none_match, etag):
+            file.close()
+            return not_modified_response(etag, cache_control)
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        file.close()
+        return range_not_satisfiable_response(size)
+
+    return MappedFileResponse(
+        file, size, media_type, etag, last_modified,
+        cache_control=cache_control, byte_range=byte_range, path=path
+    )
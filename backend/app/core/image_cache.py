@@ -0,0 +1,424 @@
+"""
+Disk Image Cache
+
+Size-bounded on-disk LRU cache for original images served by the image proxy
+(/api/v1/images). The cache directory is the only shared state, so every
+worker process on the host (and every thread in it) shares one cache:
+
+- Entries: ``objects/{h[:2]}/{h}.json`` (metadata) + ``{h}-{etag-hash}.bin``
+  (bytes), where ``h`` hashes bucket/key. Both are written to a temp file and
+  renamed into place, so readers never see partial data.
+- Single-flight: a miss takes an exclusive ``flock`` on one of LOCK_STRIPES
+  lock files chosen by ``h``. Concurrent requests for the same image (from any
+  worker) block on that lock and then read the file the first one fetched, so
+  N annotators opening the same image cost one upstream GET.
+- LRU: hits bump the data file's mtime (at most every TOUCH_INTERVAL seconds);
+  when the tracked total exceeds ``max_bytes`` one process scans the cache and
+  deletes the least recently used files down to LOW_WATERMARK of the limit.
+- Counters: hits / misses / coalesced / revalidations / evictions and the
+  cached byte total live in a small mmap'ed file updated under ``flock``, so
+  stats() reports totals across all workers.
+"""
+
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Dict, Iterator, NamedTuple, Optional
+
+from app.core.config import settings
+from app.core.storage_backends import ObjectNotFoundError, StorageObject
+
+logger = logging.getLogger(__name__)
+
+LOCK_STRIPES = 1024
+TOUCH_INTERVAL = 60  # seconds between LRU mtime bumps of a hot file
+LOW_WATERMARK = 0.9  # evict down to this fraction of max_bytes
+
+_COUNTERS = ("hits", "misses", "coalesced", "revalidations", "evictions", "bytes")
+_STATS_FORMAT = f"<{len(_COUNTERS)}q"
+_STATS_SIZE = struct.calcsize(_STATS_FORMAT)
+
+
+class CachedImage(NamedTuple):
+    """An open cache entry; the caller owns (and must close) ``file``."""
+
+    file: BinaryIO
+    path: str
+    size: int
+    etag: str
+    last_modified: float
+
+
+class _SharedCounters:
+    """int64 counters in a file shared by every process using the cache."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _mapping(self):
+        # Re-open after fork: flock() locks belong to the open file description
+        if self._pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if os.fstat(fd).st_size < _STATS_SIZE:
+                os.ftruncate(fd, _STATS_SIZE)
+            self._fd, self._map, self._pid = fd, mmap.mmap(fd, _STATS_SIZE), os.getpid()
+        return self._fd, self._map
+
+    def _update(self, change: Callable[[list], None]) -> Dict[str, int]:
+        fd, mapped = self._mapping()
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            values = list(struct.unpack_from(_STATS_FORMAT, mapped))
+            change(values)
+            struct.pack_into(_STATS_FORMAT, mapped, 0, *values)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return dict(zip(_COUNTERS, values))
+
+    def add(self, **deltas: int) -> Dict[str, int]:
+        def change(values):
+            for name, delta in deltas.items():
+                values[_COUNTERS.index(name)] += delta
+        return self._update(change)
+
+    def set(self, **new_values: int) -> Dict[str, int]:
+        def change(values):
+            for name, value in new_values.items():
+                values[_COUNTERS.index(name)] = value
+        return self._update(change)
+
+    def read(self) -> Dict[str, int]:
+        return self.add()
+
+
+class DiskImageCache:
+    """
+    On-disk LRU cache shared by all workers on a host.
+
+    Args:
+        root: Cache directory (created if missing)
+        max_bytes: Size limit of cached data
+        revalidate_seconds: Entries older than this are checked against
+            storage (HEAD) before being served again; 0 never revalidates
+        now: Clock returning a Unix timestamp (for tests)
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int,
+        revalidate_seconds: int = 300,
+        now: Optional[Callable[[], float]] = None
+    ):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self._now = now or time.time
+        self._objects_dir = os.path.join(self.root, "objects")
+        self._locks_dir = os.path.join(self.root, "locks")
+        self._tmp_dir = os.path.join(self.root, "tmp")
+        for directory in (self._objects_dir, self._locks_dir, self._tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+        self._counters = _SharedCounters(os.path.join(self.root, "stats.bin"))
+
+    # Paths ---------------------------------------------------------------
+
+    @staticmethod
+    def _entry_hash(bucket: str, key: str) -> str:
+        return hashlib.sha256(f"{bucket}\n{key}".encode("utf-8")).hexdigest()
+
+    def _meta_path(self, h: str) -> str:
+        return os.path.join(self._objects_dir, h[:2], f"{h}.json")
+
+    def _data_path(self, h: str, etag: str) -> str:
+        etag_hash = hashlib.sha256(etag.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self._objects_dir, h[:2], f"{h}-{etag_hash}.bin")
+
+    @contextmanager
+    def _stripe_lock(self, h: str) -> Iterator[None]:
+        stripe = int(h[:8], 16) % LOCK_STRIPES
+        fd = os.open(os.path.join(self._locks_dir, f"{stripe:04d}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # Releases the lock
+
+    # Entries -------------------------------------------------------------
+
+    def _read_meta(self, h: str) -> Optional[dict]:
+        try:
+            with open(self._meta_path(h), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self, h: str, meta: dict) -> None:
+        path = self._meta_path(h)
+        fd, temp_path = tempfile.mkstemp(dir=self._tmp_dir, suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, path)
+
+    def _open_entry(self, h: str, meta: Optional[dict]) -> Optional[CachedImage]:
+        """Open the data file described by ``meta``; None if gone or inconsistent."""
+        if meta is None:
+            return None
+        path = self._data_path(h, meta["etag"])
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        if os.fstat(f.fileno()).st_size != meta["size"]:
+            f.close()
+            return None
+        return CachedImage(f, path, meta["size"], meta["etag"], meta["last_modified"])
+
+    def _is_fresh(self, meta: dict) -> bool:
+        return not self.revalidate_seconds or self._now() - meta["checked_at"] < self.revalidate_seconds
+
+    def _touch(self, entry: CachedImage) -> None:
+        now = self._now()
+        try:
+            if now - os.fstat(entry.file.fileno()).st_mtime >= TOUCH_INTERVAL:
+                os.utime(entry.path, (now, now))
+        except OSError:
+            pass
+
+    def _store(
+        self,
+        h: str,
+        bucket: str,
+        key: str,
+        fetch: Callable[[BinaryIO], StorageObject]
+    ) -> CachedImage:
+        """Fetch an object into the cache (caller holds the stripe lock)."""
+        fd, temp_path = tempfile.mkstemp(dir=self._tmp_dir, suffix=".bin")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                obj = fetch(f)
+                size = f.tell()
+            # LRU order follows the cache clock
+            now = self._now()
+            os.utime(temp_path, (now, now))
+            # Open before publishing so a concurrent eviction cannot pull it away
+            reader = open(temp_path, "rb")
+            path = self._data_path(h, obj.etag)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        previous = self._read_meta(h)
+        meta = {
+            "bucket": bucket,
+            "key": key,
+            "etag": obj.etag,
+            "size": size,
+            "last_modified": obj.last_modified.timestamp(),
+            "checked_at": self._now(),
+        }
+        self._write_meta(h, meta)
+        if previous and previous["etag"] != obj.etag:
+            self._remove_file(self._data_path(h, previous["etag"]))
+        elif previous:
+            size -= previous["size"]  # Same file replaced in place
+
+        self._counters.add(misses=1, bytes=size)
+        return CachedImage(reader, path, meta["size"], meta["etag"], meta["last_modified"])
+
+    # Public API ----------------------------------------------------------
+
+    def open(
+        self,
+        bucket: str,
+        key: str,
+        fetch: Callable[[BinaryIO], StorageObject],
+        validate: Optional[Callable[[], Optional[StorageObject]]] = None
+    ) -> CachedImage:
+        """
+        Return an open cache entry, fetching the object on a miss.
+
+        Args:
+            bucket: Storage bucket
+            key: Object key
+            fetch: Writes the object's bytes to the given file and returns its
+                metadata; raises ObjectNotFoundError if it does not exist
+            validate: Returns the object's current metadata (HEAD) or None;
+                used to revalidate entries older than revalidate_seconds
+
+        Returns:
+            CachedImage whose file the caller must close
+        """
+        h = self._entry_hash(bucket, key)
+
+        meta = self._read_meta(h)
+        if meta is not None and self._is_fresh(meta):
+            entry = self._open_entry(h, meta)
+            if entry is not None:
+                self._counters.add(hits=1)
+                self._touch(entry)
+                return entry
+
+        with self._stripe_lock(h):
+            # Another worker may have fetched it while we waited
+            meta = self._read_meta(h)
+            entry = self._open_entry(h, meta)
+            if entry is not None and self._is_fresh(meta):
+                self._counters.add(hits=1, coalesced=1)
+                return entry
+
+            if entry is not None and validate is not None:
+                current = validate()
+                self._counters.add(revalidations=1)
+                if current is not None and current.etag == meta["etag"]:
+                    meta["checked_at"] = self._now()
+                    self._write_meta(h, meta)
+                    self._counters.add(hits=1)
+                    return entry
+                entry.file.close()
+                if current is None:
+                    self.invalidate(bucket, key)
+                    raise ObjectNotFoundError(f"{bucket}/{key}")
+            elif entry is not None:
+                entry.file.close()
+
+            entry = self._store(h, bucket, key, fetch)
+
+        if self._counters.read()["bytes"] > self.max_bytes:
+            self.evict()
+        return entry
+
+    def invalidate(self, bucket: str, key: str) -> None:
+        """Drop an object from the cache (e.g. after it was overwritten)."""
+        h = self._entry_hash(bucket, key)
+        meta = self._read_meta(h)
+        self._remove_file(self._meta_path(h))
+        if meta is not None:
+            self._remove_file(self._data_path(h, meta["etag"]), size=meta["size"])
+
+    def _remove_file(self, path: str, size: Optional[int] = None) -> None:
+        try:
+            if size is None and path.endswith(".bin"):
+                size = os.stat(path).st_size
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        if size:
+            self._counters.add(bytes=-size)
+
+    def evict(self) -> int:
+        """
+        Delete least recently used entries until the cache is under
+        LOW_WATERMARK of max_bytes. Only one process evicts at a time; others
+        return immediately.
+
+        Returns:
+            Number of entries evicted
+        """
+        fd = os.open(os.path.join(self._locks_dir, "evict.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    return 0
+                raise
+
+            files = []
+            total = 0
+            for shard in os.scandir(self._objects_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if not entry.name.endswith(".bin"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+            # Temp files left behind by killed workers
+            stale_before = self._now() - 3600
+            for entry in os.scandir(self._tmp_dir):
+                try:
+                    if entry.stat().st_mtime < stale_before:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+
+            target = int(self.max_bytes * LOW_WATERMARK)
+            evicted = 0
+            files.sort()
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                # The metadata file shares the entry hash prefix
+                name = os.path.basename(path)
+                try:
+                    os.unlink(os.path.join(os.path.dirname(path), name.split("-", 1)[0] + ".json"))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+
+            self._counters.set(bytes=total)
+            if evicted:
+                self._counters.add(evictions=evicted)
+                logger.info(f"Image cache evicted {evicted} entries ({total} bytes remain)")
+            return evicted
+        finally:
+            os.close(fd)
+
+    def stats(self) -> Dict[str, float]:
+        """Counters summed over all workers, plus the hit ratio."""
+        stats = self._counters.read()
+        lookups = stats["hits"] + stats["misses"]
+        stats["max_bytes"] = self.max_bytes
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters."""
+        shutil.rmtree(self._objects_dir, ignore_errors=True)
+        os.makedirs(self._objects_dir, exist_ok=True)
+        self._counters.set(**{name: 0 for name in _COUNTERS})
+
+
+_image_cache: Optional[DiskImageCache] = None
+
+
+def get_image_cache() -> Optional[DiskImageCache]:
+    """Process-wide cache for the image proxy; None when IMAGE_CACHE_MAX_MB is 0."""
+    global _image_cache
+    if settings.IMAGE_CACHE_MAX_MB <= 0:
+        return None
+    if _image_cache is None:
+        _image_cache = DiskImageCache(
+            settings.IMAGE_CACHE_DIR,
+            max_bytes=settings.IMAGE_CACHE_MAX_MB * 1024 * 1024,
+            revalidate_seconds=settings.IMAGE_CACHE_REVALIDATE_SECONDS,
+        )
+    return _image_cache
@@ -0,0 +1,236 @@
+"""
+Incremental JSON Reader / Writer
+
+Iterates the elements of large top-level arrays in a JSON document without
+loading the whole document:
+
+    for path, image in iter_json_items(chunks, paths=("images",)):
+        ...
+
+and writes such documents the same way, from generators:
+
+    chunks = iter_json_object([
+        ("format_version", "1.0"),
+        ("images", StreamedArray(generate_images())),
+        ("statistics", lambda: stats.result()),  # Evaluated after "images"
+    ])
+    storage_client.upload_stream(bucket, key, chunks)
+
+DICE/COCO annotation files are one object with a few small members
+(info, categories) and one or two huge arrays (images, annotations). Reading
+them with ``json.loads(body.read())`` keeps the raw bytes, the decoded text and
+the parsed tree in memory at once. Here only the current chunk and the current
+array element are held; each element is decoded with the C ``json`` scanner.
+
+Supported paths are top-level object members (``"images"``) and the root
+array itself (``""``). Members not asked for are skipped element by element,
+so skipping a large array is bounded too.
+
+The writer emits compact JSON (no indentation) in chunks of about
+``chunk_size`` bytes; memory stays proportional to one chunk plus one array
+element. The output parses to the same value as ``json.dumps`` of the
+equivalent dict.
+"""
+
+import codecs
+import json
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Tuple, Union
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789.eE+-"
+_decoder = json.JSONDecoder()
+
+
+class _ChunkReader:
+    """Text buffer over an iterator of byte chunks."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Append the next chunk, dropping consumed text. Returns False at EOF."""
+        if self.eof:
+            return False
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            if text:
+                self.buf = self.buf[self.pos:] + text
+                self.pos = 0
+                return True
+        self.buf = self.buf[self.pos:] + self._utf8.decode(b"", final=True)
+        self.pos = 0
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at EOF)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r} in JSON stream")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode one complete JSON value at the current position."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A number may continue past the buffer ("6" of "6.5"); need a delimiter after it
+                if self.eof or (end < len(self.buf) and self.buf[end] not in _NUMBER_CHARS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow the buffer geometrically so huge values don't re-parse quadratically
+            target = 2 * (len(self.buf) - self.pos)
+            while self.fill() and len(self.buf) - self.pos < target:
+                pass
+
+
+def _iter_array(reader: _ChunkReader) -> Iterator[Any]:
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' but found {separator!r} in JSON stream")
+
+
+def iter_json_items(
+    chunks: Iterable[bytes],
+    paths: Iterable[str] = ("images",),
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Stream the elements of selected top-level arrays.
+
+    Args:
+        chunks: UTF-8 encoded JSON document as an iterable of byte chunks
+        paths: Top-level member names whose array elements to yield; "" selects
+            the elements of a root-level array. A selected member that is not an
+            array is yielded once as a whole.
+
+    Yields:
+        (path, element) tuples in document order
+
+    Raises:
+        ValueError: If the document is not valid JSON
+    """
+    wanted = set(paths)
+    reader = _ChunkReader(chunks)
+
+    first = reader.peek()
+    if first == "[":
+        for item in _iter_array(reader):
+            if "" in wanted:
+                yield "", item
+        return
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError("Expected object key in JSON stream")
+        reader.expect(":")
+
+        if reader.peek() == "[":
+            # Arrays are walked element by element whether wanted or not
+            for item in _iter_array(reader):
+                if key in wanted:
+                    yield key, item
+        else:
+            value = reader.value()
+            if key in wanted:
+                yield key, value
+
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or '}}' but found {separator!r} in JSON stream")
+
+
+# =============================================================================
+# Writer
+# =============================================================================
+
+_encoder = json.JSONEncoder(separators=(",", ":"))
+
+# Bytes collected before a chunk is yielded (one upload write per chunk)
+WRITE_CHUNK_SIZE = 64 * 1024
+
+
+class StreamedArray(NamedTuple):
+    """Object member written element by element from an iterable."""
+
+    items: Iterable[Any]
+
+
+JsonMember = Union[Any, StreamedArray, Callable[[], Any]]
+
+
+def iter_json_object(
+    members: Iterable[Tuple[str, JsonMember]],
+    chunk_size: int = WRITE_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Encode a JSON object incrementally.
+
+    Args:
+        members: (key, value) pairs in output order. A StreamedArray value is
+            written one element at a time; a callable is called when its
+            member is reached, so it can return values accumulated while
+            earlier arrays were streamed (e.g. statistics). Other values are
+            encoded as a whole.
+        chunk_size: Approximate bytes per yielded chunk
+
+    Yields:
+        UTF-8 encoded chunks of compact JSON
+    """
+    parts = ["{"]
+    size = 1
+
+    def put(text: str) -> Iterator[bytes]:
+        nonlocal parts, size
+        parts.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            chunk, parts, size = "".join(parts).encode("utf-8"), [], 0
+            yield chunk
+
+    for index, (key, value) in enumerate(members):
+        yield from put(("," if index else "") + _encoder.encode(key) + ":")
+        if isinstance(value, StreamedArray):
+            yield from put("[")
+            for item_index, item in enumerate(value.items):
+                yield from put(("," if item_index else "") + _encoder.encode(item))
+            yield from put("]")
+        else:
+            if callable(value):
+                value = value()
+            yield from put(_encoder.encode(value))
+    parts.append("}")
+    yield "".join(parts).encode("utf-8")
@@ -0,0 +1,188 @@
+"""
+Streaming S3 Multipart Upload Writer
+
+A write-only file-like object that uploads to S3 with a multipart upload.
+
+Exports used to be built as one ``bytes`` object and sent with a single
+put_object, holding the whole file in memory (usually twice: dict + bytes).
+The writer instead buffers at most one part, hands full parts to a small
+thread pool, and keeps at most ``max_concurrency`` parts in flight, so memory
+stays at roughly ``part_size * (max_concurrency + 1)`` regardless of object size:
+
+    with storage_client.open_upload_stream(bucket, key, content_type='application/json') as out:
+        for chunk in json.JSONEncoder().iterencode(data):
+            out.write(chunk.encode('utf-8'))
+
+Objects smaller than one part are sent with a plain put_object on close.
+If the ``with`` block raises, the multipart upload is aborted.
+"""
+
+import io
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# S3 requires every part except the last to be at least 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+class MultipartUploadWriter(io.RawIOBase):
+    """Write-only stream that uploads to ``bucket/key`` via S3 multipart upload."""
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        key: str,
+        content_type: str = 'application/octet-stream',
+        metadata: Optional[Dict[str, str]] = None,
+        part_size: int = 8 * 1024 * 1024,
+        max_concurrency: int = 4,
+    ):
+        super().__init__()
+        self._s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+        self._extra_args = {'ContentType': content_type}
+        if metadata:
+            self._extra_args['Metadata'] = metadata
+
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self._max_concurrency = max(1, max_concurrency)
+
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Bounds the number of parts buffered/in flight (backpressure for write())
+        self._slots = threading.BoundedSemaphore(self._max_concurrency)
+        self._futures: List[Future] = []
+        self._part_number = 0
+
+        self.bytes_written = 0
+        self.etag: Optional[str] = None
+
+    # io.RawIOBase interface --------------------------------------------------
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed upload stream")
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit_part(part)
+        return len(data)
+
+    def close(self) -> None:
+        """Upload the remaining buffer and complete the upload."""
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                # Small object: one request, no multipart bookkeeping
+                response = self._s3.put_object(
+                    Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), **self._extra_args
+                )
+                self.etag = response.get('ETag')
+            else:
+                if self._buffer or self._part_number == 0:
+                    self._submit_part(bytes(self._buffer))
+                parts = [future.result() for future in self._futures]
+                response = self._s3.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={'Parts': parts},
+                )
+                self.etag = response.get('ETag')
+                logger.debug(f"Completed multipart upload: {self.key} ({len(parts)} parts, {self.bytes_written} bytes)")
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            self._shutdown()
+            super().close()
+
+    def abort(self) -> None:
+        """Abort the multipart upload (if started) and discard buffered data."""
+        if self._upload_id is not None:
+            for future in self._futures:
+                future.cancel()
+            # Let in-flight parts finish first, or they could outlive the abort
+            self._shutdown()
+            try:
+                self._s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+                logger.warning(f"Aborted multipart upload: {self.key}")
+            except Exception as e:
+                logger.error(f"Failed to abort multipart upload {self.key}: {e}")
+            self._upload_id = None
+        self._buffer = bytearray()
+        self._shutdown()
+        if not self.closed:
+            super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+            return False
+        self.close()
+        return False
+
+    def __del__(self):
+        # Never complete a half-written upload from the garbage collector
+        if not self.closed:
+            self.abort()
+
+    # Internals ---------------------------------------------------------------
+
+    def _submit_part(self, data: bytes) -> None:
+        if self._upload_id is None:
+            response = self._s3.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self._extra_args)
+            self._upload_id = response['UploadId']
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_concurrency, thread_name_prefix='s3-multipart'
+            )
+
+        self._part_number += 1
+        if self._part_number > MAX_PARTS:
+            raise ValueError(f"Upload exceeds {MAX_PARTS} parts; increase part_size")
+
+        # Fail fast if an earlier part already failed
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+        self._slots.acquire()
+        future = self._executor.submit(self._upload_part, self._part_number, data)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _upload_part(self, part_number: int, data: bytes) -> Dict:
+        response = self._s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+    def _shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,175 @@
+"""
+Version Snapshot Blob
+
+A published version's annotation snapshots as one compressed object in the
+annotations bucket, sorted by image, so a diff can read one image's
+annotations with a ranged GET instead of the whole version:
+
+    snapshots/{project_id}/{task_type}/{version_number}/annotations.jsonl.gz
+        Concatenated gzip members ("blocks"); each holds the JSON lines of
+        whole, consecutive images:
+        ["train/001.jpg", 17, {"annotation_type": "bbox", ...}]
+
+    snapshots/{project_id}/{task_type}/{version_number}/index.json
+        {"version": 1, "annotation_count": 2, "image_count": 1,
+         "blocks": [["train/001.jpg", 0, 1840], ...]}
+
+Every block is a complete gzip member, so it decompresses on its own: the
+index maps the first image of each block to the block's byte range, and
+bisect finds the block that holds any image. Concatenated members are still
+one valid gzip file, so the whole blob also streams through gzip.
+
+Images are sorted in code point order (the export order); snapshots whose
+image is unknown (annotation deleted before the version was moved to a blob)
+have image id null and sort first.
+"""
+
+import bisect
+import gzip
+import io
+import json
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+SNAPSHOT_BLOB_VERSION = 1
+
+# Uncompressed bytes per block: larger compresses better, smaller makes
+# ranged reads of one image cheaper
+BLOCK_SIZE = 64 * 1024
+
+
+class SnapshotRow(NamedTuple):
+    """One annotation snapshot in a blob."""
+
+    image_id: Optional[str]
+    annotation_id: int
+    snapshot_data: Dict[str, Any]
+
+
+class SnapshotBlock(NamedTuple):
+    """Byte range of one gzip member and the first image it holds."""
+
+    first_image_id: str
+    offset: int
+    length: int
+
+
+def snapshot_blob_key(project_id: str, task_type: str, version_number: str) -> str:
+    """Key of a version's snapshot blob in the annotations bucket."""
+    return f"snapshots/{project_id}/{task_type}/{version_number}/annotations.jsonl.gz"
+
+
+def _sort_key(image_id: Optional[str]) -> str:
+    return image_id or ""
+
+
+class SnapshotBlobIndex:
+    """Block index of a snapshot blob."""
+
+    def __init__(self, blocks: Iterable[SnapshotBlock], annotation_count: int = 0, image_count: int = 0):
+        self.blocks: List[SnapshotBlock] = list(blocks)
+        self.annotation_count = annotation_count
+        self.image_count = image_count
+        self._first_image_ids = [block.first_image_id for block in self.blocks]
+
+    def find_block(self, image_id: str) -> Optional[SnapshotBlock]:
+        """Block that holds image_id's snapshots if the version has any (None if it cannot)."""
+        position = bisect.bisect_right(self._first_image_ids, image_id) - 1
+        if position < 0:
+            return None
+        return self.blocks[position]
+
+    def to_bytes(self) -> bytes:
+        return json.dumps({
+            "version": SNAPSHOT_BLOB_VERSION,
+            "annotation_count": self.annotation_count,
+            "image_count": self.image_count,
+            "blocks": [list(block) for block in self.blocks],
+        }, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SnapshotBlobIndex":
+        """Parse an index produced by to_bytes()."""
+        index = json.loads(data)
+        if index.get("version") != SNAPSHOT_BLOB_VERSION:
+            raise ValueError(f"Unsupported snapshot blob version: {index.get('version')}")
+        return cls(
+            blocks=[SnapshotBlock(*block) for block in index["blocks"]],
+            annotation_count=index["annotation_count"],
+            image_count=index["image_count"],
+        )
+
+
+class SnapshotBlobBuilder:
+    """
+    Writes a snapshot blob to a file object, image by image.
+
+    Images must be added in sort order (each image once); finish() flushes
+    the last block and returns the index.
+    """
+
+    def __init__(self, fileobj: BinaryIO, block_size: int = BLOCK_SIZE):
+        self._fileobj = fileobj
+        self._block_size = block_size
+        self._blocks: List[SnapshotBlock] = []
+        self._pending: List[bytes] = []
+        self._pending_size = 0
+        self._pending_first: Optional[str] = None
+        self._offset = 0
+        self._last_key: Optional[str] = None
+        self.annotation_count = 0
+        self.image_count = 0
+
+    def add_image(self, image_id: Optional[str], snapshots: Iterable[Tuple[int, Dict[str, Any]]]) -> None:
+        """Append one image's (annotation_id, snapshot_data) pairs."""
+        key = _sort_key(image_id)
+        if self._last_key is not None and key <= self._last_key:
+            raise ValueError(f"Snapshot blob images out of order: {image_id!r} after {self._last_key!r}")
+        self._last_key = key
+
+        lines = [
+            json.dumps([image_id, annotation_id, snapshot_data], separators=(",", ":"), ensure_ascii=False,
+                       default=str).encode("utf-8") + b"\n"
+            for annotation_id, snapshot_data in snapshots
+        ]
+        if not lines:
+            return
+
+        if self._pending_first is None:
+            self._pending_first = key
+        self._pending.extend(lines)
+        self._pending_size += sum(len(line) for line in lines)
+        self.annotation_count += len(lines)
+        self.image_count += 1
+        if self._pending_size >= self._block_size:
+            self._flush()
+
+    def finish(self) -> SnapshotBlobIndex:
+        self._flush()
+        return SnapshotBlobIndex(self._blocks, self.annotation_count, self.image_count)
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        member = gzip.compress(b"".join(self._pending), compresslevel=6, mtime=0)
+        self._fileobj.write(member)
+        self._blocks.append(SnapshotBlock(self._pending_first, self._offset, len(member)))
+        self._offset += len(member)
+        self._pending = []
+        self._pending_size = 0
+        self._pending_first = None
+
+
+def parse_block(data: bytes, image_id: Optional[str] = None) -> List[SnapshotRow]:
+    """Rows of one block (or several concatenated), optionally of one image only."""
+    return [
+        row for row in iter_blob_rows(io.BytesIO(data))
+        if image_id is None or row.image_id == image_id
+    ]
+
+
+def iter_blob_rows(fileobj: BinaryIO) -> Iterator[SnapshotRow]:
+    """Stream all rows of a blob (or a byte range of whole blocks)."""
+    with gzip.GzipFile(fileobj=fileobj, mode="rb") as lines:
+        for line in lines:
+            if line.strip():
+                yield SnapshotRow(*json.loads(line))
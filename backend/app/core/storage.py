@@ -7,59 +7,186 @@ Handles image storage operations including:
 - Upload/download annotations
 """
 
+import hmac
 import logging
-from typing import List, Dict, Optional
-from datetime import datetime, timedelta
-import boto3
-from botocore.config import Config
+import threading
+import time
+from typing import Any, BinaryIO, List, Dict, Iterable, Iterator, Optional, Tuple, Union
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
 from botocore.exceptions import ClientError
 
 from app.core.config import settings
+from app.core.json_stream import iter_json_items
+from app.core.manifest import DatasetManifest, ManifestEntry
+from app.core.multipart import MultipartUploadWriter
+from app.core.snapshot_blob import SnapshotBlobIndex, SnapshotRow, iter_blob_rows, parse_block
+from app.core.storage_backends import (
+    LOCAL_STORAGE_TYPE,
+    LocalStorageBackend,
+    ObjectNotFoundError,
+    PreconditionFailedError,
+    S3StorageBackend,
+    StorageBackend,
+    sign_local_url,
+)
+from app.core.sigv4 import MAX_PRESIGN_EXPIRES, PresignedUrlCache, SigV4Presigner, signing_window
 
 logger = logging.getLogger(__name__)
 
+# Anything upload_stream() accepts: raw bytes, a readable file, or an iterator of chunks
+UploadSource = Union[bytes, BinaryIO, Iterable[Union[bytes, str]]]
+
+# Seconds to wait before retrying a failed bucket verification
+BUCKET_VERIFY_RETRY_SECONDS = 30.0
+
+# Conditional-write attempts of update_dataset_manifest() before giving up
+MANIFEST_UPDATE_ATTEMPTS = 5
+
 
 class StorageClient:
     """S3/MinIO storage client for managing images and annotations."""
 
     def __init__(self):
-        """Initialize S3 client with configuration from settings."""
-        self.s3_client = boto3.client(
-            's3',
-            endpoint_url=settings.S3_ENDPOINT,
-            aws_access_key_id=settings.S3_ACCESS_KEY,
-            aws_secret_access_key=settings.S3_SECRET_KEY,
-            region_name=settings.S3_REGION,
-            config=Config(signature_version='s3v4'),
-            use_ssl=settings.S3_USE_SSL
-        )
+        """
+        Set up storage configuration from settings.
+
+        No network I/O happens here: the boto3 client is created on first use and
+        the bucket check runs once per process (see s3_client / ensure_buckets),
+        so importing this module never stalls on a slow or unreachable S3.
+        """
         self.datasets_bucket = settings.S3_BUCKET_DATASETS
         self.annotations_bucket = settings.S3_BUCKET_ANNOTATIONS
-        logger.info(f"Storage client initialized: endpoint={settings.S3_ENDPOINT}")
 
-        # Ensure required buckets exist
-        self._ensure_buckets_exist()
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._buckets_verified = False
+        self._buckets_lock = threading.Lock()
+        # time.monotonic() before which a failed verification is not retried
+        self._buckets_retry_at = 0.0
+
+        # Local SigV4 signer for batch URL generation (created with the client)
+        self._presigner: Optional[SigV4Presigner] = None
+        # Per-process LRU of cache-stable URLs (see S3_PRESIGN_WINDOW_SECONDS)
+        self._url_cache = PresignedUrlCache(max_size=settings.S3_PRESIGN_CACHE_SIZE)
+        # dataset_id -> (loaded_at monotonic, manifest or None)
+        self._manifest_cache: Dict[str, tuple] = {}
+        # Storage backends by name (see get_backend)
+        self._backends: Dict[str, StorageBackend] = {}
+
+    def get_backend(self, storage_type: Optional[str] = None) -> StorageBackend:
+        """
+        Storage backend for a dataset's storage_type.
+
+        Args:
+            storage_type: Dataset.storage_type ("local", or "s3"/"r2"/... for S3);
+                None uses settings.STORAGE_BACKEND
+
+        Returns:
+            LocalStorageBackend or S3StorageBackend
+        """
+        name = LOCAL_STORAGE_TYPE if (storage_type or settings.STORAGE_BACKEND) == LOCAL_STORAGE_TYPE else 's3'
+        backend = self._backends.get(name)
+        if backend is None:
+            if name == LOCAL_STORAGE_TYPE:
+                backend = LocalStorageBackend(
+                    root=settings.LOCAL_STORAGE_ROOT,
+                    url_base=settings.LOCAL_STORAGE_URL_BASE,
+                    url_secret=settings.LOCAL_STORAGE_URL_SECRET,
+                    window_seconds=settings.S3_PRESIGN_WINDOW_SECONDS
+                )
+            else:
+                backend = S3StorageBackend(lambda: self.s3_client, presigner=self._presign_s3_urls)
+            self._backends[name] = backend
+        return backend
+
+    @property
+    def s3_client(self):
+        """boto3 S3 client (created lazily; required buckets verified on first use)."""
+        client = self._get_client()
+        if not self._buckets_verified:
+            self.ensure_buckets()
+        return client
+
+    def _get_client(self):
+        """Create the boto3 client once per process. Does not touch the network."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    # Imported here: boto3 is the most expensive import of the app
+                    import boto3
+                    from botocore.config import Config
+
+                    client = boto3.client(
+                        's3',
+                        endpoint_url=settings.S3_ENDPOINT,
+                        aws_access_key_id=settings.S3_ACCESS_KEY,
+                        aws_secret_access_key=settings.S3_SECRET_KEY,
+                        region_name=settings.S3_REGION,
+                        config=Config(signature_version='s3v4'),
+                        use_ssl=settings.S3_USE_SSL
+                    )
+                    # Path-style custom endpoints only; AWS virtual-host URLs are signed by boto3
+                    if settings.S3_ENDPOINT:
+                        self._presigner = SigV4Presigner(
+                            endpoint_url=client.meta.endpoint_url,
+                            access_key=settings.S3_ACCESS_KEY,
+                            secret_key=settings.S3_SECRET_KEY,
+                            region=settings.S3_REGION,
+                        )
+                    self._client = client
+                    logger.info(f"Storage client initialized: endpoint={settings.S3_ENDPOINT}")
+        return self._client
+
+    def ensure_buckets(self) -> None:
+        """
+        Verify (and create if missing) the required buckets, once per process.
+
+        Called automatically on first use of s3_client, and scheduled in the
+        background at application startup so requests rarely have to wait.
+        Failures are logged, not raised: errors surface on the actual S3 call.
+        A failed verification is retried on first use after
+        BUCKET_VERIFY_RETRY_SECONDS, so a transient error at startup does not
+        disable bucket creation for the life of the process.
+        """
+        if self._buckets_verified or time.monotonic() < self._buckets_retry_at:
+            return
+        with self._buckets_lock:
+            if self._buckets_verified or time.monotonic() < self._buckets_retry_at:
+                return
+            try:
+                self._ensure_buckets_exist()
+            except Exception as e:
+                logger.error(f"Bucket verification failed, retrying in {BUCKET_VERIFY_RETRY_SECONDS:.0f}s: {e}")
+                self._buckets_retry_at = time.monotonic() + BUCKET_VERIFY_RETRY_SECONDS
+                return
+            self._buckets_verified = True
 
     def list_dataset_images(
         self,
         dataset_id: str,
         prefix: str = "images/",
         max_keys: int = 1000,
-        offset: int = 0
+        offset: int = 0,
+        storage_type: Optional[str] = None
     ) -> Dict[str, any]:
         """
-        List images in a dataset with pagination support.
+        List images in a dataset with offset pagination.
 
         Performance optimization:
-        - Fetches all image metadata first (fast)
-        - Generates presigned URLs only for requested page (slow operation)
-        - Supports offset/limit pagination
+        - Served from the dataset manifest when one exists (no S3 listing)
+        - Otherwise fetches all image metadata first, then slices
+        - Generates presigned URLs only for requested page
+
+        Prefer list_dataset_images_page() for large datasets: offset pagination
+        without a manifest has to list every object on each call.
 
         Args:
             dataset_id: Dataset ID
             prefix: Folder prefix (default: "images/")
             max_keys: Maximum number of images to return in this page
             offset: Number of images to skip (for pagination)
+            storage_type: Dataset.storage_type (None = settings.STORAGE_BACKEND)
 
         Returns:
             Dict with keys:
@@ -74,101 +201,390 @@ class StorageClient:
 
             logger.info(f"Listing images: bucket={self.datasets_bucket}, prefix={s3_prefix}, offset={offset}, limit={max_keys}")
 
-            # Phase 1: Get all image keys (fast - no URL generation)
-            all_objects = []
-            continuation_token = None
-
-            while True:
-                list_params = {
-                    'Bucket': self.datasets_bucket,
-                    'Prefix': s3_prefix,
-                    'MaxKeys': 1000
-                }
-                if continuation_token:
-                    list_params['ContinuationToken'] = continuation_token
-
-                response = self.s3_client.list_objects_v2(**list_params)
-
-                if 'Contents' in response:
-                    all_objects.extend(response['Contents'])
-
-                if not response.get('IsTruncated'):
-                    break
+            manifest = self.get_dataset_manifest(dataset_id, storage_type) if prefix == "images/" else None
+            if manifest is not None:
+                # Phase 1: Image entries from manifest (no S3 calls)
+                image_objects = [
+                    (f"{s3_prefix}{entry.key}", entry.size, datetime.fromtimestamp(entry.last_modified, tz=timezone.utc))
+                    for entry in manifest.entries
+                    if self._is_image_file(entry.key)
+                ]
+            else:
+                # Phase 1: Get all image keys (fast - no URL generation)
+                image_objects = [
+                    (obj.key, obj.size, obj.last_modified)
+                    for obj in self.get_backend(storage_type).list_objects(self.datasets_bucket, prefix=s3_prefix)
+                    # Skip folders and non-image files
+                    if not obj.key.endswith('/') and self._is_image_file(obj.key)
+                ]
 
-                continuation_token = response.get('NextContinuationToken')
+            total_images = len(image_objects)
 
-            # Filter image files only
-            image_objects = []
-            for obj in all_objects:
-                key = obj['Key']
+            # Phase 2: Apply pagination (slice)
+            paginated_objects = image_objects[offset:offset + max_keys]
 
-                # Skip folders
-                if key.endswith('/'):
-                    continue
+            # Phase 3: Generate presigned URLs only for paginated images
+            images = self._build_image_items(dataset_id, paginated_objects, storage_type)
 
-                # Extract filename
-                filename = key.split('/')[-1]
+            logger.info(f"Found {total_images} total images, returning {len(images)} (offset={offset}, limit={max_keys})")
 
-                # Skip non-image files
-                if not self._is_image_file(filename):
-                    continue
+            return {
+                'images': images,
+                'total': total_images,
+                'offset': offset,
+                'limit': max_keys
+            }
 
-                image_objects.append(obj)
+        except ClientError as e:
+            logger.error(f"Failed to list images in {dataset_id}: {e}")
+            raise Exception(f"Failed to list images: {str(e)}")
 
-            total_images = len(image_objects)
+    def list_dataset_images_page(
+        self,
+        dataset_id: str,
+        page_size: int = 200,
+        cursor: Optional[str] = None,
+        use_manifest: bool = True,
+        storage_type: Optional[str] = None
+    ) -> Dict[str, any]:
+        """
+        List one page of dataset images with keyset (cursor) pagination.
 
-            # Phase 2: Apply pagination (slice)
-            paginated_objects = image_objects[offset:offset + max_keys]
+        Uses S3 StartAfter + continuation tokens, so a page costs one
+        list_objects_v2 call (two when it straddles a 1000-key batch),
+        regardless of how deep into the dataset it is. When a manifest exists
+        the page is served from it without touching S3.
 
-            # Phase 3: Generate presigned URLs only for paginated images (slow)
-            images = []
-            dataset_prefix = f"datasets/{dataset_id}/"
+        Args:
+            dataset_id: Dataset ID
+            page_size: Maximum number of images to return (max 1000)
+            cursor: next_cursor from the previous page (None for first page)
+            use_manifest: Read from the dataset manifest if one exists
+            storage_type: Dataset.storage_type (None = settings.STORAGE_BACKEND)
 
-            for obj in paginated_objects:
-                key = obj['Key']
-                filename = key.split('/')[-1]
+        Returns:
+            Dict with keys:
+            - images: List of image metadata dicts (same shape as list_dataset_images)
+            - next_cursor: Cursor for the next page, or None on the last page
+            - limit: Current page size
+        """
+        page_size = max(1, min(page_size, 1000))
+        images_prefix = f"datasets/{dataset_id}/images/"
 
-                # Generate presigned URL (valid for 1 hour)
-                presigned_url = self.generate_presigned_url(
-                    bucket=self.datasets_bucket,
-                    key=key,
-                    expiration=3600
+        try:
+            manifest = self.get_dataset_manifest(dataset_id, storage_type) if use_manifest else None
+            if manifest is not None:
+                entries = manifest.page(
+                    start_after=cursor,
+                    limit=page_size + 1,
+                    predicate=lambda entry: self._is_image_file(entry.key)
                 )
+                has_more = len(entries) > page_size
+                page_objects = [
+                    (f"{images_prefix}{entry.key}", entry.size, datetime.fromtimestamp(entry.last_modified, tz=timezone.utc))
+                    for entry in entries[:page_size]
+                ]
+            else:
+                # The listing is consumed lazily: S3 is only asked for as many
+                # 1000-key batches as it takes to fill the page (usually one)
+                page_objects = []
+                has_more = False
+                objects = self.get_backend(storage_type).list_objects(
+                    self.datasets_bucket,
+                    prefix=images_prefix,
+                    start_after=f"{images_prefix}{cursor}" if cursor else None
+                )
+                for obj in objects:
+                    if obj.key.endswith('/') or not self._is_image_file(obj.key):
+                        continue
+                    if len(page_objects) == page_size:
+                        has_more = True
+                        break
+                    page_objects.append((obj.key, obj.size, obj.last_modified))
 
-                # Phase 11: Use relative path from dataset root (includes images/ prefix and full path)
-                # This matches the format stored in DB: "images/zipper/squeezed_teeth/001.png"
-                # key format: "datasets/{dataset_id}/images/zipper/squeezed_teeth/001.png"
-                # image_id format: "images/zipper/squeezed_teeth/001.png"
-                image_id = key[len(dataset_prefix):] if key.startswith(dataset_prefix) else filename
-
-                images.append({
-                    'id': image_id,
-                    'key': key,
-                    'filename': filename,
-                    'file_name': filename,  # Frontend expects file_name
-                    'size': obj['Size'],
-                    'last_modified': obj['LastModified'].isoformat(),
-                    'url': presigned_url
-                })
+            images = self._build_image_items(dataset_id, page_objects, storage_type)
+            next_cursor = page_objects[-1][0][len(images_prefix):] if has_more and page_objects else None
 
-            logger.info(f"Found {total_images} total images, returning {len(images)} (offset={offset}, limit={max_keys})")
+            logger.info(f"Listed image page: dataset={dataset_id}, returned={len(images)}, has_more={has_more}")
 
             return {
                 'images': images,
-                'total': total_images,
-                'offset': offset,
-                'limit': max_keys
+                'next_cursor': next_cursor,
+                'limit': page_size
             }
 
         except ClientError as e:
             logger.error(f"Failed to list images in {dataset_id}: {e}")
             raise Exception(f"Failed to list images: {str(e)}")
 
+    def _build_image_items(
+        self,
+        dataset_id: str,
+        objects: List[tuple],
+        storage_type: Optional[str] = None
+    ) -> List[Dict]:
+        """Build image dicts with batch-signed URLs from (key, size, last_modified) tuples."""
+        dataset_prefix = f"datasets/{dataset_id}/"
+        presigned_urls = self.generate_presigned_urls(
+            bucket=self.datasets_bucket,
+            keys=[key for key, _, _ in objects],
+            expiration=3600,
+            storage_type=storage_type
+        )
+
+        images = []
+        for key, size, last_modified in objects:
+            filename = key.split('/')[-1]
+
+            # Phase 11: Use relative path from dataset root (includes images/ prefix and full path)
+            # This matches the format stored in DB: "images/zipper/squeezed_teeth/001.png"
+            # key format: "datasets/{dataset_id}/images/zipper/squeezed_teeth/001.png"
+            # image_id format: "images/zipper/squeezed_teeth/001.png"
+            image_id = key[len(dataset_prefix):] if key.startswith(dataset_prefix) else filename
+
+            images.append({
+                'id': image_id,
+                'key': key,
+                'filename': filename,
+                'file_name': filename,  # Frontend expects file_name
+                'size': size,
+                'last_modified': last_modified.isoformat(),
+                'url': presigned_urls[key]
+            })
+        return images
+
+    # =========================================================================
+    # Dataset object manifest
+    # =========================================================================
+
+    def _manifest_key(self, dataset_id: str) -> str:
+        """Manifest lives next to the dataset so dataset deletion removes it too."""
+        return f"datasets/{dataset_id}/.manifest/images.jsonl.gz"
+
+    def get_dataset_manifest(
+        self,
+        dataset_id: str,
+        storage_type: Optional[str] = None
+    ) -> Optional[DatasetManifest]:
+        """
+        Load the dataset's object manifest, or None if it has none.
+
+        Loaded manifests are kept in-process for S3_MANIFEST_CACHE_TTL_SECONDS,
+        so repeated listings don't touch S3 at all. The manifest is read from
+        the dataset's own backend (storage_type, None = settings.STORAGE_BACKEND).
+        """
+        cached = self._manifest_cache.get(dataset_id)
+        if cached is not None and time.monotonic() - cached[0] < settings.S3_MANIFEST_CACHE_TTL_SECONDS:
+            return cached[1]
+
+        manifest = None
+        try:
+            data = self.get_backend(storage_type).get_object(self.datasets_bucket, self._manifest_key(dataset_id))
+            manifest = DatasetManifest.from_bytes(data)
+        except ObjectNotFoundError:
+            pass
+        except ClientError as e:
+            logger.warning(f"Failed to load manifest for {dataset_id}: {e}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring invalid manifest for {dataset_id}: {e}")
+
+        self._manifest_cache[dataset_id] = (time.monotonic(), manifest)
+        return manifest
+
+    def invalidate_manifest_cache(self, dataset_id: str) -> None:
+        """Drop the in-process copy so the next read goes to S3."""
+        self._manifest_cache.pop(dataset_id, None)
+
+    def save_dataset_manifest(self, manifest: DatasetManifest, storage_type: Optional[str] = None) -> str:
+        """Persist a manifest and refresh the in-process copy. Returns the S3 key."""
+        key = self._manifest_key(manifest.dataset_id)
+        self.get_backend(storage_type).put_object(
+            self.datasets_bucket,
+            key,
+            manifest.to_bytes(),
+            content_type='application/gzip'
+        )
+        self._manifest_cache[manifest.dataset_id] = (time.monotonic(), manifest)
+        logger.info(f"Saved manifest: {key} ({len(manifest)} objects)")
+        return key
+
+    def build_dataset_manifest(self, dataset_id: str, storage_type: Optional[str] = None) -> DatasetManifest:
+        """Rebuild a dataset's manifest from a full listing of its backend and persist it."""
+        images_prefix = f"datasets/{dataset_id}/images/"
+        entries = []
+
+        for obj in self.get_backend(storage_type).list_objects(self.datasets_bucket, prefix=images_prefix):
+            if obj.key.endswith('/'):
+                continue
+            entries.append(ManifestEntry(
+                key=obj.key[len(images_prefix):],
+                size=obj.size,
+                etag=obj.etag,
+                last_modified=int(obj.last_modified.timestamp())
+            ))
+
+        # Backends list keys in manifest order
+        manifest = DatasetManifest(dataset_id, entries, presorted=True)
+        self.save_dataset_manifest(manifest, storage_type)
+        return manifest
+
+    def update_dataset_manifest(
+        self,
+        dataset_id: str,
+        upserts: Iterable[ManifestEntry] = (),
+        deletes: Iterable[str] = (),
+        storage_type: Optional[str] = None
+    ) -> bool:
+        """
+        Incrementally merge changes into an existing manifest.
+
+        Writers call this with the objects they just uploaded/deleted. Datasets
+        without a manifest are left alone (build one with build_dataset_manifest).
+
+        Concurrent writers (parallel upload completions, ingest) must not drop
+        each other's changes: the merged manifest is written only if the stored
+        one is unchanged since it was read (If-Match on its ETag), and the merge
+        is retried on conflict. If it still conflicts after
+        MANIFEST_UPDATE_ATTEMPTS, the manifest is deleted so listings fall back
+        to the backend until it is rebuilt.
+
+        Args:
+            dataset_id: Dataset ID
+            upserts: Entries of objects added or replaced
+            deletes: Keys (relative to images/) of removed objects
+            storage_type: Dataset.storage_type (None = settings.STORAGE_BACKEND)
+
+        Returns:
+            True if a manifest existed and was updated
+        """
+        upserts, deletes = list(upserts), list(deletes)
+        backend = self.get_backend(storage_type)
+        key = self._manifest_key(dataset_id)
+        # Always merge into the latest persisted copy, not the cached one
+        self.invalidate_manifest_cache(dataset_id)
+
+        for _ in range(MANIFEST_UPDATE_ATTEMPTS):
+            current = backend.head_object(self.datasets_bucket, key)
+            if current is None:
+                return False
+            try:
+                manifest = DatasetManifest.from_bytes(backend.get_object(self.datasets_bucket, key))
+            except ObjectNotFoundError:
+                continue  # Deleted since the HEAD: next attempt sees it missing
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring invalid manifest for {dataset_id}: {e}")
+                return False
+
+            merged = manifest.merge(upserts=upserts, deletes=deletes)
+            try:
+                backend.put_object(
+                    self.datasets_bucket,
+                    key,
+                    merged.to_bytes(),
+                    content_type='application/gzip',
+                    if_match=current.etag
+                )
+            except PreconditionFailedError:
+                continue  # Another writer got there first: merge into its copy
+            self._manifest_cache[dataset_id] = (time.monotonic(), merged)
+            logger.info(f"Updated manifest: {key} ({len(merged)} objects)")
+            return True
+
+        logger.warning(
+            f"Manifest for {dataset_id} kept changing during update; "
+            f"deleting it so listings fall back to the storage backend"
+        )
+        backend.delete_objects(self.datasets_bucket, [key])
+        self.invalidate_manifest_cache(dataset_id)
+        return False
+
+    # =========================================================================
+    # Version snapshot blobs
+    # =========================================================================
+
+    def _snapshot_index_key(self, blob_key: str) -> str:
+        return blob_key.rsplit('/', 1)[0] + "/index.json"
+
+    def save_snapshot_blob(self, blob_key: str, blob: BinaryIO, index: SnapshotBlobIndex) -> None:
+        """
+        Upload a version's snapshot blob (see snapshot_blob_key) and its index.
+
+        The index is written last, so a reader never finds an index without
+        its blob.
+        """
+        backend = self.get_backend()
+        backend.put_object(self.annotations_bucket, blob_key, blob, content_type='application/gzip')
+        backend.put_object(
+            self.annotations_bucket,
+            self._snapshot_index_key(blob_key),
+            index.to_bytes(),
+            content_type='application/json'
+        )
+        logger.info(
+            f"Saved snapshot blob: {blob_key} ({index.annotation_count} annotations, {len(index.blocks)} blocks)"
+        )
+
+    def get_snapshot_blob_index(self, blob_key: str) -> Optional[SnapshotBlobIndex]:
+        """Index of a snapshot blob, or None if it does not exist."""
+        try:
+            data = self.get_backend().get_object(self.annotations_bucket, self._snapshot_index_key(blob_key))
+        except ObjectNotFoundError:
+            return None
+        return SnapshotBlobIndex.from_bytes(data)
+
+    def read_snapshot_blob_image(
+        self,
+        blob_key: str,
+        image_id: str,
+        index: Optional[SnapshotBlobIndex] = None
+    ) -> List[SnapshotRow]:
+        """
+        One image's snapshots, read with a ranged GET of the block holding it.
+
+        Args:
+            blob_key: Key of the snapshot blob
+            image_id: Image to read
+            index: The blob's index, if already loaded
+
+        Returns:
+            The image's snapshot rows (empty if the version has none)
+
+        Raises:
+            ObjectNotFoundError: If the blob has no index
+        """
+        if index is None:
+            index = self.get_snapshot_blob_index(blob_key)
+            if index is None:
+                raise ObjectNotFoundError(f"{self.annotations_bucket}/{self._snapshot_index_key(blob_key)}")
+
+        block = index.find_block(image_id)
+        if block is None:
+            return []
+
+        body = self.get_backend().open_object(
+            self.annotations_bucket,
+            blob_key,
+            byte_range=(block.offset, block.offset + block.length - 1)
+        )
+        try:
+            return parse_block(body.read(), image_id=image_id)
+        finally:
+            body.close()
+
+    def iter_snapshot_blob(self, blob_key: str) -> Iterator[SnapshotRow]:
+        """Stream all snapshots of a blob in image order. Raises ObjectNotFoundError."""
+        body = self.get_backend().open_object(self.annotations_bucket, blob_key)
+        try:
+            yield from iter_blob_rows(body)
+        finally:
+            body.close()
+
     def generate_presigned_url(
         self,
         bucket: str,
         key: str,
-        expiration: int = 3600
+        expiration: int = 3600,
+        storage_type: Optional[str] = None
     ) -> str:
         """
         Generate a URL for accessing an object.
@@ -180,23 +596,41 @@ class StorageClient:
         This allows the same code to work in both R2 and on-prem S3 environments
         without any code changes - just configure R2_PUBLIC_URL environment variable.
 
+        If S3_PRESIGN_WINDOW_SECONDS is set, the URL is cache-stable: it is signed
+        at the start of the current window and stays identical until the window ends.
+
         Args:
             bucket: Bucket name
             key: Object key
             expiration: URL expiration time in seconds (default: 1 hour)
+            storage_type: Dataset.storage_type of the object's dataset
+                (None = settings.STORAGE_BACKEND); local objects get signed
+                /api/v1/storage URLs
 
         Returns:
             URL string (either public R2.dev URL or presigned S3 URL)
         """
+        if settings.IMAGE_PROXY_ENABLED and bucket == self.datasets_bucket:
+            proxied = self._proxy_image_urls([key], expiration)
+            if key in proxied:
+                return proxied[key]
+
+        backend = self.get_backend(storage_type)
+        if backend.name == LOCAL_STORAGE_TYPE:
+            return backend.presign_get_many(bucket, [key], expiration)[key]
+
         # Check if R2 public URL is configured (for R2 development only)
         if settings.R2_PUBLIC_URL and bucket == self.datasets_bucket:
             # Use R2 public development URL
             # Format: https://pub-xxx.r2.dev/{key}
             return f"{settings.R2_PUBLIC_URL}/{key}"
 
+        if self._use_signing_window(expiration):
+            return self._generate_windowed_urls(bucket, [key], expiration)[key]
+
         # Fall back to presigned URL (S3/MinIO/on-prem compatible)
         try:
-            url = self.s3_client.generate_presigned_url(
+            url = self._get_client().generate_presigned_url(
                 'get_object',
                 Params={'Bucket': bucket, 'Key': key},
                 ExpiresIn=expiration
@@ -206,7 +640,157 @@ class StorageClient:
             logger.error(f"Failed to generate presigned URL for {key}: {e}")
             raise Exception(f"Failed to generate presigned URL: {str(e)}")
 
-    def get_image_url(self, dataset_id: str, filename: str, expiration: int = 3600) -> str:
+    def generate_presigned_urls(
+        self,
+        bucket: str,
+        keys: Iterable[str],
+        expiration: int = 3600,
+        storage_type: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Generate URLs for many objects in one call.
+
+        Same semantics as generate_presigned_url(), but signs locally: the SigV4
+        signing key is derived once per day/region/service and every key is
+        signed in a tight loop. Output is identical to boto3's presigned URLs.
+
+        Args:
+            bucket: Bucket name
+            keys: Object keys
+            expiration: URL expiration time in seconds (default: 1 hour)
+            storage_type: Dataset.storage_type of the objects' dataset
+                (None = settings.STORAGE_BACKEND)
+
+        Returns:
+            Dict mapping each object key to its URL
+        """
+        keys = list(dict.fromkeys(keys))
+
+        urls = {}
+        if settings.IMAGE_PROXY_ENABLED and bucket == self.datasets_bucket:
+            urls = self._proxy_image_urls(keys, expiration)
+            keys = [key for key in keys if key not in urls]
+            if not keys:
+                return urls
+
+        backend = self.get_backend(storage_type)
+        if backend.name == LOCAL_STORAGE_TYPE:
+            urls.update(backend.presign_get_many(bucket, keys, expiration))
+        else:
+            urls.update(self._presign_s3_urls(bucket, keys, expiration))
+        return urls
+
+    def _proxy_image_urls(self, keys: List[str], expiration: int) -> Dict[str, str]:
+        """
+        Signed /api/v1/images URLs for dataset originals (IMAGE_PROXY_ENABLED).
+
+        Only keys of the form ``datasets/{dataset_id}/images/{image_id}`` are
+        proxied; others (thumbnails, exports) are left to the caller. URLs are
+        signed per S3_PRESIGN_WINDOW_SECONDS window like presigned URLs, so they
+        stay stable and browser-cacheable.
+        """
+        window = settings.S3_PRESIGN_WINDOW_SECONDS
+        now = int(time.time())
+        if window > 0:
+            expires = now - now % window + expiration + window
+        else:
+            expires = now + expiration
+
+        base = settings.IMAGE_PROXY_URL_BASE.rstrip('/')
+        urls = {}
+        for key in keys:
+            parts = key.split('/', 3)
+            if len(parts) != 4 or parts[0] != 'datasets' or parts[2] != 'images' or not parts[3]:
+                continue
+            dataset_id, image_id = parts[1], parts[3]
+            signature = sign_local_url(settings.IMAGE_PROXY_URL_SECRET, dataset_id, image_id, expires)
+            urls[key] = (
+                f"{base}/{quote(dataset_id)}/{quote(image_id, safe='/~')}"
+                f"?expires={expires}&signature={signature}"
+            )
+        return urls
+
+    def verify_image_proxy_url(self, dataset_id: str, image_id: str, expires: int, signature: str) -> bool:
+        """Check the signature and expiry of a URL from _proxy_image_urls()."""
+        if expires < time.time():
+            return False
+        expected = sign_local_url(settings.IMAGE_PROXY_URL_SECRET, dataset_id, image_id, expires)
+        return hmac.compare_digest(expected, signature)
+
+    def _presign_s3_urls(self, bucket: str, keys: List[str], expiration: int) -> Dict[str, str]:
+        """S3 part of generate_presigned_urls() (R2 public URLs, local SigV4 or boto3)."""
+        if settings.R2_PUBLIC_URL and bucket == self.datasets_bucket:
+            return {key: f"{settings.R2_PUBLIC_URL}/{key}" for key in keys}
+
+        self._get_client()
+        if self._presigner is None:
+            # No custom endpoint (AWS virtual-host addressing) - let boto3 sign
+            return {
+                key: self._get_client().generate_presigned_url(
+                    'get_object',
+                    Params={'Bucket': bucket, 'Key': key},
+                    ExpiresIn=expiration
+                )
+                for key in keys
+            }
+
+        if self._use_signing_window(expiration):
+            return self._generate_windowed_urls(bucket, keys, expiration)
+
+        urls = self._presigner.presign_get_many(bucket, keys, expires=expiration)
+        return dict(zip(keys, urls))
+
+    def _use_signing_window(self, expiration: int) -> bool:
+        """Whether cache-stable (time-bucketed) signing applies to this request."""
+        window = settings.S3_PRESIGN_WINDOW_SECONDS
+        if window > 0:
+            self._get_client()
+        return (
+            window > 0
+            and self._presigner is not None
+            and expiration + window <= MAX_PRESIGN_EXPIRES
+        )
+
+    def _generate_windowed_urls(
+        self,
+        bucket: str,
+        keys: List[str],
+        expiration: int
+    ) -> Dict[str, str]:
+        """
+        Sign URLs at the start of the current time window.
+
+        The expiry is extended by the window length, so a URL handed out at the
+        very end of a window is still valid for at least `expiration` seconds.
+        Signed URLs are memoized per (bucket, key, window) in the process LRU.
+        """
+        window_start = signing_window(settings.S3_PRESIGN_WINDOW_SECONDS)
+        expires = expiration + settings.S3_PRESIGN_WINDOW_SECONDS
+
+        urls = {}
+        missing = []
+        for key in keys:
+            url = self._url_cache.get((bucket, key, window_start, expires))
+            if url is None:
+                missing.append(key)
+            else:
+                urls[key] = url
+
+        if missing:
+            signed = self._presigner.presign_get_many(bucket, missing, expires=expires, now=window_start)
+            for key, url in zip(missing, signed):
+                self._url_cache.put((bucket, key, window_start, expires), url)
+                urls[key] = url
+
+        return urls
+
+    def get_image_url(
+        self,
+        dataset_id: str,
+        filename: str,
+        expiration: int = 3600,
+        storage_type: Optional[str] = None
+    ) -> str:
         """
         Get presigned URL for a specific image.
 
@@ -214,6 +798,7 @@ class StorageClient:
             dataset_id: Dataset ID
             filename: Image filename
             expiration: URL expiration time in seconds
+            storage_type: Dataset.storage_type (None = settings.STORAGE_BACKEND)
 
         Returns:
             Presigned URL string
@@ -222,7 +807,8 @@ class StorageClient:
         return self.generate_presigned_url(
             bucket=self.datasets_bucket,
             key=key,
-            expiration=expiration
+            expiration=expiration,
+            storage_type=storage_type
         )
 
     def upload_annotation(
@@ -301,7 +887,7 @@ class StorageClient:
     def check_bucket_exists(self, bucket: str) -> bool:
         """Check if a bucket exists and is accessible."""
         try:
-            self.s3_client.head_bucket(Bucket=bucket)
+            self._get_client().head_bucket(Bucket=bucket)
             return True
         except ClientError:
             return False
@@ -313,7 +899,7 @@ class StorageClient:
         for bucket in required_buckets:
             if not self.check_bucket_exists(bucket):
                 try:
-                    self.s3_client.create_bucket(Bucket=bucket)
+                    self._get_client().create_bucket(Bucket=bucket)
                     logger.info(f"Created bucket: {bucket}")
                 except ClientError as e:
                     logger.error(f"Failed to create bucket {bucket}: {e}")
@@ -321,12 +907,86 @@ class StorageClient:
             else:
                 logger.info(f"Bucket exists: {bucket}")
 
+    def open_upload_stream(
+        self,
+        bucket: str,
+        key: str,
+        content_type: str = 'application/octet-stream',
+        metadata: Optional[Dict[str, str]] = None
+    ) -> MultipartUploadWriter:
+        """
+        Open a write-only stream that uploads to S3 with a multipart upload.
+
+        Memory stays bounded by S3_MULTIPART_PART_SIZE_MB * (S3_MULTIPART_CONCURRENCY + 1)
+        however much is written. Use as a context manager: the upload completes
+        on exit, or is aborted if the block raises.
+
+        Args:
+            bucket: Bucket name
+            key: Object key
+            content_type: Content-Type of the object
+            metadata: Optional user metadata
+
+        Returns:
+            MultipartUploadWriter
+        """
+        return MultipartUploadWriter(
+            self.s3_client,
+            bucket=bucket,
+            key=key,
+            content_type=content_type,
+            metadata=metadata,
+            part_size=settings.S3_MULTIPART_PART_SIZE_MB * 1024 * 1024,
+            max_concurrency=settings.S3_MULTIPART_CONCURRENCY
+        )
+
+    def upload_stream(
+        self,
+        bucket: str,
+        key: str,
+        data: UploadSource,
+        content_type: str = 'application/octet-stream',
+        metadata: Optional[Dict[str, str]] = None
+    ) -> int:
+        """
+        Upload bytes, a file-like object or an iterator of chunks to S3.
+
+        Small payloads go out as a single put_object; anything larger than one
+        part is streamed through a multipart upload (see open_upload_stream).
+
+        Args:
+            bucket: Bucket name
+            key: Object key
+            data: bytes, object with read(), or iterable of bytes/str chunks
+            content_type: Content-Type of the object
+            metadata: Optional user metadata
+
+        Returns:
+            Number of bytes uploaded
+        """
+        writer = self.open_upload_stream(bucket, key, content_type=content_type, metadata=metadata)
+        with writer:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                view = memoryview(data)
+                for start in range(0, len(view), writer.part_size):
+                    writer.write(view[start:start + writer.part_size])
+            elif hasattr(data, 'read'):
+                while True:
+                    chunk = data.read(writer.part_size)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+            else:
+                for chunk in data:
+                    writer.write(chunk)
+        return writer.bytes_written
+
     def upload_export(
         self,
         project_id: str,
         task_type: str,
         version_number: str,
-        export_data: bytes,
+        export_data: UploadSource,
         export_format: str,
         filename: str
     ) -> tuple[str, str, datetime]:
@@ -337,7 +997,7 @@ class StorageClient:
             project_id: Project ID
             task_type: Task type (classification, detection, segmentation)
             version_number: Version number (e.g., "v1.0")
-            export_data: Export file data as bytes
+            export_data: Export file data (bytes, file-like object or iterator of chunks)
             export_format: Export format (coco, yolo, dice, etc.)
             filename: Export filename
 
@@ -352,13 +1012,13 @@ class StorageClient:
             # Determine content type
             content_type = 'application/json' if export_format in ['coco', 'dice'] else 'application/zip'
 
-            # Upload to S3
-            self.s3_client.put_object(
-                Bucket=self.annotations_bucket,
-                Key=key,
-                Body=export_data,
-                ContentType=content_type,
-                Metadata={
+            # Upload to S3 (streamed as multipart for large exports)
+            size = self.upload_stream(
+                bucket=self.annotations_bucket,
+                key=key,
+                data=export_data,
+                content_type=content_type,
+                metadata={
                     'project_id': project_id,
                     'version': version_number,
                     'format': export_format,
@@ -376,7 +1036,7 @@ class StorageClient:
 
             expires_at = datetime.utcnow() + timedelta(seconds=expiration_seconds)
 
-            logger.info(f"Uploaded export: {key} ({len(export_data)} bytes)")
+            logger.info(f"Uploaded export: {key} ({size} bytes)")
             return key, presigned_url, expires_at
 
         except ClientError as e:
@@ -412,6 +1072,42 @@ class StorageClient:
             logger.error(f"Failed to parse JSON from {target_bucket}/{key}: {e}")
             return None
 
+    def iter_json_items(
+        self,
+        key: str,
+        paths: Iterable[str] = ("images",),
+        bucket: Optional[str] = None,
+        chunk_size: int = 256 * 1024
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        Stream elements of top-level arrays from a JSON object in S3.
+
+        Unlike get_json(), the document is never fully loaded: memory stays
+        proportional to one chunk plus one array element (e.g. one DICE image).
+
+        Args:
+            key: S3 object key
+            paths: Top-level members to iterate (e.g. ("images",)); "" for a root array
+            bucket: Bucket name (default: datasets bucket)
+            chunk_size: Bytes read from S3 per chunk
+
+        Yields:
+            (path, element) tuples in document order
+
+        Raises:
+            ClientError: If the object cannot be read (e.g. NoSuchKey)
+            ValueError: If the object is not valid JSON
+        """
+        response = self.s3_client.get_object(
+            Bucket=bucket or self.datasets_bucket,
+            Key=key
+        )
+        body = response['Body']
+        try:
+            yield from iter_json_items(body.iter_chunks(chunk_size=chunk_size), paths=paths)
+        finally:
+            body.close()
+
     def regenerate_presigned_url(
         self,
         s3_key: str,
@@ -447,8 +1143,9 @@ class StorageClient:
         self,
         dataset_id: str,
         task_type: str,
-        dice_data: bytes,
-        version_number: str
+        dice_data: Optional[UploadSource],
+        version_number: str,
+        export_key: Optional[str] = None
     ) -> str:
         """
         Update official task-specific annotations file in Platform S3.
@@ -459,8 +1156,10 @@ class StorageClient:
         Args:
             dataset_id: Dataset ID
             task_type: Task type (classification, detection, segmentation)
-            dice_data: DICE format data as bytes
+            dice_data: DICE format data (bytes, file-like object or iterator of chunks)
             version_number: Version number for metadata
+            export_key: Key of an uploaded DICE export (see upload_export) to
+                copy server-side instead of uploading dice_data
 
         Returns:
             S3 key
@@ -469,22 +1168,37 @@ class StorageClient:
             # Phase 2.9: Task-specific annotation files
             # S3 key: datasets/{dataset_id}/annotations_{task_type}.json
             key = f"datasets/{dataset_id}/annotations_{task_type}.json"
+            metadata = {
+                'dataset_id': dataset_id,
+                'task_type': task_type,
+                'version': version_number,
+                'format': 'dice',
+                'updated_at': datetime.utcnow().isoformat(),
+                'source': 'labeler_publish'
+            }
 
-            # Upload to Platform datasets bucket
-            self.s3_client.put_object(
-                Bucket=self.datasets_bucket,
-                Key=key,
-                Body=dice_data,
-                ContentType='application/json',
-                Metadata={
-                    'dataset_id': dataset_id,
-                    'task_type': task_type,
-                    'version': version_number,
-                    'format': 'dice',
-                    'updated_at': datetime.utcnow().isoformat(),
-                    'source': 'labeler_publish'
-                }
-            )
+            if export_key:
+                # Copied inside S3 (multipart copy for large files): the
+                # export is not downloaded or generated a second time
+                self.s3_client.copy(
+                    CopySource={'Bucket': self.annotations_bucket, 'Key': export_key},
+                    Bucket=self.datasets_bucket,
+                    Key=key,
+                    ExtraArgs={
+                        'ContentType': 'application/json',
+                        'Metadata': metadata,
+                        'MetadataDirective': 'REPLACE'
+                    }
+                )
+            else:
+                # Upload to Platform datasets bucket (streamed as multipart for large files)
+                self.upload_stream(
+                    bucket=self.datasets_bucket,
+                    key=key,
+                    data=dice_data,
+                    content_type='application/json',
+                    metadata=metadata
+                )
 
             logger.info(f"Updated Platform S3 annotations: {key} (task: {task_type}, version: {version_number})")
             return key
@@ -0,0 +1,812 @@
+"""
+Storage Backends
+
+Pluggable object storage used by StorageClient, selected per dataset by
+``Dataset.storage_type`` (default from ``settings.STORAGE_BACKEND``):
+
+- S3StorageBackend: S3 / MinIO / R2 through boto3 (``"s3"``, ``"r2"``, ...)
+- LocalStorageBackend: a directory tree on a local NVMe/NFS volume (``"local"``)
+
+Both expose the same bucket/key model and the same operations (list, head,
+get, open, put, delete, presigned GET URLs, presigned PUT and multipart
+uploads for direct browser uploads), and both pass the shared suite in
+tests/test_storage_backends.py.
+
+Local layout is ``{root}/{bucket}/{key}``. Local "presigned" URLs point at the
+/api/v1/storage endpoint and carry an HMAC signature + expiry, so they can be
+used from <img> tags exactly like S3 presigned URLs. Presigned PUT URLs sign
+the method (and upload id / part number) too, so a GET URL never allows
+writes. Multipart uploads keep their parts under ``{root}/.multipart-uploads``
+until completed.
+"""
+
+import fcntl
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Backend names accepted in Dataset.storage_type / settings.STORAGE_BACKEND
+LOCAL_STORAGE_TYPE = "local"
+
+_TEMP_PREFIX = ".upload-"
+_TEMP_SUFFIX = ".tmp"
+_MULTIPART_DIR = ".multipart-uploads"
+
+# S3 limits for multipart uploads
+MAX_UPLOAD_PARTS = 10000
+
+
+class ObjectNotFoundError(Exception):
+    """Raised when a requested object does not exist."""
+
+
+class PreconditionFailedError(Exception):
+    """Raised when a conditional write finds the object changed (or gone) since it was read."""
+
+
+class UploadVerificationError(Exception):
+    """Raised when a multipart upload cannot be completed (unknown or mismatched parts)."""
+
+
+class UploadNotFoundError(UploadVerificationError):
+    """Raised when a multipart upload does not exist (never created, aborted or already completed)."""
+
+
+class UploadPart(NamedTuple):
+    """One stored part of a multipart upload."""
+
+    part_number: int
+    etag: str
+    size: int
+
+
+class StorageObject(NamedTuple):
+    """Metadata of one stored object."""
+
+    key: str
+    size: int
+    last_modified: datetime  # timezone-aware (UTC)
+    etag: str
+
+
+class StorageBackend(ABC):
+    """Common interface of all storage backends."""
+
+    name: str
+
+    @abstractmethod
+    def list_objects(
+        self,
+        bucket: str,
+        prefix: str = "",
+        start_after: Optional[str] = None
+    ) -> Iterator[StorageObject]:
+        """Yield objects under ``prefix`` in S3 key order (UTF-8 bytes), after ``start_after``."""
+
+    @abstractmethod
+    def head_object(self, bucket: str, key: str) -> Optional[StorageObject]:
+        """Return object metadata, or None if the object does not exist."""
+
+    @abstractmethod
+    def open_object(self, bucket: str, key: str, byte_range: Optional[Tuple[int, int]] = None) -> BinaryIO:
+        """
+        Open an object for streaming reads. Raises ObjectNotFoundError.
+
+        ``byte_range`` is an inclusive ``(first, last)`` pair (HTTP Range
+        semantics); the returned stream then yields only those bytes.
+        """
+
+    @abstractmethod
+    def put_object(
+        self,
+        bucket: str,
+        key: str,
+        data: Union[bytes, BinaryIO],
+        content_type: Optional[str] = None,
+        if_match: Optional[str] = None
+    ) -> str:
+        """
+        Store an object (replacing any existing one). Returns its ETag.
+
+        With ``if_match``, the object is only replaced if its current ETag
+        equals it; otherwise PreconditionFailedError is raised (read-modify-
+        write without losing concurrent updates).
+        """
+
+    @abstractmethod
+    def copy_object(self, bucket: str, source_key: str, key: str) -> str:
+        """
+        Copy an object within a bucket without transferring its bytes through
+        this process (server-side on S3). Returns the new ETag.
+        Raises ObjectNotFoundError.
+        """
+
+    @abstractmethod
+    def delete_objects(self, bucket: str, keys: Iterable[str]) -> int:
+        """Delete objects (missing keys are ignored). Returns the number of keys processed."""
+
+    @abstractmethod
+    def presign_get_many(self, bucket: str, keys: Iterable[str], expiration: int = 3600) -> Dict[str, str]:
+        """Return time-limited GET URLs for many objects."""
+
+    @abstractmethod
+    def presign_put(
+        self,
+        bucket: str,
+        key: str,
+        content_type: Optional[str] = None,
+        expiration: int = 3600
+    ) -> str:
+        """
+        Return a time-limited URL that stores an object with one PUT request.
+
+        The response of the PUT carries the object's ETag header. When
+        ``content_type`` is given the request must send the same Content-Type.
+        """
+
+    @abstractmethod
+    def create_multipart_upload(self, bucket: str, key: str, content_type: Optional[str] = None) -> str:
+        """Start a multipart upload. Returns its upload id."""
+
+    @abstractmethod
+    def presign_upload_parts(
+        self,
+        bucket: str,
+        key: str,
+        upload_id: str,
+        part_numbers: Iterable[int],
+        expiration: int = 3600
+    ) -> Dict[int, str]:
+        """Return time-limited PUT URLs for parts (1..MAX_UPLOAD_PARTS) of a multipart upload."""
+
+    @abstractmethod
+    def upload_part(
+        self,
+        bucket: str,
+        key: str,
+        upload_id: str,
+        part_number: int,
+        data: Union[bytes, BinaryIO]
+    ) -> str:
+        """Store one part of a multipart upload. Returns the part's ETag."""
+
+    @abstractmethod
+    def list_parts(self, bucket: str, key: str, upload_id: str) -> List[UploadPart]:
+        """Parts stored so far, by part number. Raises UploadNotFoundError."""
+
+    @abstractmethod
+    def complete_multipart_upload(
+        self,
+        bucket: str,
+        key: str,
+        upload_id: str,
+        parts: Iterable[Tuple[int, str]]
+    ) -> str:
+        """
+        Assemble the object from ``(part_number, etag)`` pairs in ascending order.
+
+        Raises UploadVerificationError when a part is missing or its ETag does
+        not match what was stored (UploadNotFoundError for unknown uploads).
+
+        Returns:
+            ETag of the completed object
+        """
+
+    @abstractmethod
+    def abort_multipart_upload(self, bucket: str, key: str, upload_id: str) -> None:
+        """Discard a multipart upload and its parts (unknown uploads are ignored)."""
+
+    def get_object(self, bucket: str, key: str) -> bytes:
+        """Read a whole object into memory. Raises ObjectNotFoundError."""
+        f = self.open_object(bucket, key)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def exists(self, bucket: str, key: str) -> bool:
+        return self.head_object(bucket, key) is not None
+
+
+# =============================================================================
+# S3 / MinIO / R2
+# =============================================================================
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    Backend on top of a boto3 S3 client.
+
+    Args:
+        client_provider: Returns the boto3 client (lets StorageClient keep it lazy)
+        presigner: Optional batch URL signer ``(bucket, keys, expiration) -> {key: url}``;
+            defaults to boto3's generate_presigned_url per key
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        client_provider: Callable[[], Any],
+        presigner: Optional[Callable[[str, List[str], int], Dict[str, str]]] = None
+    ):
+        self._client_provider = client_provider
+        self._presigner = presigner
+
+    @property
+    def client(self):
+        return self._client_provider()
+
+    def list_objects(self, bucket, prefix="", start_after=None):
+        params = {'Bucket': bucket, 'Prefix': prefix}
+        if start_after:
+            params['StartAfter'] = start_after
+
+        while True:
+            response = self.client.list_objects_v2(**params)
+            for obj in response.get('Contents', []):
+                yield StorageObject(
+                    key=obj['Key'],
+                    size=obj['Size'],
+                    last_modified=obj['LastModified'],
+                    etag=obj.get('ETag', '').strip('"')
+                )
+            if not response.get('IsTruncated'):
+                return
+            params.pop('StartAfter', None)
+            params['ContinuationToken'] = response['NextContinuationToken']
+
+    def head_object(self, bucket, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return StorageObject(
+            key=key,
+            size=response['ContentLength'],
+            last_modified=response['LastModified'],
+            etag=response.get('ETag', '').strip('"')
+        )
+
+    def open_object(self, bucket, key, byte_range=None):
+        from botocore.exceptions import ClientError
+
+        params = {'Bucket': bucket, 'Key': key}
+        if byte_range is not None:
+            params['Range'] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        try:
+            response = self.client.get_object(**params)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                raise ObjectNotFoundError(f"{bucket}/{key}")
+            raise
+        return response['Body']
+
+    def put_object(self, bucket, key, data, content_type=None, if_match=None):
+        from botocore.exceptions import ClientError
+
+        params = {'Bucket': bucket, 'Key': key, 'Body': data}
+        if content_type:
+            params['ContentType'] = content_type
+        if if_match is not None:
+            params['IfMatch'] = '"' + if_match.strip('"') + '"'
+        try:
+            response = self.client.put_object(**params)
+        except ClientError as e:
+            # 412 = ETag changed, 409 = concurrent conditional write, 404 = object gone
+            if if_match is not None and e.response['Error']['Code'] in (
+                '412', 'PreconditionFailed', '409', 'ConditionalRequestConflict', '404', 'NoSuchKey'
+            ):
+                raise PreconditionFailedError(f"{bucket}/{key}")
+            raise
+        return response.get('ETag', '').strip('"')
+
+    def copy_object(self, bucket, source_key, key):
+        from botocore.exceptions import ClientError
+
+        # Single CopyObject request (objects up to 5 GB); metadata is copied too
+        try:
+            response = self.client.copy_object(
+                Bucket=bucket, Key=key, CopySource={'Bucket': bucket, 'Key': source_key}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                raise ObjectNotFoundError(f"{bucket}/{source_key}")
+            raise
+        return response['CopyObjectResult'].get('ETag', '').strip('"')
+
+    def delete_objects(self, bucket, keys):
+        keys = list(keys)
+        # S3 accepts at most 1000 keys per DeleteObjects request
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]], 'Quiet': True}
+            )
+        return len(keys)
+
+    def presign_get_many(self, bucket, keys, expiration=3600):
+        keys = list(dict.fromkeys(keys))
+        if self._presigner is not None:
+            return self._presigner(bucket, keys, expiration)
+        return {
+            key: self.client.generate_presigned_url(
+                'get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=expiration
+            )
+            for key in keys
+        }
+
+    def presign_put(self, bucket, key, content_type=None, expiration=3600):
+        params = {'Bucket': bucket, 'Key': key}
+        if content_type:
+            params['ContentType'] = content_type
+        return self.client.generate_presigned_url('put_object', Params=params, ExpiresIn=expiration)
+
+    def create_multipart_upload(self, bucket, key, content_type=None):
+        params = {'Bucket': bucket, 'Key': key}
+        if content_type:
+            params['ContentType'] = content_type
+        return self.client.create_multipart_upload(**params)['UploadId']
+
+    def presign_upload_parts(self, bucket, key, upload_id, part_numbers, expiration=3600):
+        return {
+            part_number: self.client.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': bucket, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+                ExpiresIn=expiration
+            )
+            for part_number in dict.fromkeys(part_numbers)
+        }
+
+    def upload_part(self, bucket, key, upload_id, part_number, data):
+        with _upload_errors():
+            response = self.client.upload_part(
+                Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data
+            )
+        return response['ETag'].strip('"')
+
+    def list_parts(self, bucket, key, upload_id):
+        params = {'Bucket': bucket, 'Key': key, 'UploadId': upload_id}
+        parts = []
+        with _upload_errors():
+            while True:
+                response = self.client.list_parts(**params)
+                parts.extend(
+                    UploadPart(part['PartNumber'], part['ETag'].strip('"'), part['Size'])
+                    for part in response.get('Parts', [])
+                )
+                if not response.get('IsTruncated'):
+                    return parts
+                params['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    def complete_multipart_upload(self, bucket, key, upload_id, parts):
+        with _upload_errors():
+            response = self.client.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': part_number, 'ETag': '"' + etag.strip('"') + '"'}
+                    for part_number, etag in parts
+                ]}
+            )
+        return response.get('ETag', '').strip('"')
+
+    def abort_multipart_upload(self, bucket, key, upload_id):
+        try:
+            with _upload_errors():
+                self.client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        except UploadNotFoundError:
+            pass
+
+
+# S3 error codes of CompleteMultipartUpload / UploadPart that mean "the upload does not verify"
+_UPLOAD_ERROR_CODES = ('InvalidPart', 'InvalidPartOrder', 'EntityTooSmall', 'MalformedXML', 'InvalidRequest')
+
+
+@contextmanager
+def _upload_errors():
+    """Translate S3 multipart errors into UploadVerificationError / UploadNotFoundError."""
+    from botocore.exceptions import ClientError
+
+    try:
+        yield
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in ('NoSuchUpload', '404'):
+            raise UploadNotFoundError(str(e)) from e
+        if code in _UPLOAD_ERROR_CODES:
+            raise UploadVerificationError(str(e)) from e
+        raise
+
+
+# =============================================================================
+# Local filesystem (NVMe / NFS)
+# =============================================================================
+
+
+class _RangeReader(io.RawIOBase):
+    """Read at most ``length`` bytes from an already positioned file."""
+
+    def __init__(self, f: BinaryIO, length: int):
+        self._f = f
+        self._remaining = max(length, 0)
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size) if size else b""
+        self._remaining -= len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        self._f.close()
+        super().close()
+
+
+class _ChunkReader(io.RawIOBase):
+    """File-like view of an iterator of byte chunks (for put_object)."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size is None or size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def sign_local_url(secret: str, bucket: str, key: str, expires: int, *scope: str) -> str:
+    """
+    HMAC signature for a local storage URL (bucket, key, expiry timestamp).
+
+    ``scope`` narrows what the URL allows beyond reading, e.g. ``("PUT",)``
+    or ``("PUT", upload_id, part_number)``; GET URLs have no scope.
+    """
+    message = "\n".join([bucket, key, str(expires), *scope]).encode("utf-8")
+    return hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Backend storing objects as files under ``{root}/{bucket}/{key}``.
+
+    Writes go to a temp file in the target directory and are renamed into
+    place, so readers never see partial objects. ETags are derived from
+    size + mtime (not a content hash) and change whenever the file changes.
+
+    Args:
+        root: Storage root directory
+        url_base: Prefix for presigned URLs (the /api/v1/storage endpoint)
+        url_secret: HMAC secret for presigned URLs
+        window_seconds: Round signing time down to this window so URLs stay
+            identical (and browser-cacheable) within it; 0 disables
+        now: Clock returning a Unix timestamp (for tests)
+    """
+
+    name = LOCAL_STORAGE_TYPE
+
+    def __init__(
+        self,
+        root: str,
+        url_base: str = "/api/v1/storage",
+        url_secret: str = "",
+        window_seconds: int = 0,
+        now: Optional[Callable[[], float]] = None
+    ):
+        self.root = os.path.abspath(root)
+        self.url_base = url_base.rstrip("/")
+        self._url_secret = url_secret
+        self._window_seconds = window_seconds
+        self._now = now or (lambda: datetime.now(timezone.utc).timestamp())
+
+    # Paths ---------------------------------------------------------------
+
+    def _bucket_root(self, bucket: str) -> str:
+        if not bucket or "/" in bucket or bucket in (".", ".."):
+            raise ValueError(f"Invalid bucket name: {bucket!r}")
+        return os.path.join(self.root, bucket)
+
+    def path_for(self, bucket: str, key: str) -> str:
+        """Filesystem path of an object; rejects keys escaping the bucket."""
+        parts = key.split("/")
+        if not key or key.startswith("/") or "\0" in key or any(part in ("", ".", "..") for part in parts):
+            raise ValueError(f"Invalid object key: {key!r}")
+        return os.path.join(self._bucket_root(bucket), *parts)
+
+    @staticmethod
+    def _to_object(key: str, stat: os.stat_result) -> StorageObject:
+        return StorageObject(
+            key=key,
+            size=stat.st_size,
+            last_modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+            etag=f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        )
+
+    # Operations ----------------------------------------------------------
+
+    def list_objects(self, bucket, prefix="", start_after=None):
+        bucket_root = self._bucket_root(bucket)
+        # Only walk the deepest directory the prefix pins down
+        base_dir = prefix.rsplit("/", 1)[0] if "/" in prefix else ""
+        walk_root = os.path.join(bucket_root, *base_dir.split("/")) if base_dir else bucket_root
+        if not os.path.isdir(walk_root):
+            return
+
+        entries = []
+        for dirpath, _, filenames in os.walk(walk_root):
+            rel_dir = os.path.relpath(dirpath, bucket_root).replace(os.sep, "/")
+            for filename in filenames:
+                if filename.startswith(_TEMP_PREFIX) and filename.endswith(_TEMP_SUFFIX):
+                    continue
+                key = filename if rel_dir == "." else f"{rel_dir}/{filename}"
+                if key.startswith(prefix):
+                    entries.append((key.encode("utf-8"), key, os.path.join(dirpath, filename)))
+
+        entries.sort()
+        start = start_after.encode("utf-8") if start_after else None
+        for key_bytes, key, path in entries:
+            if start is not None and key_bytes <= start:
+                continue
+            try:
+                yield self._to_object(key, os.stat(path))
+            except FileNotFoundError:
+                continue  # Deleted while listing
+
+    def head_object(self, bucket, key):
+        path = self.path_for(bucket, key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            return self._to_object(key, os.stat(path))
+        except FileNotFoundError:
+            return None
+
+    def open_object(self, bucket, key, byte_range=None):
+        try:
+            f = open(self.path_for(bucket, key), "rb")
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            raise ObjectNotFoundError(f"{bucket}/{key}")
+        if byte_range is None:
+            return f
+        f.seek(byte_range[0])
+        return _RangeReader(f, byte_range[1] - byte_range[0] + 1)
+
+    def put_object(self, bucket, key, data, content_type=None, if_match=None):
+        path = self.path_for(bucket, key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        if if_match is None:
+            return self._write_file(key, path, directory, data)
+
+        # Conditional writes to one directory are serialized, so the ETag
+        # check and the replace cannot interleave with another conditional write
+        directory_fd = os.open(directory, os.O_RDONLY)
+        try:
+            fcntl.flock(directory_fd, fcntl.LOCK_EX)
+            current = self.head_object(bucket, key)
+            if current is None or current.etag != if_match.strip('"'):
+                raise PreconditionFailedError(f"{bucket}/{key}")
+            return self._write_file(key, path, directory, data)
+        finally:
+            os.close(directory_fd)
+
+    def _write_file(self, key, path, directory, data) -> str:
+        """Write via a temp file + atomic rename; returns the new ETag."""
+        fd, temp_path = tempfile.mkstemp(prefix=_TEMP_PREFIX, suffix=_TEMP_SUFFIX, dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f, length=1024 * 1024)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        return self._to_object(key, os.stat(path)).etag
+
+    def copy_object(self, bucket, source_key, key):
+        with self.open_object(bucket, source_key) as f:
+            return self.put_object(bucket, key, f)
+
+    def delete_objects(self, bucket, keys):
+        bucket_root = self._bucket_root(bucket)
+        count = 0
+        for key in keys:
+            path = self.path_for(bucket, key)
+            count += 1
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            # Prune now-empty parent directories (S3 has no directories)
+            directory = os.path.dirname(path)
+            while directory != bucket_root:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+        return count
+
+    def presign_get_many(self, bucket, keys, expiration=3600):
+        now = int(self._now())
+        if self._window_seconds > 0:
+            # Same URL for the whole window; still valid >= expiration seconds
+            expires = now - now % self._window_seconds + expiration + self._window_seconds
+        else:
+            expires = now + expiration
+        return {key: self._signed_url(bucket, key, expires) for key in dict.fromkeys(keys)}
+
+    def verify_url(self, bucket: str, key: str, expires: int, signature: str, *scope: str) -> bool:
+        """Check a presigned URL's signature and expiry (``scope`` as passed to sign_local_url)."""
+        if expires < self._now():
+            return False
+        expected = sign_local_url(self._url_secret, bucket, key, expires, *scope)
+        return hmac.compare_digest(expected, signature)
+
+    def _signed_url(self, bucket: str, key: str, expires: int, *scope: str, **params: str) -> str:
+        query = "".join(f"&{name}={quote(str(value))}" for name, value in params.items())
+        return (
+            f"{self.url_base}/{quote(bucket)}/{quote(key, safe='/~')}"
+            f"?expires={expires}&signature={sign_local_url(self._url_secret, bucket, key, expires, *scope)}"
+            f"{query}"
+        )
+
+    # Uploads (direct browser uploads through the storage endpoint) --------
+
+    def presign_put(self, bucket, key, content_type=None, expiration=3600):
+        self.path_for(bucket, key)
+        return self._signed_url(bucket, key, int(self._now()) + expiration, "PUT")
+
+    def create_multipart_upload(self, bucket, key, content_type=None):
+        self.path_for(bucket, key)
+        upload_id = uuid.uuid4().hex
+        directory = os.path.join(self.root, _MULTIPART_DIR, upload_id)
+        os.makedirs(directory)
+        with open(os.path.join(directory, "upload.json"), "w") as f:
+            json.dump({"bucket": bucket, "key": key}, f)
+        return upload_id
+
+    def presign_upload_parts(self, bucket, key, upload_id, part_numbers, expiration=3600):
+        expires = int(self._now()) + expiration
+        return {
+            part_number: self._signed_url(
+                bucket, key, expires, "PUT", upload_id, str(part_number),
+                uploadId=upload_id, partNumber=str(part_number)
+            )
+            for part_number in dict.fromkeys(part_numbers)
+        }
+
+    def _upload_dir(self, bucket: str, key: str, upload_id: str) -> str:
+        """Directory of an open multipart upload for this bucket/key."""
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+            raise UploadNotFoundError(f"Unknown upload {upload_id!r}")
+        directory = os.path.join(self.root, _MULTIPART_DIR, upload_id)
+        try:
+            with open(os.path.join(directory, "upload.json")) as f:
+                target = json.load(f)
+        except FileNotFoundError:
+            raise UploadNotFoundError(f"Unknown upload {upload_id!r}")
+        if target != {"bucket": bucket, "key": key}:
+            raise UploadNotFoundError(f"Upload {upload_id!r} belongs to another object")
+        return directory
+
+    def upload_part(self, bucket, key, upload_id, part_number, data):
+        if not 1 <= part_number <= MAX_UPLOAD_PARTS:
+            raise ValueError(f"Invalid part number: {part_number}")
+        directory = self._upload_dir(bucket, key, upload_id)
+
+        md5 = hashlib.md5()
+        fd, temp_path = tempfile.mkstemp(prefix=_TEMP_PREFIX, suffix=_TEMP_SUFFIX, dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    md5.update(data)
+                    f.write(data)
+                else:
+                    for chunk in iter(lambda: data.read(1024 * 1024), b""):
+                        md5.update(chunk)
+                        f.write(chunk)
+            etag = md5.hexdigest()
+            # The ETag is part of the name: a re-uploaded part replaces the file atomically
+            for name in os.listdir(directory):
+                if name.startswith(f"{part_number:05d}."):
+                    os.unlink(os.path.join(directory, name))
+            os.replace(temp_path, os.path.join(directory, f"{part_number:05d}.{etag}"))
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return etag
+
+    def _stored_parts(self, directory: str) -> Dict[int, UploadPart]:
+        parts = {}
+        for name in os.listdir(directory):
+            number, _, etag = name.partition(".")
+            if number.isdigit() and etag:
+                try:
+                    size = os.stat(os.path.join(directory, name)).st_size
+                except FileNotFoundError:
+                    continue
+                parts[int(number)] = UploadPart(int(number), etag, size)
+        return parts
+
+    def list_parts(self, bucket, key, upload_id):
+        parts = self._stored_parts(self._upload_dir(bucket, key, upload_id))
+        return [parts[number] for number in sorted(parts)]
+
+    def complete_multipart_upload(self, bucket, key, upload_id, parts):
+        directory = self._upload_dir(bucket, key, upload_id)
+        stored = self._stored_parts(directory)
+        parts = [(part_number, etag.strip('"')) for part_number, etag in parts]
+        if not parts:
+            raise UploadVerificationError("No parts given")
+        previous = 0
+        for part_number, etag in parts:
+            if part_number <= previous:
+                raise UploadVerificationError("Parts must be in ascending order")
+            previous = part_number
+            if part_number not in stored or stored[part_number].etag != etag:
+                raise UploadVerificationError(f"Part {part_number} is missing or its ETag does not match")
+
+        def chunks():
+            for part_number, etag in parts:
+                with open(os.path.join(directory, f"{part_number:05d}.{etag}"), "rb") as f:
+                    yield from iter(lambda: f.read(1024 * 1024), b"")
+
+        etag = self.put_object(bucket, key, _ChunkReader(chunks()))
+        shutil.rmtree(directory, ignore_errors=True)
+        return etag
+
+    def abort_multipart_upload(self, bucket, key, upload_id):
+        try:
+            directory = self._upload_dir(bucket, key, upload_id)
+        except UploadNotFoundError:
+            return
+        shutil.rmtree(directory, ignore_errors=True)
@@ -15,7 +15,7 @@ from typing import Dict, List
 
 from sqlalchemy import (
     Boolean, Column, DateTime, Integer, String, Text, ARRAY,
-    BigInteger, Index, JSON, ForeignKey, UniqueConstraint, CheckConstraint
+    BigInteger, Index, JSON, ForeignKey, LargeBinary, UniqueConstraint, CheckConstraint, text
 )
 from sqlalchemy.dialects.postgresql import JSONB
 
@@ -216,6 +216,8 @@ class ImageMetadata(LabelerBase):
     size = Column(BigInteger, nullable=False)  # File size in bytes
     width = Column(Integer)  # Image width in pixels (optional)
     height = Column(Integer)  # Image height in pixels (optional)
+    thumbnail_sizes = Column(String(50))  # Pyramid levels stored, e.g. "128,512,1024" ("" = none or queued, NULL = legacy thumbnail)
+    content_hash = Column(String(64))  # SHA-256 (hex) of the file when ingested; NULL = unknown (legacy, direct upload)
 
     # Timestamps
     uploaded_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -226,12 +228,114 @@ class ImageMetadata(LabelerBase):
         Index("ix_image_metadata_dataset", "dataset_id"),
         Index("ix_image_metadata_folder", "dataset_id", "folder_path"),
         Index("ix_image_metadata_uploaded", "dataset_id", "uploaded_at"),
+        Index("ix_image_metadata_content_hash", "dataset_id", "content_hash"),
     )
 
     def __repr__(self):
         return f"<ImageMetadata(id='{self.id}', file_name='{self.file_name}', dataset_id='{self.dataset_id}')>"
 
 
+class ThumbnailJob(LabelerBase):
+    """
+    Pending thumbnail pyramid for one image (persistent work queue).
+
+    Uploads only enqueue a job; thumbnail workers claim due jobs with
+    SELECT ... FOR UPDATE SKIP LOCKED and delete them once the pyramid is
+    stored. At most one job per image: re-enqueueing resets it.
+    """
+
+    __tablename__ = "thumbnail_jobs"
+
+    id = Column(Integer, primary_key=True)
+    dataset_id = Column(
+        String(100),
+        ForeignKey('datasets.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    image_id = Column(String(200), nullable=False)  # image_metadata.id
+
+    status = Column(String(20), nullable=False, default="pending")  # pending, failed (attempts exhausted)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Due time: retry backoff, or the lease expiry while a worker holds the job
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('dataset_id', 'image_id', name='uq_thumbnail_job_image'),
+        Index("ix_thumbnail_jobs_due", "status", "run_after"),
+    )
+
+    def __repr__(self):
+        return f"<ThumbnailJob(id={self.id}, dataset_id='{self.dataset_id}', image_id='{self.image_id}', status='{self.status}')>"
+
+
+class UploadSession(LabelerBase):
+    """
+    Direct-to-storage browser upload of many files into one dataset.
+
+    The browser PUTs files straight to S3/R2 (presigned PUT or multipart URLs)
+    and reports completed files back; the session remembers which files are
+    done, so an interrupted upload resumes where it stopped.
+    """
+
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(50), primary_key=True)  # us_{hex}
+    dataset_id = Column(
+        String(100),
+        ForeignKey('datasets.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True
+    )
+    created_by = Column(String(36), nullable=False)  # Keycloak user sub
+
+    status = Column(String(20), nullable=False, default="active")  # active, completed, aborted
+    total_files = Column(Integer, nullable=False, default=0)
+    total_bytes = Column(BigInteger, nullable=False, default=0)
+    completed_files = Column(Integer, nullable=False, default=0)
+    completed_bytes = Column(BigInteger, nullable=False, default=0)
+
+    expires_at = Column(DateTime, nullable=False)  # Extended on every URL request
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UploadSession(id='{self.id}', dataset_id='{self.dataset_id}', status='{self.status}')>"
+
+
+class UploadSessionFile(LabelerBase):
+    """One file of an upload session."""
+
+    __tablename__ = "upload_session_files"
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(
+        String(50),
+        ForeignKey('upload_sessions.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    image_id = Column(String(200), nullable=False)  # Relative path = image_metadata.id
+
+    size = Column(BigInteger, nullable=False)  # Declared by the client, verified on completion
+    content_type = Column(String(100))
+    upload_id = Column(String(1024))  # Multipart upload id (NULL = single PUT or not started)
+
+    status = Column(String(20), nullable=False, default="pending")  # pending, completed
+    etag = Column(String(100))  # ETag of the stored object once completed
+    completed_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint('session_id', 'image_id', name='uq_upload_session_file'),
+        Index("ix_upload_session_files_status", "session_id", "status", "image_id"),
+    )
+
+    def __repr__(self):
+        return f"<UploadSessionFile(session_id='{self.session_id}', image_id='{self.image_id}', status='{self.status}')>"
+
+
 class AnnotationProject(LabelerBase):
     """Annotation project."""
 
@@ -514,6 +618,9 @@ class AnnotationVersion(LabelerBase):
     download_url = Column(Text)  # Presigned S3 URL
     download_url_expires_at = Column(DateTime)  # When the presigned URL expires
 
+    # Compressed, image-indexed snapshot blob in the annotations bucket (see app.core.snapshot_blob)
+    snapshot_path = Column(Text)
+
     __table_args__ = (
         Index("ix_annotation_versions_project_task_version", "project_id", "task_type", "version_number", unique=True),
         Index("ix_annotation_versions_project_type", "project_id", "version_type"),
@@ -545,6 +652,178 @@ class AnnotationSnapshot(LabelerBase):
         return f"<AnnotationSnapshot(id={self.id}, version_id={self.version_id}, annotation_id={self.annotation_id})>"
 
 
+class AnnotationState(LabelerBase):
+    """
+    Content-addressed annotation snapshot, stored once however many versions
+    (or annotations) share it. Replaces AnnotationSnapshot for new versions.
+    """
+
+    __tablename__ = "annotation_states"
+
+    # SHA-256 (hex) of the canonical snapshot_data JSON
+    hash = Column(String(64), primary_key=True)
+
+    # Snapshot data (annotation state as JSON, see annotation_snapshot_service)
+    snapshot_data = Column(JSONB, nullable=False)
+
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<AnnotationState(hash='{self.hash[:12]}')>"
+
+
+class AnnotationVersionMember(LabelerBase):
+    """
+    Copy-on-write membership of annotation states in published versions.
+
+    A row covers the consecutive versions of one (project, task_type) in
+    which an annotation had the same state: from first_version_id up to,
+    not including, end_version_id (NULL = still in the latest version).
+    Publishing only closes and opens rows for changed annotations.
+    """
+
+    __tablename__ = "annotation_version_members"
+
+    id = Column(BigInteger, primary_key=True)
+    project_id = Column(String(50), nullable=False)
+    task_type = Column(String(50), nullable=False)
+    annotation_id = Column(BigInteger, nullable=False)
+    state_hash = Column(String(64), nullable=False, index=True)
+
+    # Version range (annotation_versions.id, increasing within the project)
+    first_version_id = Column(Integer, nullable=False)
+    end_version_id = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_annotation_version_members_range", "project_id", "task_type", "first_version_id"),
+        Index(
+            "ix_annotation_version_members_current", "project_id", "task_type", "annotation_id",
+            postgresql_where=text("end_version_id IS NULL"),
+        ),
+    )
+
+    def __repr__(self):
+        return (
+            f"<AnnotationVersionMember(annotation_id={self.annotation_id}, "
+            f"versions=[{self.first_version_id}, {self.end_version_id}))>"
+        )
+
+
+class ExportArtifact(LabelerBase):
+    """
+    Last uploaded export per (project, task_type, format, include_draft).
+
+    The fingerprint summarizes the project content the export was built from
+    (see export_cache_service); while it still matches, the export endpoint
+    returns this artifact with a fresh presigned URL instead of regenerating.
+    """
+
+    __tablename__ = "export_artifacts"
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(String(50), nullable=False)
+    task_type = Column(String(50), nullable=False)  # "all" = every task type
+    export_format = Column(String(20), nullable=False)  # 'coco' | 'yolo' | 'dice'
+    include_draft = Column(Boolean, nullable=False, default=False)
+
+    # SHA-256 (hex) of the content the export was built from
+    fingerprint = Column(String(64), nullable=False)
+
+    # Uploaded file (annotations bucket)
+    export_path = Column(Text, nullable=False)
+    file_size = Column(BigInteger)
+    annotation_count = Column(Integer, nullable=False, default=0)
+    image_count = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index(
+            "ix_export_artifacts_key",
+            "project_id", "task_type", "export_format", "include_draft",
+            unique=True,
+        ),
+    )
+
+    def __repr__(self):
+        return f"<ExportArtifact(project_id='{self.project_id}', task_type='{self.task_type}', format='{self.export_format}')>"
+
+
+class VersionDiff(LabelerBase):
+    """
+    Cached diff between two versions of a project task (see version_diff_cache_service).
+
+    Holds the summary header; the per-image diffs are VersionDiffImage rows.
+    Diffs against a live version (Working or draft, read from annotations)
+    are revalidated against live_fingerprint on every request.
+    """
+
+    __tablename__ = "version_diffs"
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(String(50), nullable=False)
+    task_type = Column(String(50), nullable=False)
+
+    # Older and newer version (annotation_versions.id, -1 = Working)
+    version_a_id = Column(Integer, nullable=False)
+    version_b_id = Column(Integer, nullable=False)
+
+    # Diff code the rows were computed with (stale rows are recomputed)
+    format_version = Column(Integer, nullable=False)
+
+    # Aggregate of the live annotations as of the last refresh (NULL if both versions are published)
+    live_fingerprint = Column(String(64))
+
+    # Same shape as the compare response's summary and class_stats
+    summary = Column(JSONB, nullable=False)
+    class_stats = Column(JSONB, nullable=False)
+
+    computed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_version_diffs_key", "project_id", "task_type", "version_a_id", "version_b_id", unique=True),
+    )
+
+    def __repr__(self):
+        return f"<VersionDiff(project_id='{self.project_id}', versions={self.version_a_id}->{self.version_b_id})>"
+
+
+class VersionDiffImage(LabelerBase):
+    """One image of a cached version diff (every image of either version)."""
+
+    __tablename__ = "version_diff_images"
+
+    diff_id = Column(
+        Integer,
+        ForeignKey('version_diffs.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    image_id = Column(String(255), primary_key=True)
+
+    added_count = Column(Integer, nullable=False, default=0)
+    removed_count = Column(Integer, nullable=False, default=0)
+    modified_count = Column(Integer, nullable=False, default=0)
+    unchanged_count = Column(Integer, nullable=False, default=0)
+    total_changes = Column(Integer, nullable=False, default=0)
+
+    # Per-class counts and the image diff as gzip-compressed JSON (NULL without changes)
+    class_stats = Column(JSONB)
+    diff = Column(LargeBinary)
+
+    # Aggregate of the image's live annotations (NULL if it has none)
+    live_fingerprint = Column(String(64))
+
+    __table_args__ = (
+        Index(
+            "ix_version_diff_images_changed", "diff_id", "image_id",
+            postgresql_where=text("total_changes > 0"),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<VersionDiffImage(diff_id={self.diff_id}, image_id='{self.image_id}', changes={self.total_changes})>"
+
+
 class ImageLock(LabelerBase):
     """Phase 8.5.2: Image locks for concurrent editing protection."""
 
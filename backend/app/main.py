@@ -4,6 +4,8 @@ Vision AI Labeler - Backend API
 Main FastAPI application entry point.
 """
 
+import asyncio
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -179,6 +181,15 @@ async def startup_event():
     print(f"Client ID:  {settings.KEYCLOAK_CLIENT_ID}")
     print("=" * 60)
 
+    # Verify storage buckets off the request path (runs once per process, never blocks startup)
+    from app.core.storage import storage_client
+    asyncio.get_running_loop().run_in_executor(None, storage_client.ensure_buckets)
+
+    # Opt-in thumbnail queue worker in this process; deployments run scripts/maintenance/thumbnail_worker.py
+    if settings.THUMBNAIL_WORKER_EMBEDDED and settings.ENVIRONMENT != "test":
+        from app.services.thumbnail_queue_service import start_embedded_worker
+        start_embedded_worker()
+
 
 # Shutdown event
 @app.on_event("shutdown")
@@ -186,6 +197,9 @@ async def shutdown_event():
     """Run on application shutdown."""
     print(f"Shutting down {settings.APP_NAME}")
 
+    from app.services.thumbnail_queue_service import stop_embedded_worker
+    stop_embedded_worker()
+
 
 if __name__ == "__main__":
     import uvicorn
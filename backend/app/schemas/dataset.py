@@ -117,6 +117,8 @@ class UploadSummary(BaseModel):
     annotations_imported: int = 0
     storage_bytes_used: int
     folder_structure: Dict[str, int] = {}
+    duplicates_skipped: int = 0  # Files whose content was already stored (not uploaded again)
+    ingest_stats: Dict[str, Dict[str, float]] = {}  # Per-stage throughput (read/hash/upload/metadata)
 
     class Config:
         from_attributes = True
@@ -0,0 +1,118 @@
+"""Upload session schemas (direct-to-storage browser uploads)."""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class UploadFileItem(BaseModel):
+    """A file the browser is going to upload."""
+    path: str = Field(..., min_length=1, max_length=200, description="Relative path in the dataset (e.g. 'train/cat/001.jpg')")
+    size: int = Field(..., ge=0, description="File size in bytes")
+    content_type: Optional[str] = Field(None, max_length=100, description="MIME type (default: guessed from the extension)")
+
+
+class UploadSessionCreate(BaseModel):
+    """Schema for starting an upload session."""
+    files: List[UploadFileItem] = Field(default=[], description="Files to upload (more can be added later)")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "files": [
+                    {"path": "train/cat/001.jpg", "size": 183422, "content_type": "image/jpeg"},
+                    {"path": "train/dog/002.png", "size": 96512000, "content_type": "image/png"}
+                ]
+            }
+        }
+
+
+class UploadSessionFilesAdd(BaseModel):
+    """Schema for adding files to an upload session."""
+    files: List[UploadFileItem] = Field(..., min_length=1)
+
+
+class UploadUrlsRequest(BaseModel):
+    """Schema for requesting upload URLs of pending files."""
+    paths: Optional[List[str]] = Field(None, description="Specific files (default: next pending files after 'after')")
+    after: Optional[str] = Field(None, description="Cursor from the previous response's next_after")
+    limit: int = Field(default=100, ge=1, le=1000)
+
+
+class UploadPartUrl(BaseModel):
+    """Presigned URL for one part of a multipart upload."""
+    part_number: int
+    url: str
+
+
+class UploadedPart(BaseModel):
+    """A part that is already stored."""
+    part_number: int
+    etag: str
+
+
+class UploadTarget(BaseModel):
+    """
+    Where to upload one file.
+
+    method 'put': PUT the whole file to url with headers; keep the ETag
+    response header.
+    method 'multipart': PUT byte range [(n-1)*part_size, n*part_size) to the
+    URL of part n; keep each part's ETag and report them together with
+    uploaded_parts.
+    """
+    path: str
+    method: str
+    url: Optional[str] = None
+    headers: Dict[str, str] = {}
+    upload_id: Optional[str] = None
+    part_size: Optional[int] = None
+    parts: List[UploadPartUrl] = []
+    uploaded_parts: List[UploadedPart] = []
+
+
+class UploadUrlsResponse(BaseModel):
+    """Upload URLs for a page of pending files."""
+    targets: List[UploadTarget]
+    next_after: Optional[str] = None
+    expires_in: int
+
+
+class CompletedFileItem(BaseModel):
+    """A file the browser finished uploading."""
+    path: str
+    etag: Optional[str] = Field(None, description="ETag of the PUT response (single PUT uploads)")
+    parts: Optional[List[UploadedPart]] = Field(None, description="All parts of a multipart upload")
+
+
+class UploadCompleteRequest(BaseModel):
+    """Schema for reporting finished uploads."""
+    files: List[CompletedFileItem] = Field(..., min_length=1, max_length=5000)
+
+
+class UploadSessionResponse(BaseModel):
+    """Upload session progress."""
+    id: str
+    dataset_id: str
+    status: str
+    total_files: int
+    total_bytes: int
+    completed_files: int
+    completed_bytes: int
+    expires_at: datetime
+    created_at: datetime
+    pending_files: List[str] = Field(default=[], description="First pending files (for resuming)")
+
+    class Config:
+        from_attributes = True
+
+
+class UploadCompleteResponse(BaseModel):
+    """Outcome of reporting finished uploads."""
+    completed: int
+    already_completed: int
+    failed: Dict[str, str] = Field(default={}, description="path -> reason; these files stay pending")
+    images_added: int
+    storage_bytes_used: int
+    folder_structure: Dict[str, int]
+    session: UploadSessionResponse
@@ -50,6 +50,7 @@ class ExportRequest(BaseModel):
     """Export annotations request."""
     project_id: str
     export_format: str  # 'coco' | 'yolo' | 'voc'
+    task_type: Optional[str] = None  # Export one task type only (None = all)
     include_draft: bool = False  # Whether to include draft annotations
     image_ids: Optional[List[str]] = None  # Export specific images only (None = all)
 
@@ -63,3 +64,4 @@ class ExportResponse(BaseModel):
     annotation_count: int
     image_count: int
     file_size_bytes: Optional[int] = None
+    cached: bool = False  # True if an unchanged earlier export was reused
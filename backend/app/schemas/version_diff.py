@@ -40,15 +40,24 @@ class VersionDiffSummary(BaseModel):
     total_changes: int
 
 
+class VersionDiffPage(BaseModel):
+    """Which images with changes a diff response holds (ordered by image_id)."""
+    offset: int
+    limit: Optional[int] = None  # None = all
+    total: int  # Images with changes
+    next_offset: Optional[int] = None  # None on the last page
+
+
 class VersionDiffResponse(BaseModel):
     """Complete version diff response."""
     version_a: VersionMetadata
     version_b: VersionMetadata
     project_id: str
     task_type: str
-    image_diffs: Dict[str, Any]  # image_id -> diff data
+    image_diffs: Dict[str, Any]  # image_id -> diff data (current page)
     summary: VersionDiffSummary
     class_stats: Dict[str, ClassStats]
+    page: Optional[VersionDiffPage] = None  # None for single-image diffs
 
 
 class VersionDiffSummaryResponse(BaseModel):
@@ -0,0 +1,502 @@
+"""
+Annotation Matching
+
+Pairs the annotations of one image in two versions for version diffs:
+
+1. Annotations with the same annotation_id are the same annotation.
+2. The remaining annotations are paired by IoU, assigned greedily by
+   descending IoU over all candidate pairs, so each annotation gets its
+   best still-free partner (not the first candidate that happens to be
+   scanned).
+
+IoU is computed for area geometries:
+
+- Boxes (DB {x, y, width, height} or DICE {bbox: [x, y, w, h]}): packed into
+  NumPy arrays; the full IoU matrix is computed at once for ordinary images.
+- Rotated boxes ({cx, cy, width, height, angle} or {x, y, width, height,
+  angle}, angle in degrees) and polygons ({points: [[x, y], ...]}): the
+  candidates of each annotation come from a uniform grid index over the
+  bounding boxes, pairs whose IoU cannot reach the threshold are pruned
+  from bounding boxes and areas alone, and the overlap of the remaining
+  pairs is clipped exactly (both shapes convex) or sampled on a NumPy grid
+  over the bounding-box intersection (non-convex polygons).
+
+Very crowded box images take the grid index path too, so matching stays
+near-linear in the number of annotations.
+"""
+
+import math
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Box pairs above this use the grid index instead of the full IoU matrix
+DENSE_IOU_LIMIT = 4_000_000
+
+# Samples per axis when rasterizing non-convex polygon overlaps
+RASTER_RESOLUTION = 64
+
+# Shapes spanning more grid cells than this are checked against every query
+MAX_GRID_CELLS = 64
+
+# Annotation types whose points are an open path, not an area
+_PATH_TYPES = ('polyline', 'line')
+
+
+class MatchResult(NamedTuple):
+    """Pairs (index in a, index in b) and the unpaired indices of each side, all ascending."""
+
+    pairs: List[Tuple[int, int]]
+    unmatched_a: List[int]
+    unmatched_b: List[int]
+
+
+def box_of(geometry: Optional[Dict[str, Any]]) -> Optional[Tuple[float, float, float, float]]:
+    """(x1, y1, x2, y2) of an axis-aligned bbox geometry in DB or DICE format, or None if it has no box."""
+    if not geometry or geometry.get('angle'):
+        return None
+    bbox = geometry.get('bbox')
+    if isinstance(bbox, list):
+        if len(bbox) < 4:
+            return None
+        x, y, width, height = bbox[:4]
+    elif 'x' in geometry:
+        x, y = geometry.get('x'), geometry.get('y')
+        width, height = geometry.get('width'), geometry.get('height')
+    else:
+        return None
+    x, y, width, height = (float(value or 0) for value in (x, y, width, height))
+    return x, y, x + width, y + height
+
+
+def boxes_array(annotations: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pack the boxes of annotations into an (n, 4) x1, y1, x2, y2 array.
+
+    Returns:
+        (boxes, indices): boxes of the annotations that have one and their
+        positions in annotations
+    """
+    boxes = []
+    indices = []
+    for index, annotation in enumerate(annotations):
+        box = box_of(annotation.get('geometry'))
+        if box is not None:
+            boxes.append(box)
+            indices.append(index)
+    return np.array(boxes, dtype=np.float64).reshape(-1, 4), np.array(indices, dtype=np.intp)
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """(len(a), len(b)) IoU of every pair of x1, y1, x2, y2 boxes (0 where the union is empty)."""
+    return _box_iou(boxes_a[:, None, :], boxes_b[None, :, :])
+
+
+def _box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Element-wise IoU of two broadcastable (..., 4) box arrays."""
+    x1 = np.maximum(boxes_a[..., 0], boxes_b[..., 0])
+    y1 = np.maximum(boxes_a[..., 1], boxes_b[..., 1])
+    x2 = np.minimum(boxes_a[..., 2], boxes_b[..., 2])
+    y2 = np.minimum(boxes_a[..., 3], boxes_b[..., 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    union = area_a + area_b - intersection
+
+    iou = np.zeros_like(intersection)
+    np.divide(intersection, union, out=iou, where=union > 0)
+    return iou
+
+
+def polygon_of(annotation: Dict[str, Any]) -> Optional[np.ndarray]:
+    """
+    (k, 2) vertices of an annotation's area geometry: polygon, rotated box or box.
+
+    Returns None for geometries without an area (classification, polylines,
+    fewer than 3 points).
+    """
+    geometry = annotation.get('geometry')
+    if not geometry or annotation.get('annotation_type') in _PATH_TYPES:
+        return None
+
+    points = geometry.get('points')
+    if isinstance(points, list):
+        if len(points) < 3:
+            return None
+        try:
+            vertices = np.array([point[:2] for point in points], dtype=np.float64)
+        except (TypeError, ValueError):
+            return None
+        if vertices.shape[1] != 2:
+            return None
+        if len(vertices) > 3 and np.array_equal(vertices[0], vertices[-1]):
+            vertices = vertices[:-1]
+        return vertices
+
+    if 'angle' in geometry:
+        width = float(geometry.get('width') or 0)
+        height = float(geometry.get('height') or 0)
+        if 'cx' in geometry:
+            cx, cy = float(geometry.get('cx') or 0), float(geometry.get('cy') or 0)
+        elif 'x' in geometry:
+            cx = float(geometry.get('x') or 0) + width / 2
+            cy = float(geometry.get('y') or 0) + height / 2
+        else:
+            return None
+        theta = math.radians(float(geometry.get('angle') or 0))
+        cos, sin = math.cos(theta), math.sin(theta)
+        corners = np.array([
+            [-width / 2, -height / 2], [width / 2, -height / 2],
+            [width / 2, height / 2], [-width / 2, height / 2],
+        ])
+        return corners @ np.array([[cos, sin], [-sin, cos]]) + (cx, cy)
+
+    box = box_of(geometry)
+    if box is None:
+        return None
+    x1, y1, x2, y2 = box
+    return np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+
+
+def polygon_area_signed(vertices: np.ndarray) -> float:
+    """Signed shoelace area (positive for counter-clockwise vertices in y-up axes)."""
+    x, y = vertices[:, 0], vertices[:, 1]
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2.0
+
+
+def polygon_area(vertices: np.ndarray) -> float:
+    """Area of a simple polygon (shoelace formula)."""
+    return abs(polygon_area_signed(vertices))
+
+
+def _is_convex(vertices: np.ndarray) -> bool:
+    """True if all turns of the polygon go the same way (collinear points allowed)."""
+    edges = np.roll(vertices, -1, axis=0) - vertices
+    turns = edges[:, 0] * np.roll(edges[:, 1], -1) - edges[:, 1] * np.roll(edges[:, 0], -1)
+    return bool(np.all(turns >= 0) or np.all(turns <= 0))
+
+
+class ShapeSet:
+    """
+    Area shapes of a list of annotations.
+
+    Attributes:
+        polygons: Vertices of each shape
+        indices: Position of each shape's annotation in the list
+        envelopes: (n, 4) x1, y1, x2, y2 bounding boxes
+        areas: Shape areas
+        convex: Whether each shape is convex
+    """
+
+    def __init__(self, annotations: Sequence[Dict[str, Any]]):
+        self.polygons: List[np.ndarray] = []
+        indices = []
+        for index, annotation in enumerate(annotations):
+            vertices = polygon_of(annotation)
+            if vertices is not None and polygon_area(vertices) > 0:
+                self.polygons.append(vertices)
+                indices.append(index)
+
+        self.indices = np.array(indices, dtype=np.intp)
+        self.envelopes = np.array(
+            [np.concatenate([vertices.min(axis=0), vertices.max(axis=0)]) for vertices in self.polygons],
+            dtype=np.float64,
+        ).reshape(-1, 4)
+        self.areas = np.array([polygon_area(vertices) for vertices in self.polygons], dtype=np.float64)
+        self.convex = [_is_convex(vertices) for vertices in self.polygons]
+
+    def __len__(self) -> int:
+        return len(self.polygons)
+
+
+class SpatialGrid:
+    """
+    Uniform grid over bounding boxes for overlap candidate lookup.
+
+    Each box is registered in the cells it covers; a query returns the boxes
+    registered in the cells the query box covers. The cell size defaults to
+    the median box extent, so a box lands in a handful of cells and lookups
+    stay O(1) per annotation. Boxes spanning more than MAX_GRID_CELLS cells
+    are kept aside and returned by every query.
+    """
+
+    def __init__(self, envelopes: np.ndarray, cell_size: Optional[float] = None):
+        if cell_size is None:
+            extents = np.maximum(envelopes[:, 2] - envelopes[:, 0], envelopes[:, 3] - envelopes[:, 1])
+            cell_size = float(np.median(extents)) if len(extents) else 0.0
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+        self.size = len(envelopes)
+
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._oversized: List[int] = []
+        for index, envelope in enumerate(envelopes.tolist()):
+            cells = self._cells_of(envelope)
+            if cells is None:
+                self._oversized.append(index)
+                continue
+            for cell in cells:
+                self._cells.setdefault(cell, []).append(index)
+
+    def _cells_of(self, envelope: Sequence[float]) -> Optional[Iterable[Tuple[int, int]]]:
+        """Cells covered by envelope, or None if they are more than MAX_GRID_CELLS."""
+        x1, y1, x2, y2 = (math.floor(value / self.cell_size) for value in envelope)
+        if (x2 - x1 + 1) * (y2 - y1 + 1) > MAX_GRID_CELLS:
+            return None
+        return ((x, y) for x in range(x1, x2 + 1) for y in range(y1, y2 + 1))
+
+    def query(self, envelope: Sequence[float]) -> List[int]:
+        """Indices of the boxes sharing a cell with envelope, ascending."""
+        cells = self._cells_of(envelope)
+        if cells is None:
+            return list(range(self.size))
+        found = set(self._oversized)
+        for cell in cells:
+            found.update(self._cells.get(cell, ()))
+        return sorted(found)
+
+    def candidate_pairs(self, envelopes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, columns): every query envelope paired with each box it may overlap."""
+        rows: List[int] = []
+        columns: List[int] = []
+        for row, envelope in enumerate(envelopes.tolist()):
+            found = self.query(envelope)
+            rows.extend([row] * len(found))
+            columns.extend(found)
+        return np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)
+
+
+def _clip_convex(subject: List[Tuple[float, float]], clip: np.ndarray) -> List[Tuple[float, float]]:
+    """Part of polygon subject inside convex polygon clip (Sutherland-Hodgman)."""
+    if polygon_area_signed(clip) < 0:
+        clip = clip[::-1]
+    output = subject
+    for (cx0, cy0), (cx1, cy1) in zip(clip.tolist(), np.roll(clip, -1, axis=0).tolist()):
+        if not output:
+            break
+        points, output = output, []
+        prev = points[-1]
+        prev_side = (cx1 - cx0) * (prev[1] - cy0) - (cy1 - cy0) * (prev[0] - cx0)
+        for point in points:
+            side = (cx1 - cx0) * (point[1] - cy0) - (cy1 - cy0) * (point[0] - cx0)
+            if (side >= 0) != (prev_side >= 0):
+                t = prev_side / (prev_side - side)
+                output.append((prev[0] + t * (point[0] - prev[0]), prev[1] + t * (point[1] - prev[1])))
+            if side >= 0:
+                output.append(point)
+            prev, prev_side = point, side
+    return output
+
+
+def _raster_mask(vertices: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """
+    (len(ys), len(xs)) even-odd inside mask of a polygon sampled at grid points.
+
+    Each grid row is a scanline: the polygon edges crossing it toggle the
+    samples to the right of the crossing, so the cost is O(rows * edges +
+    samples) instead of O(samples * edges).
+    """
+    x0, y0 = vertices[:, 0], vertices[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    rows, edges = np.nonzero((y0 > ys[:, None]) != (y1 > ys[:, None]))
+    x_at = x0[edges] + (ys[rows] - y0[edges]) * (x1[edges] - x0[edges]) / (y1[edges] - y0[edges])
+
+    toggles = np.zeros((len(ys), len(xs) + 1), dtype=np.int32)
+    np.add.at(toggles, (rows, np.searchsorted(xs, x_at, side='right')), 1)
+    return np.cumsum(toggles[:, :-1], axis=1) % 2 == 1
+
+
+def polygon_intersection_area(
+    vertices_a: np.ndarray,
+    vertices_b: np.ndarray,
+    convex: bool = False,
+    resolution: int = RASTER_RESOLUTION,
+) -> float:
+    """
+    Overlap area of two polygons.
+
+    Exact for convex polygons (convex=True); otherwise estimated from a
+    resolution x resolution sample grid over the bounding-box intersection.
+    """
+    if convex:
+        clipped = _clip_convex([tuple(point) for point in vertices_a.tolist()], vertices_b)
+        return polygon_area(np.array(clipped)) if len(clipped) >= 3 else 0.0
+
+    x1, y1 = np.maximum(vertices_a.min(axis=0), vertices_b.min(axis=0))
+    x2, y2 = np.minimum(vertices_a.max(axis=0), vertices_b.max(axis=0))
+    if x2 <= x1 or y2 <= y1:
+        return 0.0
+    xs = x1 + (np.arange(resolution) + 0.5) * (x2 - x1) / resolution
+    ys = y1 + (np.arange(resolution) + 0.5) * (y2 - y1) / resolution
+
+    inside = _raster_mask(vertices_a, xs, ys) & _raster_mask(vertices_b, xs, ys)
+    return float(np.count_nonzero(inside)) / inside.size * (x2 - x1) * (y2 - y1)
+
+
+def shape_iou_pairs(
+    shapes_a: ShapeSet,
+    shapes_b: ShapeSet,
+    threshold: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    IoU of the shape pairs that can reach threshold.
+
+    Candidates come from a SpatialGrid over shapes_b; a pair is kept only if
+    its bounding boxes overlap and min(area_a, area_b, box overlap) /
+    max(area_a, area_b) - an upper bound of its IoU - reaches threshold.
+
+    Returns:
+        (rows, columns, ious) indexed into shapes_a and shapes_b
+    """
+    empty = np.zeros(0, dtype=np.intp)
+    if not len(shapes_a) or not len(shapes_b):
+        return empty, empty, np.zeros(0)
+
+    rows, columns = SpatialGrid(shapes_b.envelopes).candidate_pairs(shapes_a.envelopes)
+
+    envelopes_a, envelopes_b = shapes_a.envelopes[rows], shapes_b.envelopes[columns]
+    overlap = (
+        np.clip(np.minimum(envelopes_a[:, 2], envelopes_b[:, 2]) - np.maximum(envelopes_a[:, 0], envelopes_b[:, 0]), 0, None)
+        * np.clip(np.minimum(envelopes_a[:, 3], envelopes_b[:, 3]) - np.maximum(envelopes_a[:, 1], envelopes_b[:, 1]), 0, None)
+    )
+    areas_a, areas_b = shapes_a.areas[rows], shapes_b.areas[columns]
+    bound = np.minimum(np.minimum(areas_a, areas_b), overlap) / np.maximum(areas_a, areas_b)
+    keep = (overlap > 0) & (bound >= threshold)
+    rows, columns = rows[keep], columns[keep]
+
+    ious = np.zeros(len(rows))
+    for position, (row, column) in enumerate(zip(rows.tolist(), columns.tolist())):
+        intersection = polygon_intersection_area(
+            shapes_a.polygons[row],
+            shapes_b.polygons[column],
+            convex=shapes_a.convex[row] and shapes_b.convex[column],
+        )
+        union = shapes_a.areas[row] + shapes_b.areas[column] - intersection
+        ious[position] = intersection / union if union > 0 else 0.0
+    return rows, columns, ious
+
+
+def greedy_pairs(
+    rows: np.ndarray,
+    columns: np.ndarray,
+    scores: np.ndarray,
+    threshold: float,
+) -> List[Tuple[int, int]]:
+    """
+    Assign rows to columns by descending score (each used once), keeping pairs >= threshold.
+
+    Ties are broken by (row, column) order, so equal shapes pair up in
+    document order.
+    """
+    keep = (scores >= threshold) & (scores > 0)
+    rows, columns, scores = rows[keep], columns[keep], scores[keep]
+    if rows.size == 0:
+        return []
+    # Descending score, then ascending row and column (lexsort: last key is primary)
+    order = np.lexsort((columns, rows, -scores))
+
+    pairs = []
+    used_rows = set()
+    used_columns = set()
+    for row, column in zip(rows[order].tolist(), columns[order].tolist()):
+        if row in used_rows or column in used_columns:
+            continue
+        used_rows.add(row)
+        used_columns.add(column)
+        pairs.append((row, column))
+    return pairs
+
+
+def greedy_assignment(iou: np.ndarray, threshold: float) -> List[Tuple[int, int]]:
+    """Assign rows to columns of a dense IoU matrix by descending IoU (see greedy_pairs)."""
+    rows, columns = np.nonzero((iou >= threshold) & (iou > 0))
+    return greedy_pairs(rows, columns, iou[rows, columns], threshold)
+
+
+def _match_geometry(
+    annotations_a: Sequence[Dict[str, Any]],
+    annotations_b: Sequence[Dict[str, Any]],
+    iou_threshold: float,
+) -> List[Tuple[int, int]]:
+    """IoU pairs (index in a, index in b) of two annotation lists."""
+    if any(
+        box_of(annotation.get('geometry')) is None and polygon_of(annotation) is not None
+        for annotation in (*annotations_a, *annotations_b)
+    ):
+        # Rotated boxes or polygons: grid candidates, exact or rasterized IoU
+        shapes_a, shapes_b = ShapeSet(annotations_a), ShapeSet(annotations_b)
+        rows, columns, ious = shape_iou_pairs(shapes_a, shapes_b, iou_threshold)
+        return [
+            (int(shapes_a.indices[row]), int(shapes_b.indices[column]))
+            for row, column in greedy_pairs(rows, columns, ious, iou_threshold)
+        ]
+
+    boxes_a, indices_a = boxes_array(annotations_a)
+    boxes_b, indices_b = boxes_array(annotations_b)
+    if not len(boxes_a) or not len(boxes_b):
+        return []
+    if len(boxes_a) * len(boxes_b) <= DENSE_IOU_LIMIT:
+        box_pairs = greedy_assignment(iou_matrix(boxes_a, boxes_b), iou_threshold)
+    else:
+        rows, columns = SpatialGrid(boxes_b).candidate_pairs(boxes_a)
+        ious = _box_iou(boxes_a[rows], boxes_b[columns])
+        box_pairs = greedy_pairs(rows, columns, ious, iou_threshold)
+    return [(int(indices_a[row]), int(indices_b[column])) for row, column in box_pairs]
+
+
+def match_annotations(
+    annotations_a: Sequence[Dict[str, Any]],
+    annotations_b: Sequence[Dict[str, Any]],
+    iou_threshold: float = 0.5,
+) -> MatchResult:
+    """
+    Pair one image's annotations of two versions.
+
+    Args:
+        annotations_a: Annotations of the older version
+        annotations_b: Annotations of the newer version
+        iou_threshold: Minimum IoU for a geometric pair
+
+    Returns:
+        MatchResult (pairs sorted by index in a)
+    """
+    pairs = []
+    free_a = list(range(len(annotations_a)))
+    free_b = list(range(len(annotations_b)))
+
+    # 1. Same annotation_id (first unpaired candidate per id)
+    by_id: Dict[Any, List[int]] = {}
+    for index in free_b:
+        annotation_id = annotations_b[index].get('annotation_id')
+        if annotation_id:
+            by_id.setdefault(annotation_id, []).append(index)
+    if by_id:
+        unpaired_a = []
+        for index in free_a:
+            candidates = by_id.get(annotations_a[index].get('annotation_id'))
+            if candidates:
+                pairs.append((index, candidates.pop(0)))
+            else:
+                unpaired_a.append(index)
+        paired_b = {b for _, b in pairs}
+        free_a = unpaired_a
+        free_b = [index for index in free_b if index not in paired_b]
+
+    # 2. Best IoU among the remaining boxes, rotated boxes and polygons
+    if free_a and free_b:
+        geometry_pairs = [
+            (free_a[row], free_b[column])
+            for row, column in _match_geometry(
+                [annotations_a[index] for index in free_a],
+                [annotations_b[index] for index in free_b],
+                iou_threshold,
+            )
+        ]
+        pairs.extend(geometry_pairs)
+        paired_a = {a for a, _ in geometry_pairs}
+        paired_b = {b for _, b in geometry_pairs}
+        free_a = [index for index in free_a if index not in paired_a]
+        free_b = [index for index in free_b if index not in paired_b]
+
+    pairs.sort()
+    return MatchResult(pairs, free_a, free_b)
@@ -0,0 +1,408 @@
+"""
+Annotation Snapshot Service
+
+Writes the immutable annotation snapshots of a published version from the
+publish export stream, so publishing does not query the annotations
+separately for them.
+
+Snapshots are copy-on-write: every distinct annotation state is stored once
+in annotation_states, keyed by the SHA-256 of its canonical JSON, and
+annotation_version_members records the range of consecutive versions of a
+(project, task_type) in which an annotation had that state. Publishing a
+version only writes the states and members of annotations that changed
+since the previous version, and closes the members of removed ones.
+
+Versions published before content-addressed states keep their
+annotation_snapshots rows; iter_version_snapshots() reads both.
+
+Publishing also writes the version's snapshots as one compressed,
+image-indexed blob in the annotations bucket (app.core.snapshot_blob), from
+which diffs read single images with ranged GETs. move_version_snapshots_to_blob()
+writes the blob of an older version and drops its annotation_snapshots rows.
+"""
+
+import hashlib
+import itertools
+import json
+import tempfile
+from operator import itemgetter
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Sequence, Tuple
+
+from sqlalchemy import exists, insert, or_, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Query, Session
+
+from app.core.snapshot_blob import SnapshotBlobBuilder, SnapshotBlobIndex, snapshot_blob_key
+from app.core.storage import storage_client
+from app.db.models.labeler import (
+    Annotation,
+    AnnotationSnapshot,
+    AnnotationState,
+    AnnotationVersion,
+    AnnotationVersionMember,
+)
+from app.services.export_query_service import STREAM_BATCH_SIZE, ExportBatch, ExportWriter, batched
+
+# Annotation columns stored in a snapshot
+SNAPSHOT_ANNOTATION_COLUMNS = (
+    Annotation.annotation_type,
+    Annotation.geometry,
+    Annotation.class_id,
+    Annotation.class_name,
+    Annotation.attributes,
+    Annotation.confidence,
+    Annotation.annotation_state,
+    Annotation.created_at,
+    Annotation.updated_at,
+)
+
+# Rows per INSERT / ids per IN (...) (bound parameter limits)
+WRITE_CHUNK_SIZE = 1000
+
+# Snapshot blobs are built in memory up to this size, then in a temp file
+BLOB_SPOOL_BYTES = 16 * 1024 * 1024
+
+
+def build_snapshot_data(annotation: Any) -> Dict[str, Any]:
+    """Snapshot of one annotation (ORM object or row with SNAPSHOT_ANNOTATION_COLUMNS)."""
+    return {
+        "annotation_type": annotation.annotation_type,
+        "geometry": annotation.geometry,
+        "class_id": annotation.class_id,
+        "class_name": annotation.class_name,
+        "attributes": annotation.attributes,
+        "confidence": annotation.confidence,
+        "annotation_state": annotation.annotation_state,
+        "created_at": annotation.created_at.isoformat() if annotation.created_at else None,
+        "updated_at": annotation.updated_at.isoformat() if annotation.updated_at else None,
+    }
+
+
+def snapshot_hash(snapshot_data: Dict[str, Any]) -> str:
+    """SHA-256 (hex) of the canonical JSON of a snapshot (key of annotation_states)."""
+    canonical = json.dumps(snapshot_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _insert_states(db: Session, states: Dict[str, Dict[str, Any]]) -> None:
+    """Insert the states not stored yet (concurrent publishes may store the same state)."""
+    rows = [{"hash": digest, "snapshot_data": data} for digest, data in states.items()]
+    dialect = db.get_bind().dialect.name
+    for chunk in batched(rows, WRITE_CHUNK_SIZE):
+        if dialect in ("postgresql", "sqlite"):
+            insert_ = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            db.execute(insert_(AnnotationState).values(chunk).on_conflict_do_nothing(index_elements=["hash"]))
+        else:
+            stored = {
+                digest for (digest,) in db.query(AnnotationState.hash).filter(
+                    AnnotationState.hash.in_([row["hash"] for row in chunk])
+                )
+            }
+            missing = [row for row in chunk if row["hash"] not in stored]
+            if missing:
+                db.execute(insert(AnnotationState), missing)
+
+
+def lock_project_publishes(db: Session, project_id: str) -> None:
+    """
+    Serialize the version step of the publishes of a project (transaction
+    advisory lock, released at commit or rollback).
+
+    Take it before creating the version row and writing its members: the
+    version ids must grow in the order in which publishes update the member
+    chain, or a publish could close members that a version with a higher id
+    opened (end_version_id < first_version_id). Annotation writes update the
+    annotation_projects row (project stats), so a lock on that row would
+    make them wait for the publish. SQLite (tests) has one writer at a time.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext('annotation_publish'), hashtext(:project_id))"),
+            {"project_id": project_id},
+        )
+
+
+def lock_version_number(db: Session, project_id: str, task_type: str, version_number: str) -> None:
+    """
+    Reserve a version number of a (project, task_type) until commit or rollback.
+
+    Export and snapshot blob keys contain the version number, so a publish
+    holds it while uploading: a concurrent publish of the same number waits
+    and then finds the version, instead of overwriting the uploaded files.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:project_id), hashtext(:task_type || '/' || :version_number))"),
+            {"project_id": project_id, "task_type": task_type, "version_number": version_number},
+        )
+
+
+class AnnotationSnapshotWriter(ExportWriter):
+    """
+    Writes a version's snapshots from an export stream.
+
+    While the stream is consumed, stores the annotation states that are not
+    stored yet and keeps the state hash of every annotation. write_members()
+    then compares them with the open members of the (project, task_type)
+    chain and only writes members for changed or new annotations, and closes
+    the members of changed and removed ones. Everything is written in the
+    caller's transaction (nothing is committed), so a failed publish leaves
+    the chain unchanged. annotation_count / image_count are the version's
+    counts once the stream has been consumed, changed_count the number of
+    members written or closed by write_members().
+
+    States are content-addressed, so the stream (and the uploads it feeds)
+    needs no lock; write_members() needs lock_project_publishes() since
+    before its version row was created.
+    """
+
+    columns = SNAPSHOT_ANNOTATION_COLUMNS
+
+    def __init__(self, db: Session, project_id: str, task_type: str):
+        self._db = db
+        self._project_id = project_id
+        self._task_type = task_type
+        self.annotation_count = 0
+        self.image_count = 0
+        self.changed_count = 0
+
+        # annotation_id -> state hash, in stream order
+        self._hashes: Dict[int, str] = {}
+
+    def add_batch(self, batch: ExportBatch) -> None:
+        states: Dict[str, Dict[str, Any]] = {}
+        for image in batch.images:
+            for annotation in image.annotations:
+                data = build_snapshot_data(annotation)
+                digest = snapshot_hash(data)
+                self._hashes[annotation.id] = digest
+                states.setdefault(digest, data)
+            if image.annotations:
+                self.image_count += 1
+                self.annotation_count += len(image.annotations)
+
+        # Unchanged annotations mostly have stored states: only send the others
+        for chunk in batched(list(states), WRITE_CHUNK_SIZE):
+            stored = {
+                digest for (digest,) in self._db.query(AnnotationState.hash).filter(AnnotationState.hash.in_(chunk))
+            }
+            missing = {digest: states[digest] for digest in chunk if digest not in stored}
+            if missing:
+                _insert_states(self._db, missing)
+
+    def write_members(self, version_id: int) -> None:
+        """Update the member chain for the version, once the stream has been consumed."""
+        # annotation_id -> (member id, state hash) of the previous version
+        previous_members: Dict[int, Tuple[int, str]] = {
+            annotation_id: (member_id, state_hash)
+            for member_id, annotation_id, state_hash in self._db.query(
+                AnnotationVersionMember.id,
+                AnnotationVersionMember.annotation_id,
+                AnnotationVersionMember.state_hash,
+            ).filter(
+                AnnotationVersionMember.project_id == self._project_id,
+                AnnotationVersionMember.task_type == self._task_type,
+                AnnotationVersionMember.end_version_id.is_(None),
+            )
+        }
+
+        members = []
+        closed = []
+        for annotation_id, digest in self._hashes.items():
+            previous = previous_members.pop(annotation_id, None)
+            if previous and previous[1] == digest:
+                continue
+            if previous:
+                closed.append(previous[0])
+            members.append({
+                "project_id": self._project_id,
+                "task_type": self._task_type,
+                "annotation_id": annotation_id,
+                "state_hash": digest,
+                "first_version_id": version_id,
+            })
+        # Annotations that are not in this version
+        closed.extend(member_id for member_id, _ in previous_members.values())
+
+        for chunk in batched(members, WRITE_CHUNK_SIZE):
+            self._db.execute(insert(AnnotationVersionMember), chunk)
+        for chunk in batched(closed, WRITE_CHUNK_SIZE):
+            self._db.execute(
+                update(AnnotationVersionMember)
+                .where(AnnotationVersionMember.id.in_(chunk))
+                .values(end_version_id=version_id)
+            )
+        self.changed_count = len(members) + len(previous_members)
+
+
+class SnapshotBlobWriter(ExportWriter):
+    """
+    Builds a version's snapshot blob from an export stream (image-sorted,
+    as the blob requires).
+
+    result() returns the compressed blob (a rewound temporary file, closed
+    by the caller) and its index, for storage_client.save_snapshot_blob().
+    """
+
+    columns = SNAPSHOT_ANNOTATION_COLUMNS
+
+    def __init__(self):
+        self._blob = tempfile.SpooledTemporaryFile(max_size=BLOB_SPOOL_BYTES)
+        self._builder = SnapshotBlobBuilder(self._blob)
+
+    def add_batch(self, batch: ExportBatch) -> None:
+        for image in batch.images:
+            self._builder.add_image(
+                image.image_id,
+                ((annotation.id, build_snapshot_data(annotation)) for annotation in image.annotations),
+            )
+
+    def result(self) -> Tuple[BinaryIO, SnapshotBlobIndex]:
+        index = self._builder.finish()
+        self._blob.seek(0)
+        return self._blob, index
+
+
+def _database_snapshots(db: Session, version: AnnotationVersion) -> Tuple[Query, Any]:
+    """Query of a version's (annotation_id, snapshot_data) rows and its annotation_id column."""
+    legacy = db.query(AnnotationSnapshot.annotation_id, AnnotationSnapshot.snapshot_data).filter(
+        AnnotationSnapshot.version_id == version.id
+    )
+    if db.query(legacy.exists()).scalar():
+        return legacy, AnnotationSnapshot.annotation_id
+
+    members = db.query(AnnotationVersionMember.annotation_id, AnnotationState.snapshot_data).join(
+        AnnotationState, AnnotationState.hash == AnnotationVersionMember.state_hash
+    ).filter(
+        AnnotationVersionMember.project_id == version.project_id,
+        AnnotationVersionMember.task_type == version.task_type,
+        AnnotationVersionMember.first_version_id <= version.id,
+        or_(
+            AnnotationVersionMember.end_version_id.is_(None),
+            AnnotationVersionMember.end_version_id > version.id,
+        ),
+    )
+    return members, AnnotationVersionMember.annotation_id
+
+
+def iter_version_snapshots(db: Session, version: AnnotationVersion) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Stream the snapshots of a published version.
+
+    Rows come from the database in annotation_id order; a version published
+    before content-addressed states whose rows were moved to its blob is
+    read from the blob, in image order.
+
+    Args:
+        db: Labeler database session
+        version: Published version
+
+    Yields:
+        (annotation_id, snapshot_data)
+    """
+    rows, annotation_id_column = _database_snapshots(db, version)
+    found = False
+    for annotation_id, snapshot_data in rows.order_by(annotation_id_column).yield_per(STREAM_BATCH_SIZE):
+        found = True
+        yield annotation_id, snapshot_data
+
+    if not found and version.snapshot_path:
+        for row in storage_client.iter_snapshot_blob(version.snapshot_path):
+            yield row.annotation_id, row.snapshot_data
+
+
+def _iter_database_snapshots_by_image(
+    db: Session,
+    version: AnnotationVersion,
+) -> Iterator[Tuple[Optional[str], int, Dict[str, Any]]]:
+    """
+    A version's database snapshots with the image of their annotation, in blob order.
+
+    Snapshots store no image id: it is read from the annotation, so
+    snapshots of deleted annotations have image id None.
+    """
+    rows, annotation_id_column = _database_snapshots(db, version)
+    image_id = Annotation.image_id
+    if db.get_bind().dialect.name == "postgresql":
+        # Code point order, as the export stream and the blob index
+        image_id = image_id.collate("C")
+    rows = rows.outerjoin(Annotation, Annotation.id == annotation_id_column).add_columns(
+        Annotation.image_id
+    ).order_by(image_id.nulls_first(), annotation_id_column)
+
+    for annotation_id, snapshot_data, annotation_image_id in rows.yield_per(STREAM_BATCH_SIZE):
+        yield annotation_image_id, annotation_id, snapshot_data
+
+
+def move_version_snapshots_to_blob(db: Session, version: AnnotationVersion, delete_rows: bool = True) -> int:
+    """
+    Write the snapshot blob of a version published without one.
+
+    The blob is built from the version's database snapshots and
+    version.snapshot_path is set. The version's annotation_snapshots rows
+    are then deleted in batches (content-addressed members are shared with
+    other versions and kept). Nothing is committed.
+
+    Args:
+        db: Labeler database session
+        version: Published version without snapshot_path
+        delete_rows: Delete the version's annotation_snapshots rows
+
+    Returns:
+        Number of annotations in the blob
+    """
+    key = snapshot_blob_key(version.project_id, version.task_type, version.version_number)
+    with tempfile.SpooledTemporaryFile(max_size=BLOB_SPOOL_BYTES) as blob:
+        builder = SnapshotBlobBuilder(blob)
+        rows = _iter_database_snapshots_by_image(db, version)
+        for image_id, image_rows in itertools.groupby(rows, key=itemgetter(0)):
+            builder.add_image(image_id, ((annotation_id, data) for _, annotation_id, data in image_rows))
+        index = builder.finish()
+        blob.seek(0)
+        storage_client.save_snapshot_blob(key, blob, index)
+    version.snapshot_path = key
+
+    if delete_rows:
+        while True:
+            ids = [
+                snapshot_id for (snapshot_id,) in db.query(AnnotationSnapshot.id).filter(
+                    AnnotationSnapshot.version_id == version.id
+                ).limit(WRITE_CHUNK_SIZE)
+            ]
+            if not ids:
+                break
+            db.query(AnnotationSnapshot).filter(AnnotationSnapshot.id.in_(ids)).delete(synchronize_session=False)
+
+    return index.annotation_count
+
+
+def delete_project_snapshots(db: Session, project_ids: Sequence[str]) -> int:
+    """
+    Delete the version members of projects and the states no other project uses.
+
+    Args:
+        db: Labeler database session
+        project_ids: Projects being deleted
+
+    Returns:
+        Number of deleted members
+    """
+    if not project_ids:
+        return 0
+
+    hashes = [
+        digest for (digest,) in db.query(AnnotationVersionMember.state_hash).filter(
+            AnnotationVersionMember.project_id.in_(project_ids)
+        ).distinct()
+    ]
+    deleted = db.query(AnnotationVersionMember).filter(
+        AnnotationVersionMember.project_id.in_(project_ids)
+    ).delete(synchronize_session=False)
+
+    for chunk in batched(hashes, WRITE_CHUNK_SIZE):
+        db.query(AnnotationState).filter(
+            AnnotationState.hash.in_(chunk),
+            ~exists().where(AnnotationVersionMember.state_hash == AnnotationState.hash),
+        ).delete(synchronize_session=False)
+
+    return deleted
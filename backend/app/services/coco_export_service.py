@@ -17,6 +17,11 @@ from sqlalchemy import and_
 
 from app.db.models.labeler import Dataset, Annotation, AnnotationProject, TextLabel
 from app.core.config import settings
+from app.services.export_query_service import ExportBatch, ExportWriter, write_export
+from app.services.image_dimension_service import Dimensions
+
+# Annotation columns read by COCO exports
+COCO_ANNOTATION_COLUMNS = (Annotation.annotation_type, Annotation.geometry, Annotation.class_id)
 
 # Korea Standard Time (UTC+9)
 KST = timezone(timedelta(hours=9))
@@ -46,95 +51,133 @@ def export_to_coco(
     Returns:
         COCO format dictionary
     """
-    # Get project
-    project = db.query(AnnotationProject).filter(
-        AnnotationProject.id == project_id
-    ).first()
-
-    if not project:
-        raise ValueError(f"Project {project_id} not found")
-
-    # Get dataset from Labeler DB
-    dataset = db.query(Dataset).filter(
-        Dataset.id == project.dataset_id
-    ).first()
-
-    if not dataset:
-        raise ValueError(f"Dataset {project.dataset_id} not found")
-
-    # Build annotation query
-    query = db.query(Annotation).filter(Annotation.project_id == project_id)
-
-    # Filter by annotation state
-    if not include_draft:
-        query = query.filter(Annotation.annotation_state.in_(['confirmed', 'verified']))
-
-    # Filter by image IDs if specified
-    if image_ids:
-        query = query.filter(Annotation.image_id.in_(image_ids))
-
-    annotations = query.all()
-
-    # Phase 19: Query text labels for export
-    text_labels_query = db.query(TextLabel).filter(TextLabel.project_id == project_id)
-    if image_ids:
-        text_labels_query = text_labels_query.filter(TextLabel.image_id.in_(image_ids))
-    text_labels = text_labels_query.all()
-
-    # Extract unique image IDs from annotations
-    # Sort to ensure consistent order (image_id is now file_path)
-    unique_image_ids = sorted(list(set([ann.image_id for ann in annotations])))
-
-    # REFACTORING: Get task-specific classes (task_classes only, no legacy fallback)
-    # Legacy project.classes field has been removed
-    if task_type and project.task_classes and task_type in project.task_classes:
-        task_classes = project.task_classes[task_type]
-    elif project.task_classes:
-        # If task_type not specified, try to get first available task's classes
-        task_classes = next(iter(project.task_classes.values())) if project.task_classes else {}
-    else:
-        task_classes = {}
-
-    # Build class_id to COCO category ID mapping (1-based)
-    class_id_to_category = {}
-    if isinstance(task_classes, dict):
-        sorted_classes = sorted(
-            task_classes.items(),
-            key=lambda x: (x[1].get("order", 0), x[0])
-        )
-        for idx, (class_id, class_info) in enumerate(sorted_classes, start=1):
-            class_id_to_category[class_id] = idx
+    writer = CocoExportWriter(db, project_id, task_type=task_type, version=version)
+    write_export(
+        db, project_id, writer.dataset_id, [writer],
+        include_draft=include_draft, image_ids=image_ids, task_type=task_type,
+    )
+    return writer.result()
 
-    # Phase 16.6: Add storage information for Platform integration
-    storage_info = {
-        "storage_type": dataset.storage_type if dataset else "s3",
-        "bucket": settings.S3_BUCKET_DATASETS,
-        "image_root": f"{dataset.storage_path}images/" if dataset and dataset.storage_path else f"datasets/{project.dataset_id}/images/",
-    }
 
-    # Build COCO structure
-    coco_data = {
-        "info": _build_info(project, dataset, version),
-        "licenses": _build_licenses(),
-        "images": _build_images(unique_image_ids),
-        "annotations": _build_annotations(annotations, class_id_to_category),
-        "categories": _build_categories(task_classes),
-        "storage_info": storage_info,  # Phase 16.6: Image storage location
-    }
+class CocoExportWriter(ExportWriter):
+    """
+    Builds a COCO document from a (possibly shared) export stream.
 
-    # Phase 19: Add text label sections (COCO extensions)
-    if text_labels:
-        captions, region_descriptions, vqa = _build_text_label_sections(
-            text_labels, unique_image_ids, annotations
-        )
-        if captions:
-            coco_data["captions"] = captions
-        if region_descriptions:
-            coco_data["region_descriptions"] = region_descriptions
-        if vqa:
-            coco_data["vqa"] = vqa
+    Feed it with write_export() / iter_writer_batches(); result() returns
+    the same dictionary as export_to_coco() over the same stream.
+    """
+
+    columns = COCO_ANNOTATION_COLUMNS
+
+    def __init__(
+        self,
+        db: Session,
+        project_id: str,
+        task_type: Optional[str] = None,
+        version: Optional[str] = None,
+    ):
+        # Get project
+        project = db.query(AnnotationProject).filter(
+            AnnotationProject.id == project_id
+        ).first()
+
+        if not project:
+            raise ValueError(f"Project {project_id} not found")
+
+        # Get dataset from Labeler DB
+        dataset = db.query(Dataset).filter(
+            Dataset.id == project.dataset_id
+        ).first()
+
+        if not dataset:
+            raise ValueError(f"Dataset {project.dataset_id} not found")
+
+        # REFACTORING: Get task-specific classes (task_classes only, no legacy fallback)
+        # Legacy project.classes field has been removed
+        if task_type and project.task_classes and task_type in project.task_classes:
+            task_classes = project.task_classes[task_type]
+        elif project.task_classes:
+            # If task_type not specified, try to get first available task's classes
+            task_classes = next(iter(project.task_classes.values())) if project.task_classes else {}
+        else:
+            task_classes = {}
+
+        # Build class_id to COCO category ID mapping (1-based)
+        class_id_to_category = {}
+        if isinstance(task_classes, dict):
+            sorted_classes = sorted(
+                task_classes.items(),
+                key=lambda x: (x[1].get("order", 0), x[0])
+            )
+            for idx, (class_id, class_info) in enumerate(sorted_classes, start=1):
+                class_id_to_category[class_id] = idx
+
+        self.dataset_id = project.dataset_id
+        self._project = project
+        self._dataset = dataset
+        self._version = version
+        self._task_classes = task_classes
+        self._class_id_to_category = class_id_to_category
+
+        self._images: List[Dict[str, Any]] = []
+        self._annotations: List[Dict[str, Any]] = []
+        self._captions: List[Dict[str, Any]] = []
+        self._region_descriptions: List[Dict[str, Any]] = []
+        self._vqa: List[Dict[str, Any]] = []
+        self._annotation_count = 0
+
+    def add_batch(self, batch: ExportBatch) -> None:
+        for image in batch.images:
+            if not image.annotations:
+                continue
+            coco_image_id = len(self._images) + 1
+            self._images.extend(_build_images([image.image_id], batch.dimensions, start=coco_image_id))
+            self._annotations.extend(
+                _build_annotations(image.annotations, coco_image_id, self._class_id_to_category)
+            )
+
+            # Phase 19: Text labels (region labels refer to the annotation's
+            # 1-based position in the export)
+            if image.text_labels:
+                ann_id_to_coco_id = {
+                    ann.id: self._annotation_count + idx + 1 for idx, ann in enumerate(image.annotations)
+                }
+                _build_text_label_sections(
+                    image.text_labels, coco_image_id, ann_id_to_coco_id,
+                    self._captions, self._region_descriptions, self._vqa
+                )
+            self._annotation_count += len(image.annotations)
+
+    def result(self) -> Dict[str, Any]:
+        """COCO dictionary of the batches added so far."""
+        project, dataset = self._project, self._dataset
+
+        # Phase 16.6: Add storage information for Platform integration
+        storage_info = {
+            "storage_type": dataset.storage_type if dataset else "s3",
+            "bucket": settings.S3_BUCKET_DATASETS,
+            "image_root": f"{dataset.storage_path}images/" if dataset and dataset.storage_path else f"datasets/{project.dataset_id}/images/",
+        }
 
-    return coco_data
+        # Build COCO structure
+        coco_data = {
+            "info": _build_info(project, dataset, self._version),
+            "licenses": _build_licenses(),
+            "images": self._images,
+            "annotations": self._annotations,
+            "categories": _build_categories(self._task_classes),
+            "storage_info": storage_info,  # Phase 16.6: Image storage location
+        }
+
+        # Phase 19: Add text label sections (COCO extensions)
+        if self._captions:
+            coco_data["captions"] = self._captions
+        if self._region_descriptions:
+            coco_data["region_descriptions"] = self._region_descriptions
+        if self._vqa:
+            coco_data["vqa"] = self._vqa
+
+        return coco_data
 
 
 def _build_info(project: AnnotationProject, dataset: Dataset, version: Optional[str] = None) -> Dict[str, Any]:
@@ -161,20 +204,28 @@ def _build_licenses() -> List[Dict[str, Any]]:
     ]
 
 
-def _build_images(image_ids: List[str]) -> List[Dict[str, Any]]:
+def _build_images(
+    image_ids: List[str],
+    dimensions: Dict[str, Dimensions],
+    start: int = 1
+) -> List[Dict[str, Any]]:
     """
     Build COCO images section.
 
-    Note: We don't have width/height in the database yet, so we'll use placeholders.
-    In production, you should fetch this from S3 metadata or store in DB.
+    Args:
+        image_ids: Sorted image IDs
+        dimensions: image_id -> (width, height) from image_metadata; images
+            without stored dimensions get 0 x 0
+        start: COCO ID of the first image
     """
     images = []
-    for idx, image_id in enumerate(image_ids, start=1):
+    for idx, image_id in enumerate(image_ids, start=start):
+        width, height = dimensions.get(image_id, (0, 0))
         images.append({
             "id": idx,
             "file_name": image_id,  # Use image_id as file_name
-            "width": 0,  # TODO: Get actual dimensions from S3 or DB
-            "height": 0,  # TODO: Get actual dimensions from S3 or DB
+            "width": width,
+            "height": height,
             "license": 1,
             "flickr_url": "",
             "coco_url": "",
@@ -186,21 +237,18 @@ def _build_images(image_ids: List[str]) -> List[Dict[str, Any]]:
 
 def _build_annotations(
     annotations: List[Annotation],
+    coco_image_id: int,
     class_id_to_category: Dict[str, int] = None
 ) -> List[Dict[str, Any]]:
-    """Build COCO annotations section.
+    """Build COCO annotations of one image.
 
     Args:
-        annotations: List of annotation objects
+        annotations: Annotation rows of the image
+        coco_image_id: COCO ID of the image
         class_id_to_category: Mapping from DB class_id to COCO category ID (1-based)
     """
     coco_annotations = []
 
-    # Create image_id to COCO image_id mapping
-    # Sort to ensure consistent order (image_id is now file_path)
-    unique_image_ids = sorted(list(set([ann.image_id for ann in annotations])))
-    image_id_to_coco_id = {img_id: idx + 1 for idx, img_id in enumerate(unique_image_ids)}
-
     for annotation in annotations:
         # Skip non-bbox/polygon annotations (COCO for object detection & segmentation)
         if annotation.annotation_type not in ("bbox", "polygon"):
@@ -209,9 +257,6 @@ def _build_annotations(
         # Extract geometry
         geometry = annotation.geometry
 
-        # Get COCO image ID
-        coco_image_id = image_id_to_coco_id.get(annotation.image_id)
-
         # Get category ID from mapping
         category_id = 1  # Default
         if class_id_to_category and annotation.class_id in class_id_to_category:
@@ -328,68 +373,52 @@ def _build_categories(task_classes: Dict[str, Any]) -> List[Dict[str, Any]]:
 
 def _build_text_label_sections(
     text_labels: List[TextLabel],
-    image_ids: List[str],
-    annotations: List[Annotation]
-) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    coco_image_id: int,
+    ann_id_to_coco_id: Dict[int, int],
+    captions: List[Dict[str, Any]],
+    region_descriptions: List[Dict[str, Any]],
+    vqa: List[Dict[str, Any]]
+) -> None:
     """
-    Build COCO text label sections (Phase 19).
+    Add one image's text labels to the COCO text label sections (Phase 19).
 
-    Returns:
-        Tuple of (captions, region_descriptions, vqa)
+    Args:
+        text_labels: Text label rows of the image
+        coco_image_id: COCO ID of the image
+        ann_id_to_coco_id: Annotation ID -> COCO annotation ID
+        captions, region_descriptions, vqa: Sections appended to (IDs
+            continue from their lengths)
     """
-    # Create image_id to index mapping
-    image_id_to_idx = {image_id: idx + 1 for idx, image_id in enumerate(image_ids)}
-
-    # Create annotation_id to COCO ann_id mapping
-    ann_id_to_coco_id = {ann.id: idx + 1 for idx, ann in enumerate(annotations)}
-
-    captions = []
-    region_descriptions = []
-    vqa = []
-
-    caption_id = 1
-    region_desc_id = 1
-    vqa_id = 1
-
     for label in text_labels:
-        image_idx = image_id_to_idx.get(label.image_id)
-        if image_idx is None:
-            continue  # Skip if image not in export
-
         # Image-level labels (caption, description, VQA)
         if label.annotation_id is None:
             if label.label_type in ["caption", "description"]:
                 captions.append({
-                    "id": caption_id,
-                    "image_id": image_idx,
+                    "id": len(captions) + 1,
+                    "image_id": coco_image_id,
                     "caption": label.text_content,
                     "language": label.language,
                     "label_type": label.label_type,
                 })
-                caption_id += 1
             elif label.label_type == "qa" and label.question:
                 vqa.append({
-                    "id": vqa_id,
-                    "image_id": image_idx,
+                    "id": len(vqa) + 1,
+                    "image_id": coco_image_id,
                     "question": label.question,
                     "answer": label.text_content,
                     "language": label.language,
                 })
-                vqa_id += 1
         # Region-level labels
         else:
             coco_ann_id = ann_id_to_coco_id.get(label.annotation_id)
             if coco_ann_id:
                 region_descriptions.append({
-                    "id": region_desc_id,
-                    "image_id": image_idx,
+                    "id": len(region_descriptions) + 1,
+                    "image_id": coco_image_id,
                     "annotation_id": coco_ann_id,
                     "phrase": label.text_content,
                     "language": label.language,
                 })
-                region_desc_id += 1
-
-    return captions, region_descriptions, vqa
 
 
 def get_export_stats(coco_data: Dict[str, Any]) -> Dict[str, int]:
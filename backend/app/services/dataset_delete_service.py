@@ -25,6 +25,10 @@ from app.db.models.labeler import (
     AnnotationSnapshot
 )
 from app.core.storage import storage_client
+from app.core.storage_backends import StorageBackend
+from app.services.annotation_snapshot_service import delete_project_snapshots
+from app.services.export_cache_service import delete_project_export_artifacts
+from app.services.version_diff_cache_service import delete_project_diffs
 from app.services.dice_export_service import export_to_dice
 import json
 
@@ -139,43 +143,28 @@ def calculate_deletion_impact(
         # List all files in dataset directory
         dataset_prefix = f"datasets/{dataset_id}/"
 
-        paginator = storage_client.s3_client.get_paginator('list_objects_v2')
-        pages = paginator.paginate(
-            Bucket=storage_client.datasets_bucket,
-            Prefix=dataset_prefix
-        )
-
-        for page in pages:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    key = obj['Key']
-                    size = obj['Size']
-                    impact.storage_size_bytes += size
+        for obj in storage_client.get_backend(dataset.storage_type).list_objects(
+            storage_client.datasets_bucket, prefix=dataset_prefix
+        ):
+            key = obj.key
+            impact.storage_size_bytes += obj.size
 
-                    # Categorize files
-                    if 'annotations_' in key or key.endswith('annotations.json'):
-                        impact.annotation_files.append(key)
-                    elif key.endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif')):
-                        impact.image_files.append(key)
+            # Categorize files
+            if 'annotations_' in key or key.endswith('annotations.json'):
+                impact.annotation_files.append(key)
+            elif key.endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif')):
+                impact.image_files.append(key)
 
         # List export files
+        export_backend = storage_client.get_backend('s3')
         for project in projects:
             export_prefix = f"exports/{project.id}/"
 
-            export_pages = paginator.paginate(
-                Bucket=storage_client.datasets_bucket,
-                Prefix=export_prefix
-            )
-
-            for page in export_pages:
-                if 'Contents' in page:
-                    for obj in page['Contents']:
-                        key = obj['Key']
-                        size = obj['Size']
-                        impact.storage_size_bytes += size
-                        impact.export_files.append(key)
+            for obj in export_backend.list_objects(storage_client.datasets_bucket, prefix=export_prefix):
+                impact.storage_size_bytes += obj.size
+                impact.export_files.append(obj.key)
 
-    except ClientError as e:
+    except (ClientError, OSError) as e:
         print(f"Warning: Failed to calculate S3 storage size: {e}")
 
     return impact
@@ -192,8 +181,9 @@ def delete_labeler_data(
     1. Annotations
     2. ImageAnnotationStatus
     3. AnnotationVersions
-    4. AnnotationSnapshots
-    5. AnnotationProjects
+    4. AnnotationSnapshots (and version members / unshared states)
+    5. Cached version diffs and export artifact records
+    6. AnnotationProjects
 
     Args:
         labeler_db: Labeler database session
@@ -207,6 +197,8 @@ def delete_labeler_data(
         "image_statuses": 0,
         "annotation_versions": 0,
         "annotation_snapshots": 0,
+        "version_diffs": 0,
+        "export_artifacts": 0,
         "projects": 0
     }
 
@@ -239,12 +231,19 @@ def delete_labeler_data(
         ).all()
     ]
 
-    # Delete annotation snapshots
+    # Delete annotation snapshots (legacy rows and content-addressed members)
     if version_ids:
         deleted_snapshots = labeler_db.query(AnnotationSnapshot).filter(
             AnnotationSnapshot.version_id.in_(version_ids)
         ).delete(synchronize_session=False)
         counts["annotation_snapshots"] = deleted_snapshots
+    counts["annotation_snapshots"] += delete_project_snapshots(labeler_db, project_ids)
+
+    # Delete cached version diffs
+    counts["version_diffs"] = delete_project_diffs(labeler_db, project_ids)
+
+    # Delete export artifact records (the files go with the export prefixes)
+    counts["export_artifacts"] = delete_project_export_artifacts(labeler_db, project_ids)
 
     # Delete annotation versions
     deleted_versions = labeler_db.query(AnnotationVersion).filter(
@@ -264,9 +263,18 @@ def delete_labeler_data(
     return counts
 
 
+def _delete_prefix(backend: StorageBackend, bucket: str, prefix: str) -> int:
+    """Delete every object under a prefix; returns the number of objects deleted."""
+    keys = [obj.key for obj in backend.list_objects(bucket, prefix=prefix)]
+    if keys:
+        backend.delete_objects(bucket, keys)
+    return len(keys)
+
+
 def delete_s3_data(
     dataset_id: str,
-    project_ids: List[str]
+    project_ids: List[str],
+    storage_type: Optional[str] = None
 ) -> Dict[str, int]:
     """
     Delete all S3 files for a dataset.
@@ -275,72 +283,52 @@ def delete_s3_data(
     1. Dataset images (datasets/{id}/)
     2. Dataset annotations (datasets/{id}/annotations_*.json)
     3. Export files (exports/{project_id}/)
+    4. Version snapshot blobs (snapshots/{project_id}/)
+
+    Dataset files are deleted from the dataset's own backend, snapshot blobs
+    from the default backend they are written to, exports from S3.
 
     Args:
         dataset_id: Dataset ID
         project_ids: List of project IDs to clean up exports
+        storage_type: Dataset.storage_type (None = settings.STORAGE_BACKEND)
 
     Returns:
-        Dictionary with deletion counts
+        Dictionary with deletion counts (dataset_files, export_files,
+        snapshot_files)
     """
     counts = {
         "dataset_files": 0,
-        "export_files": 0
+        "export_files": 0,
+        "snapshot_files": 0
     }
 
     try:
         # Delete dataset directory
-        dataset_prefix = f"datasets/{dataset_id}/"
-
-        paginator = storage_client.s3_client.get_paginator('list_objects_v2')
-        pages = paginator.paginate(
-            Bucket=storage_client.datasets_bucket,
-            Prefix=dataset_prefix
+        counts["dataset_files"] = _delete_prefix(
+            storage_client.get_backend(storage_type),
+            storage_client.datasets_bucket,
+            f"datasets/{dataset_id}/"
         )
 
-        # Collect all object keys
-        objects_to_delete = []
-        for page in pages:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    objects_to_delete.append({'Key': obj['Key']})
-
-        # Delete in batches of 1000 (S3 limit)
-        for i in range(0, len(objects_to_delete), 1000):
-            batch = objects_to_delete[i:i+1000]
-            if batch:
-                storage_client.s3_client.delete_objects(
-                    Bucket=storage_client.datasets_bucket,
-                    Delete={'Objects': batch}
-                )
-                counts["dataset_files"] += len(batch)
+        # The manifest was deleted with the prefix; drop the in-process copy too
+        storage_client.invalidate_manifest_cache(dataset_id)
 
         # Delete export directories for each project
+        export_backend = storage_client.get_backend('s3')
         for project_id in project_ids:
-            export_prefix = f"exports/{project_id}/"
+            counts["export_files"] += _delete_prefix(
+                export_backend, storage_client.datasets_bucket, f"exports/{project_id}/"
+            )
 
-            export_pages = paginator.paginate(
-                Bucket=storage_client.datasets_bucket,
-                Prefix=export_prefix
+        # Delete version snapshot blobs for each project (annotations bucket)
+        snapshot_backend = storage_client.get_backend()
+        for project_id in project_ids:
+            counts["snapshot_files"] += _delete_prefix(
+                snapshot_backend, storage_client.annotations_bucket, f"snapshots/{project_id}/"
             )
 
-            export_objects = []
-            for page in export_pages:
-                if 'Contents' in page:
-                    for obj in page['Contents']:
-                        export_objects.append({'Key': obj['Key']})
-
-            # Delete export files in batches
-            for i in range(0, len(export_objects), 1000):
-                batch = export_objects[i:i+1000]
-                if batch:
-                    storage_client.s3_client.delete_objects(
-                        Bucket=storage_client.datasets_bucket,
-                        Delete={'Objects': batch}
-                    )
-                    counts["export_files"] += len(batch)
-
-    except ClientError as e:
+    except (ClientError, OSError) as e:
         raise RuntimeError(f"Failed to delete S3 data: {e}")
 
     return counts
@@ -443,11 +431,14 @@ def delete_dataset_complete(
     # Get project IDs for S3 cleanup
     project_ids = [p["project_id"] for p in impact.projects]
 
+    # Storage backend of the dataset files (read before the record goes away)
+    storage_type = labeler_db.query(Dataset.storage_type).filter(Dataset.id == dataset_id).scalar()
+
     # Delete Labeler data
     labeler_counts = delete_labeler_data(labeler_db, dataset_id)
 
     # Delete S3 data
-    s3_counts = delete_s3_data(dataset_id, project_ids)
+    s3_counts = delete_s3_data(dataset_id, project_ids, storage_type)
 
     # Delete Labeler dataset record
     dataset = labeler_db.query(Dataset).filter(Dataset.id == dataset_id).first()
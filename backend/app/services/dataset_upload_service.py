@@ -6,20 +6,22 @@ Handles file uploads for datasets:
 - Annotation file parsing
 """
 
+import asyncio
 import logging
 import os
-import io
+import shutil
+import tempfile
 import zipfile
 import json
-from typing import List, Dict, Optional, Tuple
+import time
+from typing import Callable, List, Dict, NamedTuple, Optional, Tuple
 from fastapi import UploadFile
-from datetime import datetime
 from sqlalchemy.orm import Session
 
+from app.core.manifest import ManifestEntry
 from app.core.storage import storage_client
 from app.core.config import settings
-from app.services.thumbnail_service import create_thumbnail, get_thumbnail_path
-from app.db.models.labeler import ImageMetadata  # Phase 2.12: Performance
+from app.services.ingest_pipeline import IngestContent, IngestItem, IngestPipeline, IngestResult, SpooledContent
 
 logger = logging.getLogger(__name__)
 
@@ -31,235 +33,235 @@ class UploadResult:
         self,
         images_count: int = 0,
         total_bytes: int = 0,
-        folder_structure: Dict[str, int] = None
+        folder_structure: Dict[str, int] = None,
+        stage_stats: Dict[str, Dict[str, float]] = None,
+        duplicates_skipped: int = 0,
+        new_images: int = 0
     ):
         self.images_count = images_count
+        self.new_images = new_images  # Not in the dataset before (replacements excluded)
         self.total_bytes = total_bytes
         self.folder_structure = folder_structure or {}
+        self.stage_stats = stage_stats or {}
+        self.duplicates_skipped = duplicates_skipped
+
+    @classmethod
+    def from_ingest(cls, result: IngestResult) -> "UploadResult":
+        return cls(
+            images_count=result.images_count,
+            total_bytes=result.total_bytes,
+            folder_structure=result.folder_structure,
+            stage_stats=result.stage_stats,
+            duplicates_skipped=result.duplicates_skipped,
+            new_images=result.new_images
+        )
+
+
+class ZipMemberProgress(NamedTuple):
+    """Progress of a ZIP import, reported once per stored member."""
+
+    member: str
+    completed: int  # Members stored so far (completion order, not archive order)
+    total: int  # Image members in the archive
+    bytes_completed: int  # Uncompressed bytes stored so far
+    bytes_total: int
 
 
 async def upload_files_to_s3(
     dataset_id: str,
     files: List[UploadFile],
     labeler_db: Session,  # Phase 2.12: For saving metadata
-    preserve_structure: bool = True
+    preserve_structure: bool = True,
+    storage_type: Optional[str] = None
 ) -> UploadResult:
     """
     Upload files to S3 with optional folder structure preservation.
 
     Phase 2.12: Now saves image metadata to DB for fast lookups.
+    Files go through IngestPipeline: uploads and metadata inserts run
+    concurrently off the event loop with bounded memory; thumbnails are
+    queued for the thumbnail workers.
 
     Args:
         dataset_id: Dataset ID
         files: List of uploaded files
         labeler_db: Database session for saving metadata
         preserve_structure: Whether to preserve folder structure
+        storage_type: Dataset.storage_type (None = settings.STORAGE_BACKEND)
 
     Returns:
-        UploadResult with counts and structure info
+        UploadResult with counts, structure info and per-stage throughput
     """
-    images_count = 0
-    total_bytes = 0
-    folder_structure = {}
-    COMMIT_BATCH_SIZE = 50  # Commit every 50 images to avoid large transaction
-
-    for file in files:
-        # Handle ZIP files
-        if file.filename and file.filename.lower().endswith('.zip'):
-            result = await upload_zip_with_structure(dataset_id, file, labeler_db)
-            images_count += result.images_count
-            total_bytes += result.total_bytes
-            folder_structure.update(result.folder_structure)
-
-        # Handle individual images
-        elif file.filename and is_image_file(file.filename):
-            # Determine S3 key and relative path
-            if preserve_structure and '/' in file.filename:
-                # Keep folder structure
-                relative_path = file.filename
-                s3_key = f"datasets/{dataset_id}/images/{relative_path}"
-                folder_path = os.path.dirname(relative_path)
-            else:
-                # Flat structure
-                file_name = os.path.basename(file.filename)
-                relative_path = file_name
-                s3_key = f"datasets/{dataset_id}/images/{file_name}"
-                folder_path = None
-
-            # Upload original to S3
-            content = await file.read()
-            storage_client.s3_client.put_object(
-                Bucket=storage_client.datasets_bucket,
-                Key=s3_key,
-                Body=content,
-                ContentType=get_content_type(file.filename)
-            )
-
-            images_count += 1
-            total_bytes += len(content)
-
-            # Generate and upload thumbnail
-            thumbnail_bytes = create_thumbnail(content)
-            if thumbnail_bytes:
-                thumbnail_key = get_thumbnail_path(s3_key)
-                storage_client.s3_client.put_object(
-                    Bucket=storage_client.datasets_bucket,
-                    Key=thumbnail_key,
-                    Body=thumbnail_bytes,
-                    ContentType='image/jpeg'
-                )
-                logger.debug(f"Uploaded thumbnail: {thumbnail_key} ({len(thumbnail_bytes)} bytes)")
-
-            # Phase 2.12: Save image metadata to DB
-            # Generate unique image ID (relative path with extension for S3 key compatibility)
-            image_id = relative_path
-            file_name = os.path.basename(file.filename)
-
-            db_image = ImageMetadata(
-                id=image_id,
-                dataset_id=dataset_id,
-                file_name=file_name,
-                s3_key=s3_key,
-                folder_path=folder_path,
-                size=len(content),
-                uploaded_at=datetime.utcnow(),
-                last_modified=datetime.utcnow()
-            )
-            labeler_db.add(db_image)
-            logger.debug(f"Saved metadata for image: {image_id}")
-
-            # Track folder structure
-            if '/' in file.filename:
-                folder = os.path.dirname(file.filename)
-                if folder not in folder_structure:
-                    folder_structure[folder] = 0
-                folder_structure[folder] += 1
-
-            logger.info(f"Uploaded image: {s3_key} ({len(content)} bytes)")
-
-            # Commit periodically to avoid large transactions
-            if images_count % COMMIT_BATCH_SIZE == 0:
-                labeler_db.commit()
-                logger.debug(f"Committed batch of {COMMIT_BATCH_SIZE} images")
-
-    # Final commit for remaining images
-    labeler_db.commit()
-    logger.debug(f"Final commit completed")
-
-    return UploadResult(
-        images_count=images_count,
-        total_bytes=total_bytes,
-        folder_structure=folder_structure
-    )
+    backend = storage_client.get_backend(storage_type)
+
+    async with IngestPipeline(dataset_id, labeler_db, backend) as pipeline:
+        for file in files:
+            # Handle ZIP files
+            if file.filename and file.filename.lower().endswith('.zip'):
+                await _ingest_zip(pipeline, dataset_id, file)
+
+            # Handle individual images
+            elif file.filename and is_image_file(file.filename):
+                # Determine S3 key and relative path
+                if preserve_structure and '/' in file.filename:
+                    # Keep folder structure
+                    relative_path = file.filename
+                    folder_path = os.path.dirname(relative_path)
+                else:
+                    # Flat structure
+                    relative_path = os.path.basename(file.filename)
+                    folder_path = None
+
+                started = time.perf_counter()
+                content = await file.read()
+                pipeline.record_read(started, len(content))
+
+                # Phase 2.12: image ID is the relative path with extension (S3 key compatible)
+                await pipeline.submit(IngestItem(
+                    image_id=relative_path,
+                    s3_key=f"datasets/{dataset_id}/images/{relative_path}",
+                    file_name=os.path.basename(file.filename),
+                    folder_path=folder_path,
+                    content_type=get_content_type(file.filename)
+                ), content)
+
+    result = pipeline.result()
+    _update_manifest(dataset_id, result.manifest_entries, storage_type)
+
+    return UploadResult.from_ingest(result)
 
 
 async def upload_zip_with_structure(
     dataset_id: str,
     zip_file: UploadFile,
-    labeler_db: Session
+    labeler_db: Session,
+    storage_type: Optional[str] = None,
+    progress: Optional[Callable[[ZipMemberProgress], None]] = None
 ) -> UploadResult:
     """
     Extract ZIP and upload with folder structure.
 
     Phase 2.12: Now saves image metadata to DB for fast lookups.
+    Streams members from the spooled upload with bounded memory (see _ingest_zip).
 
     Args:
         dataset_id: Dataset ID
         zip_file: ZIP file upload
         labeler_db: Database session for saving metadata
+        storage_type: Dataset.storage_type (None = settings.STORAGE_BACKEND)
+        progress: Optional callback receiving a ZipMemberProgress per stored member
 
     Returns:
-        UploadResult with counts and structure info
+        UploadResult with counts, structure info and per-stage throughput
     """
-    images_count = 0
-    total_bytes = 0
-    folder_structure = {}
-    COMMIT_BATCH_SIZE = 50  # Commit every 50 images to avoid large transaction
+    backend = storage_client.get_backend(storage_type)
+
+    async with IngestPipeline(dataset_id, labeler_db, backend) as pipeline:
+        await _ingest_zip(pipeline, dataset_id, zip_file, progress)
 
-    # Read ZIP into memory
-    zip_content = await zip_file.read()
-    zip_buffer = io.BytesIO(zip_content)
+    result = pipeline.result()
+    _update_manifest(dataset_id, result.manifest_entries, storage_type)
 
-    with zipfile.ZipFile(zip_buffer) as zf:
-        for member in zf.namelist():
-            # Skip directories and hidden files
-            if member.endswith('/') or member.startswith('.') or '/__MACOSX' in member:
-                continue
+    logger.info(f"ZIP upload complete: {result.images_count} images, {result.total_bytes} bytes")
 
-            # Check if image file
-            if not is_image_file(member):
-                continue
+    return UploadResult.from_ingest(result)
 
-            # Read file content
-            content = zf.read(member)
 
-            # Upload original to S3 with structure
+async def _ingest_zip(
+    pipeline: IngestPipeline,
+    dataset_id: str,
+    zip_file: UploadFile,
+    progress: Optional[Callable[[ZipMemberProgress], None]] = None
+) -> None:
+    """
+    Feed the images of a ZIP archive into the pipeline, keeping its folder structure.
+
+    The archive is never loaded into memory: UploadFile.file is Starlette's
+    SpooledTemporaryFile (on disk past 1 MB), and zipfile only reads the
+    central directory (ZIP64 aware) plus one member at a time from it. Members
+    above INGEST_SPOOL_THRESHOLD_MB are extracted to a temp file and streamed
+    to storage instead of being held in memory.
+    """
+    spool_threshold = settings.INGEST_SPOOL_THRESHOLD_MB * 1024 * 1024
+    zip_file.file.seek(0)
+
+    with zipfile.ZipFile(zip_file.file) as zf:
+        members = [info for info in zf.infolist() if _is_image_member(info)]
+        total = len(members)
+        bytes_total = sum(info.file_size for info in members)
+        done = {"count": 0, "bytes": 0}
+        member_keys = set()
+
+        def on_stored(item: IngestItem, size: int) -> None:
+            if item.s3_key not in member_keys:
+                return  # Not from this archive
+            done["count"] += 1
+            done["bytes"] += size
+            logger.info(f"Uploaded from ZIP [{done['count']}/{total}]: {item.s3_key} ({size} bytes)")
+            if progress is not None:
+                progress(ZipMemberProgress(item.image_id, done["count"], total, done["bytes"], bytes_total))
+
+        pipeline.add_stored_callback(on_stored)
+        logger.info(f"ZIP archive {zip_file.filename}: {total} images, {bytes_total} bytes uncompressed")
+
+        for info in members:
+            member = info.filename
             s3_key = f"datasets/{dataset_id}/images/{member}"
-            storage_client.s3_client.put_object(
-                Bucket=storage_client.datasets_bucket,
-                Key=s3_key,
-                Body=content,
-                ContentType=get_content_type(member)
-            )
-
-            images_count += 1
-            total_bytes += len(content)
-
-            # Generate and upload thumbnail
-            thumbnail_bytes = create_thumbnail(content)
-            if thumbnail_bytes:
-                thumbnail_key = get_thumbnail_path(s3_key)
-                storage_client.s3_client.put_object(
-                    Bucket=storage_client.datasets_bucket,
-                    Key=thumbnail_key,
-                    Body=thumbnail_bytes,
-                    ContentType='image/jpeg'
-                )
-                logger.debug(f"Uploaded thumbnail: {thumbnail_key} ({len(thumbnail_bytes)} bytes)")
-
-            # Phase 2.12: Save image metadata to DB
-            # Generate unique image ID (relative path with extension for S3 key compatibility)
-            image_id = member
-            file_name = os.path.basename(member)
-            folder_path = os.path.dirname(member) if os.path.dirname(member) else None
-
-            db_image = ImageMetadata(
-                id=image_id,
-                dataset_id=dataset_id,
-                file_name=file_name,
+            member_keys.add(s3_key)
+
+            # Decompression is CPU work: keep it off the event loop
+            started = time.perf_counter()
+            content = await asyncio.to_thread(_read_member, zf, info, spool_threshold)
+            pipeline.record_read(started, info.file_size)
+
+            await pipeline.submit(IngestItem(
+                image_id=member,
                 s3_key=s3_key,
-                folder_path=folder_path,
-                size=len(content),
-                uploaded_at=datetime.utcnow(),
-                last_modified=datetime.utcnow()
-            )
-            labeler_db.add(db_image)
-            logger.debug(f"Saved metadata for image: {image_id}")
-
-            # Track folder structure
-            if folder_path:
-                if folder_path not in folder_structure:
-                    folder_structure[folder_path] = 0
-                folder_structure[folder_path] += 1
-
-            logger.info(f"Uploaded from ZIP: {s3_key} ({len(content)} bytes)")
-
-            # Commit periodically to avoid large transactions
-            if images_count % COMMIT_BATCH_SIZE == 0:
-                labeler_db.commit()
-                logger.debug(f"Committed batch of {COMMIT_BATCH_SIZE} images from ZIP")
-
-    # Final commit for remaining images
-    labeler_db.commit()
-    logger.debug(f"Final commit completed for ZIP upload")
-
-    logger.info(f"ZIP upload complete: {images_count} images, {total_bytes} bytes")
-
-    return UploadResult(
-        images_count=images_count,
-        total_bytes=total_bytes,
-        folder_structure=folder_structure
+                file_name=os.path.basename(member),
+                folder_path=os.path.dirname(member) or None,
+                content_type=get_content_type(member)
+            ), content)
+
+
+def _is_image_member(info: zipfile.ZipInfo) -> bool:
+    """Image members worth importing (skips directories, hidden files, macOS metadata, unsafe paths)."""
+    member = info.filename
+    # Skip directories and hidden files
+    if info.is_dir() or member.startswith('.') or '/__MACOSX' in member:
+        return False
+    # Never let a member escape datasets/{id}/images/
+    if member.startswith('/') or '..' in member.split('/'):
+        return False
+    return is_image_file(member)
+
+
+def _read_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo, spool_threshold: int) -> IngestContent:
+    """Read a member into memory, or extract it to a temp file if it is large."""
+    if info.file_size <= spool_threshold:
+        return zf.read(info)
+
+    fd, path = tempfile.mkstemp(
+        prefix="ingest-", suffix=os.path.splitext(info.filename)[1], dir=settings.INGEST_SPOOL_DIR or None
     )
+    try:
+        with os.fdopen(fd, "wb") as dst, zf.open(info) as src:
+            shutil.copyfileobj(src, dst, length=1024 * 1024)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledContent(path, info.file_size)
+
+
+def _update_manifest(dataset_id: str, entries: List[ManifestEntry], storage_type: Optional[str] = None) -> None:
+    """Merge freshly uploaded objects into the dataset manifest (if it has one)."""
+    if not entries:
+        return
+    try:
+        storage_client.update_dataset_manifest(dataset_id, upserts=entries, storage_type=storage_type)
+    except Exception as e:
+        # A stale manifest only misses these uploads; rebuild it with
+        # scripts/maintenance/build_dataset_manifests.py
+        logger.warning(f"Failed to update manifest for dataset {dataset_id}: {e}")
 
 
 async def parse_annotation_file(
@@ -29,10 +29,9 @@ DICE Format Structure:
 """
 
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional
+from typing import Iterator, List, Dict, Any, Optional, Sequence, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-import json
 import hashlib
 import os
 
@@ -86,9 +85,23 @@ def get_split_from_image_id(image_id: str, train_ratio: float = 0.7, val_ratio:
     else:
         return "test"
 
-from app.db.models.labeler import Dataset, Annotation, AnnotationProject, ImageAnnotationStatus, TextLabel
+from app.db.models.labeler import Dataset, Annotation, AnnotationProject, ImageAnnotationStatus
 from app.db.models.platform import User
+from app.core.json_stream import StreamedArray, iter_json_object
 from app.core.storage import storage_client
+from app.services.export_query_service import ExportImage, ExportWriter, iter_writer_batches
+
+# Annotation columns read by DICE exports (see _convert_annotation_to_dice)
+DICE_ANNOTATION_COLUMNS = (
+    Annotation.annotation_type,
+    Annotation.geometry,
+    Annotation.class_id,
+    Annotation.class_name,
+    Annotation.attributes,
+    Annotation.created_by,
+    Annotation.confirmed_by,
+    Annotation.created_at,
+)
 
 
 def export_to_dice(
@@ -104,6 +117,9 @@ def export_to_dice(
     """
     Export annotations to DICE format.
 
+    Builds the whole document in memory; use DiceExportStream to upload
+    large exports.
+
     Args:
         db: Labeler database session
         platform_db: Platform database session
@@ -116,6 +132,89 @@ def export_to_dice(
     Returns:
         DICE format dictionary
     """
+    header, images, statistics = _prepare_dice_export(
+        db, platform_db, project_id, include_draft, image_ids, task_type, version
+    )
+    dice_images = list(images)
+    return {**header, "images": dice_images, "statistics": statistics.result()}
+
+
+class DiceExportStream:
+    """
+    DICE export encoded incrementally as compact JSON.
+
+    Iterating yields UTF-8 chunks, so the stream can be passed to
+    storage_client.upload_export / upload_stream and goes out as a multipart
+    upload: only the current image and one chunk are held, instead of the
+    document, its indented text and the encoded bytes. Parsed, the output
+    equals export_to_dice() with the same arguments.
+
+    The project is looked up on construction (a missing project raises
+    ValueError before anything is uploaded); annotation rows are streamed
+    and converted while iterating. A stream can be iterated once;
+    get_stats() and bytes_written are complete afterwards.
+
+    writers (see export_query_service.ExportWriter) are fed from the same
+    annotation stream while it is iterated, so e.g. a publish produces its
+    COCO/YOLO export and snapshots without querying the annotations again;
+    they are complete once the stream has been consumed.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        platform_db: Session,
+        project_id: str,
+        include_draft: bool = False,
+        image_ids: Optional[List[str]] = None,
+        task_type: Optional[str] = None,
+        version: Optional[str] = None,
+        writers: Sequence[ExportWriter] = (),
+    ):
+        self.header, self._images, self._statistics = _prepare_dice_export(
+            db, platform_db, project_id, include_draft, image_ids, task_type, version, writers
+        )
+        self.bytes_written = 0
+
+    def __iter__(self) -> Iterator[bytes]:
+        members = [
+            *self.header.items(),
+            ("images", StreamedArray(self._images)),
+            ("statistics", self._statistics.result),
+        ]
+        for chunk in iter_json_object(members):
+            self.bytes_written += len(chunk)
+            yield chunk
+
+    def get_stats(self) -> Dict[str, int]:
+        """Same as get_export_stats() of the equivalent DICE dictionary."""
+        return {
+            "image_count": self._statistics.total_images,
+            "annotation_count": self._statistics.total_annotations,
+            "class_count": len(self.header["classes"]),
+        }
+
+
+def _prepare_dice_export(
+    db: Session,
+    platform_db: Session,
+    project_id: str,
+    include_draft: bool,
+    image_ids: Optional[List[str]],
+    task_type: Optional[str],
+    version: Optional[str],
+    writers: Sequence[ExportWriter] = (),
+) -> Tuple[Dict[str, Any], Iterator[Dict[str, Any]], "_DiceStatistics"]:
+    """
+    Look up the project and set up the streamed DICE images.
+
+    writers receive every batch of the annotation stream before it is
+    converted (see DiceExportStream).
+
+    Returns:
+        Tuple of (members before "images", lazy DICE images, statistics
+        filled in as the images are consumed)
+    """
     # Get project
     project = db.query(AnnotationProject).filter(
         AnnotationProject.id == project_id
@@ -132,67 +231,22 @@ def export_to_dice(
     if not dataset:
         raise ValueError(f"Dataset {project.dataset_id} not found")
 
-    # Build annotation query
-    query = db.query(Annotation).filter(Annotation.project_id == project_id)
-
-    # Filter by annotation state
-    if not include_draft:
-        query = query.filter(Annotation.annotation_state.in_(['confirmed', 'verified']))
-
-    # Filter by image IDs if specified
-    if image_ids:
-        query = query.filter(Annotation.image_id.in_(image_ids))
-
-    # REFACTORING: Filter by task_type using direct column (10x faster!)
-    # Before: Complex mapping and OR clause with JSON path filtering
-    # After: Simple indexed column lookup
-    if task_type:
-        # Normalize task_type (handle aliases like 'object_detection' → 'detection')
-        normalized_task_type = task_type
-        if task_type == 'object_detection':
-            normalized_task_type = 'detection'
+    # Annotations and text labels streamed image by image, shared with the
+    # writers (see export_query_service). REFACTORING: Filter by task_type
+    # using direct column (10x faster!); 'object_detection' → 'detection'
+    batches = iter_writer_batches(
+        db,
+        project_id,
+        dataset.id,
+        writers,
+        columns=DICE_ANNOTATION_COLUMNS,
+        include_draft=include_draft,
+        image_ids=image_ids,
+        task_type=task_type,
+    )
 
-        # REFACTORING: Simple indexed lookup!
-        query = query.filter(Annotation.task_type == normalized_task_type)
-
-    annotations = query.all()
-
-    # Phase 19: Query text labels for export
-    text_labels_query = db.query(TextLabel).filter(TextLabel.project_id == project_id)
-    if image_ids:
-        text_labels_query = text_labels_query.filter(TextLabel.image_id.in_(image_ids))
-    text_labels = text_labels_query.all()
-
-    # Group annotations by image
-    images_dict = {}
-    for ann in annotations:
-        if ann.image_id not in images_dict:
-            images_dict[ann.image_id] = []
-        images_dict[ann.image_id].append(ann)
-
-    # Phase 19: Group text labels by image and annotation
-    text_labels_by_image = {}  # image_id -> [text labels]
-    text_labels_by_annotation = {}  # annotation_id -> [text labels]
-    for label in text_labels:
-        # Image-level labels (annotation_id is None)
-        if label.annotation_id is None:
-            if label.image_id not in text_labels_by_image:
-                text_labels_by_image[label.image_id] = []
-            text_labels_by_image[label.image_id].append(label)
-        # Region-level labels (annotation_id is set)
-        else:
-            if label.annotation_id not in text_labels_by_annotation:
-                text_labels_by_annotation[label.annotation_id] = []
-            text_labels_by_annotation[label.annotation_id].append(label)
-
-    # Load image dimensions from Platform annotations file
     # Use provided task_type or fallback to first task type
     effective_task_type = task_type or (project.task_types[0] if project.task_types else 'detection')
-    image_dimensions_map = _load_image_dimensions(dataset)
-
-    # Sort by image_id (now file_path, so string sort)
-    sorted_images = sorted(images_dict.items(), key=lambda x: x[0])
-    image_id_mapping = {}  # Map image_id (file_path) to DICE numeric ID
 
     # REFACTORING: Get task-specific classes (task_classes only, no legacy fallback)
     # Legacy project.classes field has been removed
@@ -217,146 +271,37 @@ def export_to_dice(
             class_id_to_dice_index[class_id] = idx
             class_id_to_name[class_id] = class_info.get('name', class_id)
 
-    # Rebuild DICE images with correct class mapping
-    dice_images_with_mapping = []
-    for idx, (image_id, image_annotations) in enumerate(sorted_images):
-        # Use sequential integer as DICE ID (for COCO/DICE format compatibility)
-        # image_id is now file_path, so we generate sequential IDs
-        dice_id = idx + 1
-
-        image_id_mapping[image_id] = dice_id
-
-        # Get image metadata from image_annotation_status
-        status = db.query(ImageAnnotationStatus).filter(
-            ImageAnnotationStatus.project_id == project_id,
-            ImageAnnotationStatus.image_id == image_id
-        ).first()
-
-        # Get user information for metadata
-        labeled_by_user = None
-        reviewed_by_user = None
-
-        # Find labeled_by: Check all annotations for created_by
-        if image_annotations and platform_db:
-            # Try to find any annotation with created_by (Keycloak UUID)
-            for ann in image_annotations:
-                if ann.created_by:
-                    # Note: ann.created_by is Keycloak UUID which matches User.id
-                    labeled_by_user = platform_db.query(User).filter(
-                        User.id == ann.created_by
-                    ).first()
-                    if labeled_by_user:
-                        break
-
-        # Find reviewed_by: Look for confirmed_by
-        if status and status.is_image_confirmed and platform_db:
-            confirmed_by_id = None
-            for ann in image_annotations:
-                if ann.confirmed_by:
-                    confirmed_by_id = ann.confirmed_by
-                    break
-
-            if confirmed_by_id:
-                # Note: confirmed_by is Keycloak UUID which matches User.id
-                reviewed_by_user = platform_db.query(User).filter(
-                    User.id == confirmed_by_id
-                ).first()
-
-        # image_id is now file_path, so use it directly as file_name
-        file_name = image_id
-
-        # Get image dimensions from mapping if available
-        image_info = image_dimensions_map.get(image_id, {})
-        width = image_info.get('width', 0)
-        height = image_info.get('height', 0)
-
-        # Fallback: get dimensions from annotation geometry if not in mapping
-        if (width == 0 or height == 0) and image_annotations:
-            for ann in image_annotations:
-                if ann.geometry:
-                    geom_width = ann.geometry.get('image_width', 0)
-                    geom_height = ann.geometry.get('image_height', 0)
-                    if geom_width > 0 and geom_height > 0:
-                        width = geom_width
-                        height = geom_height
-                        break
-
-        # Deterministic train/val/test split based on image_id hash
-        split = get_split_from_image_id(image_id)
-
-        # Extract file format from file_name
-        file_ext = os.path.splitext(file_name)[1]  # e.g., ".png"
-        file_format = file_ext[1:].lower() if file_ext else "unknown"  # e.g., "png"
-
-        # Phase 19: Build annotations with text labels
-        dice_annotations = []
-        for ann in image_annotations:
-            dice_ann = _convert_annotation_to_dice(ann, dice_id, class_id_to_dice_index, class_id_to_name)
-
-            # Add region-level text labels to annotation if they exist
-            if ann.id in text_labels_by_annotation:
-                dice_ann["text_labels"] = [
-                    {
-                        "text": label.text_content,
-                        "language": label.language,
-                        "label_type": label.label_type,
-                        "confidence": label.confidence,
-                    }
-                    for label in text_labels_by_annotation[ann.id]
-                ]
-
-            dice_annotations.append(dice_ann)
-
-        # Phase 19: Build image-level text labels
-        image_captions = []
-        vqa_pairs = []
-        if image_id in text_labels_by_image:
-            for label in text_labels_by_image[image_id]:
-                if label.label_type == "caption":
-                    image_captions.append({
-                        "text": label.text_content,
-                        "language": label.language,
-                        "confidence": label.confidence,
-                    })
-                elif label.label_type == "description":
-                    image_captions.append({
-                        "text": label.text_content,
-                        "language": label.language,
-                        "label_type": "description",
-                        "confidence": label.confidence,
-                    })
-                elif label.label_type == "qa" and label.question:
-                    vqa_pairs.append({
-                        "question": label.question,
-                        "answer": label.text_content,
-                        "language": label.language,
-                        "confidence": label.confidence,
-                    })
-
-        dice_image = {
-            "id": dice_id,
-            "file_name": file_name,
-            "file_format": file_format,  # e.g., "png", "jpg", "jpeg"
-            "width": width,
-            "height": height,
-            "depth": 3,  # Assume RGB images
-            "split": split,  # Hash-based deterministic split (70% train, 20% val, 10% test)
-            "annotations": dice_annotations,
-            "metadata": {
-                "labeled_by": labeled_by_user.email if labeled_by_user else None,
-                "labeled_at": to_kst_isoformat(image_annotations[0].created_at) if image_annotations else None,
-                "reviewed_by": reviewed_by_user.email if reviewed_by_user else None,
-                "reviewed_at": to_kst_isoformat(status.confirmed_at) if status and status.confirmed_at else None,
-                "source": "platform_labeler_v1.0"
-            }
-        }
-
-        # Phase 19: Add image-level text labels to DICE image
-        if image_captions:
-            dice_image["image_captions"] = image_captions
-        if vqa_pairs:
-            dice_image["vqa_pairs"] = vqa_pairs
-        dice_images_with_mapping.append(dice_image)
+    statistics = _DiceStatistics()
+
+    # DICE images are built one at a time while the document is written
+    def generate_images() -> Iterator[Dict[str, Any]]:
+        dice_id = 0
+        fallback_dimensions = None
+        for batch in batches:
+            # Image dimensions recorded at upload (or by backfill_image_dimensions.py)
+            stored_dimensions = batch.dimensions
+            # Images with text labels only (requested by a writer) are not DICE images
+            images = [image for image in batch.images if image.annotations]
+            # Images without stored dimensions: fall back to the Platform annotations file
+            if fallback_dimensions is None and any(image.image_id not in stored_dimensions for image in images):
+                fallback_dimensions = _load_image_dimensions(dataset)
+
+            for image in images:
+                # Use sequential integer as DICE ID (for COCO/DICE format compatibility)
+                # image_id is now file_path, so we generate sequential IDs
+                dice_id += 1
+                if image.image_id in stored_dimensions:
+                    width, height = stored_dimensions[image.image_id]
+                    image_info = {'width': width, 'height': height}
+                else:
+                    image_info = (fallback_dimensions or {}).get(image.image_id, {})
+
+                dice_image = _build_dice_image(
+                    db, platform_db, project_id, image, dice_id, image_info,
+                    class_id_to_dice_index, class_id_to_name
+                )
+                statistics.add(dice_image)
+                yield dice_image
 
     # Map task_type to DICE task_type format
     dice_task_type_mapping = {
@@ -377,8 +322,8 @@ def export_to_dice(
         "image_root": f"{dataset.storage_path}images/" if dataset and dataset.storage_path else f"datasets/{project.dataset_id}/images/",
     }
 
-    # Build final DICE data
-    dice_data = {
+    # DICE members before "images"; "statistics" follows them
+    header = {
         "format_version": "1.0",
         "dataset_id": project.dataset_id,
         "dataset_name": dataset.name if dataset else project.name,
@@ -388,11 +333,175 @@ def export_to_dice(
         "version": version or "1.0",  # Use provided version or default to "1.0"
         "storage_info": storage_info,  # Phase 16.6: Image storage location
         "classes": _convert_classes_to_dice(task_classes),
-        "images": dice_images_with_mapping,
-        "statistics": _calculate_statistics(dice_images_with_mapping, task_classes)
     }
 
-    return dice_data
+    return header, generate_images(), statistics
+
+
+def _build_dice_image(
+    db: Session,
+    platform_db: Session,
+    project_id: str,
+    image: ExportImage,
+    dice_id: int,
+    image_info: Dict[str, int],
+    class_id_to_dice_index: Dict[str, int],
+    class_id_to_name: Dict[str, str],
+) -> Dict[str, Any]:
+    """
+    Convert one image's annotation and text label rows to a DICE image.
+
+    Args:
+        image: Rows of the image (see export_query_service)
+        dice_id: DICE format image ID
+        image_info: Stored {width, height} of the image, if known
+    """
+    image_id = image.image_id
+    image_annotations = image.annotations
+
+    # Phase 19: Group text labels by image and annotation
+    image_text_labels = []  # image-level text labels
+    text_labels_by_annotation = {}  # annotation_id -> [text labels]
+    for label in image.text_labels:
+        # Image-level labels (annotation_id is None)
+        if label.annotation_id is None:
+            image_text_labels.append(label)
+        # Region-level labels (annotation_id is set)
+        else:
+            if label.annotation_id not in text_labels_by_annotation:
+                text_labels_by_annotation[label.annotation_id] = []
+            text_labels_by_annotation[label.annotation_id].append(label)
+
+    # Get image metadata from image_annotation_status
+    status = db.query(ImageAnnotationStatus).filter(
+        ImageAnnotationStatus.project_id == project_id,
+        ImageAnnotationStatus.image_id == image_id
+    ).first()
+
+    # Get user information for metadata
+    labeled_by_user = None
+    reviewed_by_user = None
+
+    # Find labeled_by: Check all annotations for created_by
+    if image_annotations and platform_db:
+        # Try to find any annotation with created_by (Keycloak UUID)
+        for ann in image_annotations:
+            if ann.created_by:
+                # Note: ann.created_by is Keycloak UUID which matches User.id
+                labeled_by_user = platform_db.query(User).filter(
+                    User.id == ann.created_by
+                ).first()
+                if labeled_by_user:
+                    break
+
+    # Find reviewed_by: Look for confirmed_by
+    if status and status.is_image_confirmed and platform_db:
+        confirmed_by_id = None
+        for ann in image_annotations:
+            if ann.confirmed_by:
+                confirmed_by_id = ann.confirmed_by
+                break
+
+        if confirmed_by_id:
+            # Note: confirmed_by is Keycloak UUID which matches User.id
+            reviewed_by_user = platform_db.query(User).filter(
+                User.id == confirmed_by_id
+            ).first()
+
+    # image_id is now file_path, so use it directly as file_name
+    file_name = image_id
+
+    # Get image dimensions if available
+    width = image_info.get('width', 0)
+    height = image_info.get('height', 0)
+
+    # Fallback: get dimensions from annotation geometry if not in mapping
+    if (width == 0 or height == 0) and image_annotations:
+        for ann in image_annotations:
+            if ann.geometry:
+                geom_width = ann.geometry.get('image_width', 0)
+                geom_height = ann.geometry.get('image_height', 0)
+                if geom_width > 0 and geom_height > 0:
+                    width = geom_width
+                    height = geom_height
+                    break
+
+    # Deterministic train/val/test split based on image_id hash
+    split = get_split_from_image_id(image_id)
+
+    # Extract file format from file_name
+    file_ext = os.path.splitext(file_name)[1]  # e.g., ".png"
+    file_format = file_ext[1:].lower() if file_ext else "unknown"  # e.g., "png"
+
+    # Phase 19: Build annotations with text labels
+    dice_annotations = []
+    for ann in image_annotations:
+        dice_ann = _convert_annotation_to_dice(ann, dice_id, class_id_to_dice_index, class_id_to_name)
+
+        # Add region-level text labels to annotation if they exist
+        if ann.id in text_labels_by_annotation:
+            dice_ann["text_labels"] = [
+                {
+                    "text": label.text_content,
+                    "language": label.language,
+                    "label_type": label.label_type,
+                    "confidence": label.confidence,
+                }
+                for label in text_labels_by_annotation[ann.id]
+            ]
+
+        dice_annotations.append(dice_ann)
+
+    # Phase 19: Build image-level text labels
+    image_captions = []
+    vqa_pairs = []
+    for label in image_text_labels:
+        if label.label_type == "caption":
+            image_captions.append({
+                "text": label.text_content,
+                "language": label.language,
+                "confidence": label.confidence,
+            })
+        elif label.label_type == "description":
+            image_captions.append({
+                "text": label.text_content,
+                "language": label.language,
+                "label_type": "description",
+                "confidence": label.confidence,
+            })
+        elif label.label_type == "qa" and label.question:
+            vqa_pairs.append({
+                "question": label.question,
+                "answer": label.text_content,
+                "language": label.language,
+                "confidence": label.confidence,
+            })
+
+    dice_image = {
+        "id": dice_id,
+        "file_name": file_name,
+        "file_format": file_format,  # e.g., "png", "jpg", "jpeg"
+        "width": width,
+        "height": height,
+        "depth": 3,  # Assume RGB images
+        "split": split,  # Hash-based deterministic split (70% train, 20% val, 10% test)
+        "annotations": dice_annotations,
+        "metadata": {
+            "labeled_by": labeled_by_user.email if labeled_by_user else None,
+            "labeled_at": to_kst_isoformat(image_annotations[0].created_at) if image_annotations else None,
+            "reviewed_by": reviewed_by_user.email if reviewed_by_user else None,
+            "reviewed_at": to_kst_isoformat(status.confirmed_at) if status and status.confirmed_at else None,
+            "source": "platform_labeler_v1.0"
+        }
+    }
+
+    # Phase 19: Add image-level text labels to DICE image
+    if image_captions:
+        dice_image["image_captions"] = image_captions
+    if vqa_pairs:
+        dice_image["vqa_pairs"] = vqa_pairs
+
+    return dice_image
 
 
 def _convert_annotation_to_dice(
@@ -664,39 +773,42 @@ def _convert_classes_to_dice(classes) -> List[Dict]:
     return dice_classes
 
 
-def _calculate_statistics(images: List[Dict], classes: List[Dict]) -> Dict:
-    """Calculate dataset statistics."""
-    if not images:
-        return {
-            "total_images": 0,
-            "total_annotations": 0,
-            "avg_annotations_per_image": 0,
-            "class_distribution": {},
-            "split_distribution": {}
-        }
+class _DiceStatistics:
+    """Dataset statistics accumulated one DICE image at a time."""
 
-    total_annotations = sum(len(img['annotations']) for img in images)
+    def __init__(self):
+        self.total_images = 0
+        self.total_annotations = 0
+        self.class_distribution: Dict[str, int] = {}
+        self.split_distribution: Dict[str, int] = {}
 
-    # Calculate class distribution
-    class_distribution = {}
-    for img in images:
-        for ann in img['annotations']:
+    def add(self, image: Dict) -> None:
+        self.total_images += 1
+        self.total_annotations += len(image['annotations'])
+        for ann in image['annotations']:
             class_name = ann.get('class_name', 'unknown')
-            class_distribution[class_name] = class_distribution.get(class_name, 0) + 1
+            self.class_distribution[class_name] = self.class_distribution.get(class_name, 0) + 1
+        split = image.get('split', 'train')
+        self.split_distribution[split] = self.split_distribution.get(split, 0) + 1
 
-    # Calculate split distribution
-    split_distribution = {}
-    for img in images:
-        split = img.get('split', 'train')
-        split_distribution[split] = split_distribution.get(split, 0) + 1
+    def result(self) -> Dict:
+        return {
+            "total_images": self.total_images,
+            "total_annotations": self.total_annotations,
+            "avg_annotations_per_image": (
+                round(self.total_annotations / self.total_images, 2) if self.total_images else 0
+            ),
+            "class_distribution": self.class_distribution,
+            "split_distribution": self.split_distribution
+        }
 
-    return {
-        "total_images": len(images),
-        "total_annotations": total_annotations,
-        "avg_annotations_per_image": round(total_annotations / len(images), 2) if images else 0,
-        "class_distribution": class_distribution,
-        "split_distribution": split_distribution
-    }
+
+def _calculate_statistics(images: List[Dict], classes: List[Dict]) -> Dict:
+    """Calculate dataset statistics."""
+    statistics = _DiceStatistics()
+    for image in images:
+        statistics.add(image)
+    return statistics.result()
 
 
 def get_export_stats(dice_data: Dict[str, Any]) -> Dict[str, int]:
@@ -725,20 +837,9 @@ def _load_image_dimensions(dataset: Dataset) -> Dict[str, Any]:
         return mapping
 
     try:
-        # Download annotations file from S3
-        annotation_data = storage_client.s3_client.get_object(
-            Bucket=storage_client.datasets_bucket,
-            Key=dataset.annotation_path
-        )
-
-        # Parse JSON
-        content = annotation_data['Body'].read().decode('utf-8')
-        annotations_json = json.loads(content)
-
-        # Build mapping from images array
+        # Stream images[*] from the annotations file (never loads the whole file)
         # Now image_id is file_path, so map file_name to dimensions
-        images = annotations_json.get('images', [])
-        for img in images:
+        for _, img in storage_client.iter_json_items(dataset.annotation_path, paths=("images",)):
             file_name = img.get('file_name')
 
             if file_name:
@@ -0,0 +1,247 @@
+"""
+Export Cache Service
+
+Reuses uploaded exports while the project content they were built from is
+unchanged. Each (project, task_type, format, include_draft) keeps its last
+upload in export_artifacts together with a content fingerprint.
+
+The fingerprint is recomputed per request from a few indexed aggregates, so
+there is nothing to keep in sync on the write paths:
+
+- Exported annotations (same filters as the exporter): row count, highest
+  id and latest updated_at. Creates and deletes change the count or the
+  highest id; edits, confirm and unconfirm bump updated_at.
+- Text labels: the same aggregates
+- Image confirmation (image_annotation_status): row count, confirmed images,
+  latest last_modified_at / confirmed_at
+- Class definitions: task_classes of the exported task type
+- Dataset: name, storage location, content_hash and image metadata
+  (count, latest last_modified), which provide file names and dimensions
+
+Not covered: display names of labelers and reviewers (Platform DB), which
+are taken as of the cached export.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.models.labeler import (
+    Annotation,
+    AnnotationProject,
+    Dataset,
+    ExportArtifact,
+    ImageAnnotationStatus,
+    ImageMetadata,
+    TextLabel,
+)
+from app.services.export_query_service import normalize_task_type
+
+logger = logging.getLogger(__name__)
+
+# Bump when exporter output changes, so artifacts of older code are not reused
+FINGERPRINT_VERSION = 1
+
+# export_artifacts.task_type of exports without a task type filter
+ALL_TASK_TYPES = "all"
+
+
+def export_cache_task_type(task_type: Optional[str]) -> str:
+    """Task type under which an export is cached and uploaded."""
+    return task_type or ALL_TASK_TYPES
+
+
+def compute_export_fingerprint(
+    db: Session,
+    project: AnnotationProject,
+    task_type: Optional[str] = None,
+    include_draft: bool = False,
+) -> str:
+    """
+    Fingerprint the content an export of the project would be built from.
+
+    Args:
+        db: Labeler database session
+        project: Project to export
+        task_type: Exported task type (None = all)
+        include_draft: Whether draft annotations are exported
+
+    Returns:
+        SHA-256 hex digest; equal digests mean an identical export
+    """
+    annotation_query = db.query(
+        func.count(Annotation.id),
+        func.max(Annotation.id),
+        func.max(Annotation.updated_at),
+    ).filter(Annotation.project_id == project.id)
+    if not include_draft:
+        annotation_query = annotation_query.filter(
+            Annotation.annotation_state.in_(['confirmed', 'verified'])
+        )
+    if task_type:
+        annotation_query = annotation_query.filter(Annotation.task_type == normalize_task_type(task_type))
+
+    text_labels = db.query(
+        func.count(TextLabel.id),
+        func.max(TextLabel.id),
+        func.max(TextLabel.updated_at),
+    ).filter(TextLabel.project_id == project.id).one()
+
+    image_status = db.query(
+        func.count(ImageAnnotationStatus.id),
+        func.sum(case((ImageAnnotationStatus.is_image_confirmed.is_(True), 1), else_=0)),
+        func.max(ImageAnnotationStatus.last_modified_at),
+        func.max(ImageAnnotationStatus.confirmed_at),
+    ).filter(ImageAnnotationStatus.project_id == project.id).one()
+
+    dataset = db.query(
+        Dataset.name,
+        Dataset.storage_type,
+        Dataset.storage_path,
+        Dataset.annotation_path,
+        Dataset.content_hash,
+    ).filter(Dataset.id == project.dataset_id).first()
+
+    images = db.query(
+        func.count(ImageMetadata.id),
+        func.max(ImageMetadata.last_modified),
+    ).filter(ImageMetadata.dataset_id == project.dataset_id).one()
+
+    task_classes = project.task_classes or {}
+    if task_type and task_type in task_classes:
+        task_classes = task_classes[task_type]
+
+    content = [
+        FINGERPRINT_VERSION,
+        project.id,
+        project.name,
+        project.dataset_id,
+        task_type,
+        include_draft,
+        task_classes,
+        list(annotation_query.one()),
+        list(text_labels),
+        list(image_status),
+        list(dataset) if dataset else None,
+        list(images),
+    ]
+    encoded = json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_cached_export(
+    db: Session,
+    project_id: str,
+    task_type: Optional[str],
+    export_format: str,
+    include_draft: bool,
+    fingerprint: str,
+) -> Optional[ExportArtifact]:
+    """
+    Get the cached export if it was built from content with this fingerprint.
+
+    Args:
+        db: Labeler database session
+        project_id: Project ID
+        task_type: Exported task type (None = all)
+        export_format: Export format (coco, yolo, dice)
+        include_draft: Whether draft annotations are exported
+        fingerprint: Current fingerprint (see compute_export_fingerprint)
+
+    Returns:
+        ExportArtifact, or None if there is none or it is stale
+    """
+    return db.query(ExportArtifact).filter(
+        ExportArtifact.project_id == project_id,
+        ExportArtifact.task_type == export_cache_task_type(task_type),
+        ExportArtifact.export_format == export_format,
+        ExportArtifact.include_draft == include_draft,
+        ExportArtifact.fingerprint == fingerprint,
+    ).first()
+
+
+def save_export_artifact(
+    db: Session,
+    project_id: str,
+    task_type: Optional[str],
+    export_format: str,
+    include_draft: bool,
+    fingerprint: str,
+    export_path: str,
+    annotation_count: int,
+    image_count: int,
+    file_size: Optional[int] = None,
+) -> Optional[ExportArtifact]:
+    """
+    Record an uploaded export, replacing the previous one for its key.
+
+    The fingerprint must be computed before the export is generated: if the
+    content changes meanwhile, the next request sees a different fingerprint
+    and regenerates instead of reusing a mixed export.
+
+    Args:
+        db: Labeler database session
+        project_id: Project ID
+        task_type: Exported task type (None = all)
+        export_format: Export format (coco, yolo, dice)
+        include_draft: Whether draft annotations were exported
+        fingerprint: Fingerprint computed before the export was generated
+        export_path: S3 key of the uploaded export
+        annotation_count: Exported annotations
+        image_count: Exported images
+        file_size: Export size in bytes
+
+    Returns:
+        The saved ExportArtifact, or None if a concurrent export of the same
+        key was saved first
+    """
+    cache_task_type = export_cache_task_type(task_type)
+    artifact = db.query(ExportArtifact).filter(
+        ExportArtifact.project_id == project_id,
+        ExportArtifact.task_type == cache_task_type,
+        ExportArtifact.export_format == export_format,
+        ExportArtifact.include_draft == include_draft,
+    ).first()
+    if artifact is None:
+        artifact = ExportArtifact(
+            project_id=project_id,
+            task_type=cache_task_type,
+            export_format=export_format,
+            include_draft=include_draft,
+        )
+        db.add(artifact)
+
+    artifact.fingerprint = fingerprint
+    artifact.export_path = export_path
+    artifact.annotation_count = annotation_count
+    artifact.image_count = image_count
+    artifact.file_size = file_size
+    artifact.created_at = datetime.utcnow()
+
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.info(f"Export artifact for {project_id}/{cache_task_type}/{export_format} saved concurrently")
+        return None
+    return artifact
+
+
+def delete_project_export_artifacts(db: Session, project_ids: List[str]) -> int:
+    """
+    Delete the export artifact records of projects (caller commits).
+
+    Returns:
+        Number of deleted records
+    """
+    if not project_ids:
+        return 0
+    return db.query(ExportArtifact).filter(
+        ExportArtifact.project_id.in_(project_ids)
+    ).delete(synchronize_session=False)
@@ -0,0 +1,279 @@
+"""
+Export Query Service
+
+Streams annotations to the exporters (DICE, COCO, YOLO) one image at a time
+instead of loading every Annotation and TextLabel with query.all():
+
+- Only the columns an exporter uses are selected (plain rows, no ORM objects)
+- Rows are ordered by image_id and read through server-side cursors
+  (yield_per: STREAM_BATCH_SIZE rows per round trip)
+- Annotation and text label streams are merged and grouped on the fly
+
+Exporters look up per-image data (dimensions) for IMAGE_BATCH_SIZE images at
+a time, so export memory grows with one batch of images (and the largest
+image), not with the project.
+
+Several exports can share one stream (single-pass publish): each ExportWriter
+receives every batch of the stream, which selects the union of their columns.
+
+Usage:
+    images = iter_export_images(db, project_id, (Annotation.geometry, Annotation.class_id))
+    for batch in iter_export_batches(db, dataset_id, images):
+        for image in batch.images:
+            ...  # image.annotations, image.text_labels, batch.dimensions
+
+    write_export(db, project_id, dataset_id, [coco_writer, yolo_writer], task_type="detection")
+"""
+
+import itertools
+from operator import attrgetter
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy.orm import Query, Session
+
+from app.db.models.labeler import Annotation, TextLabel
+from app.services.image_dimension_service import Dimensions, get_image_dimensions
+
+# Rows fetched per round trip from a server-side cursor
+STREAM_BATCH_SIZE = 2000
+
+# Images per batched lookup (e.g. get_image_dimensions)
+IMAGE_BATCH_SIZE = 1000
+
+# Text label columns used by the exporters
+TEXT_LABEL_COLUMNS = (
+    TextLabel.id,
+    TextLabel.image_id,
+    TextLabel.annotation_id,
+    TextLabel.label_type,
+    TextLabel.text_content,
+    TextLabel.question,
+    TextLabel.language,
+    TextLabel.confidence,
+)
+
+
+class ExportImage(NamedTuple):
+    """Rows of one exported image, in id order."""
+
+    image_id: str
+    annotations: List[Any]
+    text_labels: List[Any]
+
+
+class ExportBatch(NamedTuple):
+    """Up to IMAGE_BATCH_SIZE consecutive images and their stored dimensions."""
+
+    images: List[ExportImage]
+    dimensions: Dict[str, Dimensions]
+
+
+class ExportWriter:
+    """
+    Consumer of a shared export stream (see write_export / iter_writer_batches).
+
+    Subclasses declare the annotation columns they read and whether they
+    also need images that have text labels but no exported annotations
+    (otherwise those images reach add_batch() with empty annotations and
+    are skipped). finish() is called once the stream has been consumed.
+    """
+
+    columns: Sequence[Any] = ()
+    text_label_only_images: bool = False
+
+    def add_batch(self, batch: ExportBatch) -> None:
+        raise NotImplementedError
+
+    def finish(self) -> None:
+        pass
+
+
+def _image_order(db: Session, column):
+    """
+    ORDER BY image_id in code point order, as Python's sorted() orders str.
+
+    Exports number images in this order, and the annotation and text label
+    streams are merged by comparing image ids in Python, so the database
+    must not sort by a locale collation.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return column.collate("C")
+    return column
+
+
+def _stream(query: Query) -> Query:
+    return query.yield_per(STREAM_BATCH_SIZE)
+
+
+def iter_export_images(
+    db: Session,
+    project_id: str,
+    columns: Sequence[Any],
+    include_draft: bool = False,
+    image_ids: Optional[List[str]] = None,
+    task_type: Optional[str] = None,
+    text_labels: bool = True,
+    text_label_only_images: bool = False,
+) -> Iterator[ExportImage]:
+    """
+    Stream a project's annotations grouped by image, in image_id order.
+
+    Args:
+        db: Labeler database session
+        project_id: Project ID to export
+        columns: Annotation columns to select; id and image_id are always
+            included
+        include_draft: Include draft annotations (default: False, only confirmed)
+        image_ids: Only these images (None = all images)
+        task_type: Only annotations of this task type (None = all;
+            'object_detection' is an alias of 'detection')
+        text_labels: Also stream the images' text labels
+        text_label_only_images: Also yield images that have text labels
+            but no exported annotations (with empty annotations)
+
+    Yields:
+        ExportImage per image
+    """
+    query = db.query(Annotation.id, Annotation.image_id, *columns).filter(
+        Annotation.project_id == project_id
+    )
+    if not include_draft:
+        query = query.filter(Annotation.annotation_state.in_(['confirmed', 'verified']))
+    if image_ids:
+        query = query.filter(Annotation.image_id.in_(image_ids))
+    if task_type:
+        query = query.filter(Annotation.task_type == normalize_task_type(task_type))
+    query = query.order_by(_image_order(db, Annotation.image_id), Annotation.id)
+
+    annotation_groups = itertools.groupby(_stream(query), key=attrgetter("image_id"))
+    if not text_labels:
+        for image_id, rows in annotation_groups:
+            yield ExportImage(image_id, list(rows), [])
+        return
+
+    label_query = db.query(*TEXT_LABEL_COLUMNS).filter(TextLabel.project_id == project_id)
+    if image_ids:
+        label_query = label_query.filter(TextLabel.image_id.in_(image_ids))
+    label_query = label_query.order_by(_image_order(db, TextLabel.image_id), TextLabel.id)
+    label_groups = (
+        (image_id, list(rows))
+        for image_id, rows in itertools.groupby(_stream(label_query), key=attrgetter("image_id"))
+    )
+
+    labels = next(label_groups, None)
+    for image_id, rows in annotation_groups:
+        # Text labels of images without annotations
+        while labels is not None and labels[0] < image_id:
+            if text_label_only_images:
+                yield ExportImage(labels[0], [], labels[1])
+            labels = next(label_groups, None)
+
+        image_labels = []
+        if labels is not None and labels[0] == image_id:
+            image_labels = labels[1]
+            labels = next(label_groups, None)
+        yield ExportImage(image_id, list(rows), image_labels)
+
+    if text_label_only_images:
+        while labels is not None:
+            yield ExportImage(labels[0], [], labels[1])
+            labels = next(label_groups, None)
+
+
+def normalize_task_type(task_type: Optional[str]) -> Optional[str]:
+    """Stored task type of a requested one ('object_detection' -> 'detection')."""
+    if task_type == 'object_detection':
+        return 'detection'
+    return task_type
+
+
+def iter_export_batches(
+    db: Session,
+    dataset_id: str,
+    images: Iterable[ExportImage],
+) -> Iterator[ExportBatch]:
+    """Group streamed images into batches with one dimension lookup each."""
+    for batch in batched(images, IMAGE_BATCH_SIZE):
+        dimensions = get_image_dimensions(db, dataset_id, [image.image_id for image in batch])
+        yield ExportBatch(batch, dimensions)
+
+
+def iter_writer_batches(
+    db: Session,
+    project_id: str,
+    dataset_id: str,
+    writers: Sequence[ExportWriter],
+    columns: Sequence[Any] = (),
+    include_draft: bool = False,
+    image_ids: Optional[List[str]] = None,
+    task_type: Optional[str] = None,
+    text_label_only_images: bool = False,
+) -> Iterator[ExportBatch]:
+    """
+    Stream the project once and hand every batch to all writers.
+
+    Each batch is passed to the writers before it is yielded, so a caller
+    that produces its own export from the batches (DiceExportStream) drives
+    all of them in a single pass.
+
+    Args:
+        db: Labeler database session
+        project_id: Project ID to export
+        dataset_id: Dataset of the project (for image dimensions)
+        writers: Writers fed with every batch
+        columns: Annotation columns the caller reads, besides the writers'
+        include_draft, image_ids, task_type: Filters (see iter_export_images)
+        text_label_only_images: The caller needs text label-only images
+
+    Yields:
+        ExportBatch, after all writers have received it; the writers are
+        finished after the last one
+    """
+    selected = {}
+    for column in itertools.chain(columns, *(writer.columns for writer in writers)):
+        selected.setdefault(column.key, column)
+
+    images = iter_export_images(
+        db,
+        project_id,
+        tuple(selected.values()),
+        include_draft=include_draft,
+        image_ids=image_ids,
+        task_type=task_type,
+        text_label_only_images=text_label_only_images or any(
+            writer.text_label_only_images for writer in writers
+        ),
+    )
+    for batch in iter_export_batches(db, dataset_id, images):
+        for writer in writers:
+            writer.add_batch(batch)
+        yield batch
+    for writer in writers:
+        writer.finish()
+
+
+def write_export(
+    db: Session,
+    project_id: str,
+    dataset_id: str,
+    writers: Sequence[ExportWriter],
+    include_draft: bool = False,
+    image_ids: Optional[List[str]] = None,
+    task_type: Optional[str] = None,
+) -> None:
+    """Feed all writers from a single stream of the project (see iter_writer_batches)."""
+    for _ in iter_writer_batches(
+        db, project_id, dataset_id, writers,
+        include_draft=include_draft, image_ids=image_ids, task_type=task_type,
+    ):
+        pass
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Split an iterable into lists of at most size items."""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
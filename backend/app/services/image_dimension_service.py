@@ -0,0 +1,224 @@
+"""Image Dimension Service
+
+Reads image width/height from file headers (no pixel decoding) and keeps
+ImageMetadata.width / height filled, so exports never download or decode
+images to learn their size.
+
+- Ingest: IngestPipeline probes every image while it is uploaded
+- Backfill: backfill_dataset_dimensions() probes stored images with ranged
+  GETs of the first IMAGE_PROBE_HEAD_KB, IMAGE_PROBE_WORKERS at a time
+- Export: get_image_dimensions() reads the stored values
+"""
+
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from PIL import Image
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.storage import storage_client
+from app.core.storage_backends import ObjectNotFoundError, StorageBackend
+from app.db.models.labeler import Dataset, ImageMetadata
+
+logger = logging.getLogger(__name__)
+
+Dimensions = Tuple[int, int]
+
+# EXIF orientations that swap width and height (rotated by 90/270 degrees)
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+# Formats whose EXIF block is parsed while reading the header
+_HEADER_EXIF_FORMATS = {"JPEG", "MPO", "TIFF", "WEBP"}
+
+# Rows probed and updated per commit in backfill_dataset_dimensions()
+BACKFILL_BATCH_SIZE = 1000
+
+
+def probe_dimensions(source: Union[bytes, str, BinaryIO]) -> Optional[Dimensions]:
+    """
+    Read image dimensions from the file header.
+
+    Image.open() only parses the header; pixels are never decoded. The
+    result follows the EXIF orientation (as browsers display the image),
+    i.e. width and height are swapped for rotated JPEGs.
+
+    Args:
+        source: Image bytes, file path or binary file object
+
+    Returns:
+        (width, height), or None if the header cannot be parsed
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    try:
+        with Image.open(source) as img:
+            width, height = img.size
+            if img.format in _HEADER_EXIF_FORMATS:
+                orientation = img.getexif().get(0x0112)
+                if orientation in _TRANSPOSED_ORIENTATIONS:
+                    width, height = height, width
+    except Exception as e:
+        logger.debug(f"Failed to probe image dimensions: {e}")
+        return None
+    if width <= 0 or height <= 0:
+        return None
+    return width, height
+
+
+def probe_object_dimensions(backend: StorageBackend, bucket: str, key: str) -> Optional[Dimensions]:
+    """
+    Probe a stored image with a ranged GET of its first bytes.
+
+    Falls back to the whole object when the header does not fit in
+    IMAGE_PROBE_HEAD_KB (e.g. large EXIF/ICC blocks, TIFF IFDs at the end).
+
+    Returns:
+        (width, height), or None if the object is missing or not an image
+    """
+    head_bytes = settings.IMAGE_PROBE_HEAD_KB * 1024
+    try:
+        body = backend.open_object(bucket, key, byte_range=(0, head_bytes - 1))
+        try:
+            head = body.read()
+        finally:
+            body.close()
+        dimensions = probe_dimensions(head)
+        if dimensions is not None or len(head) < head_bytes:
+            return dimensions
+        return probe_dimensions(backend.get_object(bucket, key))
+    except ObjectNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to probe {key}: {e}")
+        return None
+
+
+def probe_objects_dimensions(
+    backend: StorageBackend,
+    bucket: str,
+    keys: Iterable[str],
+    workers: Optional[int] = None
+) -> Dict[str, Dimensions]:
+    """
+    Probe many stored images in parallel.
+
+    Args:
+        backend: Storage backend holding the images
+        bucket: Bucket name
+        keys: Object keys
+        workers: Concurrent ranged GETs (default IMAGE_PROBE_WORKERS)
+
+    Returns:
+        Dictionary mapping key to (width, height); unreadable images are omitted
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+    with ThreadPoolExecutor(max_workers=workers or settings.IMAGE_PROBE_WORKERS) as pool:
+        results = pool.map(lambda key: probe_object_dimensions(backend, bucket, key), keys)
+        return {key: dims for key, dims in zip(keys, results) if dims is not None}
+
+
+def backfill_dataset_dimensions(
+    db: Session,
+    dataset: Dataset,
+    workers: Optional[int] = None,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Tuple[int, int]:
+    """
+    Fill ImageMetadata.width / height for a dataset's images that lack them.
+
+    Rows are processed in id order, one batch per commit, so the backfill can
+    be interrupted and rerun. Images that cannot be probed stay NULL and are
+    not retried within the same run.
+
+    Args:
+        db: Labeler database session
+        dataset: Dataset to backfill
+        workers: Concurrent ranged GETs (default IMAGE_PROBE_WORKERS)
+        batch_size: Rows per probe batch / commit
+        progress: Called with (updated, failed) after each batch
+
+    Returns:
+        Tuple of (rows updated, images that could not be probed)
+    """
+    backend = storage_client.get_backend(dataset.storage_type)
+    bucket = storage_client.datasets_bucket
+    updated = failed = 0
+    last_id = None
+
+    while True:
+        query = db.query(ImageMetadata.id, ImageMetadata.s3_key).filter(
+            ImageMetadata.dataset_id == dataset.id,
+            ImageMetadata.width.is_(None)
+        )
+        if last_id is not None:
+            query = query.filter(ImageMetadata.id > last_id)
+        rows = query.order_by(ImageMetadata.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        dimensions = probe_objects_dimensions(backend, bucket, [row.s3_key for row in rows], workers)
+        # last_modified changes the export fingerprint, so cached exports with 0x0 sizes are rebuilt
+        now = datetime.utcnow()
+        mappings = [
+            {
+                "id": row.id,
+                "width": dimensions[row.s3_key][0],
+                "height": dimensions[row.s3_key][1],
+                "last_modified": now
+            }
+            for row in rows if row.s3_key in dimensions
+        ]
+        if mappings:
+            db.bulk_update_mappings(ImageMetadata, mappings)
+            db.commit()
+        updated += len(mappings)
+        failed += len(rows) - len(mappings)
+        if progress:
+            progress(updated, failed)
+
+    if failed:
+        logger.warning(f"Could not read dimensions of {failed} images in dataset {dataset.id}")
+    return updated, failed
+
+
+def get_image_dimensions(
+    db: Session,
+    dataset_id: str,
+    image_ids: Optional[Iterable[str]] = None
+) -> Dict[str, Dimensions]:
+    """
+    Stored dimensions of a dataset's images.
+
+    Args:
+        db: Labeler database session
+        dataset_id: Dataset ID
+        image_ids: Only these images (None = all images of the dataset)
+
+    Returns:
+        Dictionary mapping image_id to (width, height); images without
+        stored dimensions are omitted
+    """
+    base = db.query(ImageMetadata.id, ImageMetadata.width, ImageMetadata.height).filter(
+        ImageMetadata.dataset_id == dataset_id,
+        ImageMetadata.width.isnot(None),
+        ImageMetadata.height.isnot(None)
+    )
+    if image_ids is None:
+        queries = [base]
+    else:
+        ids: List[str] = list(image_ids)
+        queries = [base.filter(ImageMetadata.id.in_(ids[i:i + 1000])) for i in range(0, len(ids), 1000)]
+
+    dimensions = {}
+    for query in queries:
+        for image_id, width, height in query:
+            dimensions[image_id] = (width, height)
+    return dimensions
@@ -0,0 +1,244 @@
+"""Image Metadata Writer
+
+Bulk upserts of ImageMetadata rows for every ingestion path (multipart and
+ZIP uploads through IngestPipeline, backfill_image_metadata.py).
+
+Rows are written in batches as one statement per chunk instead of one ORM
+object per image:
+
+- PostgreSQL, batches >= IMAGE_METADATA_COPY_MIN_ROWS: COPY into a temp
+  staging table, then one INSERT ... SELECT ... ON CONFLICT DO UPDATE
+- PostgreSQL / SQLite otherwise: multi-row INSERT ... ON CONFLICT DO UPDATE
+- Other dialects: Session.merge() per row (slow path, tests only)
+
+Re-uploading an image updates its row (file name, key, size, content hash,
+last_modified) instead of failing on the primary key; uploaded_at keeps the
+first upload time and width/height/thumbnail_sizes are only overwritten by
+known values.
+image_metadata.id is the relative path alone, so a row owned by another
+dataset is never overwritten: such rows are skipped and counted in
+``rows_skipped``.
+
+Usage:
+    with ImageMetadataWriter(labeler_db) as writer:
+        for ...:
+            writer.add({"id": ..., "dataset_id": ..., ...})
+"""
+
+import io
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models.labeler import ImageMetadata
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    "id", "dataset_id", "file_name", "s3_key", "folder_path",
+    "size", "width", "height", "thumbnail_sizes", "content_hash", "uploaded_at", "last_modified",
+)
+
+# Overwritten on conflict (uploaded_at keeps the first upload time). A row
+# without content_hash clears a stale one: the stored bytes may have changed
+UPDATE_COLUMNS = ("file_name", "s3_key", "folder_path", "size", "content_hash", "last_modified")
+
+# Only overwritten when the new row knows the value
+COALESCE_COLUMNS = ("width", "height", "thumbnail_sizes")
+
+# Rows per multi-row INSERT; keeps bind parameters below the PostgreSQL
+# (65535) and SQLite (32766) limits
+INSERT_CHUNK_ROWS = 3000
+
+STAGING_TABLE = "image_metadata_staging"
+
+
+class ImageMetadataWriter:
+    """
+    Buffered bulk upsert of ImageMetadata rows.
+
+    Each flush is committed on its own, so a long ingestion never holds one
+    huge transaction and rows become visible batch by batch.
+
+    Args:
+        db: Labeler DB session (used from one thread at a time)
+        batch_size: Rows buffered before add() flushes
+            (default INGEST_METADATA_BATCH_SIZE)
+        copy_min_rows: Smallest batch written with COPY on PostgreSQL
+            (default IMAGE_METADATA_COPY_MIN_ROWS)
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        batch_size: Optional[int] = None,
+        copy_min_rows: Optional[int] = None
+    ):
+        self.db = db
+        self.batch_size = batch_size or settings.INGEST_METADATA_BATCH_SIZE
+        self.copy_min_rows = (
+            settings.IMAGE_METADATA_COPY_MIN_ROWS if copy_min_rows is None else copy_min_rows
+        )
+        self.dialect = db.get_bind().dialect.name
+        self.rows_written = 0
+        self.rows_skipped = 0
+        # id -> row: a later row for the same image replaces the earlier one
+        # (one statement may not update the same row twice)
+        self._buffer: Dict[str, Dict[str, Any]] = {}
+
+    def __enter__(self) -> "ImageMetadataWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+        else:
+            self._buffer.clear()
+
+    def add(self, row: Mapping[str, Any]) -> None:
+        """Buffer one row (ImageMetadata column -> value); flushes when the batch is full."""
+        self._buffer[row["id"]] = _normalize(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Upsert and commit buffered rows.
+
+        Returns:
+            Number of rows inserted or updated
+        """
+        rows, self._buffer = list(self._buffer.values()), {}
+        return self._write(rows)
+
+    def write(self, rows: Iterable[Mapping[str, Any]]) -> int:
+        """
+        Upsert and commit ``rows`` right away, bypassing the buffer.
+
+        Returns:
+            Number of rows inserted or updated
+        """
+        unique = {row["id"]: _normalize(row) for row in rows}
+        return self._write(list(unique.values()))
+
+    def _write(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        try:
+            if self.dialect == "postgresql" and len(rows) >= self.copy_min_rows:
+                written = self._copy_upsert(rows)
+            elif self.dialect in ("postgresql", "sqlite"):
+                written = sum(
+                    self._insert_upsert(rows[i:i + INSERT_CHUNK_ROWS])
+                    for i in range(0, len(rows), INSERT_CHUNK_ROWS)
+                )
+            else:
+                written = self._merge(rows)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        skipped = len(rows) - written
+        self.rows_written += written
+        self.rows_skipped += skipped
+        if skipped:
+            logger.warning(
+                f"Skipped {skipped} image metadata rows whose id belongs to another dataset "
+                f"(dataset {rows[0]['dataset_id']})"
+            )
+        return written
+
+    def _insert_upsert(self, rows: List[Dict[str, Any]]) -> int:
+        insert = postgresql.insert if self.dialect == "postgresql" else sqlite.insert
+        stmt = insert(ImageMetadata).values(rows)
+        excluded = stmt.excluded
+        table = ImageMetadata.__table__
+        set_ = {name: excluded[name] for name in UPDATE_COLUMNS}
+        set_.update({name: func.coalesce(excluded[name], table.c[name]) for name in COALESCE_COLUMNS})
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_=set_,
+            where=table.c.dataset_id == excluded.dataset_id,
+        )
+        return self.db.execute(stmt).rowcount
+
+    def _copy_upsert(self, rows: List[Dict[str, Any]]) -> int:
+        columns = ", ".join(COLUMNS)
+        assignments = ", ".join(
+            [f"{name} = EXCLUDED.{name}" for name in UPDATE_COLUMNS]
+            + [f"{name} = COALESCE(EXCLUDED.{name}, image_metadata.{name})" for name in COALESCE_COLUMNS]
+        )
+        # Session-local and emptied on commit, so concurrent writers never see each other's rows
+        self.db.execute(text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+            f"(LIKE image_metadata INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        ))
+
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {STAGING_TABLE} ({columns}) FROM STDIN",
+                io.StringIO("".join(_copy_line(row) for row in rows)),
+            )
+        finally:
+            cursor.close()
+
+        result = self.db.execute(text(
+            f"INSERT INTO image_metadata ({columns}) "
+            f"SELECT {columns} FROM {STAGING_TABLE} "
+            f"ON CONFLICT (id) DO UPDATE SET {assignments} "
+            f"WHERE image_metadata.dataset_id = EXCLUDED.dataset_id"
+        ))
+        return result.rowcount
+
+    def _merge(self, rows: List[Dict[str, Any]]) -> int:
+        written = 0
+        for row in rows:
+            existing = self.db.get(ImageMetadata, row["id"])
+            if existing is None:
+                self.db.add(ImageMetadata(**row))
+            elif existing.dataset_id == row["dataset_id"]:
+                for name in UPDATE_COLUMNS:
+                    setattr(existing, name, row[name])
+                for name in COALESCE_COLUMNS:
+                    if row[name] is not None:
+                        setattr(existing, name, row[name])
+            else:
+                continue
+            written += 1
+        return written
+
+
+def _normalize(row: Mapping[str, Any]) -> Dict[str, Any]:
+    """Same keys for every row (multi-row VALUES needs them) with timestamp defaults."""
+    normalized = {name: row.get(name) for name in COLUMNS}
+    if normalized["uploaded_at"] is None:
+        normalized["uploaded_at"] = datetime.utcnow()
+    if normalized["last_modified"] is None:
+        normalized["last_modified"] = normalized["uploaded_at"]
+    return normalized
+
+
+def _copy_value(value: Any) -> str:
+    """Encode one value for COPY text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_line(row: Mapping[str, Any]) -> str:
+    return "\t".join(_copy_value(row[name]) for name in COLUMNS) + "\n"
@@ -0,0 +1,72 @@
+"""Image URL Service
+
+Presigned URLs for image listings (dataset summary, project image pages).
+
+All originals and thumbnails of a page are signed in one batch. If the batch
+fails or leaves keys out, the missing keys are signed one by one, so a bad
+key only drops its own image instead of failing the whole listing.
+"""
+
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.core.storage import storage_client
+
+logger = logging.getLogger(__name__)
+
+
+def sign_image_urls(
+    images: Iterable[Tuple[str, Optional[str]]],
+    storage_type: Optional[str] = None,
+    expiration: int = 3600
+) -> Dict[str, Tuple[str, Optional[str]]]:
+    """
+    Sign original and thumbnail URLs for a page of images.
+
+    Args:
+        images: (original key, thumbnail key or None) per image
+        storage_type: Dataset.storage_type (None = settings.STORAGE_BACKEND)
+        expiration: URL lifetime in seconds
+
+    Returns:
+        Original key -> (url, thumbnail_url). Images whose original cannot be
+        signed are left out; a thumbnail that cannot be signed is None
+        (clients show the original).
+    """
+    images = list(images)
+    keys = [key for key, _ in images] + [thumbnail_key for _, thumbnail_key in images if thumbnail_key]
+    if not keys:
+        return {}
+
+    try:
+        urls = storage_client.generate_presigned_urls(
+            bucket=storage_client.datasets_bucket,
+            keys=keys,
+            expiration=expiration,
+            storage_type=storage_type
+        )
+    except Exception as e:
+        logger.warning(f"Batch URL signing failed for {len(images)} images, signing per image: {e}")
+        urls = {}
+
+    def sign(key: str) -> Optional[str]:
+        url = urls.get(key)
+        if url is not None:
+            return url
+        try:
+            return storage_client.generate_presigned_url(
+                bucket=storage_client.datasets_bucket,
+                key=key,
+                expiration=expiration,
+                storage_type=storage_type
+            )
+        except Exception as e:
+            logger.error(f"Error generating presigned URL for {key}: {e}")
+            return None
+
+    signed = {}
+    for key, thumbnail_key in images:
+        url = sign(key)
+        if url is not None:
+            signed[key] = (url, sign(thumbnail_key) if thumbnail_key else None)
+    return signed
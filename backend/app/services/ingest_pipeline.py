@@ -0,0 +1,499 @@
+"""Ingest Pipeline
+
+Bounded concurrent pipeline for dataset image ingestion, used by
+dataset_upload_service for multipart and ZIP uploads.
+
+Stages (each image flows through all of them, images overlap):
+
+1. read       - producer reads the file (UploadFile / ZIP member); runs on the
+                event loop or a worker thread, never blocks the loop
+2. hash       - SHA-256 of the content (chunked, on the upload threads), then
+                one indexed lookup of that hash in the dataset
+3. upload     - original put_object on a thread pool (INGEST_UPLOAD_WORKERS);
+                image dimensions are read from the header on the same
+                threads at the same time
+4. metadata   - ImageMetadata rows upserted (ImageMetadataWriter) in batches
+                of INGEST_METADATA_BATCH_SIZE on a single DB thread, and one
+                thumbnail job per image enqueued with them
+
+Deduplication: ImageMetadata.content_hash remembers what every ingested file
+contained, so re-uploading overlapping folders is cheap:
+
+- same path, same content: skipped entirely (no PUT, no row, no thumbnails)
+- same content at another path of the dataset (or earlier in this upload):
+  the original and its thumbnail pyramid are copied server-side (CopyObject)
+  instead of uploaded and regenerated
+
+Both count as ``duplicates_skipped`` in the result.
+
+Thumbnails are not generated here: thumbnail workers (thumbnail_queue_service)
+build the pyramids from the stored originals, so an upload finishes as soon
+as its bytes are stored. Until then rows have thumbnail_sizes "" and image
+listings fall back to the original.
+
+Backpressure: submit() waits while INGEST_MAX_IN_FLIGHT images are between
+read and upload completion, so memory stays bounded by that many files no
+matter how large the upload is. Large files can be handed over as
+SpooledContent (a temp file) instead of bytes; they are streamed to storage
+from disk, and the temp file is deleted afterwards.
+
+Usage:
+    async with IngestPipeline(dataset_id, labeler_db, backend) as pipeline:
+        for ...:
+            await pipeline.submit(item, content)
+    result = pipeline.result()
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+
+from sqlalchemy import case
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.manifest import ManifestEntry
+from app.core.storage import storage_client
+from app.core.storage_backends import ObjectNotFoundError, StorageBackend
+from app.db.models.labeler import ImageMetadata
+from app.services.image_dimension_service import Dimensions, probe_dimensions
+from app.services.image_metadata_writer import ImageMetadataWriter
+from app.services.thumbnail_queue_service import enqueue_thumbnail_jobs
+from app.services.thumbnail_service import get_thumbnail_path, parse_thumbnail_sizes
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("read", "hash", "upload", "metadata")
+
+# Bytes hashed per read from spooled files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class SpooledContent(NamedTuple):
+    """Image data in a temp file; the pipeline deletes the file when done."""
+
+    path: str
+    size: int
+
+
+IngestContent = Union[bytes, SpooledContent]
+
+
+class StoredImage(NamedTuple):
+    """An image already stored in the dataset (copy source for duplicates)."""
+
+    image_id: str
+    s3_key: str
+    size: int
+    width: Optional[int]
+    height: Optional[int]
+    thumbnail_sizes: Optional[str]
+
+
+@dataclass
+class IngestItem:
+    """One image to ingest."""
+
+    image_id: str  # Relative path under datasets/{id}/images/
+    s3_key: str
+    file_name: str
+    folder_path: Optional[str]
+    content_type: str
+
+
+@dataclass
+class StageStats:
+    """Throughput counters for one pipeline stage."""
+
+    name: str
+    items: int = 0
+    bytes: int = 0
+    busy_seconds: float = 0.0
+    first_started: Optional[float] = None
+    last_finished: Optional[float] = None
+
+    def record(self, started: float, nbytes: int = 0, items: int = 1) -> None:
+        finished = time.perf_counter()
+        self.items += items
+        self.bytes += nbytes
+        self.busy_seconds += finished - started
+        if self.first_started is None or started < self.first_started:
+            self.first_started = started
+        if self.last_finished is None or finished > self.last_finished:
+            self.last_finished = finished
+
+    def to_dict(self) -> Dict[str, float]:
+        wall = (self.last_finished - self.first_started) if self.items else 0.0
+        return {
+            "items": self.items,
+            "bytes": self.bytes,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wall_seconds": round(wall, 3),
+            "items_per_second": round(self.items / wall, 2) if wall > 0 else 0.0,
+            "mb_per_second": round(self.bytes / wall / (1024 * 1024), 2) if wall > 0 else 0.0,
+        }
+
+
+@dataclass
+class IngestResult:
+    """Outcome of a pipeline run."""
+
+    images_count: int = 0  # Images stored (uploaded or copied), including replaced ones
+    new_images: int = 0  # Rows inserted: images that were not in the dataset before
+    total_bytes: int = 0
+    duplicates_skipped: int = 0  # Identical content already stored: not uploaded again
+    folder_structure: Dict[str, int] = field(default_factory=dict)
+    manifest_entries: List[ManifestEntry] = field(default_factory=list)
+    stage_stats: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+
+class IngestPipeline:
+    """
+    Concurrent upload -> metadata pipeline for one dataset.
+
+    Args:
+        dataset_id: Dataset ID
+        labeler_db: Session used (from one thread at a time) for metadata inserts
+        backend: Storage backend of the dataset
+        upload_workers: Threads for put_object calls
+        max_in_flight: Images buffered between read and upload (backpressure)
+        batch_size: ImageMetadata rows per upsert/commit
+    """
+
+    def __init__(
+        self,
+        dataset_id: str,
+        labeler_db: Session,
+        backend: StorageBackend,
+        upload_workers: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        batch_size: Optional[int] = None
+    ):
+        self.dataset_id = dataset_id
+        self.labeler_db = labeler_db
+        self.backend = backend
+        self.bucket = storage_client.datasets_bucket
+        self.batch_size = batch_size or settings.INGEST_METADATA_BATCH_SIZE
+
+        self._upload_pool = ThreadPoolExecutor(
+            max_workers=upload_workers or settings.INGEST_UPLOAD_WORKERS,
+            thread_name_prefix="ingest-upload"
+        )
+        # Session objects are not thread-safe: all inserts go through one thread
+        self._db_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-db")
+        self._writer = ImageMetadataWriter(labeler_db, batch_size=self.batch_size)
+
+        self._slots = asyncio.Semaphore(max_in_flight or settings.INGEST_MAX_IN_FLIGHT)
+        self._tasks: Set[asyncio.Task] = set()
+        self._pending_rows: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._error: Optional[BaseException] = None
+        self._started = time.perf_counter()
+        self._stored_callbacks: List[Callable[[IngestItem, int], None]] = []
+        self._spooled: Set[str] = set()  # Temp files not yet deleted
+        # content hash -> where this upload stored it (None if that failed);
+        # catches duplicates whose rows are not written yet
+        self._stored_hashes: Dict[str, asyncio.Future] = {}
+
+        self.stats = {name: StageStats(name) for name in STAGES}
+        self._result = IngestResult()
+
+    async def __aenter__(self) -> "IngestPipeline":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                await self.finish()
+            else:
+                for task in self._tasks:
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            self._upload_pool.shutdown(wait=False)
+            self._db_pool.shutdown(wait=True)
+            # Tasks cancelled before they started never cleaned up their input
+            for path in list(self._spooled):
+                self._discard(SpooledContent(path, 0))
+
+    # Producer side -------------------------------------------------------
+
+    async def submit(self, item: IngestItem, content: IngestContent) -> None:
+        """
+        Queue one image. Waits while the pipeline is full (backpressure) and
+        re-raises the first failure of an earlier image.
+        """
+        await self._slots.acquire()
+        if self._error is not None:
+            self._slots.release()
+            _discard(content)
+            raise self._error
+        if isinstance(content, SpooledContent):
+            self._spooled.add(content.path)
+        self._track(asyncio.create_task(self._process(item, content)))
+
+    def add_stored_callback(self, callback: Callable[[IngestItem, int], None]) -> None:
+        """Call ``callback(item, size)`` once each image is stored."""
+        self._stored_callbacks.append(callback)
+
+    def record_read(self, started: float, nbytes: int) -> None:
+        """Account producer read time (started = time.perf_counter())."""
+        self.stats["read"].record(started, nbytes)
+
+    def _track(self, task: asyncio.Task) -> None:
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None and self._error is None:
+            self._error = task.exception()
+
+    # Stages --------------------------------------------------------------
+
+    async def _run(self, executor: Executor, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+    async def _process(self, item: IngestItem, content: IngestContent) -> None:
+        try:
+            await self._store(item, content)
+        finally:
+            self._discard(content)
+
+    async def _store(self, item: IngestItem, content: IngestContent) -> None:
+        size = content.size if isinstance(content, SpooledContent) else len(content)
+        stored = None
+        registered = None
+        try:
+            started = time.perf_counter()
+            content_hash = await self._run(self._upload_pool, hash_content, content)
+            pending = self._stored_hashes.get(content_hash)
+            if pending is not None:
+                # Stored earlier in this upload (its row may not be written yet)
+                source = await asyncio.shield(pending)
+            else:
+                registered = self._stored_hashes[content_hash] = asyncio.get_running_loop().create_future()
+                source = await self._run(self._db_pool, self._lookup_hash, item.image_id, content_hash)
+            self.stats["hash"].record(started, size)
+
+            if source is not None and source.s3_key == item.s3_key and source.size == size:
+                # Unchanged re-upload: the object, its row and thumbnails are current
+                stored = source
+                self._result.duplicates_skipped += 1
+            else:
+                stored = await self._store_original(item, content, size, content_hash, source)
+        finally:
+            if registered is not None:
+                registered.set_result(stored)
+            # Original is stored: the next file may be read
+            self._slots.release()
+
+        for callback in self._stored_callbacks:
+            callback(item, size)
+        if len(self._pending_rows) >= self.batch_size:
+            # Own task: this image's data is released while the batch waits for the DB
+            self._track(asyncio.create_task(self._flush()))
+
+    def _lookup_hash(self, image_id: str, content_hash: str) -> Optional[StoredImage]:
+        """An image of this dataset with the same content, preferring ``image_id`` itself."""
+        row = self.labeler_db.query(
+            ImageMetadata.id,
+            ImageMetadata.s3_key,
+            ImageMetadata.size,
+            ImageMetadata.width,
+            ImageMetadata.height,
+            ImageMetadata.thumbnail_sizes
+        ).filter(
+            ImageMetadata.dataset_id == self.dataset_id,
+            ImageMetadata.content_hash == content_hash
+        ).order_by(case((ImageMetadata.id == image_id, 0), else_=1)).first()
+        return StoredImage(*row) if row is not None else None
+
+    async def _store_original(
+        self,
+        item: IngestItem,
+        content: IngestContent,
+        size: int,
+        content_hash: str,
+        source: Optional[StoredImage]
+    ) -> StoredImage:
+        """PUT the original (or copy an identical stored one) and queue its row."""
+        started = time.perf_counter()
+        copied = None
+        if source is not None and source.s3_key != item.s3_key:
+            copied = await self._run(self._upload_pool, self._copy_original, item, source)
+        probe_source = content.path if isinstance(content, SpooledContent) else content
+        if copied is not None:
+            etag, thumbnail_sizes = copied
+            if source.width is not None:
+                dimensions = (source.width, source.height)
+            else:
+                dimensions = await self._run(self._upload_pool, probe_dimensions, probe_source)
+            self.stats["upload"].record(started)
+            self._result.duplicates_skipped += 1
+        else:
+            dimensions_future = asyncio.ensure_future(self._run(self._upload_pool, probe_dimensions, probe_source))
+            try:
+                etag = await self._run(self._upload_pool, self._put_original, item, content)
+                self.stats["upload"].record(started, size)
+                dimensions = await dimensions_future
+            except BaseException:
+                dimensions_future.cancel()
+                raise
+            thumbnail_sizes = ""  # Queued: listings show the original until the worker is done
+
+        self._add_row(item, size, etag, dimensions, content_hash, thumbnail_sizes)
+        width, height = dimensions or (None, None)
+        return StoredImage(item.image_id, item.s3_key, size, width, height, thumbnail_sizes)
+
+    def _discard(self, content: IngestContent) -> None:
+        if isinstance(content, SpooledContent):
+            self._spooled.discard(content.path)
+            _discard(content)
+
+    def _copy_original(self, item: IngestItem, source: StoredImage) -> Optional[Tuple[str, str]]:
+        """
+        Server-side copy of an identical original and its thumbnail pyramid.
+
+        Returns:
+            (etag, thumbnail_sizes) with thumbnail_sizes "" if the pyramid
+            still has to be generated, or None if the source object is gone
+        """
+        try:
+            etag = self.backend.copy_object(self.bucket, source.s3_key, item.s3_key)
+        except ObjectNotFoundError:
+            return None
+
+        levels = parse_thumbnail_sizes(source.thumbnail_sizes) if source.thumbnail_sizes else []
+        try:
+            for level in levels:
+                self.backend.copy_object(
+                    self.bucket, get_thumbnail_path(source.s3_key, level), get_thumbnail_path(item.s3_key, level)
+                )
+        except ObjectNotFoundError:
+            levels = []
+        return etag, source.thumbnail_sizes if levels else ""
+
+    def _put_original(self, item: IngestItem, content: IngestContent) -> str:
+        if isinstance(content, SpooledContent):
+            with open(content.path, "rb") as f:
+                return self.backend.put_object(self.bucket, item.s3_key, f, item.content_type)
+        return self.backend.put_object(self.bucket, item.s3_key, content, item.content_type)
+
+    def _add_row(
+        self,
+        item: IngestItem,
+        size: int,
+        etag: str,
+        dimensions: Optional[Dimensions],
+        content_hash: str,
+        thumbnail_sizes: str
+    ) -> None:
+        now = datetime.utcnow()
+        width, height = dimensions or (None, None)
+        self._pending_rows.append({
+            "id": item.image_id,
+            "dataset_id": self.dataset_id,
+            "file_name": item.file_name,
+            "s3_key": item.s3_key,
+            "folder_path": item.folder_path,
+            "size": size,
+            "width": width,
+            "height": height,
+            "thumbnail_sizes": thumbnail_sizes,
+            "content_hash": content_hash,
+            "uploaded_at": now,
+            "last_modified": now,
+        })
+
+        result = self._result
+        result.images_count += 1
+        result.total_bytes += size
+        result.manifest_entries.append(ManifestEntry(
+            key=item.image_id, size=size, etag=etag, last_modified=int(time.time())
+        ))
+        if item.folder_path:
+            result.folder_structure[item.folder_path] = result.folder_structure.get(item.folder_path, 0) + 1
+
+    async def _flush(self) -> None:
+        async with self._flush_lock:
+            rows, self._pending_rows = self._pending_rows, []
+            if not rows:
+                return
+            started = time.perf_counter()
+            written = await self._run(self._db_pool, self._write_rows, rows)
+            self.stats["metadata"].record(started, items=len(rows))
+            logger.debug(f"Upserted {written} image metadata rows for dataset {self.dataset_id}")
+
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> int:
+        ids = {row["id"] for row in rows}
+        known = {
+            image_id for (image_id,) in self.labeler_db.query(ImageMetadata.id).filter(
+                ImageMetadata.dataset_id == self.dataset_id, ImageMetadata.id.in_(ids)
+            )
+        }
+        written = self._writer.write(rows)
+        # Only the DB thread touches the counter
+        self._result.new_images += len(ids - known)
+        # Copied duplicates came with their thumbnails
+        enqueue_thumbnail_jobs(
+            self.labeler_db, self.dataset_id, [row["id"] for row in rows if not row["thumbnail_sizes"]]
+        )
+        return written
+
+    # Completion ----------------------------------------------------------
+
+    async def finish(self) -> IngestResult:
+        """Wait for all queued images, insert remaining rows and log throughput."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        if self._error is not None:
+            raise self._error
+        await self._flush()
+
+        self._result.stage_stats = {name: stats.to_dict() for name, stats in self.stats.items()}
+        elapsed = time.perf_counter() - self._started
+        self._result.stage_stats["total"] = {
+            "items": self._result.images_count,
+            "bytes": self._result.total_bytes,
+            "wall_seconds": round(elapsed, 3),
+            "items_per_second": round(self._result.images_count / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+        logger.info(
+            f"Ingested {self._result.images_count} images ({self._result.total_bytes} bytes, "
+            f"{self._result.duplicates_skipped} duplicates skipped) "
+            f"into dataset {self.dataset_id} in {elapsed:.1f}s: "
+            + ", ".join(
+                f"{name} {stats['items_per_second']}/s"
+                for name, stats in self._result.stage_stats.items() if name in STAGES
+            )
+        )
+        return self._result
+
+    def result(self) -> IngestResult:
+        return self._result
+
+
+def hash_content(content: IngestContent) -> str:
+    """SHA-256 (hex) of image data, reading spooled files in chunks."""
+    if not isinstance(content, SpooledContent):
+        return hashlib.sha256(content).hexdigest()
+    digest = hashlib.sha256()
+    with open(content.path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _discard(content: IngestContent) -> None:
+    if isinstance(content, SpooledContent):
+        try:
+            os.unlink(content.path)
+        except FileNotFoundError:
+            pass
@@ -4,11 +4,10 @@ Provides folder structure information for datasets in S3/MinIO storage.
 """
 
 import logging
-from typing import List, Dict, Set
+from typing import List, Dict, Iterable, Iterator, Optional, Set, Tuple
 from collections import defaultdict
 
 from app.core.storage import storage_client
-from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -22,109 +21,116 @@ class FolderInfo:
         self.total_size = total_size
 
 
-def get_storage_structure(dataset_id: str) -> Dict:
+def _iter_image_objects(dataset_id: str, storage_type: Optional[str] = None) -> Iterator[Tuple[str, int]]:
+    """
+    Yield (relative_path, size) for every object under the dataset's images/ prefix.
+
+    Reads the dataset manifest when one exists, so folder statistics don't
+    need a full S3 listing; otherwise lists the dataset's storage backend.
+    """
+    manifest = storage_client.get_dataset_manifest(dataset_id, storage_type)
+    if manifest is not None:
+        for entry in manifest.entries:
+            if '/thumbnails/' in entry.key:
+                continue
+            yield entry.key, entry.size
+        return
+
+    images_prefix = f"datasets/{dataset_id}/images/"
+
+    for obj in storage_client.get_backend(storage_type).list_objects(storage_client.datasets_bucket, prefix=images_prefix):
+        key = obj.key
+
+        # Skip thumbnails directory
+        if '/thumbnails/' in key:
+            continue
+
+        # Extract relative path from images/
+        relative_path = key[len(images_prefix):]
+
+        # Skip if it's just the prefix itself
+        if not relative_path:
+            continue
+
+        yield relative_path, obj.size
+
+
+def _build_structure(dataset_id: str, objects: Iterable[Tuple[str, int]]) -> Dict:
+    """Aggregate (relative_path, size) pairs into folder statistics."""
+    # Track folders and their stats
+    folder_stats: Dict[str, FolderInfo] = defaultdict(lambda: FolderInfo("", 0, 0))
+    all_folders: Set[str] = set()
+    total_files = 0
+    total_size = 0
+
+    for relative_path, size in objects:
+        total_files += 1
+        total_size += size
+
+        # Extract folder path(s)
+        if '/' in relative_path:
+            parts = relative_path.split('/')
+            # Build all parent folders
+            for i in range(1, len(parts)):
+                folder_path = '/'.join(parts[:i]) + '/'
+                all_folders.add(folder_path)
+                folder_stats[folder_path].path = folder_path
+                folder_stats[folder_path].file_count += 1
+                folder_stats[folder_path].total_size += size
+        else:
+            # File in root
+            folder_stats['/'].path = '/'
+            folder_stats['/'].file_count += 1
+            folder_stats['/'].total_size += size
+
+    # Convert to sorted list
+    folders = []
+
+    # Add root if it has files
+    if '/' in folder_stats:
+        folders.append({
+            'path': '/',
+            'name': '(루트)',
+            'file_count': folder_stats['/'].file_count,
+            'total_size_bytes': folder_stats['/'].total_size,
+            'depth': 0
+        })
+
+    # Add other folders sorted by path
+    for folder_path in sorted(all_folders):
+        info = folder_stats[folder_path]
+        depth = folder_path.count('/')
+        name = folder_path.rstrip('/').split('/')[-1]
+
+        folders.append({
+            'path': folder_path,
+            'name': name,
+            'file_count': info.file_count,
+            'total_size_bytes': info.total_size,
+            'depth': depth
+        })
+
+    return {
+        'dataset_id': dataset_id,
+        'total_files': total_files,
+        'total_size_bytes': total_size,
+        'folders': folders
+    }
+
+
+def get_storage_structure(dataset_id: str, storage_type: Optional[str] = None) -> Dict:
     """
     Get folder structure for a dataset's storage.
 
     Args:
         dataset_id: Dataset ID
+        storage_type: Dataset.storage_type (None = settings.STORAGE_BACKEND)
 
     Returns:
         Dict with folders list and statistics
     """
     try:
-        # Get dataset storage path
-        storage_path = f"datasets/{dataset_id}"
-        images_prefix = f"{storage_path}/images/"
-
-        # List all objects in images/ directory
-        s3_client = storage_client.s3_client
-        paginator = s3_client.get_paginator('list_objects_v2')
-
-        # Track folders and their stats
-        folder_stats: Dict[str, FolderInfo] = defaultdict(lambda: FolderInfo("", 0, 0))
-        all_folders: Set[str] = set()
-        total_files = 0
-        total_size = 0
-
-        # Iterate through all objects
-        for page in paginator.paginate(
-            Bucket=storage_client.datasets_bucket,
-            Prefix=images_prefix
-        ):
-            if 'Contents' not in page:
-                continue
-
-            for obj in page['Contents']:
-                key = obj['Key']
-                size = obj['Size']
-
-                # Skip thumbnails directory
-                if '/thumbnails/' in key:
-                    continue
-
-                # Extract relative path from images/
-                if images_prefix in key:
-                    relative_path = key[len(images_prefix):]
-                else:
-                    continue
-
-                # Skip if it's just the prefix itself
-                if not relative_path:
-                    continue
-
-                total_files += 1
-                total_size += size
-
-                # Extract folder path(s)
-                if '/' in relative_path:
-                    parts = relative_path.split('/')
-                    # Build all parent folders
-                    for i in range(1, len(parts)):
-                        folder_path = '/'.join(parts[:i]) + '/'
-                        all_folders.add(folder_path)
-                        folder_stats[folder_path].path = folder_path
-                        folder_stats[folder_path].file_count += 1
-                        folder_stats[folder_path].total_size += size
-                else:
-                    # File in root
-                    folder_stats['/'].path = '/'
-                    folder_stats['/'].file_count += 1
-                    folder_stats['/'].total_size += size
-
-        # Convert to sorted list
-        folders = []
-
-        # Add root if it has files
-        if '/' in folder_stats:
-            folders.append({
-                'path': '/',
-                'name': '(루트)',
-                'file_count': folder_stats['/'].file_count,
-                'total_size_bytes': folder_stats['/'].total_size,
-                'depth': 0
-            })
-
-        # Add other folders sorted by path
-        for folder_path in sorted(all_folders):
-            info = folder_stats[folder_path]
-            depth = folder_path.count('/')
-            name = folder_path.rstrip('/').split('/')[-1]
-
-            folders.append({
-                'path': folder_path,
-                'name': name,
-                'file_count': info.file_count,
-                'total_size_bytes': info.total_size,
-                'depth': depth
-            })
-
-        return {
-            'dataset_id': dataset_id,
-            'total_files': total_files,
-            'total_size_bytes': total_size,
-            'folders': folders
-        }
+        return _build_structure(dataset_id, _iter_image_objects(dataset_id, storage_type))
 
     except Exception as e:
         logger.error(f"Failed to get storage structure for dataset {dataset_id}: {e}")
@@ -134,7 +140,8 @@ def get_storage_structure(dataset_id: str) -> Dict:
 def preview_upload_structure(
     dataset_id: str,
     file_mappings: List[Dict[str, str]],
-    target_folder: str = ""
+    target_folder: str = "",
+    storage_type: Optional[str] = None
 ) -> Dict:
     """
     Preview what the storage structure will look like after upload.
@@ -143,40 +150,20 @@ def preview_upload_structure(
         dataset_id: Dataset ID
         file_mappings: List of {filename, relative_path, size}
         target_folder: Target folder in storage (e.g., "train/")
+        storage_type: Dataset.storage_type (None = settings.STORAGE_BACKEND)
 
     Returns:
         Dict with preview structure
     """
-    # Get current structure
-    current = get_storage_structure(dataset_id)
-    current_files = set()
-
-    # Build set of existing files
+    # Get current structure and existing files from a single listing
     try:
-        storage_path = f"datasets/{dataset_id}"
-        images_prefix = f"{storage_path}/images/"
-
-        s3_client = storage_client.s3_client
-        paginator = s3_client.get_paginator('list_objects_v2')
-
-        for page in paginator.paginate(
-            Bucket=storage_client.datasets_bucket,
-            Prefix=images_prefix
-        ):
-            if 'Contents' not in page:
-                continue
-
-            for obj in page['Contents']:
-                key = obj['Key']
-                if '/thumbnails/' in key:
-                    continue
-                if images_prefix in key:
-                    relative_path = key[len(images_prefix):]
-                    if relative_path:
-                        current_files.add(relative_path)
-
+        objects = list(_iter_image_objects(dataset_id, storage_type))
     except Exception as e:
-        logger.warning(f"Could not fetch existing files: {e}")
+        logger.error(f"Failed to get storage structure for dataset {dataset_id}: {e}")
+        raise
+
+    current = _build_structure(dataset_id, objects)
+    current_files = {relative_path for relative_path, _ in objects}
 
     # Analyze new files
     new_files = []
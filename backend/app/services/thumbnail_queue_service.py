@@ -0,0 +1,381 @@
+"""Thumbnail Queue Service
+
+Persistent job queue (thumbnail_jobs table) for thumbnail pyramids, so
+uploads never wait for Pillow: the ingest pipeline stores the original,
+writes the ImageMetadata row with thumbnail_sizes "" (listings fall back to
+the original) and enqueues a job. Thumbnail workers generate the pyramid
+later.
+
+Queue protocol:
+- enqueue_thumbnail_jobs(): upsert on (dataset_id, image_id); an existing
+  job for the image is reset to pending and due now
+- claim_thumbnail_jobs(): UPDATE ... WHERE id IN (SELECT ... FOR UPDATE
+  SKIP LOCKED) RETURNING, so concurrent workers never claim the same job
+  and never wait on each other. Claiming moves run_after to the end of a
+  lease (THUMBNAIL_JOB_LEASE_SECONDS): the job of a crashed worker becomes
+  due again on its own
+- success: thumbnail_sizes set and the job deleted in one transaction
+- failure: retried with exponential backoff (THUMBNAIL_JOB_RETRY_SECONDS);
+  after THUMBNAIL_JOB_MAX_ATTEMPTS the job is kept with status "failed"
+
+Jobs are idempotent: the pyramid only depends on the original and is
+written to the same keys, so a job that runs twice (expired lease,
+re-enqueue) gives the same result. A worker only completes a job while it
+still holds the lease; a job re-enqueued meanwhile runs again.
+
+Workers:
+- scripts/maintenance/thumbnail_worker.py: worker processes, deployed
+  next to the API (docker-entrypoint.sh thumbnail-worker)
+- ThumbnailWorker.start(): opt-in thread in the API process for single-node
+  dev (THUMBNAIL_WORKER_EMBEDDED, off by default)
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import LabelerSessionLocal
+from app.core.storage import storage_client
+from app.core.storage_backends import StorageBackend
+from app.db.models.labeler import Dataset, ImageMetadata, ThumbnailJob
+from app.services.thumbnail_service import (
+    THUMBNAIL_CONTENT_TYPE,
+    create_thumbnail_pyramid,
+    format_thumbnail_sizes,
+    get_thumbnail_path,
+)
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+FAILED = "failed"
+
+# Rows per multi-row INSERT when enqueueing (7 bind parameters per row)
+ENQUEUE_CHUNK_ROWS = 2000
+
+MAX_RETRY_SECONDS = 3600
+
+# Set after enqueueing, so idle workers in this process start right away
+# instead of after their poll interval
+_wakeup = threading.Event()
+
+_embedded_worker: Optional["ThumbnailWorker"] = None
+
+
+@dataclass
+class ClaimedJob:
+    """A job held by this worker until ``lease_until``."""
+
+    id: int
+    dataset_id: str
+    image_id: str
+    attempts: int  # Including this one
+    lease_until: datetime
+    s3_key: Optional[str] = None  # None: the image no longer exists
+
+
+def enqueue_thumbnail_jobs(db: Session, dataset_id: str, image_ids: Iterable[str]) -> int:
+    """
+    Queue thumbnail generation for images and commit.
+
+    Args:
+        db: Labeler DB session
+        dataset_id: Dataset ID
+        image_ids: ImageMetadata IDs; images that already have a job get it reset
+
+    Returns:
+        Number of images queued
+    """
+    ids = list(dict.fromkeys(image_ids))
+    if not ids:
+        return 0
+
+    now = datetime.utcnow()
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    table = ThumbnailJob.__table__
+    try:
+        for i in range(0, len(ids), ENQUEUE_CHUNK_ROWS):
+            stmt = insert(table).values([
+                {
+                    "dataset_id": dataset_id,
+                    "image_id": image_id,
+                    "status": PENDING,
+                    "attempts": 0,
+                    "run_after": now,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for image_id in ids[i:i + ENQUEUE_CHUNK_ROWS]
+            ])
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.dataset_id, table.c.image_id],
+                set_={"status": PENDING, "attempts": 0, "run_after": now, "last_error": None, "updated_at": now},
+            ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    _wakeup.set()
+    return len(ids)
+
+
+def claim_statement(limit: int, now: datetime, lease_until: datetime):
+    """UPDATE ... RETURNING that claims up to ``limit`` due jobs, skipping rows locked by other workers."""
+    table = ThumbnailJob.__table__
+    due = (
+        select(table.c.id)
+        .where(table.c.status == PENDING, table.c.run_after <= now)
+        .order_by(table.c.run_after, table.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(table)
+        .where(table.c.id.in_(due.scalar_subquery()))
+        .values(run_after=lease_until, attempts=table.c.attempts + 1, updated_at=now)
+        .returning(table.c.id, table.c.dataset_id, table.c.image_id, table.c.attempts)
+    )
+
+
+def claim_thumbnail_jobs(db: Session, limit: int, lease_seconds: Optional[int] = None) -> List[ClaimedJob]:
+    """
+    Claim up to ``limit`` due jobs and commit.
+
+    Args:
+        db: Labeler DB session
+        limit: Maximum number of jobs
+        lease_seconds: How long the jobs are held (default THUMBNAIL_JOB_LEASE_SECONDS)
+
+    Returns:
+        Claimed jobs with the current s3_key of their image
+    """
+    now = datetime.utcnow()
+    lease_until = now + timedelta(seconds=lease_seconds or settings.THUMBNAIL_JOB_LEASE_SECONDS)
+    try:
+        rows = db.execute(claim_statement(limit, now, lease_until)).all()
+        jobs = [
+            ClaimedJob(id=row.id, dataset_id=row.dataset_id, image_id=row.image_id,
+                       attempts=row.attempts, lease_until=lease_until)
+            for row in rows
+        ]
+        if jobs:
+            keys = {
+                (row.dataset_id, row.id): row.s3_key
+                for row in db.query(ImageMetadata.id, ImageMetadata.dataset_id, ImageMetadata.s3_key)
+                .filter(ImageMetadata.id.in_({job.image_id for job in jobs}))
+            }
+            for job in jobs:
+                job.s3_key = keys.get((job.dataset_id, job.image_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return jobs
+
+
+def complete_thumbnail_jobs(
+    db: Session,
+    results: Iterable[Tuple[ClaimedJob, Optional[str], Optional[str]]],
+    max_attempts: Optional[int] = None
+) -> Dict[str, int]:
+    """
+    Record job outcomes and commit.
+
+    Args:
+        db: Labeler DB session
+        results: (job, thumbnail_sizes, error) per job; error is None on success,
+            thumbnail_sizes is None when there is no image to update
+        max_attempts: Attempts before a job is marked failed (default THUMBNAIL_JOB_MAX_ATTEMPTS)
+
+    Returns:
+        Counts: done, retried, failed, lost (lease expired, another worker owns the job)
+    """
+    max_attempts = max_attempts or settings.THUMBNAIL_JOB_MAX_ATTEMPTS
+    now = datetime.utcnow()
+    table = ThumbnailJob.__table__
+    counts = {"done": 0, "retried": 0, "failed": 0, "lost": 0}
+    try:
+        for job, thumbnail_sizes, error in results:
+            # Still ours: not re-claimed after the lease expired, not re-enqueued
+            held = (table.c.id == job.id) & (table.c.run_after == job.lease_until)
+            if error is None:
+                if not db.execute(delete(table).where(held)).rowcount:
+                    counts["lost"] += 1
+                    continue
+                if thumbnail_sizes is not None:
+                    db.execute(
+                        update(ImageMetadata.__table__)
+                        .where(ImageMetadata.id == job.image_id, ImageMetadata.dataset_id == job.dataset_id)
+                        .values(thumbnail_sizes=thumbnail_sizes)
+                    )
+                counts["done"] += 1
+                continue
+
+            if job.attempts >= max_attempts:
+                values = {"status": FAILED, "run_after": now}
+                outcome = "failed"
+            else:
+                delay = min(settings.THUMBNAIL_JOB_RETRY_SECONDS * 2 ** (job.attempts - 1), MAX_RETRY_SECONDS)
+                values = {"run_after": now + timedelta(seconds=delay)}
+                outcome = "retried"
+            updated = db.execute(
+                update(table).where(held).values(last_error=error[:2000], updated_at=now, **values)
+            ).rowcount
+            counts[outcome if updated else "lost"] += 1
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return counts
+
+
+def generate_image_thumbnails(backend: StorageBackend, bucket: str, s3_key: str) -> str:
+    """
+    Build and store the thumbnail pyramid of one stored image.
+
+    Returns:
+        thumbnail_sizes value ("" when the original cannot be decoded)
+    """
+    pyramid = create_thumbnail_pyramid(backend.get_object(bucket, s3_key))
+    if not pyramid:
+        return ""
+    for size, data in pyramid.items():
+        backend.put_object(bucket, get_thumbnail_path(s3_key, size), data, THUMBNAIL_CONTENT_TYPE)
+    return format_thumbnail_sizes(pyramid)
+
+
+class ThumbnailWorker:
+    """
+    Claims thumbnail jobs in batches and generates them on a thread pool.
+
+    Args:
+        session_factory: Creates labeler DB sessions (default LabelerSessionLocal)
+        threads: Jobs generated concurrently (default THUMBNAIL_WORKER_THREADS)
+        batch_size: Jobs claimed at once (default THUMBNAIL_WORKER_BATCH_SIZE)
+        poll_seconds: Idle wait between queue polls (default THUMBNAIL_WORKER_POLL_SECONDS)
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        threads: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        poll_seconds: Optional[float] = None
+    ):
+        self.session_factory = session_factory or LabelerSessionLocal
+        self.batch_size = batch_size or settings.THUMBNAIL_WORKER_BATCH_SIZE
+        self.poll_seconds = poll_seconds or settings.THUMBNAIL_WORKER_POLL_SECONDS
+        self.bucket = storage_client.datasets_bucket
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=threads or settings.THUMBNAIL_WORKER_THREADS,
+            thread_name_prefix="thumbnail-job"
+        )
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._storage_types: Dict[str, Optional[str]] = {}
+
+    def run_once(self) -> int:
+        """
+        Claim and process one batch.
+
+        Returns:
+            Number of jobs claimed (0 when the queue has no due jobs)
+        """
+        db = self.session_factory()
+        try:
+            jobs = claim_thumbnail_jobs(db, self.batch_size)
+            if not jobs:
+                return 0
+            backends = {
+                dataset_id: self._backend(db, dataset_id)
+                for dataset_id in {job.dataset_id for job in jobs if job.s3_key}
+            }
+            db.rollback()  # No transaction held while generating
+
+            outcomes = self._pool.map(lambda job: self._generate(job, backends.get(job.dataset_id)), jobs)
+            counts = complete_thumbnail_jobs(db, [(job, *outcome) for job, outcome in zip(jobs, outcomes)])
+            logger.info(
+                f"Thumbnail jobs: {counts['done']} done, {counts['retried']} retried, "
+                f"{counts['failed']} failed, {counts['lost']} lost"
+            )
+            return len(jobs)
+        finally:
+            db.close()
+
+    def drain(self) -> int:
+        """Process batches until no job is due; returns the number of jobs claimed."""
+        total = 0
+        while not self._stop.is_set():
+            claimed = self.run_once()
+            if not claimed:
+                break
+            total += claimed
+        return total
+
+    def run(self) -> None:
+        """Process jobs until stop() is called."""
+        logger.info(f"Thumbnail worker started (batch {self.batch_size})")
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception as e:
+                logger.error(f"Thumbnail worker batch failed: {e}")
+                claimed = 0
+            if not claimed:
+                _wakeup.wait(self.poll_seconds)
+                _wakeup.clear()
+        self._pool.shutdown(wait=True)
+        logger.info("Thumbnail worker stopped")
+
+    def start(self) -> None:
+        """Run the worker on a daemon thread."""
+        self._thread = threading.Thread(target=self.run, name="thumbnail-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop after the current batch."""
+        self._stop.set()
+        _wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _backend(self, db: Session, dataset_id: str) -> StorageBackend:
+        if dataset_id not in self._storage_types:
+            # NULL (legacy datasets) = settings.STORAGE_BACKEND, resolved by get_backend()
+            self._storage_types[dataset_id] = db.query(Dataset.storage_type).filter(Dataset.id == dataset_id).scalar()
+        return storage_client.get_backend(self._storage_types[dataset_id])
+
+    def _generate(self, job: ClaimedJob, backend: Optional[StorageBackend]) -> Tuple[Optional[str], Optional[str]]:
+        """(thumbnail_sizes, error) for one job."""
+        if job.s3_key is None:
+            return None, None  # Image deleted since it was queued: nothing to do
+        try:
+            return generate_image_thumbnails(backend, self.bucket, job.s3_key), None
+        except Exception as e:
+            logger.warning(f"Thumbnail job {job.id} ({job.dataset_id}/{job.image_id}) failed: {e}")
+            return None, f"{type(e).__name__}: {e}"
+
+
+def start_embedded_worker() -> None:
+    """Start the in-process worker of the API (THUMBNAIL_WORKER_EMBEDDED)."""
+    global _embedded_worker
+    if _embedded_worker is None:
+        _embedded_worker = ThumbnailWorker()
+        _embedded_worker.start()
+
+
+def stop_embedded_worker() -> None:
+    global _embedded_worker
+    if _embedded_worker is not None:
+        _embedded_worker.stop(timeout=10)
+        _embedded_worker = None
@@ -0,0 +1,564 @@
+"""Upload Session Service
+
+Direct-to-storage browser uploads. Instead of streaming every file through
+the API (upload_files_to_s3), the browser:
+
+1. creates a session with its file list (path, size, content type); long
+   lists are added in chunks
+2. requests upload URLs for pending files: one presigned PUT per file, or a
+   multipart upload with one presigned URL per part for files above
+   UPLOAD_MULTIPART_THRESHOLD_MB
+3. PUTs the bytes straight to S3/R2 (or the local storage endpoint)
+4. reports finished files, which are verified (CompleteMultipartUpload
+   checks every part ETag; size and single-PUT ETag are compared with the
+   stored object), probed for dimensions from their header, and registered
+   in bulk: ImageMetadata rows (ImageMetadataWriter) plus thumbnail jobs
+
+Sessions are resumable: completed files are recorded, URL requests only
+return pending files, and a large file keeps its multipart upload, so after
+an interruption the browser only re-sends the parts still missing.
+
+The datasets bucket needs a CORS rule allowing PUT from the frontend origin
+and exposing the ETag header.
+"""
+
+import logging
+import math
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.manifest import ManifestEntry
+from app.core.storage import storage_client
+from app.core.storage_backends import (
+    MAX_UPLOAD_PARTS,
+    StorageBackend,
+    StorageObject,
+    UploadNotFoundError,
+    UploadVerificationError,
+)
+from app.db.models.labeler import ImageMetadata, UploadSession, UploadSessionFile
+from app.services.dataset_upload_service import get_content_type, is_image_file
+from app.services.image_dimension_service import Dimensions, probe_object_dimensions
+from app.services.image_metadata_writer import ImageMetadataWriter
+from app.services.thumbnail_queue_service import enqueue_thumbnail_jobs
+
+logger = logging.getLogger(__name__)
+
+SESSION_ACTIVE = "active"
+SESSION_COMPLETED = "completed"
+SESSION_ABORTED = "aborted"
+
+FILE_PENDING = "pending"
+FILE_COMPLETED = "completed"
+
+# IDs per IN (...) query
+QUERY_CHUNK = 1000
+
+
+class UploadFileSpec(NamedTuple):
+    """A file the browser is going to upload."""
+
+    path: str  # Relative path in the dataset, e.g. "train/cat/001.jpg"
+    size: int
+    content_type: Optional[str] = None
+
+
+class CompletedUpload(NamedTuple):
+    """A file the browser reports as uploaded."""
+
+    path: str
+    etag: Optional[str] = None  # ETag header of the PUT response (single PUT uploads)
+    parts: Optional[List[Tuple[int, str]]] = None  # (part_number, etag) of multipart uploads
+
+
+@dataclass
+class CompletionResult:
+    """Outcome of one completion request."""
+
+    completed: List[str] = field(default_factory=list)
+    already_completed: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)  # path -> reason
+    new_images: int = 0  # Completed files that were not in the dataset before
+    total_bytes: int = 0
+    folder_structure: Dict[str, int] = field(default_factory=dict)
+
+
+def normalize_upload_path(path: str) -> str:
+    """
+    Validate a relative image path from the browser (webkitRelativePath style).
+
+    Raises:
+        ValueError: Absolute, escaping, empty-segment, too long or non-image paths
+    """
+    normalized = path.replace("\\", "/")
+    while normalized.startswith("./"):
+        normalized = normalized[2:]
+    parts = normalized.split("/")
+    if not normalized or normalized.startswith("/") or any(part in ("", ".", "..") for part in parts):
+        raise ValueError(f"Invalid path: {path!r}")
+    if len(normalized) > ImageMetadata.id.type.length:
+        raise ValueError(f"Path too long: {path!r}")
+    if not is_image_file(normalized):
+        raise ValueError(f"Not an image file: {path!r}")
+    return normalized
+
+
+def image_key(dataset_id: str, image_id: str) -> str:
+    return f"datasets/{dataset_id}/images/{image_id}"
+
+
+def _part_size() -> int:
+    return settings.UPLOAD_PART_SIZE_MB * 1024 * 1024
+
+
+def _is_multipart(size: int) -> bool:
+    return size > settings.UPLOAD_MULTIPART_THRESHOLD_MB * 1024 * 1024
+
+
+def _session_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+
+def _chunks(items: Sequence, size: int = QUERY_CHUNK) -> Iterable[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _load_files(db: Session, session_id: str, image_ids: Sequence[str]) -> Dict[str, UploadSessionFile]:
+    files = {}
+    for chunk in _chunks(list(image_ids)):
+        for row in db.query(UploadSessionFile).filter(
+            UploadSessionFile.session_id == session_id,
+            UploadSessionFile.image_id.in_(chunk)
+        ):
+            files[row.image_id] = row
+    return files
+
+
+def _refresh_counters(db: Session, session: UploadSession) -> None:
+    """Recompute session totals from its files (idempotent under retries)."""
+    db.flush()
+    rows = db.query(
+        UploadSessionFile.status,
+        func.count(UploadSessionFile.id),
+        func.coalesce(func.sum(UploadSessionFile.size), 0)
+    ).filter(UploadSessionFile.session_id == session.id).group_by(UploadSessionFile.status).all()
+    counts = {status: (count, int(size)) for status, count, size in rows}
+    session.total_files = sum(count for count, _ in counts.values())
+    session.total_bytes = sum(size for _, size in counts.values())
+    session.completed_files, session.completed_bytes = counts.get(FILE_COMPLETED, (0, 0))
+
+
+def create_upload_session(
+    db: Session,
+    dataset_id: str,
+    user_id: str,
+    files: Sequence[UploadFileSpec] = ()
+) -> UploadSession:
+    """
+    Start an upload session for a dataset and commit.
+
+    Args:
+        db: Labeler DB session
+        dataset_id: Target dataset
+        user_id: Keycloak sub of the uploader
+        files: Initial file list (more can be added with add_upload_session_files)
+
+    Returns:
+        The new UploadSession
+
+    Raises:
+        ValueError: Invalid file paths or sizes
+    """
+    session = UploadSession(
+        id=f"us_{uuid.uuid4().hex[:16]}",
+        dataset_id=dataset_id,
+        created_by=user_id,
+        status=SESSION_ACTIVE,
+        total_files=0,
+        total_bytes=0,
+        completed_files=0,
+        completed_bytes=0,
+        expires_at=_session_expiry(),
+    )
+    db.add(session)
+    add_upload_session_files(db, session, files)
+    return session
+
+
+def add_upload_session_files(db: Session, session: UploadSession, files: Sequence[UploadFileSpec]) -> int:
+    """
+    Add files to a session and commit.
+
+    Re-adding a pending file updates its size / content type; completed
+    files are left alone, so a resuming browser can send its whole list again.
+
+    Returns:
+        Number of files added or updated
+
+    Raises:
+        ValueError: Invalid file paths or sizes (nothing is added)
+    """
+    max_size = _part_size() * MAX_UPLOAD_PARTS
+    specs: Dict[str, UploadFileSpec] = {}
+    for spec in files:
+        path = normalize_upload_path(spec.path)
+        if spec.size < 0 or spec.size > max_size:
+            raise ValueError(f"Invalid size for {spec.path!r}: {spec.size}")
+        specs[path] = UploadFileSpec(path, spec.size, spec.content_type or get_content_type(path))
+
+    try:
+        existing = _load_files(db, session.id, list(specs))
+        new_rows = []
+        changed = 0
+        for path, spec in specs.items():
+            row = existing.get(path)
+            if row is None:
+                new_rows.append({
+                    "session_id": session.id,
+                    "image_id": path,
+                    "size": spec.size,
+                    "content_type": spec.content_type,
+                    "status": FILE_PENDING,
+                })
+            elif row.status == FILE_PENDING and (row.size, row.content_type) != (spec.size, spec.content_type):
+                if row.size != spec.size:
+                    row.upload_id = None  # Part layout changed: start a new multipart upload
+                row.size, row.content_type = spec.size, spec.content_type
+                changed += 1
+
+        for chunk in _chunks(new_rows, 5000):
+            db.execute(insert(UploadSessionFile.__table__), list(chunk))
+        _refresh_counters(db, session)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(new_rows) + changed
+
+
+def list_pending_files(db: Session, session: UploadSession, after: Optional[str] = None, limit: int = 1000) -> List[str]:
+    """Paths still to upload, in path order after ``after`` (keyset pagination)."""
+    query = db.query(UploadSessionFile.image_id).filter(
+        UploadSessionFile.session_id == session.id,
+        UploadSessionFile.status == FILE_PENDING
+    )
+    if after:
+        query = query.filter(UploadSessionFile.image_id > after)
+    return [row.image_id for row in query.order_by(UploadSessionFile.image_id).limit(limit)]
+
+
+def get_upload_targets(
+    db: Session,
+    session: UploadSession,
+    backend: StorageBackend,
+    paths: Optional[Sequence[str]] = None,
+    after: Optional[str] = None,
+    limit: int = 100,
+    expiration: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Presigned upload URLs for pending files, and commit.
+
+    Multipart files get a multipart upload on first request; later requests
+    (resume) reuse it and only return URLs for parts not stored yet, with
+    the stored parts listed in ``uploaded_parts``.
+
+    Args:
+        db: Labeler DB session
+        session: Active upload session
+        backend: Storage backend of the dataset
+        paths: Specific files (default: the next pending files after ``after``)
+        after: Keyset cursor when ``paths`` is not given
+        limit: Maximum files
+        expiration: URL lifetime (default UPLOAD_URL_EXPIRATION_SECONDS)
+
+    Returns:
+        (targets, next_after) where next_after is the cursor for the next
+        page (None when this was the last one)
+    """
+    bucket = storage_client.datasets_bucket
+    expiration = expiration or settings.UPLOAD_URL_EXPIRATION_SECONDS
+
+    if paths is not None:
+        wanted = []
+        for path in paths:
+            try:
+                wanted.append(normalize_upload_path(path))
+            except ValueError:
+                continue
+        files = [
+            row for row in _load_files(db, session.id, wanted[:limit]).values()
+            if row.status == FILE_PENDING
+        ]
+        files.sort(key=lambda row: row.image_id)
+        next_after = None
+    else:
+        query = db.query(UploadSessionFile).filter(
+            UploadSessionFile.session_id == session.id,
+            UploadSessionFile.status == FILE_PENDING
+        )
+        if after:
+            query = query.filter(UploadSessionFile.image_id > after)
+        files = query.order_by(UploadSessionFile.image_id).limit(limit).all()
+        next_after = files[-1].image_id if len(files) == limit else None
+
+    targets = []
+    try:
+        for row in files:
+            key = image_key(session.dataset_id, row.image_id)
+            if _is_multipart(row.size):
+                targets.append(_multipart_target(backend, bucket, key, row, expiration))
+            else:
+                targets.append({
+                    "path": row.image_id,
+                    "method": "put",
+                    "url": backend.presign_put(bucket, key, row.content_type, expiration),
+                    "headers": {"Content-Type": row.content_type} if row.content_type else {},
+                })
+        session.expires_at = _session_expiry()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return targets, next_after
+
+
+def _multipart_target(
+    backend: StorageBackend,
+    bucket: str,
+    key: str,
+    row: UploadSessionFile,
+    expiration: int
+) -> Dict[str, Any]:
+    part_size = _part_size()
+    part_count = max(1, math.ceil(row.size / part_size))
+
+    stored = []
+    if row.upload_id:
+        try:
+            stored = backend.list_parts(bucket, key, row.upload_id)
+        except UploadNotFoundError:
+            row.upload_id = None  # Aborted or expired (bucket lifecycle): start over
+    if not row.upload_id:
+        row.upload_id = backend.create_multipart_upload(bucket, key, row.content_type)
+
+    # A part only counts as uploaded when it has the size the layout expects
+    expected = {
+        number: part_size if number < part_count else row.size - part_size * (part_count - 1)
+        for number in range(1, part_count + 1)
+    }
+    uploaded = [part for part in stored if expected.get(part.part_number) == part.size]
+    done = {part.part_number for part in uploaded}
+    missing = [number for number in expected if number not in done]
+    urls = backend.presign_upload_parts(bucket, key, row.upload_id, missing, expiration)
+
+    return {
+        "path": row.image_id,
+        "method": "multipart",
+        "upload_id": row.upload_id,
+        "part_size": part_size,
+        "parts": [{"part_number": number, "url": urls[number]} for number in missing],
+        "uploaded_parts": [{"part_number": part.part_number, "etag": part.etag} for part in uploaded],
+    }
+
+
+def _verify_upload(
+    backend: StorageBackend,
+    bucket: str,
+    key: str,
+    size: int,
+    upload_id: Optional[str],
+    completion: CompletedUpload
+) -> Tuple[StorageObject, Optional[Dimensions]]:
+    """Finish (multipart) and check one stored file. Raises UploadVerificationError."""
+    if upload_id:
+        if not completion.parts:
+            raise UploadVerificationError("parts are required for a multipart upload")
+        # Storage would happily complete a prefix of the parts; the object must be whole
+        part_count = max(1, math.ceil(size / _part_size()))
+        if [number for number, _ in completion.parts] != list(range(1, part_count + 1)):
+            raise UploadVerificationError(f"expected parts 1..{part_count} in order")
+        try:
+            backend.complete_multipart_upload(bucket, key, upload_id, completion.parts)
+        except UploadNotFoundError:
+            # Completed by an earlier request whose response never arrived; checked below
+            pass
+    elif not completion.etag:
+        raise UploadVerificationError("etag is required")
+
+    obj = backend.head_object(bucket, key)
+    if obj is None:
+        raise UploadVerificationError("object not found in storage")
+    if obj.size != size:
+        raise UploadVerificationError(f"size mismatch: expected {size} bytes, stored {obj.size}")
+    if not upload_id and completion.etag.strip('"') != obj.etag:
+        raise UploadVerificationError("ETag mismatch")
+    return obj, probe_object_dimensions(backend, bucket, key)
+
+
+def complete_upload_session_files(
+    db: Session,
+    session: UploadSession,
+    backend: StorageBackend,
+    completions: Sequence[CompletedUpload],
+    workers: Optional[int] = None
+) -> CompletionResult:
+    """
+    Verify uploaded files and register them in bulk, then commit.
+
+    Verified files become ImageMetadata rows (with dimensions probed from
+    their header) and thumbnail jobs in one batch. Files that fail
+    verification stay pending and can be uploaded and completed again.
+    Completing a file twice is harmless.
+
+    Args:
+        db: Labeler DB session
+        session: Active upload session
+        backend: Storage backend of the dataset
+        completions: Files the browser finished uploading
+        workers: Threads for verification requests (default IMAGE_PROBE_WORKERS)
+
+    Returns:
+        CompletionResult; the caller updates dataset / project image counts
+        with ``new_images``
+    """
+    bucket = storage_client.datasets_bucket
+    result = CompletionResult()
+
+    by_path: Dict[str, CompletedUpload] = {}
+    for completion in completions:
+        try:
+            by_path[normalize_upload_path(completion.path)] = completion
+        except ValueError as e:
+            result.failed[completion.path] = str(e)
+
+    files = _load_files(db, session.id, list(by_path))
+    pending = []
+    for path, completion in by_path.items():
+        row = files.get(path)
+        if row is None:
+            result.failed[completion.path] = "not part of this upload session"
+        elif row.status == FILE_COMPLETED:
+            result.already_completed += 1
+        else:
+            pending.append((row, completion))
+
+    def verify(item):
+        row, completion = item
+        try:
+            return _verify_upload(
+                backend, bucket, image_key(session.dataset_id, row.image_id), row.size, row.upload_id, completion
+            ), None
+        except UploadVerificationError as e:
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=workers or settings.IMAGE_PROBE_WORKERS) as pool:
+        outcomes = list(pool.map(verify, pending))
+
+    now = datetime.utcnow()
+    rows = []
+    manifest_entries = []
+    for (row, completion), (verified, error) in zip(pending, outcomes):
+        if verified is None:
+            result.failed[completion.path] = error
+            continue
+        obj, dimensions = verified
+        width, height = dimensions or (None, None)
+        folder_path = os.path.dirname(row.image_id) or None
+        rows.append({
+            "id": row.image_id,
+            "dataset_id": session.dataset_id,
+            "file_name": os.path.basename(row.image_id),
+            "s3_key": image_key(session.dataset_id, row.image_id),
+            "folder_path": folder_path,
+            "size": obj.size,
+            "width": width,
+            "height": height,
+            "thumbnail_sizes": "",  # Queued for the thumbnail workers
+            "uploaded_at": now,
+            "last_modified": obj.last_modified.astimezone(timezone.utc).replace(tzinfo=None),
+        })
+        manifest_entries.append(ManifestEntry(
+            key=row.image_id, size=obj.size, etag=obj.etag, last_modified=int(obj.last_modified.timestamp())
+        ))
+        row.status, row.etag, row.completed_at = FILE_COMPLETED, obj.etag, now
+        result.completed.append(row.image_id)
+        result.total_bytes += obj.size
+        if folder_path:
+            result.folder_structure[folder_path] = result.folder_structure.get(folder_path, 0) + 1
+
+    if rows:
+        known = set()
+        for chunk in _chunks(result.completed):
+            known.update(
+                image_id for (image_id,) in db.query(ImageMetadata.id).filter(
+                    ImageMetadata.dataset_id == session.dataset_id, ImageMetadata.id.in_(chunk)
+                )
+            )
+        result.new_images = len(rows) - len(known)
+
+        # Commits the file status changes together with the metadata rows
+        ImageMetadataWriter(db).write(rows)
+        enqueue_thumbnail_jobs(db, session.dataset_id, result.completed)
+        try:
+            storage_client.update_dataset_manifest(
+                session.dataset_id, upserts=manifest_entries, storage_type=backend.name
+            )
+        except Exception as e:
+            # A stale manifest only misses these uploads; rebuild it with
+            # scripts/maintenance/build_dataset_manifests.py
+            logger.warning(f"Failed to update manifest for dataset {session.dataset_id}: {e}")
+
+    try:
+        _refresh_counters(db, session)
+        if session.total_files and session.completed_files == session.total_files:
+            session.status = SESSION_COMPLETED
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    if result.failed:
+        logger.warning(f"Upload session {session.id}: {len(result.failed)} files failed verification")
+    logger.info(
+        f"Upload session {session.id}: {len(result.completed)} files registered "
+        f"({session.completed_files}/{session.total_files} done)"
+    )
+    return result
+
+
+def abort_upload_session(db: Session, session: UploadSession, backend: StorageBackend) -> int:
+    """
+    Abort a session: discard unfinished multipart uploads and commit.
+
+    Files already completed stay in the dataset.
+
+    Returns:
+        Number of multipart uploads aborted
+    """
+    bucket = storage_client.datasets_bucket
+    aborted = 0
+    for row in db.query(UploadSessionFile).filter(
+        UploadSessionFile.session_id == session.id,
+        UploadSessionFile.status == FILE_PENDING,
+        UploadSessionFile.upload_id.isnot(None)
+    ):
+        try:
+            backend.abort_multipart_upload(bucket, image_key(session.dataset_id, row.image_id), row.upload_id)
+            aborted += 1
+        except Exception as e:
+            logger.warning(f"Failed to abort multipart upload of {row.image_id}: {e}")
+        row.upload_id = None
+
+    session.status = SESSION_ABORTED
+    db.commit()
+    return aborted
@@ -0,0 +1,433 @@
+"""
+Version Diff Cache Service
+
+Stores computed version diffs so the compare endpoint serves them without
+re-reading both versions and re-diffing every image:
+
+- version_diffs: one row per (project, task_type, older version, newer
+  version; -1 = Working) holding the summary header (summary, class_stats)
+- version_diff_images: one row per image of either version with its change
+  counts, per-class counts and the image diff as gzip-compressed JSON (NULL
+  for images without changes); pages of changed images are read from here
+
+Published versions are immutable, so a diff between two published versions
+is computed once. A diff against a live version (Working or draft, read
+from the annotations table) is revalidated on every request, with the same
+kind of indexed aggregates as export_cache_service:
+
+1. Project level: count, id sum, highest id, latest updated_at and version
+   sum of the live annotations. Unchanged: the cached diff is served as is.
+2. Image level: the same aggregates per image. Only images whose aggregate
+   differs from the stored one (edited, annotated or emptied since the last
+   computation) are re-diffed, and the header is adjusted by the difference.
+
+Rows computed by older diff code (format_version) are recomputed.
+"""
+
+import copy
+import gzip
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.models.labeler import Annotation, VersionDiff, VersionDiffImage
+from app.services.version_diff_service import VersionDiffService
+
+logger = logging.getLogger(__name__)
+
+# Bump when matching or diff output changes, so diffs of older code are recomputed
+DIFF_FORMAT_VERSION = 1
+
+# Version types whose annotations are read live from the annotations table
+LIVE_VERSION_TYPES = ('working', 'draft')
+
+# Touched images of a published version read one by one (ranged snapshot blob
+# reads) up to this many; beyond, the version is read once
+PER_IMAGE_READ_LIMIT = 100
+
+# Image IDs per IN (...) query
+QUERY_CHUNK_SIZE = 1000
+
+# Counters of version_diff_images summed into the header summary
+_COUNT_KEYS = ('added_count', 'removed_count', 'modified_count', 'unchanged_count')
+
+
+def _is_live(version: Any) -> bool:
+    return version.version_type in LIVE_VERSION_TYPES
+
+
+def _chunks(items: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(items), QUERY_CHUNK_SIZE):
+        yield items[start:start + QUERY_CHUNK_SIZE]
+
+
+def _fingerprint(values: Iterable[Any]) -> str:
+    encoded = json.dumps(list(values), default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _live_aggregates():
+    """Aggregate columns over live annotations."""
+    return (
+        func.count(Annotation.id),
+        func.sum(Annotation.id),
+        func.max(Annotation.id),
+        func.max(Annotation.updated_at),
+        func.sum(Annotation.version),
+    )
+
+
+def compute_live_fingerprint(db: Session, project_id: str, task_type: str) -> str:
+    """
+    Fingerprint the live annotations of a project task.
+
+    Creates and deletes change the count and id sum, edits bump updated_at
+    and the optimistic-lock version.
+
+    Args:
+        db: Labeler database session
+        project_id: Project ID
+        task_type: Task type
+
+    Returns:
+        SHA-256 hex digest
+    """
+    row = db.query(*_live_aggregates()).filter(
+        Annotation.project_id == project_id,
+        Annotation.task_type == task_type,
+    ).one()
+    return _fingerprint(row)
+
+
+def compute_live_image_fingerprints(db: Session, project_id: str, task_type: str) -> Dict[str, str]:
+    """
+    Fingerprint the live annotations of each image (see compute_live_fingerprint).
+
+    Returns:
+        Dict mapping image_id to SHA-256 hex digest, for images with annotations
+    """
+    rows = db.query(Annotation.image_id, *_live_aggregates()).filter(
+        Annotation.project_id == project_id,
+        Annotation.task_type == task_type,
+    ).group_by(Annotation.image_id)
+    return {image_id: _fingerprint(aggregates) for image_id, *aggregates in rows}
+
+
+def encode_image_diff(diff: Dict[str, Any]) -> bytes:
+    """Compact storage form of an image diff."""
+    return gzip.compress(json.dumps(diff, separators=(',', ':'), default=str).encode("utf-8"))
+
+
+def decode_image_diff(data: bytes) -> Dict[str, Any]:
+    """Image diff stored by encode_image_diff."""
+    return json.loads(gzip.decompress(data))
+
+
+def _image_row(image_id: str, diff: Dict[str, Any], live_fingerprint: Optional[str]) -> Dict[str, Any]:
+    """version_diff_images values of one image diff."""
+    summary = diff['summary']
+    changed = summary['total_changes'] > 0
+    row = {key: summary[key] for key in _COUNT_KEYS}
+    row.update(
+        image_id=image_id,
+        total_changes=summary['total_changes'],
+        class_stats=VersionDiffService._calculate_class_stats({image_id: diff}) if changed else None,
+        diff=encode_image_diff(diff) if changed else None,
+        live_fingerprint=live_fingerprint,
+    )
+    return row
+
+
+class _DiffTotals:
+    """Header summary and class_stats, adjusted row by row."""
+
+    def __init__(self, summary: Optional[Dict[str, int]] = None, class_stats: Optional[Dict[str, Dict[str, int]]] = None):
+        self.summary = copy.deepcopy(summary) if summary else VersionDiffService.summarize_image_diffs({}, 0)
+        self.class_stats = copy.deepcopy(class_stats) if class_stats else {}
+
+    def apply(self, row: Dict[str, Any], sign: int = 1):
+        """Add (sign=1) or subtract (sign=-1) one image row."""
+        summary = self.summary
+        summary['total_images'] += sign
+        if row['total_changes'] <= 0:
+            return
+        summary['images_with_changes'] += sign
+        summary['total_added'] += sign * row['added_count']
+        summary['total_removed'] += sign * row['removed_count']
+        summary['total_modified'] += sign * row['modified_count']
+        summary['total_unchanged'] += sign * row['unchanged_count']
+        summary['total_changes'] += sign * row['total_changes']
+
+        for class_name, counts in (row['class_stats'] or {}).items():
+            totals = self.class_stats.setdefault(class_name, {'added': 0, 'removed': 0, 'modified': 0})
+            for key, count in counts.items():
+                totals[key] += sign * count
+            if not any(totals.values()):
+                del self.class_stats[class_name]
+
+    def save(self, diff: VersionDiff):
+        # New objects, so the JSONB columns are flagged as changed
+        diff.summary = copy.deepcopy(self.summary)
+        diff.class_stats = copy.deepcopy(self.class_stats)
+
+
+def _row_values(row: VersionDiffImage) -> Dict[str, Any]:
+    values = {key: getattr(row, key) for key in _COUNT_KEYS}
+    values.update(total_changes=row.total_changes, class_stats=row.class_stats)
+    return values
+
+
+def _load_annotations(db: Session, version: Any, image_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Annotations of some images of a version, grouped by image_id."""
+    if _is_live(version):
+        grouped = {}
+        for chunk in _chunks(image_ids):
+            grouped.update(VersionDiffService.get_annotations_from_db(
+                db, version.project_id, version.task_type, image_ids=chunk
+            ))
+        return grouped
+
+    if version.snapshot_path and len(image_ids) <= PER_IMAGE_READ_LIMIT:
+        grouped = {}
+        for image_id in image_ids:
+            grouped.update(VersionDiffService.get_version_annotations(db, version, image_id))
+        return grouped
+
+    annotations = VersionDiffService.get_version_annotations(db, version)
+    return {image_id: annotations[image_id] for image_id in image_ids if image_id in annotations}
+
+
+def _find_diff(db: Session, version_a: Any, version_b: Any) -> Optional[VersionDiff]:
+    return db.query(VersionDiff).filter(
+        VersionDiff.project_id == version_a.project_id,
+        VersionDiff.task_type == version_a.task_type,
+        VersionDiff.version_a_id == version_a.id,
+        VersionDiff.version_b_id == version_b.id,
+    ).first()
+
+
+def _compute(db: Session, version_a: Any, version_b: Any) -> VersionDiff:
+    """Diff every image of two versions and store the result."""
+    live = _is_live(version_a) or _is_live(version_b)
+    project_id, task_type = version_a.project_id, version_a.task_type
+
+    # Fingerprints first: edits made while diffing are picked up next time
+    live_fingerprint = compute_live_fingerprint(db, project_id, task_type) if live else None
+    image_fingerprints = compute_live_image_fingerprints(db, project_id, task_type) if live else {}
+
+    snapshots_a = VersionDiffService.get_version_annotations(db, version_a)
+    snapshots_b = VersionDiffService.get_version_annotations(db, version_b)
+
+    totals = _DiffTotals()
+    rows = []
+    for image_id in sorted(set(snapshots_a) | set(snapshots_b)):
+        diff = VersionDiffService.calculate_diff_for_image(
+            snapshots_a.get(image_id, []), snapshots_b.get(image_id, [])
+        )
+        row = _image_row(image_id, diff, image_fingerprints.get(image_id))
+        totals.apply(row)
+        rows.append(row)
+
+    cached = VersionDiff(
+        project_id=project_id,
+        task_type=task_type,
+        version_a_id=version_a.id,
+        version_b_id=version_b.id,
+        format_version=DIFF_FORMAT_VERSION,
+        live_fingerprint=live_fingerprint,
+        computed_at=datetime.utcnow(),
+    )
+    totals.save(cached)
+    db.add(cached)
+    try:
+        db.flush()
+    except IntegrityError:
+        # Computed concurrently: use the stored one
+        db.rollback()
+        logger.info(f"Version diff {project_id}/{task_type} {version_a.id}->{version_b.id} saved concurrently")
+        return _find_diff(db, version_a, version_b)
+
+    for row in rows:
+        row['diff_id'] = cached.id
+    if rows:
+        db.execute(insert(VersionDiffImage), rows)
+    db.commit()
+    return cached
+
+
+def _refresh(db: Session, cached: VersionDiff, version_a: Any, version_b: Any) -> VersionDiff:
+    """Re-diff the images whose live annotations changed since the last computation."""
+    project_id, task_type = cached.project_id, cached.task_type
+
+    live_fingerprint = compute_live_fingerprint(db, project_id, task_type)
+    if live_fingerprint == cached.live_fingerprint:
+        return cached
+
+    # One refresh at a time; a concurrent one may have caught up already
+    db.refresh(cached, with_for_update=True)
+    if live_fingerprint == cached.live_fingerprint:
+        db.commit()
+        return cached
+
+    current = compute_live_image_fingerprints(db, project_id, task_type)
+    stored = dict(
+        db.query(VersionDiffImage.image_id, VersionDiffImage.live_fingerprint).filter(
+            VersionDiffImage.diff_id == cached.id,
+            VersionDiffImage.live_fingerprint.isnot(None),
+        )
+    )
+    touched = sorted(
+        image_id for image_id in set(current) | set(stored)
+        if current.get(image_id) != stored.get(image_id)
+    )
+
+    if touched:
+        snapshots_a = _load_annotations(db, version_a, touched)
+        snapshots_b = _load_annotations(db, version_b, touched)
+
+        old_rows = {}
+        for chunk in _chunks(touched):
+            old_rows.update(
+                (row.image_id, row) for row in db.query(VersionDiffImage).filter(
+                    VersionDiffImage.diff_id == cached.id,
+                    VersionDiffImage.image_id.in_(chunk),
+                )
+            )
+
+        totals = _DiffTotals(cached.summary, cached.class_stats)
+        for image_id in touched:
+            old_row = old_rows.get(image_id)
+            if old_row is not None:
+                totals.apply(_row_values(old_row), sign=-1)
+
+            anns_a, anns_b = snapshots_a.get(image_id, []), snapshots_b.get(image_id, [])
+            if not anns_a and not anns_b:
+                # No longer in either version
+                if old_row is not None:
+                    db.delete(old_row)
+                continue
+
+            row = _image_row(
+                image_id,
+                VersionDiffService.calculate_diff_for_image(anns_a, anns_b),
+                current.get(image_id),
+            )
+            totals.apply(row)
+            if old_row is None:
+                db.add(VersionDiffImage(diff_id=cached.id, **row))
+            else:
+                for key, value in row.items():
+                    setattr(old_row, key, value)
+        totals.save(cached)
+
+    logger.info(f"Version diff {project_id}/{task_type} {cached.version_a_id}->{cached.version_b_id}: "
+                f"re-diffed {len(touched)} touched images")
+    cached.live_fingerprint = live_fingerprint
+    cached.computed_at = datetime.utcnow()
+    db.commit()
+    return cached
+
+
+def get_version_diff(
+    db: Session,
+    version_a: Any,
+    version_b: Any,
+    compute: bool = True,
+) -> Optional[VersionDiff]:
+    """
+    Get the up-to-date cached diff of two versions, computing it if needed.
+
+    Args:
+        db: Labeler database session
+        version_a: Older version (see VersionDiffService.resolve_versions)
+        version_b: Newer version
+        compute: Compute and store the diff if it is not cached yet
+
+    Returns:
+        VersionDiff with current summary and rows, or None if it is not
+        cached and compute is False
+    """
+    cached = _find_diff(db, version_a, version_b)
+    if cached is not None and cached.format_version != DIFF_FORMAT_VERSION:
+        delete_diffs(db, [cached.id])
+        db.commit()
+        cached = None
+
+    if cached is None:
+        return _compute(db, version_a, version_b) if compute else None
+
+    if _is_live(version_a) or _is_live(version_b):
+        return _refresh(db, cached, version_a, version_b)
+    return cached
+
+
+def get_image_diffs(
+    db: Session,
+    cached: VersionDiff,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    image_id: Optional[str] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Read a page of the images with changes of a cached diff.
+
+    Args:
+        db: Labeler database session
+        cached: Cached diff (see get_version_diff)
+        offset: Number of changed images (ordered by image_id) to skip
+        limit: Maximum images to return (None = all)
+        image_id: Optional - only this image
+
+    Returns:
+        Dict mapping image_id to its diff, ordered by image_id
+    """
+    if limit == 0:
+        return {}
+
+    query = db.query(VersionDiffImage.image_id, VersionDiffImage.diff).filter(
+        VersionDiffImage.diff_id == cached.id,
+        VersionDiffImage.total_changes > 0,
+    )
+    if image_id is not None:
+        query = query.filter(VersionDiffImage.image_id == image_id)
+    query = query.order_by(VersionDiffImage.image_id).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return {row_image_id: decode_image_diff(data) for row_image_id, data in query}
+
+
+def delete_diffs(db: Session, diff_ids: List[int]) -> int:
+    """
+    Delete cached diffs and their image rows (caller commits).
+
+    Returns:
+        Number of deleted diffs
+    """
+    if not diff_ids:
+        return 0
+    db.query(VersionDiffImage).filter(
+        VersionDiffImage.diff_id.in_(diff_ids)
+    ).delete(synchronize_session=False)
+    return db.query(VersionDiff).filter(
+        VersionDiff.id.in_(diff_ids)
+    ).delete(synchronize_session=False)
+
+
+def delete_project_diffs(db: Session, project_ids: List[str]) -> int:
+    """
+    Delete the cached diffs of projects (caller commits).
+
+    Returns:
+        Number of deleted diffs
+    """
+    diff_ids = [
+        diff_id for (diff_id,) in db.query(VersionDiff.id).filter(VersionDiff.project_id.in_(project_ids))
+    ]
+    return delete_diffs(db, diff_ids)
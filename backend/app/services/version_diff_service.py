@@ -1,13 +1,12 @@
 """Version diff calculation service."""
 
-import json
-import boto3
-from botocore.config import Config
 from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
 
 from app.db.models.labeler import AnnotationVersion, Annotation
-from app.core.config import settings
+from app.core.storage import storage_client
+from app.core.storage_backends import ObjectNotFoundError
+from app.services.annotation_matching import match_annotations
 
 
 class VersionDiffService:
@@ -193,36 +192,13 @@ class VersionDiffService:
                 if candidate.get('annotation_id') == ann_id:
                     return (candidate, idx)
 
-        # Phase 11: Try IoU-based matching for bbox annotations
-        # Normalize geometry to handle both DB and R2 formats
-        geometry = annotation.get('geometry', {})
-        if not geometry:
+        # Phase 11: Try IoU-based matching for boxes, rotated boxes and polygons
+        pairs = match_annotations([annotation], candidates, iou_threshold).pairs
+        if not pairs:
             return None
 
-        normalized_geom = VersionDiffService.normalize_geometry(geometry)
-        if 'x' not in normalized_geom:
-            return None
-
-        best_iou = 0.0
-        best_match = None
-        best_idx = -1
-
-        for idx, candidate in enumerate(candidates):
-            candidate_geometry = candidate.get('geometry', {})
-            if not candidate_geometry:
-                continue
-
-            normalized_candidate = VersionDiffService.normalize_geometry(candidate_geometry)
-            if 'x' not in normalized_candidate:
-                continue
-
-            iou = VersionDiffService.calculate_iou(normalized_geom, normalized_candidate)
-            if iou > best_iou and iou >= iou_threshold:
-                best_iou = iou
-                best_match = candidate
-                best_idx = idx
-
-        return (best_match, best_idx) if best_match else None
+        best_idx = pairs[0][1]
+        return (candidates[best_idx], best_idx)
 
     @staticmethod
     def normalize_geometry(geometry: Dict[str, Any]) -> Dict[str, Any]:
@@ -260,6 +236,11 @@ class VersionDiffService:
         if 'points' in geometry:
             normalized['points'] = geometry['points']
 
+        # Rotated bbox: Keep center and angle
+        for key in ('cx', 'cy', 'angle'):
+            if key in geometry:
+                normalized[key] = geometry[key]
+
         # Circle: Keep center and radius
         if 'center' in geometry:
             normalized['center'] = geometry['center']
@@ -322,6 +303,12 @@ class VersionDiffService:
             if ann_id and ann_id == 2129:
                 print(f"  Size changed: old ({old_geom.get('width')}, {old_geom.get('height')}) != new ({new_geom.get('width')}, {new_geom.get('height')})")
 
+        if (old_geom.get('points') != new_geom.get('points')
+                or old_geom.get('cx') != new_geom.get('cx') or old_geom.get('cy') != new_geom.get('cy')
+                or old_geom.get('angle') != new_geom.get('angle')):
+            geometry_changed = True
+            changes['shape_changed'] = True
+
         if geometry_changed:
             changes['geometry_changed'] = True
             changes['old_geometry'] = old_geom
@@ -392,24 +379,20 @@ class VersionDiffService:
                       f"class={ann.get('class_name') or ann.get('class_id')}, "
                       f"geometry_keys={list(ann.get('geometry', {}).keys())}")
 
-        added = []
         removed = []
         modified = []
         unchanged = []
 
-        # Deep copy to avoid modifying originals
-        remaining_b = list(snapshots_b)
-
-        # Find matches for version A annotations
-        for ann_a in snapshots_a:
-            match_result = VersionDiffService.find_best_match(ann_a, remaining_b)
+        # Pair by annotation_id, then by best IoU over the image's full IoU matrix
+        match = match_annotations(snapshots_a, snapshots_b)
+        matched_b = dict(match.pairs)
 
-            if not match_result:
+        for idx_a, ann_a in enumerate(snapshots_a):
+            if idx_a not in matched_b:
                 # No match found - annotation was removed
                 removed.append(ann_a)
             else:
-                ann_b, match_idx = match_result
-                remaining_b.pop(match_idx)
+                ann_b = snapshots_b[matched_b[idx_a]]
 
                 # Compare for changes
                 changes = VersionDiffService.compare_annotations(ann_a, ann_b)
@@ -426,7 +409,7 @@ class VersionDiffService:
                     unchanged.append(ann_b)
 
         # Remaining annotations in B are new additions
-        added = remaining_b
+        added = [snapshots_b[idx_b] for idx_b in match.unmatched_b]
 
         # Debug: Log diff results for specific images
         if debug_image_id and ('combined/013' in debug_image_id or 'combined/012' in debug_image_id):
@@ -463,7 +446,8 @@ class VersionDiffService:
         db: Session,
         project_id: str,
         task_type: str,
-        image_id: Optional[str] = None
+        image_id: Optional[str] = None,
+        image_ids: Optional[List[str]] = None
     ) -> Dict[str, List[Dict[str, Any]]]:
         """
         Get current annotations from DB for working/draft versions.
@@ -473,6 +457,7 @@ class VersionDiffService:
             project_id: Project ID
             task_type: Task type
             image_id: Optional - filter by specific image
+            image_ids: Optional - filter by several images
 
         Returns:
             Dict mapping image_id to list of annotations
@@ -486,6 +471,8 @@ class VersionDiffService:
         # Filter by image_id if specified
         if image_id:
             query = query.filter(Annotation.image_id == image_id)
+        if image_ids is not None:
+            query = query.filter(Annotation.image_id.in_(image_ids))
 
         annotations = query.all()
 
@@ -517,7 +504,8 @@ class VersionDiffService:
     def get_version_annotations_from_r2(
         project_id: str,
         task_type: str,
-        version_number: str
+        version_number: str,
+        image_id: Optional[str] = None
     ) -> Dict[str, List[Dict[str, Any]]]:
         """
         Get annotations for a version from R2 storage, grouped by image_id.
@@ -528,45 +516,34 @@ class VersionDiffService:
             project_id: Project ID
             task_type: Task type (detection, classification, etc.)
             version_number: Version number (e.g., 'v1.0')
+            image_id: Optional - keep only this image's annotations
 
         Returns:
             Dict mapping image_id to list of annotations
         """
-        # Initialize S3 client for R2
-        s3_client = boto3.client(
-            's3',
-            endpoint_url=settings.S3_ENDPOINT,
-            aws_access_key_id=settings.S3_ACCESS_KEY,
-            aws_secret_access_key=settings.S3_SECRET_KEY,
-            region_name=settings.S3_REGION,
-            config=Config(signature_version='s3v4')
-        )
-
         # Construct R2 key
         s3_key = f"exports/{project_id}/{task_type}/{version_number}/annotations.json"
 
         try:
-            # Download annotations.json from R2
-            response = s3_client.get_object(
-                Bucket='annotations',
-                Key=s3_key
-            )
-
-            # Parse JSON
-            annotations_data = json.loads(response['Body'].read().decode('utf-8'))
-
-            # Phase 11: Handle DICE format structure
+            # Stream images[*] (DICE) or root-level items (legacy) instead of loading the whole file
             # DICE format: {"images": [{"id": "...", "file_name": "...", "annotations": [...]}]}
             grouped = {}
 
-            if isinstance(annotations_data, dict) and 'images' in annotations_data:
-                # DICE format
-                for image_obj in annotations_data['images']:
+            for path, item in storage_client.iter_json_items(
+                s3_key,
+                paths=("images", ""),
+                bucket=storage_client.annotations_bucket
+            ):
+                if path == "images":
+                    # DICE format
                     # Prioritize file_name (full path) over id (numeric) to match frontend
-                    image_id = image_obj.get('file_name') or image_obj.get('id')
-                    annotations = image_obj.get('annotations', [])
+                    item_image_id = item.get('file_name') or item.get('id')
+                    annotations = item.get('annotations', [])
 
-                    if image_id and annotations:
+                    if image_id is not None and str(item_image_id) != image_id:
+                        continue
+
+                    if item_image_id and annotations:
                         # Convert DICE format to DB format for consistency
                         converted_annotations = []
                         for ann in annotations:
@@ -574,25 +551,71 @@ class VersionDiffService:
                             converted_annotations.append(converted_ann)
 
                         # Ensure image_id is string (DICE format may use int IDs)
-                        grouped[str(image_id)] = converted_annotations
-            else:
-                # Legacy format: flat list of annotations
-                for ann in annotations_data:
-                    image_id = ann.get('image_id')
+                        grouped[str(item_image_id)] = converted_annotations
+                else:
+                    # Legacy format: flat list of annotations
+                    item_image_id = item.get('image_id')
 
-                    if not image_id:
+                    if not item_image_id:
+                        continue
+                    if image_id is not None and item_image_id != image_id:
                         continue
 
-                    if image_id not in grouped:
-                        grouped[image_id] = []
+                    if item_image_id not in grouped:
+                        grouped[item_image_id] = []
 
-                    grouped[image_id].append(ann)
+                    grouped[item_image_id].append(item)
 
             return grouped
 
         except Exception as e:
             raise ValueError(f"Failed to load version {version_number} from R2: {str(e)}")
 
+    @staticmethod
+    def get_version_annotations_from_snapshot_blob(
+        version: AnnotationVersion,
+        image_id: Optional[str] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get annotations for a version from its snapshot blob, grouped by image_id.
+
+        With image_id, only the blob block holding that image is read (one
+        ranged GET) instead of the whole version.
+
+        Args:
+            version: Published version with snapshot_path
+            image_id: Optional - read only this image's annotations
+
+        Returns:
+            Dict mapping image_id to list of annotations
+
+        Raises:
+            ObjectNotFoundError: If the blob or its index does not exist
+        """
+        if image_id is not None:
+            rows = storage_client.read_snapshot_blob_image(version.snapshot_path, image_id)
+        else:
+            rows = storage_client.iter_snapshot_blob(version.snapshot_path)
+
+        grouped = {}
+        for row in rows:
+            # Snapshots of annotations deleted before the blob was written have no image
+            if row.image_id is None:
+                continue
+            data = row.snapshot_data
+            grouped.setdefault(row.image_id, []).append({
+                'annotation_id': row.annotation_id,
+                'image_id': row.image_id,
+                'annotation_type': data.get('annotation_type'),
+                'geometry': data.get('geometry') or {},
+                'class_id': data.get('class_id'),
+                'class_name': data.get('class_name'),
+                'attributes': data.get('attributes') or {},
+                'confidence': data.get('confidence'),
+            })
+
+        return grouped
+
     @staticmethod
     def get_version_annotations(
         db: Session,
@@ -603,7 +626,8 @@ class VersionDiffService:
         Get annotations for a version from appropriate source (DB or R2).
 
         - Working/Draft versions: DB (current state)
-        - Published versions: R2 (immutable snapshot)
+        - Published versions: snapshot blob (immutable snapshot), or the R2
+          DICE export for versions without one
 
         Args:
             db: Database session
@@ -622,38 +646,50 @@ class VersionDiffService:
                 image_id
             )
 
-        # Published versions → Get from R2
-        else:  # version.version_type == 'published'
+        # Published versions → Get from the snapshot blob (one ranged GET per image)
+        annotations = None
+        if version.snapshot_path:
+            try:
+                annotations = VersionDiffService.get_version_annotations_from_snapshot_blob(version, image_id)
+            except ObjectNotFoundError:
+                pass  # Blob missing: fall back to the DICE export
+
+        # Published versions without a blob → Get from R2
+        if annotations is None:
             annotations = VersionDiffService.get_version_annotations_from_r2(
                 version.project_id,
                 version.task_type,
-                version.version_number
+                version.version_number,
+                image_id
             )
 
-            # Filter by image_id if specified
-            if image_id:
-                return {image_id: annotations.get(image_id, [])}
+        # Filter by image_id if specified
+        if image_id:
+            return {image_id: annotations.get(image_id, [])}
 
-            return annotations
+        return annotations
 
     @staticmethod
-    def calculate_version_diff(
+    def resolve_versions(
         db: Session,
         version_a_id: int,
-        version_b_id: int,
-        image_id: Optional[str] = None
-    ) -> Dict[str, Any]:
+        version_b_id: int
+    ) -> Tuple[Any, Any]:
         """
-        Calculate diff between two versions.
+        Load two versions to compare, older first.
 
         Args:
             db: Database session
-            version_a_id: Old version ID (use -1 for virtual Working version)
-            version_b_id: New version ID (use -1 for virtual Working version)
-            image_id: Optional - compare only this image
+            version_a_id: Version ID (use -1 for virtual Working version)
+            version_b_id: Version ID (use -1 for virtual Working version)
 
         Returns:
-            Complete diff data with per-image and summary statistics
+            (older version, newer version); the Working version is a synthetic
+            object with id -1 and version_type 'working'
+
+        Raises:
+            ValueError: If a version does not exist or the versions belong to
+                different projects or task types
         """
         # Phase 11: Handle virtual Working version (ID: -1)
         # Get version metadata, handling -1 as special "current working" version
@@ -669,6 +705,8 @@ class VersionDiffService:
 
         if not ref_version:
             raise ValueError("Version not found")
+        if (version_a_id != -1 and not version_a) or (version_b_id != -1 and not version_b):
+            raise ValueError("Version not found")
 
         # Create synthetic version object for Working version (-1)
         from datetime import datetime
@@ -702,97 +740,120 @@ class VersionDiffService:
 
         # Phase 11: Auto-sort versions so older is always version_a, newer is version_b
         # This ensures "added" means "added in newer version", "removed" means "deleted in newer"
-        print(f"\n[Version Diff] Starting comparison:")
-        print(f"  Input version_a: {version_a.version_number} (type: {version_a.version_type})")
-        print(f"  Input version_b: {version_b.version_number} (type: {version_b.version_type})")
-
         parsed_a = VersionDiffService._parse_version_number(version_a.version_number)
         parsed_b = VersionDiffService._parse_version_number(version_b.version_number)
 
-        print(f"  Parsed_a: {parsed_a}")
-        print(f"  Parsed_b: {parsed_b}")
-
         # If version_a is newer than version_b, swap them
         if parsed_a > parsed_b:
             version_a, version_b = version_b, version_a
-            print(f"[Version Diff] Auto-swapped!")
-            print(f"  Final version_a (older/base): {version_a.version_number} (type: {version_a.version_type})")
-            print(f"  Final version_b (newer/compare): {version_b.version_number} (type: {version_b.version_type})")
+
+        return version_a, version_b
+
+    @staticmethod
+    def calculate_version_diff(
+        db: Session,
+        version_a_id: int,
+        version_b_id: int,
+        image_id: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Calculate diff between two versions.
+
+        Whole-version diffs are served from the version diff cache (see
+        version_diff_cache_service): computed once for two published
+        versions, and re-diffed only for the images touched since the last
+        request when one side is the Working version.
+
+        Args:
+            db: Database session
+            version_a_id: Old version ID (use -1 for virtual Working version)
+            version_b_id: New version ID (use -1 for virtual Working version)
+            image_id: Optional - compare only this image
+            offset: Number of changed images (ordered by image_id) to skip
+            limit: Maximum changed images in image_diffs (None = all)
+
+        Returns:
+            Complete diff data with per-image and summary statistics. Summary
+            and class_stats cover every image; image_diffs holds the requested
+            page, described by page (absent for single-image diffs).
+        """
+        # The cache service builds on this class
+        from app.services import version_diff_cache_service
+
+        version_a, version_b = VersionDiffService.resolve_versions(db, version_a_id, version_b_id)
+
+        page = None
+        if image_id is not None:
+            # Single image: from the cache if the diff was computed, else directly
+            cached = version_diff_cache_service.get_version_diff(db, version_a, version_b, compute=False)
+            if cached is not None:
+                image_diffs = version_diff_cache_service.get_image_diffs(db, cached, image_id=image_id)
+            else:
+                snapshots_a = VersionDiffService.get_version_annotations(db, version_a, image_id)
+                snapshots_b = VersionDiffService.get_version_annotations(db, version_b, image_id)
+                diff = VersionDiffService.calculate_diff_for_image(
+                    snapshots_a.get(image_id, []), snapshots_b.get(image_id, [])
+                )
+                image_diffs = {image_id: diff} if diff['summary']['total_changes'] > 0 else {}
+            summary = VersionDiffService.summarize_image_diffs(image_diffs, total_images=1)
+            class_stats = VersionDiffService._calculate_class_stats(image_diffs)
         else:
-            print(f"[Version Diff] No swap needed")
-            print(f"  Final version_a (older/base): {version_a.version_number} (type: {version_a.version_type})")
-            print(f"  Final version_b (newer/compare): {version_b.version_number} (type: {version_b.version_type})")
-
-        # Get annotations (hybrid: DB for working, R2 for published)
-        snapshots_a = VersionDiffService.get_version_annotations(db, version_a, image_id)
-        snapshots_b = VersionDiffService.get_version_annotations(db, version_b, image_id)
-
-        # Calculate diff for each image
-        image_diffs = {}
-        all_image_ids = set(snapshots_a.keys()) | set(snapshots_b.keys())
-
-        # Phase 11: Debug first image to diagnose false diffs
-        first_image_id = list(all_image_ids)[0] if all_image_ids else None
-        debug_count = 0
-
-        for img_id in all_image_ids:
-            anns_a = snapshots_a.get(img_id, [])
-            anns_b = snapshots_b.get(img_id, [])
-
-            # Enable debug logging for:
-            # 1. First 3 images with annotations
-            # 2. Specific images (combined/012, combined/013)
-            is_target_image = 'combined/012' in img_id or 'combined/013' in img_id
-            debug_this = is_target_image or (debug_count < 3 and (len(anns_a) > 0 or len(anns_b) > 0))
-            if debug_this and not is_target_image:
-                debug_count += 1
-
-            diff = VersionDiffService.calculate_diff_for_image(
-                anns_a, anns_b,
-                debug_image_id=img_id if debug_this else None
-            )
+            cached = version_diff_cache_service.get_version_diff(db, version_a, version_b)
+            image_diffs = version_diff_cache_service.get_image_diffs(db, cached, offset=offset, limit=limit)
+            summary = cached.summary
+            class_stats = cached.class_stats
+
+            total = summary['images_with_changes']
+            next_offset = offset + len(image_diffs)
+            page = {
+                'offset': offset,
+                'limit': limit,
+                'total': total,
+                'next_offset': next_offset if next_offset < total else None,
+            }
 
-            # Only include images with changes
-            if diff['summary']['total_changes'] > 0:
-                image_diffs[img_id] = diff
+        result = {
+            'version_a': VersionDiffService._version_metadata(version_a),
+            'version_b': VersionDiffService._version_metadata(version_b),
+            'project_id': version_a.project_id,
+            'task_type': version_a.task_type,
+            'image_diffs': image_diffs,
+            'summary': summary,
+            'class_stats': class_stats
+        }
+        if page is not None:
+            result['page'] = page
+        return result
+
+    @staticmethod
+    def _version_metadata(version: Any) -> Dict[str, Any]:
+        """Version metadata of a diff response."""
+        return {
+            'id': version.id,
+            'version_number': version.version_number,
+            'version_type': version.version_type,
+            'created_at': version.created_at.isoformat(),
+            'created_by': version.created_by
+        }
 
-        # Calculate overall summary
+    @staticmethod
+    def summarize_image_diffs(image_diffs: Dict[str, Any], total_images: int) -> Dict[str, int]:
+        """Overall summary of the images with changes."""
         total_added = sum(d['summary']['added_count'] for d in image_diffs.values())
         total_removed = sum(d['summary']['removed_count'] for d in image_diffs.values())
         total_modified = sum(d['summary']['modified_count'] for d in image_diffs.values())
         total_unchanged = sum(d['summary']['unchanged_count'] for d in image_diffs.values())
 
-        # Per-class breakdown
-        class_stats = VersionDiffService._calculate_class_stats(image_diffs)
-
         return {
-            'version_a': {
-                'id': version_a.id,
-                'version_number': version_a.version_number,
-                'version_type': version_a.version_type,
-                'created_at': version_a.created_at.isoformat(),
-                'created_by': version_a.created_by
-            },
-            'version_b': {
-                'id': version_b.id,
-                'version_number': version_b.version_number,
-                'version_type': version_b.version_type,
-                'created_at': version_b.created_at.isoformat(),
-                'created_by': version_b.created_by
-            },
-            'project_id': version_a.project_id,
-            'task_type': version_a.task_type,
-            'image_diffs': image_diffs,
-            'summary': {
-                'images_with_changes': len(image_diffs),
-                'total_images': len(all_image_ids),
-                'total_added': total_added,
-                'total_removed': total_removed,
-                'total_modified': total_modified,
-                'total_unchanged': total_unchanged,
-                'total_changes': total_added + total_removed + total_modified
-            },
-            'class_stats': class_stats
+            'images_with_changes': len(image_diffs),
+            'total_images': total_images,
+            'total_added': total_added,
+            'total_removed': total_removed,
+            'total_modified': total_modified,
+            'total_unchanged': total_unchanged,
+            'total_changes': total_added + total_removed + total_modified
         }
 
     @staticmethod
@@ -16,7 +16,11 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_
 import json
 
-from app.db.models.labeler import Annotation, AnnotationProject, TextLabel
+from app.db.models.labeler import Annotation, AnnotationProject
+from app.services.export_query_service import ExportBatch, ExportImage, ExportWriter, write_export
+
+# Annotation columns read by YOLO exports
+YOLO_ANNOTATION_COLUMNS = (Annotation.annotation_type, Annotation.geometry, Annotation.class_id)
 
 
 def export_to_yolo(
@@ -44,183 +48,209 @@ def export_to_yolo(
         - region_descriptions_files: {image_id: "json string of region descriptions"} (Phase 19)
         - vqa_files: {image_id: "json string of VQA pairs"} (Phase 19)
     """
-    # Get project
-    project = db.query(AnnotationProject).filter(
-        AnnotationProject.id == project_id
-    ).first()
-
-    if not project:
-        raise ValueError(f"Project {project_id} not found")
-
-    # Build annotation query
-    query = db.query(Annotation).filter(Annotation.project_id == project_id)
-
-    # Filter by annotation state
-    if not include_draft:
-        query = query.filter(Annotation.annotation_state.in_(['confirmed', 'verified']))
-
-    # Filter by image IDs if specified
-    if image_ids:
-        query = query.filter(Annotation.image_id.in_(image_ids))
-
-    annotations = query.all()
-
-    # Phase 19: Query text labels for export
-    text_labels_query = db.query(TextLabel).filter(TextLabel.project_id == project_id)
-    if image_ids:
-        text_labels_query = text_labels_query.filter(TextLabel.image_id.in_(image_ids))
-    text_labels = text_labels_query.all()
-
-    # REFACTORING: Get task-specific classes (task_classes only, no legacy fallback)
-    # Legacy project.classes field has been removed
-    if task_type and project.task_classes and task_type in project.task_classes:
-        task_classes = project.task_classes[task_type]
-    elif project.task_classes:
-        # If task_type not specified, try to get first available task's classes
-        task_classes = next(iter(project.task_classes.values())) if project.task_classes else {}
-    else:
-        task_classes = {}
-
-    # Build class_id to index mapping
-    class_mapping = _build_class_mapping(task_classes)
-
-    # Track all unique image IDs (including no_object images)
-    all_image_ids = set()
-
-    # Group annotations by image
-    image_annotations: Dict[str, List[str]] = {}
-
-    for annotation in annotations:
-        # Track all images including no_object
-        all_image_ids.add(annotation.image_id)
-
-        # Skip non-bbox/polygon annotations
-        # no_object images will be included with empty annotation file
-        if annotation.annotation_type not in ("bbox", "polygon"):
-            continue
-
-        # Get class index
-        class_id = annotation.class_id
-        if class_id not in class_mapping:
-            continue  # Skip unknown classes
-
-        class_idx = class_mapping[class_id]
-
-        # Extract geometry
-        geometry = annotation.geometry
-
-        if annotation.annotation_type == "bbox":
-            # Handle both formats:
-            # Format 1: {'type': 'bbox', 'bbox': [x, y, w, h]} (from frontend)
-            # Format 2: {'x': x, 'y': y, 'width': w, 'height': h} (legacy)
-            if 'bbox' in geometry and isinstance(geometry['bbox'], list):
-                bbox_arr = geometry['bbox']
-                x = float(bbox_arr[0]) if len(bbox_arr) > 0 else 0
-                y = float(bbox_arr[1]) if len(bbox_arr) > 1 else 0
-                width = float(bbox_arr[2]) if len(bbox_arr) > 2 else 0
-                height = float(bbox_arr[3]) if len(bbox_arr) > 3 else 0
-            elif "x" in geometry and "y" in geometry and "width" in geometry and "height" in geometry:
-                x = float(geometry["x"])
-                y = float(geometry["y"])
-                width = float(geometry["width"])
-                height = float(geometry["height"])
-            else:
-                continue
-
-            # Get image dimensions from geometry (required for normalization)
-            img_width = float(geometry.get("image_width", 0))
-            img_height = float(geometry.get("image_height", 0))
-
-            # Skip if no valid dimensions
-            if img_width <= 0 or img_height <= 0:
-                continue
-
-            # Convert to YOLO format (normalized center coordinates)
-            yolo_bbox = _convert_to_yolo_bbox(
-                x=x,
-                y=y,
-                width=width,
-                height=height,
-                image_width=img_width,
-                image_height=img_height,
-            )
-
-            # Format: class_id x_center y_center width height
-            yolo_line = f"{class_idx} {yolo_bbox[0]:.6f} {yolo_bbox[1]:.6f} {yolo_bbox[2]:.6f} {yolo_bbox[3]:.6f}"
-
-        elif annotation.annotation_type == "polygon":
-            # Handle polygon for YOLO-seg format
-            points = geometry.get('points', [])
-
-            if not points or len(points) < 3:
-                continue
-
-            # Get image dimensions from geometry (required for normalization)
-            image_width = float(geometry.get("image_width", 0))
-            image_height = float(geometry.get("image_height", 0))
-
-            # Skip if no valid dimensions
-            if image_width <= 0 or image_height <= 0:
-                continue
-
-            # Convert to YOLO-seg format: class_id x1 y1 x2 y2 x3 y3 ... (normalized)
-            normalized_points = []
-            for point in points:
-                x_norm = max(0.0, min(1.0, float(point[0]) / image_width))
-                y_norm = max(0.0, min(1.0, float(point[1]) / image_height))
-                normalized_points.extend([f"{x_norm:.6f}", f"{y_norm:.6f}"])
-
-            yolo_line = f"{class_idx} " + " ".join(normalized_points)
-
-        # Add to image annotations
-        image_id = annotation.image_id
-        if image_id not in image_annotations:
-            image_annotations[image_id] = []
-        image_annotations[image_id].append(yolo_line)
-
-    # Convert lists to strings
-    image_annotations_str = {
-        img_id: "\n".join(lines)
-        for img_id, lines in image_annotations.items()
-    }
+    writer = YoloExportWriter(db, project_id, task_type=task_type)
+    write_export(
+        db, project_id, writer.dataset_id, [writer],
+        include_draft=include_draft, image_ids=image_ids, task_type=task_type,
+    )
+    return writer.result()
 
-    # Include images with no_object (empty annotation file)
-    # This ensures images marked as "no object" are included in export
-    for img_id in all_image_ids:
-        if img_id not in image_annotations_str:
-            image_annotations_str[img_id] = ""  # Empty file for no_object images
 
-    # Build classes.txt
-    classes_txt = _build_classes_txt(task_classes, class_mapping)
+class YoloExportWriter(ExportWriter):
+    """
+    Builds YOLO label files from a (possibly shared) export stream.
 
-    # Phase 19: Build text label files (JSON format)
-    # Group text labels by image and annotation
-    text_labels_by_image = {}  # image_id -> [text labels]
-    text_labels_by_annotation = {}  # annotation_id -> [text labels]
+    Feed it with write_export() / iter_writer_batches(); result() returns
+    the same tuple as export_to_yolo() over the same stream. Images with
+    text labels only still get their text label files.
+    """
 
-    for label in text_labels:
-        if label.annotation_id is None:
-            # Image-level labels
-            if label.image_id not in text_labels_by_image:
-                text_labels_by_image[label.image_id] = []
-            text_labels_by_image[label.image_id].append(label)
+    columns = YOLO_ANNOTATION_COLUMNS
+    text_label_only_images = True
+
+    def __init__(self, db: Session, project_id: str, task_type: Optional[str] = None):
+        # Get project
+        project = db.query(AnnotationProject).filter(
+            AnnotationProject.id == project_id
+        ).first()
+
+        if not project:
+            raise ValueError(f"Project {project_id} not found")
+
+        # REFACTORING: Get task-specific classes (task_classes only, no legacy fallback)
+        # Legacy project.classes field has been removed
+        if task_type and project.task_classes and task_type in project.task_classes:
+            task_classes = project.task_classes[task_type]
+        elif project.task_classes:
+            # If task_type not specified, try to get first available task's classes
+            task_classes = next(iter(project.task_classes.values())) if project.task_classes else {}
         else:
-            # Region-level labels
-            if label.annotation_id not in text_labels_by_annotation:
-                text_labels_by_annotation[label.annotation_id] = []
-            text_labels_by_annotation[label.annotation_id].append(label)
+            task_classes = {}
+
+        self.dataset_id = project.dataset_id
+        self._task_classes = task_classes
+        # Build class_id to index mapping
+        self._class_mapping = _build_class_mapping(task_classes)
+
+        self._image_annotations: Dict[str, str] = {}
+        self._captions_files: Dict[str, str] = {}  # {image_id: json_string}
+        self._region_descriptions_files: Dict[str, str] = {}  # {image_id: json_string}
+        self._vqa_files: Dict[str, str] = {}  # {image_id: json_string}
+
+    def add_batch(self, batch: ExportBatch) -> None:
+        # Stored image dimensions, for geometries saved without image_width/image_height
+        stored_dimensions = batch.dimensions
+        for image in batch.images:
+            if image.annotations:
+                # Images with only no_object annotations get an empty file
+                lines = (
+                    _convert_annotation_to_yolo(annotation, self._class_mapping, stored_dimensions)
+                    for annotation in image.annotations
+                )
+                self._image_annotations[image.image_id] = "\n".join(line for line in lines if line is not None)
+
+            # Phase 19: Build text label files (JSON format)
+            if image.text_labels:
+                captions, region_labels, vqa_pairs = _build_text_label_files(image)
+                if captions:
+                    self._captions_files[image.image_id] = json.dumps(captions, ensure_ascii=False, indent=2)
+                if region_labels:
+                    self._region_descriptions_files[image.image_id] = json.dumps(region_labels, ensure_ascii=False, indent=2)
+                if vqa_pairs:
+                    self._vqa_files[image.image_id] = json.dumps(vqa_pairs, ensure_ascii=False, indent=2)
+
+    def result(self) -> Tuple[Dict[str, str], str, Dict[str, str], Dict[str, str], Dict[str, str]]:
+        """YOLO files of the batches added so far (see export_to_yolo)."""
+        # Build classes.txt
+        classes_txt = _build_classes_txt(self._task_classes, self._class_mapping)
+
+        return (
+            self._image_annotations,
+            classes_txt,
+            self._captions_files,
+            self._region_descriptions_files,
+            self._vqa_files,
+        )
+
+
+def _convert_annotation_to_yolo(
+    annotation: Annotation,
+    class_mapping: Dict[str, int],
+    stored_dimensions: Dict[str, Tuple[int, int]]
+) -> Optional[str]:
+    """
+    Convert one annotation row to a YOLO label line.
+
+    Args:
+        annotation: Annotation row
+        class_mapping: Mapping from class_id to YOLO class index
+        stored_dimensions: image_id -> (width, height), for geometries saved
+            without image_width/image_height
+
+    Returns:
+        "class_id x_center y_center width height" (bbox) or
+        "class_id x1 y1 x2 y2 ..." (polygon); None if the annotation is not
+        exported (other types, unknown class, no image dimensions)
+    """
+    # Skip non-bbox/polygon annotations
+    # no_object images will be included with empty annotation file
+    if annotation.annotation_type not in ("bbox", "polygon"):
+        return None
+
+    # Get class index
+    class_id = annotation.class_id
+    if class_id not in class_mapping:
+        return None  # Skip unknown classes
+
+    class_idx = class_mapping[class_id]
+
+    # Extract geometry
+    geometry = annotation.geometry
+
+    if annotation.annotation_type == "bbox":
+        # Handle both formats:
+        # Format 1: {'type': 'bbox', 'bbox': [x, y, w, h]} (from frontend)
+        # Format 2: {'x': x, 'y': y, 'width': w, 'height': h} (legacy)
+        if 'bbox' in geometry and isinstance(geometry['bbox'], list):
+            bbox_arr = geometry['bbox']
+            x = float(bbox_arr[0]) if len(bbox_arr) > 0 else 0
+            y = float(bbox_arr[1]) if len(bbox_arr) > 1 else 0
+            width = float(bbox_arr[2]) if len(bbox_arr) > 2 else 0
+            height = float(bbox_arr[3]) if len(bbox_arr) > 3 else 0
+        elif "x" in geometry and "y" in geometry and "width" in geometry and "height" in geometry:
+            x = float(geometry["x"])
+            y = float(geometry["y"])
+            width = float(geometry["width"])
+            height = float(geometry["height"])
+        else:
+            return None
+
+        # Get image dimensions from geometry (required for normalization)
+        img_width = float(geometry.get("image_width", 0))
+        img_height = float(geometry.get("image_height", 0))
+        if img_width <= 0 or img_height <= 0:
+            img_width, img_height = stored_dimensions.get(annotation.image_id, (0, 0))
+
+        # Skip if no valid dimensions
+        if img_width <= 0 or img_height <= 0:
+            return None
+
+        # Convert to YOLO format (normalized center coordinates)
+        yolo_bbox = _convert_to_yolo_bbox(
+            x=x,
+            y=y,
+            width=width,
+            height=height,
+            image_width=img_width,
+            image_height=img_height,
+        )
+
+        # Format: class_id x_center y_center width height
+        yolo_line = f"{class_idx} {yolo_bbox[0]:.6f} {yolo_bbox[1]:.6f} {yolo_bbox[2]:.6f} {yolo_bbox[3]:.6f}"
+
+    elif annotation.annotation_type == "polygon":
+        # Handle polygon for YOLO-seg format
+        points = geometry.get('points', [])
 
-    # Build text label file structures
-    captions_files = {}  # {image_id: json_string}
-    region_descriptions_files = {}  # {image_id: json_string}
-    vqa_files = {}  # {image_id: json_string}
+        if not points or len(points) < 3:
+            return None
 
-    # Process image-level text labels
-    for image_id, labels in text_labels_by_image.items():
-        captions = []
-        vqa_pairs = []
+        # Get image dimensions from geometry (required for normalization)
+        image_width = float(geometry.get("image_width", 0))
+        image_height = float(geometry.get("image_height", 0))
+        if image_width <= 0 or image_height <= 0:
+            image_width, image_height = stored_dimensions.get(annotation.image_id, (0, 0))
 
-        for label in labels:
+        # Skip if no valid dimensions
+        if image_width <= 0 or image_height <= 0:
+            return None
+
+        # Convert to YOLO-seg format: class_id x1 y1 x2 y2 x3 y3 ... (normalized)
+        normalized_points = []
+        for point in points:
+            x_norm = max(0.0, min(1.0, float(point[0]) / image_width))
+            y_norm = max(0.0, min(1.0, float(point[1]) / image_height))
+            normalized_points.extend([f"{x_norm:.6f}", f"{y_norm:.6f}"])
+
+        yolo_line = f"{class_idx} " + " ".join(normalized_points)
+
+    return yolo_line
+
+
+def _build_text_label_files(image: ExportImage) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """
+    Build the text label file contents of one image (Phase 19).
+
+    Returns:
+        Tuple of (captions, region_descriptions, vqa_pairs)
+    """
+    captions = []
+    vqa_pairs = []
+    text_labels_by_annotation = {}  # annotation_id -> [text labels]
+
+    for label in image.text_labels:
+        if label.annotation_id is None:
+            # Image-level labels
             if label.label_type in ["caption", "description"]:
                 captions.append({
                     "text": label.text_content,
@@ -235,33 +265,24 @@ def export_to_yolo(
                     "language": label.language,
                     "confidence": label.confidence,
                 })
+        else:
+            # Region-level labels
+            if label.annotation_id not in text_labels_by_annotation:
+                text_labels_by_annotation[label.annotation_id] = []
+            text_labels_by_annotation[label.annotation_id].append(label)
 
-        if captions:
-            captions_files[image_id] = json.dumps(captions, ensure_ascii=False, indent=2)
-        if vqa_pairs:
-            vqa_files[image_id] = json.dumps(vqa_pairs, ensure_ascii=False, indent=2)
-
-    # Process region-level text labels (group by image)
-    region_labels_by_image = {}
-    for ann in annotations:
-        if ann.id in text_labels_by_annotation:
-            image_id = ann.image_id
-            if image_id not in region_labels_by_image:
-                region_labels_by_image[image_id] = []
-
-            for label in text_labels_by_annotation[ann.id]:
-                region_labels_by_image[image_id].append({
-                    "annotation_id": str(ann.id),
-                    "class_id": ann.class_id,
-                    "text": label.text_content,
-                    "language": label.language,
-                    "confidence": label.confidence,
-                })
-
-    for image_id, region_labels in region_labels_by_image.items():
-        region_descriptions_files[image_id] = json.dumps(region_labels, ensure_ascii=False, indent=2)
-
-    return image_annotations_str, classes_txt, captions_files, region_descriptions_files, vqa_files
+    region_labels = []
+    for ann in image.annotations:
+        for label in text_labels_by_annotation.get(ann.id, []):
+            region_labels.append({
+                "annotation_id": str(ann.id),
+                "class_id": ann.class_id,
+                "text": label.text_content,
+                "language": label.language,
+                "confidence": label.confidence,
+            })
+
+    return captions, region_labels, vqa_pairs
 
 
 def _build_class_mapping(task_classes: Dict[str, Any]) -> Dict[str, int]:
@@ -17,6 +17,13 @@ if [ "$RUN_MIGRATIONS" = "true" ]; then
     python init_db.py --create-db
 fi
 
+# Thumbnail queue workers instead of the API: docker-entrypoint.sh thumbnail-worker [--processes N]
+if [ "$1" = "thumbnail-worker" ]; then
+    shift
+    echo "[INFO] Starting thumbnail workers..."
+    exec python scripts/maintenance/thumbnail_worker.py "$@"
+fi
+
 # Start the application
 echo "[INFO] Starting uvicorn server..."
 exec uvicorn app.main:app --host ${API_HOST:-0.0.0.0} --port ${API_PORT:-8001}
@@ -0,0 +1,112 @@
+"""
+Benchmark: per-annotation IoU scan vs. vectorized IoU matching in version diffs
+
+Builds images with many boxes (slightly moved, dropped and added between the
+two versions, in shuffled order, without annotation_ids so every pair has to
+be found geometrically) and compares:
+
+- the previous matcher: for each box of version A, scan the remaining boxes
+  of version B with VersionDiffService.calculate_iou and take the best one
+- VersionDiffService.calculate_diff_for_image: one NumPy IoU matrix per image
+  and a global best-IoU-first assignment
+
+Reports time per image and the diff counts of both matchers (the scan can
+mispair crowded boxes, so its counts may be worse, never better).
+
+Run: python scripts/benchmarks/benchmark_diff_matching.py [boxes_per_image] [num_images]
+"""
+
+import sys
+import os
+import random
+import time
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.services.version_diff_service import VersionDiffService
+
+
+def make_image(rng, num_boxes):
+    """Annotations of one image in versions A and B."""
+    def annotation(x, y, width, height):
+        return {
+            'class_name': 'car',
+            'geometry': {'type': 'bbox', 'bbox': [x, y, width, height]},
+        }
+
+    annotations_a = [
+        annotation(rng.uniform(0, 4000), rng.uniform(0, 3000), rng.uniform(20, 120), rng.uniform(20, 120))
+        for _ in range(num_boxes)
+    ]
+    kept = annotations_a[:int(num_boxes * 0.9)]
+    annotations_b = [
+        annotation(a['geometry']['bbox'][0] + rng.uniform(-3, 3), a['geometry']['bbox'][1] + rng.uniform(-3, 3),
+                   a['geometry']['bbox'][2], a['geometry']['bbox'][3])
+        for a in kept
+    ]
+    annotations_b += [
+        annotation(rng.uniform(0, 4000), rng.uniform(0, 3000), rng.uniform(20, 120), rng.uniform(20, 120))
+        for _ in range(num_boxes - len(kept))
+    ]
+    rng.shuffle(annotations_b)
+    return annotations_a, annotations_b
+
+
+def scan_match_counts(annotations_a, annotations_b, iou_threshold=0.5):
+    """(matched, removed, added) of the previous per-annotation matcher."""
+    normalize = VersionDiffService.normalize_geometry
+    remaining_b = list(annotations_b)
+    matched = 0
+    for ann_a in annotations_a:
+        geometry_a = normalize(ann_a['geometry'])
+        best_iou, best_idx = 0.0, -1
+        for idx, candidate in enumerate(remaining_b):
+            iou = VersionDiffService.calculate_iou(geometry_a, normalize(candidate['geometry']))
+            if iou > best_iou and iou >= iou_threshold:
+                best_iou, best_idx = iou, idx
+        if best_idx >= 0:
+            remaining_b.pop(best_idx)
+            matched += 1
+    return matched, len(annotations_a) - matched, len(remaining_b)
+
+
+def main():
+    num_boxes = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000
+    num_images = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rng = random.Random(42)
+    images = [make_image(rng, num_boxes) for _ in range(num_images)]
+
+    print("=" * 80)
+    print(f"Version diff matching benchmark ({num_images} images x {num_boxes:,} boxes)")
+    print("=" * 80)
+
+    start = time.perf_counter()
+    scan_counts = [scan_match_counts(a, b) for a, b in images]
+    scan_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    diffs = [VersionDiffService.calculate_diff_for_image(a, b) for a, b in images]
+    vector_seconds = time.perf_counter() - start
+
+    vector_counts = [
+        (
+            diff['summary']['modified_count'] + diff['summary']['unchanged_count'],
+            diff['summary']['removed_count'],
+            diff['summary']['added_count'],
+        )
+        for diff in diffs
+    ]
+
+    def totals(counts):
+        return tuple(sum(column) for column in zip(*counts))
+
+    print(f"Per-annotation scan          : {scan_seconds / num_images * 1000:10.1f} ms/image")
+    print(f"IoU matrix + assignment      : {vector_seconds / num_images * 1000:10.1f} ms/image")
+    print(f"Speed-up                     : {scan_seconds / vector_seconds:10.1f}x")
+    print(f"Scan (matched/removed/added) : {totals(scan_counts)}")
+    print(f"Diff (matched/removed/added) : {totals(vector_counts)}")
+
+
+if __name__ == "__main__":
+    main()
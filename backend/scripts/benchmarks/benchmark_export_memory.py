@@ -0,0 +1,161 @@
+"""
+Benchmark: export memory - query.all() vs. streamed rows
+
+Measures peak Python heap (tracemalloc) and time of:
+- the previous load pattern: query.all() on Annotation and TextLabel, then
+  grouping every ORM object by image
+- DiceExportStream written to a null sink (streamed rows, streamed output)
+- export_to_coco / export_to_yolo (streamed rows; their result is still one
+  in-memory document, so the output itself is part of the peak)
+
+A synthetic project with num_annotations bbox annotations (10 per image)
+is created in the Labeler DB (LABELER_DB_URL) and deleted afterwards.
+
+Run: python scripts/benchmarks/benchmark_export_memory.py [num_annotations]
+"""
+
+import sys
+import os
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import delete, insert
+
+from app.core.database import LabelerSessionLocal  # Labeler DB session factory
+from app.db.models.labeler import Annotation, AnnotationProject, Dataset, TextLabel
+from app.services.coco_export_service import export_to_coco
+from app.services.dice_export_service import DiceExportStream
+from app.services.yolo_export_service import export_to_yolo
+
+ANNOTATIONS_PER_IMAGE = 10
+INSERT_BATCH_SIZE = 10_000
+CLASSES = {f"cls_{i}": {"name": f"class {i}", "order": i} for i in range(20)}
+
+
+def make_rows(project_id: str, start: int, count: int) -> list:
+    now = datetime.utcnow()
+    rows = []
+    for i in range(start, start + count):
+        image = i // ANNOTATIONS_PER_IMAGE
+        rows.append({
+            "project_id": project_id,
+            "image_id": f"split_{image % 3}/image_{image:07d}.jpg",
+            "annotation_type": "bbox",
+            "task_type": "detection",
+            "geometry": {
+                "type": "bbox",
+                "bbox": [i % 600, i % 400, 32.5, 48.25],
+                "image_width": 1280,
+                "image_height": 720,
+            },
+            "class_id": f"cls_{i % len(CLASSES)}",
+            "class_name": f"class {i % len(CLASSES)}",
+            "attributes": {},
+            "created_by": "00000000-0000-0000-0000-000000000000",
+            "annotation_state": "confirmed",
+            "created_at": now,
+            "updated_at": now,
+        })
+    return rows
+
+
+def populate(db, project_id: str, num_annotations: int) -> None:
+    for start in range(0, num_annotations, INSERT_BATCH_SIZE):
+        db.execute(insert(Annotation), make_rows(project_id, start, min(INSERT_BATCH_SIZE, num_annotations - start)))
+        db.commit()
+
+
+def run_legacy(db, project_id: str) -> int:
+    annotations = db.query(Annotation).filter(
+        Annotation.project_id == project_id,
+        Annotation.annotation_state.in_(['confirmed', 'verified'])
+    ).all()
+    text_labels = db.query(TextLabel).filter(TextLabel.project_id == project_id).all()
+    images = {}
+    for ann in annotations:
+        images.setdefault(ann.image_id, []).append(ann)
+    return len(images) + len(text_labels)
+
+
+def run_dice(db, project_id: str) -> int:
+    stream = DiceExportStream(db, None, project_id, task_type="detection")
+    for _ in stream:
+        pass
+    return stream.bytes_written
+
+
+def run_coco(db, project_id: str) -> int:
+    return len(export_to_coco(db, None, project_id, task_type="detection")["annotations"])
+
+
+def run_yolo(db, project_id: str) -> int:
+    return len(export_to_yolo(db, project_id, task_type="detection")[0])
+
+
+def measure(label: str, run, project_id: str) -> None:
+    db = LabelerSessionLocal()
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = run(db, project_id)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        db.close()
+    print(f"  {label:<40} {peak / 1024 / 1024:10.1f} MB peak  {seconds:8.1f} s  ({result:,})")
+
+
+def main():
+    num_annotations = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    suffix = uuid.uuid4().hex[:8]
+    dataset_id = f"ds_bench_{suffix}"
+    project_id = f"proj_bench_{suffix}"
+
+    db = LabelerSessionLocal()
+
+    print("=" * 80)
+    print(f"Export memory benchmark ({num_annotations:,} annotations, "
+          f"{-(-num_annotations // ANNOTATIONS_PER_IMAGE):,} images)")
+    print("=" * 80)
+
+    db.add(Dataset(
+        id=dataset_id,
+        name="benchmark",
+        owner_id="00000000-0000-0000-0000-000000000000",
+        storage_path=f"datasets/{dataset_id}/",
+    ))
+    db.add(AnnotationProject(
+        id=project_id,
+        name="benchmark",
+        dataset_id=dataset_id,
+        owner_id="00000000-0000-0000-0000-000000000000",
+        task_types=["detection"],
+        task_config={},
+        task_classes={"detection": CLASSES},
+    ))
+    db.commit()
+
+    try:
+        populate(db, project_id, num_annotations)
+
+        measure("query.all() + group by image (previous)", run_legacy, project_id)
+        measure("DiceExportStream -> null sink", run_dice, project_id)
+        measure("export_to_coco (dict result)", run_coco, project_id)
+        measure("export_to_yolo (dict result)", run_yolo, project_id)
+    finally:
+        db.rollback()
+        db.execute(delete(Annotation).where(Annotation.project_id == project_id))
+        db.execute(delete(AnnotationProject).where(AnnotationProject.id == project_id))
+        db.execute(delete(Dataset).where(Dataset.id == dataset_id))
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
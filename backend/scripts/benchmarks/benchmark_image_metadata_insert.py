@@ -0,0 +1,125 @@
+"""
+Benchmark: ImageMetadata ingestion - ORM adds vs. bulk upserts
+
+Compares the previous ingestion approach (one ORM object per image, commit
+every 50 rows) against ImageMetadataWriter in both of its PostgreSQL modes:
+multi-row INSERT ... ON CONFLICT DO UPDATE and COPY into a staging table.
+Each writer mode also re-writes the same rows to measure the re-upload path,
+which the ORM approach cannot do (primary key collision).
+
+Rows go into a scratch dataset in the Labeler DB (LABELER_DB_URL) that is
+deleted afterwards.
+
+Run: python scripts/benchmarks/benchmark_image_metadata_insert.py [num_rows]
+"""
+
+import sys
+import os
+import time
+import uuid
+from datetime import datetime
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import delete
+
+from app.core.database import LabelerSessionLocal  # Labeler DB session factory
+from app.db.models.labeler import Dataset, ImageMetadata
+from app.services.image_metadata_writer import ImageMetadataWriter
+
+ORM_COMMIT_EVERY = 50
+WRITER_BATCH_SIZE = 5000
+
+
+def make_rows(dataset_id: str, num_rows: int) -> list:
+    now = datetime.utcnow()
+    rows = []
+    for i in range(num_rows):
+        folder = f"split_{i % 3}/class_{i % 20}"
+        image_id = f"{dataset_id}/{folder}/image_{i:07d}.jpg"  # Unique across benchmark runs
+        rows.append({
+            "id": image_id,
+            "dataset_id": dataset_id,
+            "file_name": image_id.split("/")[-1],
+            "s3_key": f"datasets/{dataset_id}/images/{image_id}",
+            "folder_path": folder,
+            "size": 100_000 + i,
+            "uploaded_at": now,
+            "last_modified": now,
+        })
+    return rows
+
+
+def clear(db, dataset_id: str) -> None:
+    db.execute(delete(ImageMetadata).where(ImageMetadata.dataset_id == dataset_id))
+    db.commit()
+
+
+def run_orm(db, rows) -> float:
+    start = time.perf_counter()
+    for i, row in enumerate(rows, 1):
+        db.add(ImageMetadata(**row))
+        if i % ORM_COMMIT_EVERY == 0:
+            db.commit()
+    db.commit()
+    return time.perf_counter() - start
+
+
+def run_writer(db, rows, copy_min_rows: int) -> float:
+    start = time.perf_counter()
+    with ImageMetadataWriter(db, batch_size=WRITER_BATCH_SIZE, copy_min_rows=copy_min_rows) as writer:
+        for row in rows:
+            writer.add(row)
+    elapsed = time.perf_counter() - start
+    assert writer.rows_written == len(rows), writer.rows_written
+    return elapsed
+
+
+def report(label: str, num_rows: int, seconds: float, baseline: float = None) -> None:
+    speedup = f"  ({baseline / seconds:5.1f}x)" if baseline else ""
+    print(f"  {label:<32} {seconds:8.2f} s  {num_rows / seconds:12,.0f} rows/s{speedup}")
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    dataset_id = f"ds_bench_{uuid.uuid4().hex[:8]}"
+
+    db = LabelerSessionLocal()
+    dialect = db.get_bind().dialect.name
+
+    print("=" * 80)
+    print(f"ImageMetadata insert benchmark ({num_rows:,} rows, {dialect})")
+    print("=" * 80)
+
+    db.add(Dataset(
+        id=dataset_id,
+        name="benchmark",
+        owner_id="00000000-0000-0000-0000-000000000000",
+        storage_path=f"datasets/{dataset_id}/",
+    ))
+    db.commit()
+
+    try:
+        rows = make_rows(dataset_id, num_rows)
+
+        orm_seconds = run_orm(db, rows)
+        report(f"ORM add, commit every {ORM_COMMIT_EVERY}", num_rows, orm_seconds)
+        clear(db, dataset_id)
+
+        for label, copy_min_rows in (("INSERT ... ON CONFLICT", num_rows + 1), ("COPY + upsert", 0)):
+            if label.startswith("COPY") and dialect != "postgresql":
+                continue
+            report(f"{label} (new rows)", num_rows, run_writer(db, rows, copy_min_rows), orm_seconds)
+            report(f"{label} (re-upload)", num_rows, run_writer(db, rows, copy_min_rows), orm_seconds)
+            clear(db, dataset_id)
+    finally:
+        db.rollback()
+        clear(db, dataset_id)
+        db.execute(delete(Dataset).where(Dataset.id == dataset_id))
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
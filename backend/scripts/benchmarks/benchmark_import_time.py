@@ -0,0 +1,68 @@
+"""
+Benchmark: application import time
+
+Measures how long `import app.main` takes in a fresh interpreter, i.e. what
+every worker start, test run and maintenance script pays before doing any work.
+Importing must not perform storage network I/O; the S3 bucket check runs
+lazily on first use instead.
+
+Point S3_ENDPOINT at an unreachable host to see the effect of a slow S3:
+    S3_ENDPOINT=http://10.255.255.1:9000 python scripts/benchmarks/benchmark_import_time.py
+
+Run: python scripts/benchmarks/benchmark_import_time.py [module] [runs]
+"""
+
+import sys
+import os
+import subprocess
+import statistics
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+try:
+    import {module}
+    status = "ok"
+except Exception as e:
+    status = type(e).__name__
+print(f"{{time.perf_counter() - start:.4f}} {{status}}")
+"""
+
+
+def time_import(module: str) -> tuple[float, str]:
+    """Import a module in a fresh interpreter and return (seconds, status)."""
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    seconds, status = result.stdout.strip().splitlines()[-1].split(" ", 1)
+    return float(seconds), status
+
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else "app.main"
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print("=" * 80)
+    print(f"Import time: {module} ({runs} runs)")
+    print(f"S3_ENDPOINT: {os.environ.get('S3_ENDPOINT', '(from .env / default)')}")
+    print("=" * 80)
+
+    timings = []
+    for i in range(runs):
+        seconds, status = time_import(module)
+        timings.append(seconds)
+        print(f"  Run {i + 1}: {seconds * 1000:8.1f} ms  ({status})")
+
+    print("-" * 80)
+    print(f"  Median: {statistics.median(timings) * 1000:8.1f} ms")
+    print(f"  Min:    {min(timings) * 1000:8.1f} ms")
+    print(f"  Max:    {max(timings) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
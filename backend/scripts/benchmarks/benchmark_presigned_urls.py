@@ -0,0 +1,85 @@
+"""
+Benchmark: boto3 presigned URLs vs. batch local SigV4 signing
+
+Compares StorageClient.generate_presigned_url (one boto3 signing pass per key)
+against the batch SigV4Presigner used by StorageClient.generate_presigned_urls,
+and verifies both produce identical URLs.
+
+No network access is needed - presigning is a purely local operation.
+
+Run: python scripts/benchmarks/benchmark_presigned_urls.py [num_keys]
+"""
+
+import sys
+import os
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import boto3
+from botocore.config import Config
+
+from app.core.config import settings
+from app.core.sigv4 import SigV4Presigner
+
+
+def main():
+    num_keys = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    bucket = settings.S3_BUCKET_DATASETS
+    keys = [f"datasets/ds_bench/images/folder_{i % 50}/image_{i:06d}.jpg" for i in range(num_keys)]
+
+    s3_client = boto3.client(
+        's3',
+        endpoint_url=settings.S3_ENDPOINT,
+        aws_access_key_id=settings.S3_ACCESS_KEY,
+        aws_secret_access_key=settings.S3_SECRET_KEY,
+        region_name=settings.S3_REGION,
+        config=Config(signature_version='s3v4'),
+    )
+    presigner = SigV4Presigner(
+        endpoint_url=s3_client.meta.endpoint_url,
+        access_key=settings.S3_ACCESS_KEY,
+        secret_key=settings.S3_SECRET_KEY,
+        region=settings.S3_REGION,
+    )
+
+    print("=" * 80)
+    print(f"Presigned URL benchmark ({num_keys:,} keys)")
+    print(f"Endpoint: {s3_client.meta.endpoint_url}")
+    print("=" * 80)
+
+    # boto3: one full request-signing pass per key
+    start = time.perf_counter()
+    boto_urls = [
+        s3_client.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=3600)
+        for key in keys
+    ]
+    boto_seconds = time.perf_counter() - start
+
+    # Local batch signer: signing key derived once, tight loop per key
+    start = time.perf_counter()
+    batch_urls = presigner.presign_get_many(bucket, keys, expires=3600)
+    batch_seconds = time.perf_counter() - start
+
+    # Correctness: re-sign with each boto URL's own timestamp and compare
+    mismatches = 0
+    for key, boto_url in zip(keys, boto_urls):
+        timestamp = parse_qs(urlsplit(boto_url).query)['X-Amz-Date'][0]
+        now = datetime.strptime(timestamp, '%Y%m%dT%H%M%SZ')
+        if presigner.presign_get(bucket, key, expires=3600, now=now) != boto_url:
+            mismatches += 1
+
+    print(f"boto3 generate_presigned_url : {boto_seconds:8.3f}s  ({num_keys / boto_seconds:>10,.0f} urls/s)")
+    print(f"SigV4Presigner (batch)       : {batch_seconds:8.3f}s  ({num_keys / batch_seconds:>10,.0f} urls/s)")
+    print(f"Speed-up                     : {boto_seconds / batch_seconds:8.1f}x")
+    print(f"Identical URLs               : {num_keys - mismatches:,}/{num_keys:,}")
+    print(f"Batch URLs generated         : {len(batch_urls):,}")
+
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
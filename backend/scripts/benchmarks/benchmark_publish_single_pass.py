@@ -0,0 +1,140 @@
+"""
+Benchmark: publish exports - one query per format vs. single pass
+
+Measures wall time and annotation queries of producing the DICE, COCO and
+YOLO exports plus snapshot rows of a publish:
+- separately: DiceExportStream, export_to_coco, export_to_yolo and a
+  query.all() for the snapshots (the previous publish)
+- single pass: DiceExportStream feeding CocoExportWriter, YoloExportWriter,
+  AnnotationSnapshotWriter and SnapshotBlobWriter (blob built, not uploaded)
+
+A synthetic project with num_annotations bbox annotations (10 per image)
+is created in the Labeler DB (LABELER_DB_URL) and deleted afterwards;
+snapshot states and members are rolled back.
+
+Run: python scripts/benchmarks/benchmark_publish_single_pass.py [num_annotations]
+"""
+
+import sys
+import os
+import time
+import uuid
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import delete, event
+
+from app.core.database import LabelerSessionLocal  # Labeler DB session factory
+from app.db.models.labeler import Annotation, AnnotationProject, Dataset
+from app.services.annotation_snapshot_service import (
+    AnnotationSnapshotWriter,
+    SnapshotBlobWriter,
+    build_snapshot_data,
+    lock_project_publishes,
+)
+from app.services.coco_export_service import CocoExportWriter, export_to_coco
+from app.services.dice_export_service import DiceExportStream
+from app.services.yolo_export_service import YoloExportWriter, export_to_yolo
+
+from benchmark_export_memory import CLASSES, populate
+
+# Snapshot rows are only built, not inserted, in the separate run; the
+# single-pass run inserts them and rolls back
+SNAPSHOT_VERSION_ID = -1
+
+
+def run_separate(db, project_id: str) -> int:
+    for _ in DiceExportStream(db, None, project_id, task_type="detection"):
+        pass
+    export_to_coco(db, None, project_id, task_type="detection")
+    export_to_yolo(db, project_id, task_type="detection")
+    annotations = db.query(Annotation).filter(
+        Annotation.project_id == project_id,
+        Annotation.task_type == "detection",
+        Annotation.annotation_state.in_(['confirmed', 'verified'])
+    ).all()
+    return len([build_snapshot_data(annotation) for annotation in annotations])
+
+
+def run_single_pass(db, project_id: str) -> int:
+    snapshots = AnnotationSnapshotWriter(db, project_id, "detection")
+    writers = [
+        snapshots,
+        SnapshotBlobWriter(),
+        CocoExportWriter(db, project_id, task_type="detection"),
+        YoloExportWriter(db, project_id, task_type="detection"),
+    ]
+    for _ in DiceExportStream(db, None, project_id, task_type="detection", writers=writers):
+        pass
+    lock_project_publishes(db, project_id)
+    snapshots.write_members(SNAPSHOT_VERSION_ID)
+    db.rollback()
+    return snapshots.annotation_count
+
+
+def measure(label: str, run, project_id: str) -> None:
+    db = LabelerSessionLocal()
+    queries = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith("SELECT") and "FROM annotations" in statement:
+            queries.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        start = time.perf_counter()
+        result = run(db, project_id)
+        seconds = time.perf_counter() - start
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        db.close()
+    print(f"  {label:<40} {seconds:8.1f} s  {len(queries):3d} annotation queries  ({result:,})")
+
+
+def main():
+    num_annotations = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    suffix = uuid.uuid4().hex[:8]
+    dataset_id = f"ds_bench_{suffix}"
+    project_id = f"proj_bench_{suffix}"
+
+    db = LabelerSessionLocal()
+
+    print("=" * 80)
+    print(f"Publish export benchmark ({num_annotations:,} annotations, DICE + COCO + YOLO + snapshots)")
+    print("=" * 80)
+
+    db.add(Dataset(
+        id=dataset_id,
+        name="benchmark",
+        owner_id="00000000-0000-0000-0000-000000000000",
+        storage_path=f"datasets/{dataset_id}/",
+    ))
+    db.add(AnnotationProject(
+        id=project_id,
+        name="benchmark",
+        dataset_id=dataset_id,
+        owner_id="00000000-0000-0000-0000-000000000000",
+        task_types=["detection"],
+        task_config={},
+        task_classes={"detection": CLASSES},
+    ))
+    db.commit()
+
+    try:
+        populate(db, project_id, num_annotations)
+
+        measure("separate exports (previous)", run_separate, project_id)
+        measure("single pass with writers", run_single_pass, project_id)
+    finally:
+        db.rollback()
+        db.execute(delete(Annotation).where(Annotation.project_id == project_id))
+        db.execute(delete(AnnotationProject).where(AnnotationProject.id == project_id))
+        db.execute(delete(Dataset).where(Dataset.id == dataset_id))
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Backfill Image Dimensions
+
+Fills image_metadata.width / height for images uploaded before dimensions
+were recorded at ingest time. Each image is probed with a ranged GET of its
+header (IMAGE_PROBE_HEAD_KB), IMAGE_PROBE_WORKERS at a time; pixels are never
+decoded. Results are committed per batch, so the script can be interrupted
+and re-run: only rows that still have no width are probed.
+
+Exports (DICE / COCO / YOLO) read the stored dimensions instead of fetching
+images or the Platform annotations file.
+
+Run: python -m backfill_image_dimensions [dataset_id ...]
+"""
+
+import sys
+import os
+import time
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.core.config import settings
+from app.core.database import LabelerSessionLocal
+from app.db.models.labeler import Dataset
+from app.services.image_dimension_service import backfill_dataset_dimensions
+
+
+def main():
+    """Backfill dimensions for the given datasets (all datasets if none given)."""
+    print("="*80)
+    print("Backfill Image Dimensions")
+    print(f"Workers: {settings.IMAGE_PROBE_WORKERS}, header bytes: {settings.IMAGE_PROBE_HEAD_KB} KB")
+    print("="*80)
+
+    dataset_ids = sys.argv[1:]
+    db = LabelerSessionLocal()
+
+    try:
+        query = db.query(Dataset)
+        if dataset_ids:
+            query = query.filter(Dataset.id.in_(dataset_ids))
+        datasets = query.all()
+        print(f"\nBackfilling dimensions for {len(datasets)} datasets")
+
+        total_updated = total_failed = errors = 0
+        for dataset in datasets:
+            started = time.perf_counter()
+
+            def progress(updated, failed):
+                print(f"  {dataset.id}: {updated} updated, {failed} unreadable...")
+
+            try:
+                updated, failed = backfill_dataset_dimensions(db, dataset, progress=progress)
+            except Exception as e:
+                db.rollback()
+                print(f"  ERROR {dataset.id}: {e}")
+                errors += 1
+                continue
+
+            elapsed = time.perf_counter() - started
+            rate = updated / elapsed if elapsed > 0 else 0.0
+            print(f"  {dataset.id}: {updated} updated, {failed} unreadable ({elapsed:.1f}s, {rate:.0f} images/s)")
+            total_updated += updated
+            total_failed += failed
+    finally:
+        db.close()
+
+    print("\n" + "="*80)
+    print(f"Updated {total_updated} images, {total_failed} unreadable")
+    if errors:
+        print(f"Done with {errors} errors")
+    else:
+        print("SUCCESS: Dimensions backfilled!")
+    print("="*80)
+
+
+if __name__ == "__main__":
+    main()
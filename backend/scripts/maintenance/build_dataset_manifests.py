@@ -0,0 +1,66 @@
+"""
+Build Dataset Object Manifests
+
+Writes (or rebuilds) the sorted object manifest for each dataset at
+datasets/{dataset_id}/.manifest/images.jsonl.gz.
+
+Once a dataset has a manifest, image listings and storage folder statistics
+are served from it instead of listing S3, and uploads keep it up to date
+incrementally. Re-run this script if objects were changed outside the app.
+
+Run: python -m build_dataset_manifests [dataset_id ...]
+"""
+
+import sys
+import os
+import time
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.core.database import LabelerSessionLocal
+from app.core.storage import storage_client
+from app.db.models.labeler import Dataset
+
+
+def main():
+    """Build manifests for the given datasets (all datasets if none given)."""
+    print("="*80)
+    print("Build Dataset Object Manifests")
+    print("="*80)
+
+    dataset_ids = sys.argv[1:]
+
+    db = LabelerSessionLocal()
+    try:
+        query = db.query(Dataset.id, Dataset.storage_type)
+        if dataset_ids:
+            query = query.filter(Dataset.id.in_(dataset_ids))
+        storage_types = dict(query.all())
+    finally:
+        db.close()
+    dataset_ids = dataset_ids or list(storage_types)
+
+    print(f"\nBuilding manifests for {len(dataset_ids)} datasets")
+
+    failed = 0
+    for dataset_id in dataset_ids:
+        try:
+            started = time.perf_counter()
+            manifest = storage_client.build_dataset_manifest(dataset_id, storage_types.get(dataset_id))
+            elapsed = time.perf_counter() - started
+            print(f"  {dataset_id}: {len(manifest)} objects ({elapsed:.2f}s)")
+        except Exception as e:
+            print(f"  ERROR {dataset_id}: {e}")
+            failed += 1
+
+    print("\n" + "="*80)
+    if failed:
+        print(f"Done with {failed} errors")
+    else:
+        print("SUCCESS: All manifests built!")
+    print("="*80)
+
+
+if __name__ == "__main__":
+    main()
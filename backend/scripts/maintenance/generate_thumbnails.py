@@ -3,155 +3,98 @@ Generate Thumbnails for Existing Images
 
 Phase 2.12: Performance Optimization
 
-This script generates thumbnails for all existing images that don't have them yet.
+This script queues the thumbnail pyramid (THUMBNAIL_SIZES, WebP) for all
+existing images that don't have every level yet, e.g. images uploaded before
+the pyramid existed (legacy 256px JPEG only) or whose thumbnails failed.
 
-Run: python -m generate_thumbnails
+Generation itself is done by the thumbnail queue workers (embedded in the API
+or scripts/maintenance/thumbnail_worker.py), in parallel and with retries.
+Re-running the script is safe: queued images keep a single job, and failed
+jobs are reset.
+
+Run: python -m generate_thumbnails [dataset_id ...]
 """
 
 import sys
 import os
-from datetime import datetime
 
 # Add backend to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from app.core.database import LabelerSessionLocal
-from app.core.storage import storage_client
 from app.db.models.labeler import Dataset, ImageMetadata
-from app.services.thumbnail_service import create_thumbnail, get_thumbnail_path
-import logging
+from app.services.thumbnail_queue_service import enqueue_thumbnail_jobs
+from app.services.thumbnail_service import THUMBNAIL_SIZES, format_thumbnail_sizes
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+BATCH_SIZE = 5000
 
 
-def thumbnail_exists(thumbnail_key: str) -> bool:
-    """Check if thumbnail already exists in S3."""
-    try:
-        storage_client.s3_client.head_object(
-            Bucket=storage_client.datasets_bucket,
-            Key=thumbnail_key
-        )
-        return True
-    except:
-        return False
-
-
-def generate_thumbnails_for_dataset(db: Session, dataset: Dataset):
-    """Generate thumbnails for all images in a dataset."""
-    print(f"\n{'='*80}")
-    print(f"Dataset: {dataset.name} ({dataset.id})")
-    print(f"{'='*80}")
-
-    # Get all images for this dataset from DB
-    images = db.query(ImageMetadata).filter(
-        ImageMetadata.dataset_id == dataset.id
-    ).all()
-
-    if not images:
-        print(f"No images found in database for dataset {dataset.id}")
-        return
-
-    print(f"Found {len(images)} images in database")
-
-    generated_count = 0
-    skipped_count = 0
-    error_count = 0
-
-    for idx, db_img in enumerate(images, 1):
-        try:
-            # Check if thumbnail already exists
-            thumbnail_key = get_thumbnail_path(db_img.s3_key)
-
-            if thumbnail_exists(thumbnail_key):
-                skipped_count += 1
-                if idx % 100 == 0:
-                    print(f"  Progress: {idx}/{len(images)} (skipped: {skipped_count}, generated: {generated_count}, errors: {error_count})")
-                continue
-
-            # Download original image
-            try:
-                response = storage_client.s3_client.get_object(
-                    Bucket=storage_client.datasets_bucket,
-                    Key=db_img.s3_key
-                )
-                image_bytes = response['Body'].read()
-            except Exception as e:
-                logger.error(f"Failed to download {db_img.s3_key}: {e}")
-                error_count += 1
-                continue
-
-            # Generate thumbnail
-            thumbnail_bytes = create_thumbnail(image_bytes)
-            if not thumbnail_bytes:
-                logger.error(f"Failed to create thumbnail for {db_img.s3_key}")
-                error_count += 1
-                continue
+def enqueue_thumbnails_for_dataset(db: Session, dataset: Dataset) -> int:
+    """Queue thumbnail pyramids for all images in a dataset that lack them."""
+    complete = format_thumbnail_sizes(THUMBNAIL_SIZES)
+    queued = 0
+    last_id = ""
 
-            # Upload thumbnail
-            storage_client.s3_client.put_object(
-                Bucket=storage_client.datasets_bucket,
-                Key=thumbnail_key,
-                Body=thumbnail_bytes,
-                ContentType='image/jpeg'
-            )
+    # Images without a complete pyramid, keyset-paginated by id
+    while True:
+        image_ids = [
+            row.id for row in db.query(ImageMetadata.id).filter(
+                ImageMetadata.dataset_id == dataset.id,
+                ImageMetadata.id > last_id,
+                or_(ImageMetadata.thumbnail_sizes.is_(None), ImageMetadata.thumbnail_sizes != complete)
+            ).order_by(ImageMetadata.id).limit(BATCH_SIZE)
+        ]
+        if not image_ids:
+            break
+        queued += enqueue_thumbnail_jobs(db, dataset.id, image_ids)
+        last_id = image_ids[-1]
+        print(f"  {dataset.id}: {queued} images queued...")
 
-            generated_count += 1
-
-            # Progress logging
-            if generated_count % 10 == 0:
-                print(f"  Generated {generated_count} thumbnails...")
-
-        except Exception as e:
-            logger.error(f"Error processing {db_img.id}: {e}")
-            error_count += 1
-            continue
-
-    print(f"\nSUCCESS: Dataset {dataset.name}")
-    print(f"  Generated: {generated_count}")
-    print(f"  Skipped (already exists): {skipped_count}")
-    print(f"  Errors: {error_count}")
+    return queued
 
 
 def main():
-    """Main thumbnail generation process."""
+    """Queue thumbnails for the given datasets (all datasets if none given)."""
     print("="*80)
     print("Thumbnail Generation")
     print("Phase 2.12: Performance Optimization")
     print("="*80)
 
+    dataset_ids = sys.argv[1:]
     db = LabelerSessionLocal()
+    total_queued = 0
+    errors = 0
 
     try:
-        # Get all datasets
-        datasets = db.query(Dataset).all()
+        query = db.query(Dataset)
+        if dataset_ids:
+            query = query.filter(Dataset.id.in_(dataset_ids))
+        datasets = query.all()
         print(f"\nFound {len(datasets)} datasets")
 
-        total_generated = 0
-        total_skipped = 0
-        total_errors = 0
-
         for dataset in datasets:
             try:
-                result = generate_thumbnails_for_dataset(db, dataset)
+                queued = enqueue_thumbnails_for_dataset(db, dataset)
             except Exception as e:
+                db.rollback()
                 print(f"ERROR processing {dataset.name}: {e}")
-                import traceback
-                traceback.print_exc()
+                errors += 1
                 continue
-
-        print("\n" + "="*80)
-        print("SUCCESS: Thumbnail generation complete!")
-        print("="*80)
-
-    except Exception as e:
-        print(f"\nFATAL ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+            print(f"  {dataset.name} ({dataset.id}): {queued} images without a complete pyramid queued")
+            total_queued += queued
     finally:
         db.close()
 
+    print("\n" + "="*80)
+    print(f"Queued {total_queued} images; thumbnail workers generate them in the background")
+    if errors:
+        print(f"Done with {errors} errors")
+    else:
+        print("SUCCESS: Thumbnail generation queued!")
+    print("="*80)
+
 
 if __name__ == "__main__":
     main()
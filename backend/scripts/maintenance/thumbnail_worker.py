@@ -0,0 +1,94 @@
+"""
+Thumbnail Worker
+
+Runs dedicated thumbnail queue workers: each process claims batches of
+thumbnail_jobs (SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+processes on any number of hosts can run side by side) and generates the
+pyramids with THUMBNAIL_WORKER_THREADS threads.
+
+This is how thumbnails are generated outside single-node dev: the API only
+enqueues (THUMBNAIL_WORKER_EMBEDDED defaults to false), so Pillow never runs
+in the API processes.
+
+Run: python scripts/maintenance/thumbnail_worker.py [--processes N] [--drain]
+ or: ./docker-entrypoint.sh thumbnail-worker [--processes N] [--drain]
+    --processes  Worker processes (default: CPU count)
+    --drain      Exit once no job is due instead of waiting for new ones
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.core.config import settings
+from app.services.thumbnail_queue_service import ThumbnailWorker
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def run_worker(drain: bool) -> None:
+    """Entry point of one worker process."""
+    worker = ThumbnailWorker()
+    if drain:
+        claimed = worker.drain()
+        logger.info(f"Queue drained: {claimed} jobs claimed")
+        return
+
+    # SIGTERM (docker stop / k8s): finish the current batch, then exit
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    """Start the worker processes and wait for them."""
+    parser = argparse.ArgumentParser(description="Thumbnail queue worker")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--drain", action="store_true", help="Exit when no job is due")
+    args = parser.parse_args()
+
+    print("="*80)
+    print("Thumbnail Worker")
+    print(f"Processes: {args.processes}, threads per process: {settings.THUMBNAIL_WORKER_THREADS}, "
+          f"batch: {settings.THUMBNAIL_WORKER_BATCH_SIZE}")
+    print("="*80)
+
+    # spawn: fresh DB connection pools in every process
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(args.drain,), name=f"thumbnail-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        forward(signal.SIGTERM, None)
+        for process in processes:
+            process.join()
+
+    print("="*80)
+    print("Thumbnail workers stopped")
+    print("="*80)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,16 @@ Phase 2.12: Populate image_metadata table from existing S3 images.
 This script:
 1. Scans all datasets in DB
 2. Lists images from S3
-3. Saves metadata to image_metadata table
+3. Upserts metadata into image_metadata table in bulk (ImageMetadataWriter),
+   so re-running it refreshes existing rows instead of skipping them
+4. Reads missing width/height from the image headers (ranged GETs in parallel)
 
 Run: python -m backfill_image_metadata
 """
 
 import sys
 import os
-from datetime import datetime
+from datetime import timezone
 
 # Add backend to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -22,6 +24,11 @@ from sqlalchemy.orm import Session
 from app.core.database import LabelerSessionLocal  # Labeler DB session factory
 from app.core.storage import storage_client
 from app.db.models.labeler import Dataset, ImageMetadata
+from app.services.image_dimension_service import backfill_dataset_dimensions
+from app.services.image_metadata_writer import ImageMetadataWriter
+
+# Rows per upsert; large enough for the COPY path on PostgreSQL
+BATCH_SIZE = 5000
 
 def is_image_file(filename: str) -> bool:
     """Check if file is an image."""
@@ -40,106 +47,68 @@ def backfill_dataset_images(db: Session, dataset: Dataset):
     ).count()
 
     if existing_count > 0:
-        print(f"Note: Already has {existing_count} images in DB. Will check each image individually...")
+        print(f"Note: Already has {existing_count} images in DB. Existing rows will be updated in place.")
 
-    # List all images from S3
+    # Stream images from storage straight into batched upserts
     s3_prefix = f"datasets/{dataset.id}/images/"
-    print(f"Scanning S3: {s3_prefix}")
-
-    all_objects = []
-    continuation_token = None
-
-    while True:
-        list_params = {
-            'Bucket': storage_client.datasets_bucket,
-            'Prefix': s3_prefix,
-            'MaxKeys': 1000
-        }
-        if continuation_token:
-            list_params['ContinuationToken'] = continuation_token
-
-        response = storage_client.s3_client.list_objects_v2(**list_params)
-
-        if 'Contents' in response:
-            all_objects.extend(response['Contents'])
-
-        if not response.get('IsTruncated'):
-            break
-
-        continuation_token = response.get('NextContinuationToken')
-
-    # Filter image files
-    image_objects = []
-    for obj in all_objects:
-        key = obj['Key']
-
-        # Skip folders
-        if key.endswith('/'):
-            continue
-
-        # Extract filename
-        filename = key.split('/')[-1]
-
-        # Skip non-image files
-        if not is_image_file(filename):
-            continue
-
-        image_objects.append(obj)
-
-    print(f"Found {len(image_objects)} images in S3")
-
-    # Save to DB
-    saved_count = 0
-    for obj in image_objects:
-        key = obj['Key']
-        filename = key.split('/')[-1]
-
-        # Extract relative path (everything after /images/)
-        # e.g., "datasets/ds_xxx/images/train/good/001.jpg" -> "train/good/001.jpg"
-        relative_path = key.replace(s3_prefix, '')
-
-        # Extract folder path (everything except filename)
-        path_parts = relative_path.split('/')
-        if len(path_parts) > 1:
-            folder_path = '/'.join(path_parts[:-1])
-        else:
-            folder_path = None
-
-        # Generate unique image ID (relative path with extension for S3 key compatibility)
-        # e.g., "train/good/001.jpg" -> "train/good/001.jpg"
-        image_id = relative_path
-
-        # Check if already exists
-        existing = db.query(ImageMetadata).filter(
-            ImageMetadata.id == image_id,
-            ImageMetadata.dataset_id == dataset.id
-        ).first()
-
-        if existing:
-            print(f"  SKIP (exists): {filename}")
-            continue
-
-        # Create metadata record
-        db_image = ImageMetadata(
-            id=image_id,
-            dataset_id=dataset.id,
-            file_name=filename,
-            s3_key=key,
-            folder_path=folder_path,
-            size=obj['Size'],
-            uploaded_at=obj['LastModified'],
-            last_modified=obj['LastModified']
-        )
-        db.add(db_image)
-        saved_count += 1
-
-        if saved_count % 100 == 0:
-            db.commit()
-            print(f"  Saved {saved_count} images...")
-
-    # Final commit
-    db.commit()
-    print(f"SUCCESS: Backfilled {saved_count} images for dataset: {dataset.name}")
+    print(f"Scanning storage: {s3_prefix}")
+
+    backend = storage_client.get_backend(dataset.storage_type)
+    found_count = 0
+
+    with ImageMetadataWriter(db, batch_size=BATCH_SIZE) as writer:
+        for obj in backend.list_objects(storage_client.datasets_bucket, s3_prefix):
+            key = obj.key
+
+            # Skip folders
+            if key.endswith('/'):
+                continue
+
+            # Extract filename
+            filename = key.split('/')[-1]
+
+            # Skip non-image files
+            if not is_image_file(filename):
+                continue
+
+            # Extract relative path (everything after /images/)
+            # e.g., "datasets/ds_xxx/images/train/good/001.jpg" -> "train/good/001.jpg"
+            relative_path = key[len(s3_prefix):]
+
+            # Extract folder path (everything except filename)
+            path_parts = relative_path.split('/')
+            if len(path_parts) > 1:
+                folder_path = '/'.join(path_parts[:-1])
+            else:
+                folder_path = None
+
+            # image_metadata stores naive UTC timestamps
+            last_modified = obj.last_modified.astimezone(timezone.utc).replace(tzinfo=None)
+
+            # Image ID is the relative path with extension (S3 key compatibility)
+            writer.add({
+                'id': relative_path,
+                'dataset_id': dataset.id,
+                'file_name': filename,
+                's3_key': key,
+                'folder_path': folder_path,
+                'size': obj.size,
+                'uploaded_at': last_modified,
+                'last_modified': last_modified,
+            })
+            found_count += 1
+
+            if found_count % BATCH_SIZE == 0:
+                print(f"  Saved {writer.rows_written} images...")
+
+    print(f"Found {found_count} images in storage")
+    if writer.rows_skipped:
+        print(f"WARNING: Skipped {writer.rows_skipped} images whose id is used by another dataset")
+
+    print("Probing image dimensions...")
+    probed, failed = backfill_dataset_dimensions(db, dataset)
+    print(f"  Dimensions: {probed} updated, {failed} unreadable")
+    print(f"SUCCESS: Backfilled {writer.rows_written} images for dataset: {dataset.name}")
 
 def main():
     """Main backfill process."""
@@ -0,0 +1,78 @@
+"""
+Migrate Version Snapshots to Blobs
+
+Writes the compressed, image-indexed snapshot blob
+(snapshots/{project_id}/{task_type}/{version_number}/annotations.jsonl.gz)
+of every published version that has none yet, and moves its
+annotation_snapshots rows out of the Labeler DB.
+
+Versions are migrated one at a time and committed individually, so the
+script can be stopped and re-run: migrated versions have snapshot_path set
+and are skipped. Each version's rows are streamed into the blob and then
+deleted in batches; versions snapshotted as content-addressed states only
+get their blob (the states are shared with later versions).
+
+Run: python -m migrate_snapshots_to_blobs [--keep-rows] [project_id ...]
+"""
+
+import sys
+import os
+import time
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.core.database import LabelerSessionLocal  # Labeler DB session factory
+from app.db.models.labeler import AnnotationVersion
+from app.services.annotation_snapshot_service import move_version_snapshots_to_blob
+
+
+def main():
+    """Migrate the versions of the given projects (all projects if none given)."""
+    print("="*80)
+    print("Migrate Version Snapshots to Blobs")
+    print("="*80)
+
+    args = sys.argv[1:]
+    keep_rows = "--keep-rows" in args
+    project_ids = [arg for arg in args if arg != "--keep-rows"]
+
+    db = LabelerSessionLocal()
+    try:
+        query = db.query(AnnotationVersion.id).filter(
+            AnnotationVersion.version_type == "published",
+            AnnotationVersion.snapshot_path.is_(None)
+        )
+        if project_ids:
+            query = query.filter(AnnotationVersion.project_id.in_(project_ids))
+        version_ids = [version_id for (version_id,) in query.order_by(AnnotationVersion.id)]
+
+        print(f"\nMigrating {len(version_ids)} versions" + (" (keeping rows)" if keep_rows else ""))
+
+        failed = 0
+        for version_id in version_ids:
+            version = db.get(AnnotationVersion, version_id)
+            label = f"{version.project_id}/{version.task_type}/{version.version_number}"
+            try:
+                started = time.perf_counter()
+                count = move_version_snapshots_to_blob(db, version, delete_rows=not keep_rows)
+                db.commit()
+                elapsed = time.perf_counter() - started
+                print(f"  {label}: {count} annotations ({elapsed:.2f}s)")
+            except Exception as e:
+                db.rollback()
+                print(f"  ERROR {label}: {e}")
+                failed += 1
+    finally:
+        db.close()
+
+    print("\n" + "="*80)
+    if failed:
+        print(f"Done with {failed} errors")
+    else:
+        print("SUCCESS: All versions migrated!")
+    print("="*80)
+
+
+if __name__ == "__main__":
+    main()
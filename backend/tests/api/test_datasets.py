@@ -1089,6 +1089,47 @@ class TestListDatasetImages:
 
         assert len(data) <= 12
 
+    @patch('app.services.image_url_service.storage_client')
+    def test_list_dataset_images_batch_signing_fallback(self, mock_storage, authenticated_client, labeler_db, test_dataset):
+        """
+        Test that a failed batch signing falls back to per-image URLs.
+
+        Only the image whose URL cannot be signed is dropped; if none can be
+        signed the endpoint fails instead of reporting an empty dataset.
+        """
+        for i in range(3):
+            labeler_db.add(ImageMetadata(
+                id=f"test_image_{i}.jpg",
+                dataset_id=test_dataset.id,
+                s3_key=f"datasets/{test_dataset.id}/test_image_{i}.jpg",
+                width=800,
+                height=600,
+                size=50000,
+                format="jpg",
+                uploaded_at=datetime.utcnow(),
+            ))
+        labeler_db.commit()
+
+        def sign(bucket, key, expiration=3600, storage_type=None):
+            if key.endswith("test_image_1.jpg"):
+                raise Exception("signing failed")
+            return f"https://s3.amazonaws.com/{key}"
+
+        mock_storage.generate_presigned_urls.side_effect = Exception("batch signing failed")
+        mock_storage.generate_presigned_url.side_effect = sign
+
+        response = authenticated_client.get(f"/api/v1/datasets/{test_dataset.id}/images?random=false")
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert [image["id"] for image in data] == ["test_image_0.jpg", "test_image_2.jpg"]
+        assert data[0]["url"] == f"https://s3.amazonaws.com/datasets/{test_dataset.id}/test_image_0.jpg"
+
+        mock_storage.generate_presigned_url.side_effect = Exception("storage unavailable")
+        response = authenticated_client.get(f"/api/v1/datasets/{test_dataset.id}/images")
+
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
     def test_list_dataset_images_not_found(self, authenticated_client):
         """
         Test listing images for non-existent dataset.
@@ -1215,3 +1256,38 @@ class TestGetDatasetSize:
         assert data["total_images"] == 10
         assert data["total_bytes"] == total_bytes
         assert data["total_gb"] > 1.0  # Should be over 1GB
+
+
+class TestListDatasetStorageImages:
+    """Test cases for GET /api/v1/datasets/{dataset_id}/storage/images endpoint."""
+
+    @patch('app.api.v1.endpoints.datasets.storage_client')
+    def test_list_storage_images_page(self, mock_storage, authenticated_client, labeler_db, test_dataset, mock_current_user):
+        """
+        Test cursor-paginated listing of stored images.
+
+        Should pass page size, cursor and the dataset's storage type through.
+        """
+        labeler_db.add(DatasetPermission(
+            dataset_id=test_dataset.id,
+            user_id=mock_current_user["sub"],
+            role="owner",
+            granted_by=mock_current_user["sub"],
+            granted_at=datetime.utcnow(),
+        ))
+        labeler_db.commit()
+        mock_storage.list_dataset_images_page.return_value = {
+            "images": [{"id": "images/b.jpg", "url": "https://example.com/b.jpg"}],
+            "next_cursor": "images/b.jpg",
+            "limit": 1,
+        }
+
+        response = authenticated_client.get(
+            f"/api/v1/datasets/{test_dataset.id}/storage/images?limit=1&cursor=images/a.jpg"
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["next_cursor"] == "images/b.jpg"
+        mock_storage.list_dataset_images_page.assert_called_once_with(
+            test_dataset.id, page_size=1, cursor="images/a.jpg", storage_type="s3"
+        )
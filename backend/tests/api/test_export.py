@@ -21,11 +21,11 @@ from app.db.models.labeler import (
     Annotation,
     AnnotationProject,
     AnnotationVersion,
-    AnnotationSnapshot,
     ProjectPermission,
     Dataset,
 )
 from app.main import app
+from app.services.annotation_snapshot_service import iter_version_snapshots
 
 
 class TestExportAnnotations:
@@ -104,6 +104,71 @@ class TestExportAnnotations:
         # Verify storage upload was called
         mock_storage.upload_export.assert_called_once()
 
+    @patch('app.api.v1.endpoints.export.storage_client')
+    @patch('app.api.v1.endpoints.export.export_to_coco')
+    @patch('app.api.v1.endpoints.export.get_coco_stats')
+    def test_export_reuses_unchanged_artifact(
+        self,
+        mock_coco_stats,
+        mock_export_coco,
+        mock_storage,
+        authenticated_client,
+        labeler_db,
+        platform_db,
+        test_project,
+        mock_current_user
+    ):
+        """
+        Test that an unchanged project returns the previous export.
+
+        The second export should not regenerate or upload, only refresh the URL;
+        an annotation write should regenerate.
+        """
+        mock_export_coco.return_value = {"images": [], "annotations": [], "categories": []}
+        mock_coco_stats.return_value = {"annotation_count": 3, "image_count": 2}
+        s3_key = f"exports/{test_project.id}/all/export_20260104_120000/annotations_coco.json"
+        mock_storage.upload_export.return_value = (
+            s3_key,
+            "https://s3.amazonaws.com/bucket/export.json?signature=abc",
+            datetime.utcnow() + timedelta(hours=1)
+        )
+        mock_storage.regenerate_presigned_url.return_value = (
+            "https://s3.amazonaws.com/bucket/export.json?signature=fresh",
+            datetime.utcnow() + timedelta(days=7)
+        )
+        export_request = {"project_id": test_project.id, "export_format": "coco"}
+        url = f"/api/v1/export/projects/{test_project.id}/export"
+
+        first = authenticated_client.post(url, json=export_request).json()
+        second = authenticated_client.post(url, json=export_request).json()
+
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert second["export_path"] == s3_key
+        assert second["download_url"].endswith("signature=fresh")
+        assert second["annotation_count"] == 3
+        assert second["file_size_bytes"] == first["file_size_bytes"]
+        mock_export_coco.assert_called_once()
+        mock_storage.upload_export.assert_called_once()
+        assert mock_storage.upload_export.call_args.kwargs["task_type"] == "all"
+        mock_storage.regenerate_presigned_url.assert_called_once_with(s3_key)
+
+        # Annotation writes invalidate the cached export
+        labeler_db.add(Annotation(
+            project_id=test_project.id,
+            image_id="img_001.jpg",
+            annotation_type="bbox",
+            task_type="detection",
+            geometry={"type": "bbox", "bbox": [1, 2, 3, 4]},
+            created_by=mock_current_user["sub"],
+            annotation_state="confirmed",
+        ))
+        labeler_db.commit()
+
+        third = authenticated_client.post(url, json=export_request).json()
+        assert third["cached"] is False
+        assert mock_export_coco.call_count == 2
+
     @patch('app.api.v1.endpoints.export.storage_client')
     @patch('app.api.v1.endpoints.export.export_to_yolo')
     @patch('app.api.v1.endpoints.export.get_yolo_stats')
@@ -165,12 +230,10 @@ class TestExportAnnotations:
         mock_export_yolo.assert_called_once()
 
     @patch('app.api.v1.endpoints.export.storage_client')
-    @patch('app.api.v1.endpoints.export.export_to_dice')
-    @patch('app.api.v1.endpoints.export.get_dice_stats')
+    @patch('app.api.v1.endpoints.export.DiceExportStream')
     def test_export_dice_success(
         self,
-        mock_dice_stats,
-        mock_export_dice,
+        mock_dice_stream,
         mock_storage,
         authenticated_client,
         labeler_db,
@@ -184,15 +247,11 @@ class TestExportAnnotations:
         Should generate DICE JSON format.
         """
         # Mock DICE export
-        dice_data = {
-            "version": "1.0",
-            "images": [{"id": "img_001", "annotations": []}]
-        }
-        mock_export_dice.return_value = dice_data
-        mock_dice_stats.return_value = {
+        mock_dice_stream.return_value.get_stats.return_value = {
             "annotation_count": 1,
             "image_count": 1
         }
+        mock_dice_stream.return_value.bytes_written = 1024
 
         # Mock storage upload
         mock_storage.upload_export.return_value = (
@@ -220,6 +279,7 @@ class TestExportAnnotations:
         assert data["export_format"] == "dice"
         assert data["annotation_count"] == 1
         assert data["image_count"] == 1
+        assert data["file_size_bytes"] == 1024
 
     @patch('app.api.v1.endpoints.export.storage_client')
     @patch('app.api.v1.endpoints.export.export_to_coco')
@@ -496,16 +556,8 @@ class TestPublishVersion:
     """Test cases for POST /api/v1/export/projects/{project_id}/versions/publish endpoint."""
 
     @patch('app.api.v1.endpoints.export.storage_client')
-    @patch('app.api.v1.endpoints.export.export_to_dice')
-    @patch('app.api.v1.endpoints.export.get_dice_stats')
-    @patch('app.api.v1.endpoints.export.export_to_coco')
-    @patch('app.api.v1.endpoints.export.get_coco_stats')
     def test_publish_version_success(
         self,
-        mock_coco_stats,
-        mock_export_coco,
-        mock_dice_stats,
-        mock_export_dice,
         mock_storage,
         authenticated_client,
         labeler_db,
@@ -516,13 +568,15 @@ class TestPublishVersion:
         """
         Test successful version publish with auto-generated version number.
 
-        Should create version, snapshots, and upload to S3.
+        Should create version, snapshots, and upload to S3 (DICE and COCO
+        written from one annotation stream).
         """
         # Create some annotations for the project
         annotation = Annotation(
             project_id=test_project.id,
             image_id="img_001",
             annotation_type="bbox",
+            task_type="detection",
             geometry={"type": "bbox", "bbox": [100, 100, 50, 50]},
             class_id="cls_person",
             class_name="person",
@@ -533,27 +587,9 @@ class TestPublishVersion:
         labeler_db.add(annotation)
         labeler_db.commit()
 
-        # Mock DICE export
-        dice_data = {"version": "1.0", "images": []}
-        mock_export_dice.return_value = dice_data
-        mock_dice_stats.return_value = {
-            "annotation_count": 1,
-            "image_count": 1
-        }
-
-        # Mock COCO export
-        coco_data = {"info": {}, "images": [], "annotations": [], "categories": []}
-        mock_export_coco.return_value = coco_data
-        mock_coco_stats.return_value = {
-            "annotation_count": 1,
-            "image_count": 1
-        }
-
-        # Mock storage upload
-        mock_storage.upload_export.return_value = (
-            f"exports/{test_project.id}/detection/v1.0/annotations.json",
-            "https://s3.amazonaws.com/bucket/export.json?signature=abc",
-            datetime.utcnow() + timedelta(hours=1)
+        # Mock storage upload (reads the uploaded data like upload_stream)
+        mock_storage.upload_export.side_effect = _consuming_upload(
+            f"exports/{test_project.id}/detection/v1.0/annotations.json"
         )
         mock_storage.update_platform_annotations.return_value = f"datasets/{test_project.dataset_id}/detection/v1.0/annotations.json"
 
@@ -596,23 +632,29 @@ class TestPublishVersion:
         assert version.version_type == "published"
 
         # Verify annotation snapshots were created
-        snapshots = labeler_db.query(AnnotationSnapshot).filter(
-            AnnotationSnapshot.version_id == version.id
-        ).all()
+        snapshots = list(iter_version_snapshots(labeler_db, version))
         assert len(snapshots) == 1
-        assert snapshots[0].annotation_id == annotation.id
-        assert snapshots[0].snapshot_data["annotation_type"] == "bbox"
+        assert snapshots[0][0] == annotation.id
+        assert snapshots[0][1]["annotation_type"] == "bbox"
+
+        # Verify DICE and COCO were uploaded
+        uploads = mock_storage.upload_export.call_args_list
+        assert [c.kwargs["export_format"] for c in uploads] == ["dice", "coco"]
+        coco = json.loads(uploads[1].kwargs["export_data"])
+        assert [ann["id"] for ann in coco["annotations"]] == [annotation.id]
 
         # Verify platform annotations were updated
         mock_storage.update_platform_annotations.assert_called_once()
+        # ... by copying the uploaded DICE export
+        assert mock_storage.update_platform_annotations.call_args.kwargs["export_key"] == (
+            f"exports/{test_project.id}/detection/v1.0/annotations.json"
+        )
 
     @patch('app.api.v1.endpoints.export.storage_client')
-    @patch('app.api.v1.endpoints.export.export_to_dice')
-    @patch('app.api.v1.endpoints.export.get_dice_stats')
+    @patch('app.api.v1.endpoints.export.DiceExportStream')
     def test_publish_version_custom_version_number(
         self,
-        mock_dice_stats,
-        mock_export_dice,
+        mock_dice_stream,
         mock_storage,
         authenticated_client,
         labeler_db,
@@ -626,9 +668,7 @@ class TestPublishVersion:
         Should use provided version number instead of auto-generating.
         """
         # Mock DICE export
-        dice_data = {"version": "1.0", "images": []}
-        mock_export_dice.return_value = dice_data
-        mock_dice_stats.return_value = {
+        mock_dice_stream.return_value.get_stats.return_value = {
             "annotation_count": 0,
             "image_count": 0
         }
@@ -659,12 +699,10 @@ class TestPublishVersion:
         assert data["version_number"] == "v2.5"
 
     @patch('app.api.v1.endpoints.export.storage_client')
-    @patch('app.api.v1.endpoints.export.export_to_dice')
-    @patch('app.api.v1.endpoints.export.get_dice_stats')
+    @patch('app.api.v1.endpoints.export.DiceExportStream')
     def test_publish_version_increments_version_number(
         self,
-        mock_dice_stats,
-        mock_export_dice,
+        mock_dice_stream,
         mock_storage,
         authenticated_client,
         labeler_db,
@@ -695,9 +733,7 @@ class TestPublishVersion:
         labeler_db.commit()
 
         # Mock DICE export
-        dice_data = {"version": "1.0", "images": []}
-        mock_export_dice.return_value = dice_data
-        mock_dice_stats.return_value = {
+        mock_dice_stream.return_value.get_stats.return_value = {
             "annotation_count": 0,
             "image_count": 0
         }
@@ -728,12 +764,10 @@ class TestPublishVersion:
         assert data["version_number"] == "v2.0"  # Incremented
 
     @patch('app.api.v1.endpoints.export.storage_client')
-    @patch('app.api.v1.endpoints.export.export_to_dice')
-    @patch('app.api.v1.endpoints.export.get_dice_stats')
+    @patch('app.api.v1.endpoints.export.DiceExportStream')
     def test_publish_version_duplicate_version_number(
         self,
-        mock_dice_stats,
-        mock_export_dice,
+        mock_dice_stream,
         mock_storage,
         authenticated_client,
         labeler_db,
@@ -780,12 +814,77 @@ class TestPublishVersion:
         assert "already exists" in response.json()["detail"].lower()
 
     @patch('app.api.v1.endpoints.export.storage_client')
-    @patch('app.api.v1.endpoints.export.export_to_dice')
-    @patch('app.api.v1.endpoints.export.get_dice_stats')
+    @patch('app.api.v1.endpoints.export.DiceExportStream')
+    def test_publish_version_locks_project_only_for_version_step(
+        self,
+        mock_dice_stream,
+        mock_storage,
+        authenticated_client,
+        labeler_db,
+        platform_db,
+        test_project,
+        mock_current_user
+    ):
+        """
+        Test publish locking.
+
+        The version number is reserved before the uploads, and the project
+        is locked only after them, before the version row exists. A
+        duplicate is rejected before uploading anything.
+        """
+        mock_dice_stream.return_value.get_stats.return_value = {
+            "annotation_count": 0,
+            "image_count": 0
+        }
+        steps = []
+
+        def upload_export(**kwargs):
+            steps.append(("upload", kwargs["export_format"]))
+            return (
+                f"exports/{test_project.id}/detection/v1.0/annotations.json",
+                "https://s3.amazonaws.com/bucket/export.json?signature=abc",
+                datetime.utcnow() + timedelta(hours=1)
+            )
+
+        def lock_number(db, project_id, task_type, version_number):
+            assert (project_id, task_type) == (test_project.id, "detection")
+            steps.append(("number", version_number, db.query(AnnotationVersion).count()))
+
+        def lock_project(db, project_id):
+            assert project_id == test_project.id
+            steps.append(("project", db.query(AnnotationVersion).count()))
+
+        mock_storage.upload_export.side_effect = upload_export
+        publish_request = {
+            "task_type": "detection",
+            "version_number": "v1.0",
+            "export_format": "dice",
+            "include_draft": False
+        }
+
+        with patch('app.api.v1.endpoints.export.lock_version_number', side_effect=lock_number), \
+                patch('app.api.v1.endpoints.export.lock_project_publishes', side_effect=lock_project):
+            first = authenticated_client.post(
+                f"/api/v1/export/projects/{test_project.id}/versions/publish",
+                json=publish_request
+            )
+            duplicate = authenticated_client.post(
+                f"/api/v1/export/projects/{test_project.id}/versions/publish",
+                json=publish_request
+            )
+
+        assert first.status_code == status.HTTP_200_OK
+        assert duplicate.status_code == status.HTTP_409_CONFLICT
+        assert steps == [
+            ("number", "v1.0", 0),
+            ("upload", "dice"),
+            ("project", 0),
+            ("number", "v1.0", 1),
+        ]
+
+    @patch('app.api.v1.endpoints.export.storage_client')
     def test_publish_version_with_draft_annotations(
         self,
-        mock_dice_stats,
-        mock_export_dice,
         mock_storage,
         authenticated_client,
         labeler_db,
@@ -803,6 +902,7 @@ class TestPublishVersion:
             project_id=test_project.id,
             image_id="img_001",
             annotation_type="bbox",
+            task_type="detection",
             geometry={"type": "bbox", "bbox": [100, 100, 50, 50]},
             class_id="cls_person",
             class_name="person",
@@ -813,19 +913,9 @@ class TestPublishVersion:
         labeler_db.add(draft_annotation)
         labeler_db.commit()
 
-        # Mock DICE export
-        dice_data = {"version": "1.0", "images": []}
-        mock_export_dice.return_value = dice_data
-        mock_dice_stats.return_value = {
-            "annotation_count": 1,
-            "image_count": 1
-        }
-
-        # Mock storage upload
-        mock_storage.upload_export.return_value = (
-            f"exports/{test_project.id}/detection/v1.0/annotations.json",
-            "https://s3.amazonaws.com/bucket/export.json?signature=abc",
-            datetime.utcnow() + timedelta(hours=1)
+        # Mock storage upload (reads the uploaded data like upload_stream)
+        mock_storage.upload_export.side_effect = _consuming_upload(
+            f"exports/{test_project.id}/detection/v1.0/annotations.json"
         )
         mock_storage.update_platform_annotations.return_value = f"datasets/{test_project.dataset_id}/detection/v1.0/annotations.json"
 
@@ -850,22 +940,19 @@ class TestPublishVersion:
             AnnotationVersion.project_id == test_project.id,
             AnnotationVersion.version_number == "v1.0"
         ).first()
-        snapshots = labeler_db.query(AnnotationSnapshot).filter(
-            AnnotationSnapshot.version_id == version.id
-        ).all()
+        snapshots = list(iter_version_snapshots(labeler_db, version))
         assert len(snapshots) == 1
+        assert data["annotation_count"] == 1
 
     @patch('app.api.v1.endpoints.export.storage_client')
-    @patch('app.api.v1.endpoints.export.export_to_dice')
-    @patch('app.api.v1.endpoints.export.get_dice_stats')
-    @patch('app.api.v1.endpoints.export.export_to_yolo')
+    @patch('app.api.v1.endpoints.export.DiceExportStream')
+    @patch('app.api.v1.endpoints.export.YoloExportWriter')
     @patch('app.api.v1.endpoints.export.get_yolo_stats')
     def test_publish_version_yolo_format(
         self,
         mock_yolo_stats,
-        mock_export_yolo,
-        mock_dice_stats,
-        mock_export_dice,
+        mock_yolo_writer,
+        mock_dice_stream,
         mock_storage,
         authenticated_client,
         labeler_db,
@@ -879,17 +966,18 @@ class TestPublishVersion:
         Should create both DICE (primary) and YOLO exports.
         """
         # Mock DICE export (primary)
-        dice_data = {"version": "1.0", "images": []}
-        mock_export_dice.return_value = dice_data
-        mock_dice_stats.return_value = {
+        mock_dice_stream.return_value.get_stats.return_value = {
             "annotation_count": 0,
             "image_count": 0
         }
 
-        # Mock YOLO export (additional)
-        mock_export_yolo.return_value = (
+        # Mock YOLO export (additional, fed from the DICE stream)
+        mock_yolo_writer.return_value.result.return_value = (
             {},  # image_annotations
-            "person\n"  # classes.txt
+            "person\n",  # classes.txt
+            {},  # captions_files
+            {},  # region_descriptions_files
+            {},  # vqa_files
         )
         mock_yolo_stats.return_value = {
             "annotation_count": 0,
@@ -920,9 +1008,11 @@ class TestPublishVersion:
         assert response.status_code == status.HTTP_200_OK
         data = response.json()
 
-        # Verify both DICE and YOLO exports were called
-        mock_export_dice.assert_called_once()
-        mock_export_yolo.assert_called_once()
+        # Verify both DICE and YOLO exports were written in one pass
+        mock_dice_stream.assert_called_once()
+        mock_yolo_writer.assert_called_once()
+        assert mock_yolo_writer.call_args.kwargs["task_type"] == "detection"
+        assert mock_yolo_writer.return_value in mock_dice_stream.call_args.kwargs["writers"]
 
         # Verify storage upload was called twice (DICE + YOLO)
         assert mock_storage.upload_export.call_count == 2
@@ -1020,10 +1110,10 @@ class TestPublishVersion:
         assert response.status_code == status.HTTP_403_FORBIDDEN
 
     @patch('app.api.v1.endpoints.export.storage_client')
-    @patch('app.api.v1.endpoints.export.export_to_dice')
+    @patch('app.api.v1.endpoints.export.DiceExportStream')
     def test_publish_version_service_error(
         self,
-        mock_export_dice,
+        mock_dice_stream,
         mock_storage,
         authenticated_client,
         labeler_db,
@@ -1037,7 +1127,7 @@ class TestPublishVersion:
         Should return 500 error and rollback transaction.
         """
         # Mock export service to raise exception
-        mock_export_dice.side_effect = Exception("Export service failed")
+        mock_dice_stream.side_effect = Exception("Export service failed")
 
         publish_request = {
             "task_type": "detection",
@@ -1062,12 +1152,10 @@ class TestPublishVersion:
         assert len(versions) == 0
 
     @patch('app.api.v1.endpoints.export.storage_client')
-    @patch('app.api.v1.endpoints.export.export_to_dice')
-    @patch('app.api.v1.endpoints.export.get_dice_stats')
+    @patch('app.api.v1.endpoints.export.DiceExportStream')
     def test_publish_version_updates_dataset_labeled_status(
         self,
-        mock_dice_stats,
-        mock_export_dice,
+        mock_dice_stream,
         mock_storage,
         authenticated_client,
         labeler_db,
@@ -1087,9 +1175,7 @@ class TestPublishVersion:
         labeler_db.commit()
 
         # Mock DICE export
-        dice_data = {"version": "1.0", "images": []}
-        mock_export_dice.return_value = dice_data
-        mock_dice_stats.return_value = {
+        mock_dice_stream.return_value.get_stats.return_value = {
             "annotation_count": 0,
             "image_count": 0
         }
@@ -1470,6 +1556,19 @@ class TestListVersions:
 # Fixture Helpers
 # =============================================================================
 
+def _consuming_upload(s3_key):
+    """upload_export side effect that reads streamed export data."""
+    def upload_export(**kwargs):
+        if not isinstance(kwargs["export_data"], bytes):
+            b"".join(kwargs["export_data"])
+        return (
+            s3_key,
+            "https://s3.amazonaws.com/bucket/export.json?signature=abc",
+            datetime.utcnow() + timedelta(hours=1)
+        )
+    return upload_export
+
+
 @pytest.fixture
 def create_project_permission():
     """Factory fixture to create project permissions."""
@@ -24,11 +24,16 @@ from datetime import datetime
 from app.core.security import get_current_user, require_project_permission
 from app.db.models.labeler import (
     AnnotationProject,
+    AnnotationState,
+    AnnotationVersionMember,
     Dataset,
+    ExportArtifact,
     ProjectPermission,
     ImageMetadata,
     ImageAnnotationStatus,
     Annotation,
+    VersionDiff,
+    VersionDiffImage,
 )
 from app.main import app
 
@@ -793,6 +798,42 @@ class TestDeleteProject:
         ).first()
         assert deleted_project is None
 
+    def test_delete_project_removes_unlinked_rows(self, authenticated_client, labeler_db, test_project):
+        """
+        Test that rows without a foreign key to the project are deleted with it.
+
+        Version members (and their unshared states), cached version diffs and
+        export artifact records must not be left orphaned.
+        """
+        project_id = test_project.id
+        labeler_db.add(AnnotationState(hash="a" * 64, snapshot_data={"class_id": "cat"}))
+        labeler_db.add(AnnotationVersionMember(
+            project_id=project_id, task_type="detection", annotation_id=1,
+            state_hash="a" * 64, first_version_id=1,
+        ))
+        diff = VersionDiff(
+            project_id=project_id, task_type="detection", version_a_id=1, version_b_id=-1,
+            format_version=1, summary={}, class_stats={},
+        )
+        labeler_db.add(diff)
+        labeler_db.flush()
+        labeler_db.add(VersionDiffImage(diff_id=diff.id, image_id="a.jpg"))
+        labeler_db.add(ExportArtifact(
+            project_id=project_id, task_type="all", export_format="dice", include_draft=False,
+            fingerprint="f" * 64, export_path=f"exports/{project_id}/all/dice/export.json",
+        ))
+        labeler_db.commit()
+
+        response = authenticated_client.delete(f"/api/v1/projects/{project_id}")
+
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        labeler_db.expire_all()
+        assert labeler_db.query(AnnotationVersionMember).filter_by(project_id=project_id).count() == 0
+        assert labeler_db.query(AnnotationState).count() == 0
+        assert labeler_db.query(VersionDiff).filter_by(project_id=project_id).count() == 0
+        assert labeler_db.query(VersionDiffImage).count() == 0
+        assert labeler_db.query(ExportArtifact).filter_by(project_id=project_id).count() == 0
+
     def test_delete_project_not_found(self, authenticated_client, labeler_db):
         """
         Test deleting non-existent project.
@@ -1059,7 +1100,7 @@ class TestAddTaskType:
 class TestListProjectImages:
     """Test cases for GET /api/v1/projects/{project_id}/images endpoint."""
 
-    @patch('app.api.v1.endpoints.projects.storage_client')
+    @patch('app.services.image_url_service.storage_client')
     def test_list_project_images_empty(self, mock_storage, authenticated_client, labeler_db, test_project):
         """
         Test listing images when project has no images.
@@ -1074,7 +1115,7 @@ class TestListProjectImages:
         assert data["total"] == 0
         assert data["project_id"] == test_project.id
 
-    @patch('app.api.v1.endpoints.projects.storage_client')
+    @patch('app.services.image_url_service.storage_client')
     def test_list_project_images_with_data(self, mock_storage, authenticated_client, labeler_db, test_project):
         """
         Test listing images with image metadata.
@@ -1106,7 +1147,9 @@ class TestListProjectImages:
         labeler_db.commit()
 
         # Mock presigned URL generation
-        mock_storage.generate_presigned_url.return_value = "https://presigned-url.com/image.jpg"
+        mock_storage.generate_presigned_urls.side_effect = lambda bucket, keys, expiration=3600, storage_type=None: {
+            key: "https://presigned-url.com/image.jpg" for key in keys
+        }
 
         response = authenticated_client.get(f"/api/v1/projects/{test_project.id}/images")
 
@@ -1117,21 +1160,23 @@ class TestListProjectImages:
         assert data["images"][0]["id"] == "img_001.jpg"
         assert data["images"][1]["id"] == "img_002.jpg"
 
-    @patch('app.api.v1.endpoints.projects.storage_client')
+    @patch('app.services.image_url_service.storage_client')
     def test_list_project_images_pagination_default(self, mock_storage, authenticated_client, labeler_db, test_project):
         """
         Test listing images with default pagination.
 
         Should use default limit=50, offset=0.
         """
-        mock_storage.generate_presigned_url.return_value = "https://presigned-url.com/image.jpg"
+        mock_storage.generate_presigned_urls.side_effect = lambda bucket, keys, expiration=3600, storage_type=None: {
+            key: "https://presigned-url.com/image.jpg" for key in keys
+        }
 
         response = authenticated_client.get(f"/api/v1/projects/{test_project.id}/images")
 
         assert response.status_code == status.HTTP_200_OK
         # Should work with default pagination
 
-    @patch('app.api.v1.endpoints.projects.storage_client')
+    @patch('app.services.image_url_service.storage_client')
     def test_list_project_images_pagination_custom(self, mock_storage, authenticated_client, labeler_db, test_project):
         """
         Test listing images with custom pagination.
@@ -1153,7 +1198,9 @@ class TestListProjectImages:
             labeler_db.add(img)
         labeler_db.commit()
 
-        mock_storage.generate_presigned_url.return_value = "https://presigned-url.com/image.jpg"
+        mock_storage.generate_presigned_urls.side_effect = lambda bucket, keys, expiration=3600, storage_type=None: {
+            key: "https://presigned-url.com/image.jpg" for key in keys
+        }
 
         # Get first 5
         response = authenticated_client.get(
@@ -1177,6 +1224,48 @@ class TestListProjectImages:
         assert len(data["images"]) == 5
         assert data["total"] == 10
 
+    @patch('app.services.image_url_service.storage_client')
+    def test_list_project_images_batch_signing_fallback(self, mock_storage, authenticated_client, labeler_db, test_project):
+        """
+        Test that missing batch-signed URLs fall back to per-image signing.
+
+        Only the image whose URL cannot be signed is dropped; if none can be
+        signed the endpoint fails.
+        """
+        for i in range(3):
+            labeler_db.add(ImageMetadata(
+                id=f"img_{i:03d}.jpg",
+                dataset_id=test_project.dataset_id,
+                s3_key=f"datasets/test/img_{i:03d}.jpg",
+                size=1024,
+                width=800,
+                height=600,
+                uploaded_at=datetime(2024, 1, 1, 0, 0, i),
+                last_modified=datetime.utcnow()
+            ))
+        labeler_db.commit()
+
+        def sign(bucket, key, expiration=3600, storage_type=None):
+            if key.endswith("img_001.jpg"):
+                raise Exception("signing failed")
+            return f"https://presigned-url.com/{key}"
+
+        # The batch leaves every key out
+        mock_storage.generate_presigned_urls.side_effect = lambda bucket, keys, expiration=3600, storage_type=None: {}
+        mock_storage.generate_presigned_url.side_effect = sign
+
+        response = authenticated_client.get(f"/api/v1/projects/{test_project.id}/images")
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert [image["id"] for image in data["images"]] == ["img_000.jpg", "img_002.jpg"]
+        assert data["images"][0]["url"] == "https://presigned-url.com/datasets/test/img_000.jpg"
+
+        mock_storage.generate_presigned_url.side_effect = Exception("storage unavailable")
+        response = authenticated_client.get(f"/api/v1/projects/{test_project.id}/images")
+
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
     def test_list_project_images_invalid_offset(self, authenticated_client, labeler_db, test_project):
         """
         Test listing images with negative offset.
@@ -9,14 +9,16 @@ This module provides:
 """
 
 import pytest
-import sys
 import json
 from typing import Generator, Dict, Any
-from unittest.mock import Mock, MagicMock, patch
+from unittest.mock import Mock, patch
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, event
+from sqlalchemy import ARRAY, BigInteger, create_engine, event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.types import TypeDecorator, TEXT
 
 # =============================================================================
@@ -55,25 +57,35 @@ class MockARRAY:
 
 postgresql.ARRAY = MockARRAY
 
+
+# DDL for the service tests that create labeler tables on SQLite (sqlite_db)
+@compiles(JSONB, "sqlite")
+def _jsonb_on_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+
+@compiles(ARRAY, "sqlite")
+def _array_on_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+
+@compiles(BigInteger, "sqlite")
+def _bigint_on_sqlite(type_, compiler, **kw):
+    # INTEGER PRIMARY KEY autoincrements on SQLite, BIGINT does not
+    return "INTEGER"
+
 # =============================================================================
-# Storage Client Mock - Must be done BEFORE importing app.main
+# Storage Client - Must be done BEFORE importing app.main
 # =============================================================================
 
-# Mock storage client before importing app.main to prevent S3 connection
-mock_storage = MagicMock()
-mock_storage.check_bucket_exists = Mock(return_value=True)
-mock_storage.upload_file = Mock(return_value="s3://test-bucket/test-key")
-mock_storage.generate_presigned_url = Mock(return_value="https://example.com/presigned-url")
-mock_storage.delete_file = Mock(return_value=True)
-mock_storage.list_files = Mock(return_value=[])
-mock_storage.upload_export = Mock(return_value="s3://test-bucket/exports/test.json")
-mock_storage.update_platform_annotations = Mock()
-mock_storage.regenerate_presigned_url = Mock(return_value="https://example.com/new-presigned-url")
-
-# Patch storage_client before importing app
-storage_module = MagicMock()
-storage_module.storage_client = mock_storage
-sys.modules['app.core.storage'] = storage_module
+# StorageClient does no network I/O until it is used, so the real module is
+# imported: storage, upload and export tests need StorageClient and the
+# shared storage_client. Only the bucket check kicked off at app startup is
+# stubbed, so TestClient never waits on S3. Endpoint tests patch
+# storage_client where they use it.
+from app.core.storage import storage_client as _storage_client
+
+_storage_client.ensure_buckets = Mock()
 
 # =============================================================================
 # App and Database Imports
@@ -82,6 +94,21 @@ sys.modules['app.core.storage'] = storage_module
 from app.main import app
 from app.core.database import get_platform_db, get_labeler_db, PlatformBase, LabelerBase
 from app.core.config import settings
+from app.db.models.labeler import (
+    Annotation,
+    AnnotationProject,
+    AnnotationSnapshot,
+    AnnotationState,
+    AnnotationVersion,
+    AnnotationVersionMember,
+    Dataset,
+    ExportArtifact,
+    ImageAnnotationStatus,
+    ImageMetadata,
+    TextLabel,
+    VersionDiff,
+    VersionDiffImage,
+)
 
 # Import fixtures from fixture modules
 from tests.fixtures.auth_fixtures import (
@@ -210,6 +237,31 @@ def labeler_db() -> Generator[Session, None, None]:
     connection.close()
 
 
+@pytest.fixture
+def sqlite_db() -> Generator[Session, None, None]:
+    """
+    Provide a session on a fresh in-memory SQLite database with the labeler
+    tables used by the annotation, export, snapshot and version diff services.
+
+    Tests seed their own rows. ARRAY columns cannot be bound on SQLite:
+    insert those rows as JSON text.
+    """
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (Dataset, AnnotationProject, Annotation, TextLabel, ImageAnnotationStatus, ImageMetadata,
+                  ExportArtifact, AnnotationSnapshot, AnnotationState, AnnotationVersionMember,
+                  VersionDiff, VersionDiffImage):
+        model.__table__.create(engine)
+    with engine.begin() as connection:
+        # annotation_versions declares ix_annotation_versions_task_type twice: skip its indexes
+        connection.execute(CreateTable(AnnotationVersion.__table__))
+    session = sessionmaker(bind=engine)()
+
+    yield session
+
+    session.close()
+    engine.dispose()
+
+
 # =============================================================================
 # FastAPI TestClient Fixtures
 # =============================================================================
@@ -339,6 +391,7 @@ __all__ = [
     "admin_client",
     "platform_db",
     "labeler_db",
+    "sqlite_db",
     "mock_current_user",
     "mock_admin_user",
     "test_headers",
@@ -0,0 +1,245 @@
+"""
+Tests for version diff annotation matching.
+
+The vectorized IoU must agree with VersionDiffService.calculate_iou, boxes
+must be paired by best IoU over the whole image instead of by scan order, and
+rotated boxes and polygons must match by their own overlap.
+"""
+
+import random
+
+import math
+
+import numpy as np
+import pytest
+
+from app.services import annotation_matching
+from app.services.annotation_matching import (
+    ShapeSet,
+    SpatialGrid,
+    box_of,
+    boxes_array,
+    greedy_assignment,
+    iou_matrix,
+    match_annotations,
+    polygon_intersection_area,
+    polygon_of,
+    shape_iou_pairs,
+)
+from app.services.version_diff_service import VersionDiffService
+
+
+def _bbox(x, y, width, height, annotation_id=None, fmt="db"):
+    geometry = {'x': x, 'y': y, 'width': width, 'height': height} if fmt == "db" else {
+        'type': 'bbox', 'bbox': [x, y, width, height]
+    }
+    annotation = {'geometry': geometry, 'class_name': 'car'}
+    if annotation_id is not None:
+        annotation['annotation_id'] = annotation_id
+    return annotation
+
+
+def _polygon(points, annotation_id=None):
+    annotation = {'annotation_type': 'polygon', 'geometry': {'points': points}, 'class_name': 'road'}
+    if annotation_id is not None:
+        annotation['annotation_id'] = annotation_id
+    return annotation
+
+
+def _shifted(points, dx, dy):
+    return [[x + dx, y + dy] for x, y in points]
+
+
+# L-shaped (non-convex) polygon of area 3 in a 2x2 square
+L_SHAPE = [[0, 0], [2, 0], [2, 1], [1, 1], [1, 2], [0, 2]]
+
+
+def test_iou_matrix_matches_scalar_iou():
+    rng = random.Random(7)
+    boxes = [
+        {'x': rng.uniform(0, 100), 'y': rng.uniform(0, 100), 'width': rng.uniform(0, 40), 'height': rng.uniform(0, 40)}
+        for _ in range(30)
+    ]
+    boxes.append({'x': 5, 'y': 5, 'width': 0, 'height': 0})
+
+    array, indices = boxes_array([{'geometry': box} for box in boxes])
+    matrix = iou_matrix(array, array)
+
+    assert indices.tolist() == list(range(len(boxes)))
+    expected = [[VersionDiffService.calculate_iou(a, b) for b in boxes] for a in boxes]
+    np.testing.assert_allclose(matrix, expected, atol=1e-12)
+
+
+def test_box_formats_and_non_boxes():
+    assert box_of({'bbox': [1, 2, 3, 4], 'type': 'bbox'}) == (1.0, 2.0, 4.0, 6.0)
+    assert box_of({'x': 1, 'y': 2, 'width': 3, 'height': 4}) == (1.0, 2.0, 4.0, 6.0)
+    assert box_of({'points': [[0, 0], [1, 1]]}) is None
+    assert box_of({'bbox': [1, 2]}) is None
+    assert box_of({}) is None
+
+    array, indices = boxes_array([{'geometry': {'points': []}}, _bbox(0, 0, 1, 1), {'geometry': None}])
+    assert array.shape == (1, 4)
+    assert indices.tolist() == [1]
+
+
+def test_greedy_assignment_prefers_best_pair_over_scan_order():
+    # a0 overlaps b0 a little and b1 well; a1 only overlaps b1 (even better)
+    iou = np.array([
+        [0.55, 0.7],
+        [0.0, 0.9],
+    ])
+    assert sorted(greedy_assignment(iou, 0.5)) == [(0, 0), (1, 1)]
+    assert greedy_assignment(iou, 0.95) == []
+
+
+def test_match_annotations_fixes_greedy_mispairing():
+    annotations_a = [_bbox(23, 0, 100, 100), _bbox(0, 0, 100, 100)]
+    annotations_b = [_bbox(50, 0, 100, 100, fmt="dice"), _bbox(5, 0, 100, 100, fmt="dice")]
+
+    # Scanning a in order, a0 takes its best box b1 (IoU 0.69 > 0.58) and
+    # a1 is left with b0 (IoU 0.33): one pair instead of two
+    assert VersionDiffService.find_best_match(annotations_a[0], annotations_b)[1] == 1
+
+    match = match_annotations(annotations_a, annotations_b)
+
+    assert match.pairs == [(0, 0), (1, 1)]
+    assert match.unmatched_a == [] and match.unmatched_b == []
+
+
+def test_match_annotations_pairs_ids_before_geometry():
+    annotations_a = [_bbox(0, 0, 10, 10, annotation_id=1), _bbox(50, 50, 10, 10, annotation_id=2),
+                     {'annotation_id': 3, 'geometry': {'points': [[0, 0], [1, 1]]}}]
+    annotations_b = [_bbox(0, 0, 10, 10, annotation_id=2), _bbox(300, 300, 10, 10, annotation_id=1),
+                     _bbox(50, 50, 10, 10, annotation_id=7)]
+
+    match = match_annotations(annotations_a, annotations_b)
+
+    assert match.pairs == [(0, 1), (1, 0)]
+    assert match.unmatched_a == [2]
+    assert match.unmatched_b == [2]
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_diff_for_image_is_consistent(seed):
+    rng = random.Random(seed)
+    annotations_a = [
+        _bbox(rng.uniform(0, 1000), rng.uniform(0, 1000), rng.uniform(10, 60), rng.uniform(10, 60))
+        for _ in range(200)
+    ]
+    # Keep most boxes (slightly moved), drop some, add some
+    annotations_b = [
+        _bbox(a['geometry']['x'] + rng.uniform(-1, 1), a['geometry']['y'], a['geometry']['width'],
+              a['geometry']['height'])
+        for a in annotations_a[:150]
+    ] + [_bbox(2000 + i * 100, 2000, 50, 50) for i in range(20)]
+    rng.shuffle(annotations_b)
+
+    diff = VersionDiffService.calculate_diff_for_image(annotations_a, annotations_b)
+
+    summary = diff['summary']
+    assert summary['modified_count'] + summary['unchanged_count'] == 150
+    assert summary['removed_count'] == 50
+    assert summary['added_count'] == 20
+    assert all(item['new']['geometry']['y'] == item['old']['geometry']['y'] for item in diff['modified'])
+
+
+def test_find_best_match_keeps_api():
+    annotation = _bbox(100, 100, 50, 50)
+    candidates = [{'geometry': {'points': [[0, 0]]}}, _bbox(110, 110, 50, 50), _bbox(100, 100, 50, 50, fmt="dice")]
+
+    match, idx = VersionDiffService.find_best_match(annotation, candidates)
+    assert idx == 2 and match is candidates[2]
+    assert VersionDiffService.find_best_match(annotation, candidates[:1]) is None
+    assert VersionDiffService.find_best_match({'geometry': {}}, candidates) is None
+    assert VersionDiffService.find_best_match(annotation, [_bbox(0, 0, 50, 50)], iou_threshold=0.0) is None
+
+
+def test_rotated_box_iou_is_exact():
+    square = {'geometry': {'cx': 0, 'cy': 0, 'width': 2, 'height': 2, 'angle': 0.0}}
+    rotated = {'geometry': {'cx': 0, 'cy': 0, 'width': 2, 'height': 2, 'angle': 45}}
+    assert box_of(rotated['geometry']) is None
+
+    shapes_a, shapes_b = ShapeSet([{'geometry': {'x': -1, 'y': -1, 'width': 2, 'height': 2}}]), ShapeSet([rotated])
+    rows, columns, ious = shape_iou_pairs(shapes_a, shapes_b, 0.5)
+
+    # Overlap of a square and itself turned 45 degrees is a regular octagon
+    assert rows.tolist() == [0] and columns.tolist() == [0]
+    assert ious[0] == pytest.approx(math.sqrt(2) / 2)
+    np.testing.assert_allclose(polygon_of(square), [[-1, -1], [1, -1], [1, 1], [-1, 1]])
+    # {x, y, width, height, angle} turns about the box center
+    np.testing.assert_allclose(
+        polygon_of({'geometry': {'x': -1, 'y': -1, 'width': 2, 'height': 2, 'angle': 45}}), polygon_of(rotated)
+    )
+
+
+def test_non_convex_overlap_is_rasterized():
+    l_shape = np.array(L_SHAPE, dtype=float)
+    square = np.array([[1, 0], [3, 0], [3, 2], [1, 2]], dtype=float)
+
+    assert polygon_intersection_area(l_shape, square) == pytest.approx(1.0, rel=0.02)
+    assert polygon_intersection_area(l_shape, l_shape + 5) == 0.0
+    # Convex pairs are clipped exactly
+    assert polygon_intersection_area(square, square + 0.5, convex=True) == pytest.approx(1.5 * 1.5)
+
+
+def test_polygon_redraws_are_modified_not_added_and_removed():
+    annotations_a = [
+        _polygon(_shifted(L_SHAPE, 10 * i, 0), annotation_id=100 + i) for i in range(5)
+    ] + [_polygon([[0, 50], [1, 50], [0.5, 51]]), {'annotation_type': 'polyline', 'geometry': {'points': [[0, 0], [5, 5], [9, 0]]}}]
+    # Re-drawn (new ids, nudged vertices) and shuffled; the triangle is gone
+    annotations_b = [_polygon(_shifted(points['geometry']['points'], 0.1, -0.05)) for points in annotations_a[:5]]
+    annotations_b.reverse()
+    annotations_b.append(_polygon(_shifted(L_SHAPE, 100, 100)))
+
+    diff = VersionDiffService.calculate_diff_for_image(annotations_a, annotations_b)
+
+    summary = diff['summary']
+    assert (summary['modified_count'], summary['removed_count'], summary['added_count']) == (5, 2, 1)
+    for item in diff['modified']:
+        assert item['changes']['shape_changed']
+        assert item['new']['geometry']['points'] == _shifted(item['old']['geometry']['points'], 0.1, -0.05)
+
+    match = VersionDiffService.find_best_match(annotations_a[2], annotations_b)
+    assert match is not None and match[1] == 2
+
+
+def test_polygon_matches_box_of_other_format():
+    annotations_a = [_polygon([[10, 10], [50, 10], [50, 40], [10, 40]])]
+    annotations_b = [_bbox(0, 0, 5, 5, fmt="dice"), _bbox(10, 10, 40, 30, fmt="dice")]
+
+    assert match_annotations(annotations_a, annotations_b).pairs == [(0, 1)]
+
+
+def test_spatial_grid_finds_every_overlap():
+    rng = random.Random(3)
+    boxes = []
+    for _ in range(300):
+        x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+        boxes.append([x, y, x + rng.uniform(1, 40), y + rng.uniform(1, 40)])
+    boxes.append([0, 0, 1000, 1000])  # spans far more cells than MAX_GRID_CELLS
+    envelopes = np.array(boxes)
+
+    rows, columns = SpatialGrid(envelopes).candidate_pairs(envelopes)
+
+    overlap = iou_matrix(envelopes, envelopes) > 0
+    found = set(zip(rows.tolist(), columns.tolist()))
+    assert set(zip(*np.nonzero(overlap))) <= found
+    assert len(found) < overlap.size / 10
+
+
+def test_crowded_box_images_use_grid_candidates(monkeypatch):
+    rng = random.Random(5)
+    annotations_a = [
+        _bbox(rng.uniform(0, 1000), rng.uniform(0, 1000), rng.uniform(10, 60), rng.uniform(10, 60))
+        for _ in range(300)
+    ]
+    annotations_b = [
+        _bbox(a['geometry']['x'] + rng.uniform(-5, 5), a['geometry']['y'] + rng.uniform(-5, 5),
+              a['geometry']['width'], a['geometry']['height'], fmt="dice")
+        for a in annotations_a
+    ]
+    rng.shuffle(annotations_b)
+
+    dense = match_annotations(annotations_a, annotations_b)
+    monkeypatch.setattr(annotation_matching, 'DENSE_IOU_LIMIT', 0)
+    assert match_annotations(annotations_a, annotations_b) == dense
@@ -0,0 +1,264 @@
+"""
+Tests for copy-on-write annotation snapshots and snapshot blobs.
+
+Publishing a version only writes the states and members of annotations that
+changed since the previous version, and every version must still read back
+exactly the annotations it was published with, also once its rows have been
+moved to a snapshot blob.
+"""
+
+import json
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import text
+
+from app.api.v1.endpoints.export import _reserve_version_number
+from app.core.storage import StorageClient
+from app.core.storage_backends import LocalStorageBackend
+from app.db.models.labeler import (
+    Annotation,
+    AnnotationSnapshot,
+    AnnotationState,
+    AnnotationVersion,
+    AnnotationVersionMember,
+)
+from app.services.annotation_snapshot_service import (
+    AnnotationSnapshotWriter,
+    SnapshotBlobWriter,
+    build_snapshot_data,
+    delete_project_snapshots,
+    iter_version_snapshots,
+    move_version_snapshots_to_blob,
+)
+from app.services.export_query_service import write_export
+from app.services.version_diff_service import VersionDiffService
+
+PROJECT_ID = "proj_1"
+OTHER_PROJECT_ID = "proj_2"
+DATASET_ID = "ds_1"
+OTHER_DATASET_ID = "ds_2"
+
+
+@pytest.fixture
+def db(sqlite_db):
+    session = sqlite_db
+
+    # ARRAY columns cannot be bound on SQLite: insert those rows as JSON text
+    for project_id, dataset_id in ((PROJECT_ID, DATASET_ID), (OTHER_PROJECT_ID, OTHER_DATASET_ID)):
+        session.execute(text(
+            "INSERT INTO datasets (id, name, owner_id, visibility, storage_path, storage_type, format, labeled,"
+            " published_task_types, num_images, is_snapshot, status, integrity_status, version, created_at,"
+            " updated_at) VALUES (:id, 'Cats', 'u1', 'private', :path, 's3', 'dice', 0, '[]', 0, 0, 'active',"
+            " 'valid', 1, :now, :now)"
+        ), {"id": dataset_id, "path": f"datasets/{dataset_id}/", "now": datetime(2026, 1, 1)})
+        session.execute(text(
+            "INSERT INTO annotation_projects (id, name, dataset_id, owner_id, task_types, task_config, task_classes,"
+            " created_at) VALUES (:id, 'Cats', :dataset_id, 'u1', '[\"detection\"]', '{}', :classes, :now)"
+        ), {
+            "id": project_id,
+            "dataset_id": dataset_id,
+            "classes": json.dumps({"detection": {"c_cat": {"name": "cat", "order": 0}}}),
+            "now": datetime(2026, 1, 1),
+        })
+    session.add_all([_annotation(i + 1, PROJECT_ID) for i in range(4)])
+    session.commit()
+    return session
+
+
+@pytest.fixture
+def storage(tmp_path):
+    client = StorageClient()
+    backend = LocalStorageBackend(str(tmp_path), url_secret="test-secret")
+    with patch.object(client, "get_backend", return_value=backend), \
+            patch("app.services.annotation_snapshot_service.storage_client", client), \
+            patch("app.services.version_diff_service.storage_client", client):
+        yield client
+
+
+def _annotation(annotation_id, project_id):
+    return Annotation(
+        id=annotation_id, project_id=project_id, image_id=f"train/{annotation_id % 3:03d}.jpg",
+        annotation_type="bbox", task_type="detection", geometry={"type": "bbox", "bbox": [annotation_id, 0, 5, 5]},
+        class_id="c_cat", class_name="cat", created_by="u1", annotation_state="confirmed",
+        created_at=datetime(2026, 1, 2), updated_at=datetime(2026, 1, 2),
+    )
+
+
+def _publish(db, project_id=PROJECT_ID, dataset_id=DATASET_ID):
+    writer = AnnotationSnapshotWriter(db, project_id, "detection")
+    write_export(db, project_id, dataset_id, [writer], task_type="detection")
+    version_count = db.query(AnnotationVersion).filter(AnnotationVersion.project_id == project_id).count()
+    version = AnnotationVersion(
+        project_id=project_id, task_type="detection", version_number=f"v{version_count + 1}.0",
+        version_type="published", created_by="u1",
+    )
+    db.add(version)
+    db.flush()
+    writer.write_members(version.id)
+    db.commit()
+    return version, writer
+
+
+def _current_snapshots(db, project_id=PROJECT_ID):
+    annotations = db.query(Annotation).filter(Annotation.project_id == project_id).order_by(Annotation.id)
+    return [(annotation.id, json.loads(json.dumps(build_snapshot_data(annotation)))) for annotation in annotations]
+
+
+def test_first_publish_writes_every_state(db):
+    version, writer = _publish(db)
+
+    assert list(iter_version_snapshots(db, version)) == _current_snapshots(db)
+    assert (writer.annotation_count, writer.image_count, writer.changed_count) == (4, 3, 4)
+    assert db.query(AnnotationState).count() == 4
+    assert db.query(AnnotationVersionMember).count() == 4
+
+
+def test_publish_only_writes_changes(db):
+    v1, _ = _publish(db)
+    v1_snapshots = _current_snapshots(db)
+
+    # Unchanged project: nothing is written
+    v2, writer = _publish(db)
+    assert writer.changed_count == 0
+    assert writer.annotation_count == 4
+    assert db.query(AnnotationVersionMember).count() == 4
+
+    # One edit, one delete, one addition
+    edited = db.get(Annotation, 2)
+    edited.geometry = {"type": "bbox", "bbox": [9, 9, 1, 1]}
+    edited.updated_at = datetime(2026, 1, 3)
+    db.delete(db.get(Annotation, 3))
+    db.add(_annotation(5, PROJECT_ID))
+    db.commit()
+
+    v3, writer = _publish(db)
+    assert writer.changed_count == 3
+    assert db.query(AnnotationState).count() == 6
+    assert db.query(AnnotationVersionMember).count() == 6
+
+    assert list(iter_version_snapshots(db, v1)) == v1_snapshots
+    assert list(iter_version_snapshots(db, v2)) == v1_snapshots
+    assert list(iter_version_snapshots(db, v3)) == _current_snapshots(db)
+
+
+def test_deleted_annotation_can_return(db):
+    _publish(db)
+    annotation = db.get(Annotation, 4)
+    annotation.annotation_state = "draft"
+    db.commit()
+    v2, _ = _publish(db)
+
+    annotation.annotation_state = "confirmed"
+    db.commit()
+    v3, writer = _publish(db)
+
+    # The returning state is shared with v1 instead of stored again
+    assert writer.changed_count == 1
+    assert db.query(AnnotationState).count() == 5
+    assert [annotation_id for annotation_id, _ in iter_version_snapshots(db, v2)] == [1, 2, 3]
+    assert list(iter_version_snapshots(db, v3)) == _current_snapshots(db)
+
+
+def test_legacy_version_snapshots_are_read(db):
+    version = AnnotationVersion(
+        project_id=PROJECT_ID, task_type="detection", version_number="v1.0", version_type="published",
+        created_by="u1",
+    )
+    db.add(version)
+    db.flush()
+    db.add(AnnotationSnapshot(version_id=version.id, annotation_id=1, snapshot_data={"class_id": "c_cat"}))
+    db.commit()
+    v2, writer = _publish(db)
+
+    assert list(iter_version_snapshots(db, version)) == [(1, {"class_id": "c_cat"})]
+    assert writer.changed_count == 4
+    assert list(iter_version_snapshots(db, v2)) == _current_snapshots(db)
+
+
+def test_delete_project_snapshots_keeps_shared_states(db):
+    _publish(db)
+    # Same content as annotation 1 of the deleted project
+    shared = _annotation(10, OTHER_PROJECT_ID)
+    shared.geometry = {"type": "bbox", "bbox": [1, 0, 5, 5]}
+    db.add(shared)
+    db.commit()
+    other, _ = _publish(db, OTHER_PROJECT_ID, OTHER_DATASET_ID)
+    assert db.query(AnnotationState).count() == 4
+
+    assert delete_project_snapshots(db, [PROJECT_ID]) == 4
+    db.commit()
+
+    assert db.query(AnnotationState).count() == 1
+    assert list(iter_version_snapshots(db, other)) == _current_snapshots(db, OTHER_PROJECT_ID)
+
+
+def test_blob_writer_matches_database_snapshots(db, storage):
+    version = AnnotationVersion(
+        project_id=PROJECT_ID, task_type="detection", version_number="v1.0", version_type="published",
+        created_by="u1",
+    )
+    db.add(version)
+    db.flush()
+    snapshot_writer, blob_writer = AnnotationSnapshotWriter(db, PROJECT_ID, "detection"), SnapshotBlobWriter()
+    write_export(db, PROJECT_ID, DATASET_ID, [snapshot_writer, blob_writer], task_type="detection")
+    snapshot_writer.write_members(version.id)
+    blob, index = blob_writer.result()
+    version.snapshot_path = "snapshots/proj_1/detection/v1.0/annotations.jsonl.gz"
+    storage.save_snapshot_blob(version.snapshot_path, blob, index)
+    db.commit()
+
+    rows = list(storage.iter_snapshot_blob(version.snapshot_path))
+    assert [row.image_id for row in rows] == ["train/000.jpg", "train/001.jpg", "train/001.jpg", "train/002.jpg"]
+    assert sorted((row.annotation_id, row.snapshot_data) for row in rows) == list(iter_version_snapshots(db, version))
+    assert (index.annotation_count, index.image_count) == (4, 3)
+
+    diff_annotations = VersionDiffService.get_version_annotations(db, version, image_id="train/001.jpg")
+    assert [annotation["annotation_id"] for annotation in diff_annotations["train/001.jpg"]] == [1, 4]
+    assert diff_annotations["train/001.jpg"][0]["geometry"] == {"type": "bbox", "bbox": [1, 0, 5, 5]}
+
+
+def test_move_legacy_snapshots_to_blob(db, storage):
+    version = AnnotationVersion(
+        project_id=PROJECT_ID, task_type="detection", version_number="v1.0", version_type="published",
+        created_by="u1",
+    )
+    db.add(version)
+    db.flush()
+    # Annotation 99 was deleted after the version was published
+    db.add_all([
+        AnnotationSnapshot(version_id=version.id, annotation_id=annotation_id, snapshot_data={"class_id": "c_cat"})
+        for annotation_id in (2, 1, 99)
+    ])
+    db.commit()
+
+    assert move_version_snapshots_to_blob(db, version) == 3
+    db.commit()
+
+    assert version.snapshot_path == "snapshots/proj_1/detection/v1.0/annotations.jsonl.gz"
+    assert db.query(AnnotationSnapshot).count() == 0
+    assert list(iter_version_snapshots(db, version)) == [
+        (99, {"class_id": "c_cat"}), (1, {"class_id": "c_cat"}), (2, {"class_id": "c_cat"})
+    ]
+    assert VersionDiffService.get_version_annotations(db, version) == {
+        image_id: [{
+            "annotation_id": annotation_id, "image_id": image_id, "annotation_type": None, "geometry": {},
+            "class_id": "c_cat", "class_name": None, "attributes": {}, "confidence": None,
+        }]
+        for annotation_id, image_id in ((1, "train/001.jpg"), (2, "train/002.jpg"))
+    }
+
+
+def test_auto_version_number_skips_number_taken_while_waiting(db):
+    _publish(db)
+
+    def concurrent_publish(db, project_id, task_type, version_number):
+        # Another publish of the same number commits while this one waits for the lock
+        if version_number == "v2.0":
+            _publish(db)
+
+    with patch("app.api.v1.endpoints.export.lock_version_number", side_effect=concurrent_publish) as lock:
+        assert _reserve_version_number(db, PROJECT_ID, "detection", None) == "v3.0"
+
+    assert [call.args[3] for call in lock.call_args_list] == ["v2.0", "v3.0"]
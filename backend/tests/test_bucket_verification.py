@@ -0,0 +1,39 @@
+"""
+Tests for StorageClient.ensure_buckets().
+
+A failed verification must be retried after a backoff instead of marking the
+buckets as verified for the life of the process.
+"""
+
+from unittest.mock import patch
+
+from app.core import storage
+from app.core.storage import StorageClient
+
+
+def test_failed_verification_is_retried_after_backoff():
+    client = StorageClient()
+    now = [1000.0]
+    calls = []
+
+    def ensure():
+        calls.append(now[0])
+        if len(calls) == 1:
+            raise ConnectionError("S3 unreachable")
+
+    with patch.object(client, '_ensure_buckets_exist', side_effect=ensure), \
+            patch.object(storage.time, 'monotonic', side_effect=lambda: now[0]):
+        client.ensure_buckets()
+        assert not client._buckets_verified
+
+        # Within the backoff: no new attempt
+        now[0] += storage.BUCKET_VERIFY_RETRY_SECONDS - 1
+        client.ensure_buckets()
+        assert len(calls) == 1
+
+        now[0] += 1
+        client.ensure_buckets()
+        assert client._buckets_verified and len(calls) == 2
+
+        client.ensure_buckets()
+        assert len(calls) == 2
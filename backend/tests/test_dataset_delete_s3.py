@@ -0,0 +1,77 @@
+"""
+Tests for delete_s3_data() deletion counts.
+
+Snapshot blobs (annotations bucket) are counted separately from exports.
+Dataset files are deleted from the dataset's own storage backend.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from app.core.storage_backends import LOCAL_STORAGE_TYPE, LocalStorageBackend
+from app.services import dataset_delete_service
+from app.services.dataset_delete_service import delete_s3_data
+
+DATASETS_BUCKET = "datasets"
+ANNOTATIONS_BUCKET = "annotations"
+
+
+@pytest.fixture
+def backends(tmp_path):
+    """Local dataset storage plus an S3 stand-in (the default backend)."""
+    backends = {
+        LOCAL_STORAGE_TYPE: LocalStorageBackend(str(tmp_path / "local")),
+        "s3": LocalStorageBackend(str(tmp_path / "s3")),
+    }
+    with patch.object(dataset_delete_service, "storage_client") as storage:
+        storage.datasets_bucket = DATASETS_BUCKET
+        storage.annotations_bucket = ANNOTATIONS_BUCKET
+        storage.get_backend.side_effect = lambda storage_type=None: backends[storage_type or "s3"]
+        yield backends
+
+
+def _put(backend, bucket, keys):
+    for key in keys:
+        backend.put_object(bucket, key, b"x")
+
+
+def _keys(backend, bucket):
+    return {obj.key for obj in backend.list_objects(bucket)}
+
+
+def test_snapshot_blobs_are_counted_separately(backends):
+    s3 = backends["s3"]
+    _put(s3, DATASETS_BUCKET, [
+        "datasets/ds_1/images/a.jpg",
+        "datasets/ds_1/images/b.jpg",
+        "exports/proj_1/detection/v1.0/annotations.json",
+    ])
+    _put(s3, ANNOTATIONS_BUCKET, [
+        "snapshots/proj_1/detection/v1.0/annotations.jsonl.gz",
+        "snapshots/proj_1/detection/v1.0/annotations.jsonl.gz.index",
+        "snapshots/proj_2/detection/v1.0/annotations.jsonl.gz",
+    ])
+
+    counts = delete_s3_data("ds_1", ["proj_1"])
+
+    assert counts == {"dataset_files": 2, "export_files": 1, "snapshot_files": 2}
+    assert _keys(s3, DATASETS_BUCKET) == set()
+    assert _keys(s3, ANNOTATIONS_BUCKET) == {"snapshots/proj_2/detection/v1.0/annotations.jsonl.gz"}
+
+
+def test_local_dataset_files_are_deleted(backends):
+    local, s3 = backends[LOCAL_STORAGE_TYPE], backends["s3"]
+    _put(local, DATASETS_BUCKET, [
+        "datasets/ds_1/images/a.jpg",
+        "datasets/ds_1/thumbnails/128/a.webp",
+        "datasets/ds_1/annotations_detection.json",
+        "datasets/ds_2/images/c.jpg",
+    ])
+    _put(s3, DATASETS_BUCKET, ["datasets/ds_1/images/a.jpg"])  # Same key on another backend
+
+    counts = delete_s3_data("ds_1", [], storage_type=LOCAL_STORAGE_TYPE)
+
+    assert counts["dataset_files"] == 3
+    assert _keys(local, DATASETS_BUCKET) == {"datasets/ds_2/images/c.jpg"}
+    assert _keys(s3, DATASETS_BUCKET) == {"datasets/ds_1/images/a.jpg"}
@@ -0,0 +1,176 @@
+"""
+Tests for the export artifact cache.
+
+The fingerprint must stay equal while the exported content is unchanged and
+change with every annotation, text label and class edit that would change
+the export.
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from app.db.models.labeler import (
+    Annotation,
+    AnnotationProject,
+    ExportArtifact,
+    TextLabel,
+)
+from app.services.export_cache_service import (
+    compute_export_fingerprint,
+    get_cached_export,
+    save_export_artifact,
+)
+
+PROJECT_ID = "proj_1"
+DATASET_ID = "ds_1"
+
+
+@pytest.fixture
+def db(sqlite_db):
+    session = sqlite_db
+
+    # ARRAY columns cannot be bound on SQLite: insert those rows as JSON text
+    session.execute(text(
+        "INSERT INTO datasets (id, name, owner_id, visibility, storage_path, storage_type, format, labeled,"
+        " published_task_types, num_images, is_snapshot, status, integrity_status, version, created_at, updated_at)"
+        " VALUES (:id, 'Cats', 'u1', 'private', 'datasets/ds_1/', 's3', 'dice', 0, '[]', 0, 0, 'active', 'valid', 1,"
+        " :now, :now)"
+    ), {"id": DATASET_ID, "now": datetime(2026, 1, 1)})
+    session.execute(text(
+        "INSERT INTO annotation_projects (id, name, dataset_id, owner_id, task_types, task_config, task_classes,"
+        " created_at) VALUES (:id, 'Cats', :dataset_id, 'u1', '[\"detection\", \"classification\"]', '{}',"
+        " :classes, :now)"
+    ), {
+        "id": PROJECT_ID,
+        "dataset_id": DATASET_ID,
+        "classes": json.dumps({
+            "detection": {"c_cat": {"name": "cat", "order": 0}},
+            "classification": {"c_day": {"name": "day", "order": 0}},
+        }),
+        "now": datetime(2026, 1, 1),
+    })
+    session.add_all([
+        Annotation(
+            id=i + 1, project_id=PROJECT_ID, image_id=f"train/{i:03d}.jpg", annotation_type="bbox",
+            task_type="detection", geometry={"type": "bbox", "bbox": [i, i, 10, 10]}, class_id="c_cat",
+            class_name="cat", created_by="u1", annotation_state="draft" if i == 0 else "confirmed",
+            created_at=datetime(2026, 1, 2), updated_at=datetime(2026, 1, 2, 0, i),
+        )
+        for i in range(5)
+    ])
+    session.commit()
+    return session
+
+
+def _project(db):
+    return db.query(AnnotationProject).filter(AnnotationProject.id == PROJECT_ID).one()
+
+
+def _fingerprint(db, task_type="detection", include_draft=False):
+    db.expire_all()
+    return compute_export_fingerprint(db, _project(db), task_type, include_draft)
+
+
+def test_fingerprint_is_stable_and_keyed(db):
+    fingerprint = _fingerprint(db)
+
+    assert _fingerprint(db) == fingerprint
+    assert len(fingerprint) == 64
+    assert _fingerprint(db, include_draft=True) != fingerprint
+    assert _fingerprint(db, task_type=None) != fingerprint
+    assert _fingerprint(db, task_type="classification") != fingerprint
+
+
+def test_annotation_writes_change_fingerprint(db):
+    before = _fingerprint(db)
+
+    annotation = db.get(Annotation, 3)
+    annotation.geometry = {"type": "bbox", "bbox": [1, 2, 3, 4]}
+    db.commit()
+    edited = _fingerprint(db)
+    assert edited != before
+
+    db.delete(db.get(Annotation, 2))
+    db.commit()
+    deleted = _fingerprint(db)
+    assert deleted != edited
+
+    db.add(Annotation(
+        id=100, project_id=PROJECT_ID, image_id="train/100.jpg", annotation_type="bbox", task_type="detection",
+        geometry={"type": "bbox", "bbox": [0, 0, 1, 1]}, class_id="c_cat", created_by="u1",
+        annotation_state="confirmed",
+    ))
+    db.commit()
+    assert _fingerprint(db) not in (before, edited, deleted)
+
+
+def test_draft_edits_only_change_draft_exports(db):
+    confirmed_only = _fingerprint(db)
+    with_drafts = _fingerprint(db, include_draft=True)
+
+    db.get(Annotation, 1).class_name = "renamed"
+    db.commit()
+
+    assert _fingerprint(db) == confirmed_only
+    assert _fingerprint(db, include_draft=True) != with_drafts
+
+    # Confirming the draft adds it to the confirmed export
+    db.get(Annotation, 1).annotation_state = "confirmed"
+    db.commit()
+    assert _fingerprint(db) != confirmed_only
+
+
+def test_class_and_text_label_edits_change_fingerprint(db):
+    before = _fingerprint(db)
+    classification = _fingerprint(db, task_type="classification")
+
+    # Same write as the class endpoints (bulk update of task_classes)
+    task_classes = dict(_project(db).task_classes)
+    task_classes["detection"] = {"c_cat": {"name": "feline", "order": 0}}
+    db.query(AnnotationProject).filter(AnnotationProject.id == PROJECT_ID).update(
+        {"task_classes": task_classes}, synchronize_session=False
+    )
+    db.commit()
+    renamed = _fingerprint(db)
+    assert renamed != before
+    assert _fingerprint(db, task_type="classification") == classification
+
+    db.add(TextLabel(id=1, project_id=PROJECT_ID, image_id="train/001.jpg", text_content="A cat", created_by=1))
+    db.commit()
+    assert _fingerprint(db) != renamed
+
+
+def test_cached_export_round_trip(db):
+    fingerprint = _fingerprint(db)
+    assert get_cached_export(db, PROJECT_ID, "detection", "coco", False, fingerprint) is None
+
+    save_export_artifact(
+        db, PROJECT_ID, "detection", "coco", False, fingerprint,
+        export_path="exports/proj_1/detection/export_1/annotations_coco.json",
+        annotation_count=4, image_count=4, file_size=123,
+    )
+    artifact = get_cached_export(db, PROJECT_ID, "detection", "coco", False, fingerprint)
+    assert artifact.export_path.endswith("export_1/annotations_coco.json")
+    assert (artifact.annotation_count, artifact.image_count, artifact.file_size) == (4, 4, 123)
+
+    # Other keys and stale fingerprints miss
+    assert get_cached_export(db, PROJECT_ID, "detection", "yolo", False, fingerprint) is None
+    assert get_cached_export(db, PROJECT_ID, "detection", "coco", True, fingerprint) is None
+    assert get_cached_export(db, PROJECT_ID, None, "coco", False, fingerprint) is None
+
+    db.get(Annotation, 4).geometry = {"type": "bbox", "bbox": [0, 0, 2, 2]}
+    db.commit()
+    current = _fingerprint(db)
+    assert get_cached_export(db, PROJECT_ID, "detection", "coco", False, current) is None
+
+    # A new export replaces the artifact of its key
+    save_export_artifact(
+        db, PROJECT_ID, "detection", "coco", False, current,
+        export_path="exports/proj_1/detection/export_2/annotations_coco.json",
+        annotation_count=4, image_count=4, file_size=125,
+    )
+    assert db.query(ExportArtifact).count() == 1
+    assert get_cached_export(db, PROJECT_ID, "detection", "coco", False, current).file_size == 125
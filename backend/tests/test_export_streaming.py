@@ -0,0 +1,296 @@
+"""
+Tests for streaming exports.
+
+Exporters read annotation rows image by image (export_query_service); the
+streamed DICE document must parse to exactly what export_to_dice() returns,
+and publishing copies the uploaded export to the Platform annotations file.
+A single-pass publish (writers fed from the DICE stream) must produce the
+same artifacts and snapshots as separate exports.
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, text
+
+from app.core.json_stream import iter_json_items
+from app.core.storage import StorageClient
+from app.db.models.labeler import (
+    Annotation,
+    AnnotationVersion,
+    ImageAnnotationStatus,
+    ImageMetadata,
+    TextLabel,
+)
+from app.services.annotation_snapshot_service import (
+    AnnotationSnapshotWriter,
+    build_snapshot_data,
+    iter_version_snapshots,
+)
+from app.services.coco_export_service import CocoExportWriter, export_to_coco
+from app.services.dice_export_service import DiceExportStream, export_to_dice, get_export_stats
+from app.services.export_query_service import batched, iter_export_images
+from app.services.yolo_export_service import YoloExportWriter, export_to_yolo
+
+PROJECT_ID = "proj_1"
+DATASET_ID = "ds_1"
+
+
+@pytest.fixture
+def db(sqlite_db):
+    session = sqlite_db
+
+    # ARRAY columns cannot be bound on SQLite: insert those rows as JSON text
+    session.execute(text(
+        "INSERT INTO datasets (id, name, owner_id, visibility, storage_path, storage_type, format, labeled,"
+        " published_task_types, num_images, is_snapshot, status, integrity_status, version, created_at, updated_at)"
+        " VALUES (:id, 'Cats', 'u1', 'private', 'datasets/ds_1/', 's3', 'dice', 0, '[]', 0, 0, 'active', 'valid', 1,"
+        " :now, :now)"
+    ), {"id": DATASET_ID, "now": datetime(2026, 1, 1)})
+    session.execute(text(
+        "INSERT INTO annotation_projects (id, name, dataset_id, owner_id, task_types, task_config, task_classes,"
+        " created_at) VALUES (:id, 'Cats', :dataset_id, 'u1', '[\"detection\"]', '{}', :classes, :now)"
+    ), {
+        "id": PROJECT_ID,
+        "dataset_id": DATASET_ID,
+        "classes": json.dumps({"detection": {
+            "c_cat": {"name": "cat", "color": "#ff0000", "order": 0},
+            "c_dog": {"name": "dog", "order": 1},
+        }}),
+        "now": datetime(2026, 1, 1),
+    })
+
+    annotations = []
+    for i in range(40):
+        image_id = f"train/{i % 12:03d}.jpg"
+        state = "draft" if i % 7 == 0 else "confirmed"
+        if i % 5 == 0:
+            geometry = {"type": "polygon", "points": [[0, 0], [10, 0], [10, 10]]}
+            annotation_type = "polygon"
+        else:
+            geometry = {"type": "bbox", "bbox": [i, i, 10.5, 20], "image_width": 640, "image_height": 480}
+            annotation_type = "bbox"
+        annotations.append(Annotation(
+            id=i + 1, project_id=PROJECT_ID, image_id=image_id, annotation_type=annotation_type,
+            task_type="detection", geometry=geometry, class_id="c_cat" if i % 2 else "c_dog",
+            class_name="cat" if i % 2 else "dog", attributes={"occluded": i % 3 == 0},
+            created_by="u1", annotation_state=state, created_at=datetime(2026, 1, 2, 3, i),
+        ))
+    session.add_all(annotations)
+    session.add_all([
+        TextLabel(id=1, project_id=PROJECT_ID, image_id="train/001.jpg", text_content="A cat", created_by=1),
+        TextLabel(id=2, project_id=PROJECT_ID, image_id="train/002.jpg", label_type="qa", question="Color?",
+                  text_content="Black", created_by=1),
+        TextLabel(id=3, project_id=PROJECT_ID, image_id="train/001.jpg", annotation_id=2, label_type="region",
+                  text_content="Ünïcode ✓ \"tag\"", created_by=1),
+        ImageAnnotationStatus(project_id=PROJECT_ID, image_id="train/001.jpg", task_type="detection",
+                              is_image_confirmed=True, confirmed_at=datetime(2026, 1, 3)),
+        TextLabel(id=4, project_id=PROJECT_ID, image_id="labels_only.jpg", text_content="No boxes", created_by=1),
+        ImageMetadata(id="train/003.jpg", dataset_id=DATASET_ID, file_name="003.jpg", s3_key="k",
+                      size=1, width=1024, height=768, uploaded_at=datetime(2026, 1, 1)),
+    ])
+    session.commit()
+    return session
+
+
+def _without_timestamp(dice_data):
+    return {key: value for key, value in dice_data.items() if key != "last_modified_at"}
+
+
+@pytest.mark.parametrize("include_draft", [False, True])
+def test_stream_matches_export_to_dice(db, include_draft):
+    expected = export_to_dice(
+        db, None, None, PROJECT_ID, include_draft=include_draft, task_type="detection", version="v2.0"
+    )
+
+    stream = DiceExportStream(db, None, PROJECT_ID, include_draft=include_draft, task_type="detection", version="v2.0")
+    data = b"".join(stream)
+
+    assert _without_timestamp(json.loads(data)) == _without_timestamp(expected)
+    assert list(json.loads(data)) == list(expected)
+    assert stream.bytes_written == len(data)
+    assert stream.get_stats() == get_export_stats(expected)
+    assert expected["images"][1]["image_captions"] and expected["images"][2]["vqa_pairs"]
+
+
+def test_missing_project_raises_before_streaming(db):
+    with pytest.raises(ValueError):
+        DiceExportStream(db, None, "missing")
+
+
+def test_publish_copies_uploaded_export(db):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    with moto.mock_aws():
+        client = StorageClient()
+        client._client = boto3.client("s3", region_name="us-east-1")
+        stream = DiceExportStream(db, None, PROJECT_ID, task_type="detection")
+
+        key, _, _ = client.upload_export(PROJECT_ID, "detection", "v1.0", stream, "dice", "annotations.json")
+        platform_key = client.update_platform_annotations(
+            DATASET_ID, "detection", None, "v1.0", export_key=key
+        )
+
+        exported = client.s3_client.get_object(Bucket=client.annotations_bucket, Key=key)["Body"].read()
+        platform = client.s3_client.get_object(Bucket=client.datasets_bucket, Key=platform_key)
+        assert platform["Body"].read() == exported
+        assert platform["Metadata"]["version"] == "v1.0"
+        assert platform["ContentType"] == "application/json"
+        assert len(exported) == stream.bytes_written
+        assert len(list(iter_json_items([exported], paths=("images",)))) == stream.get_stats()["image_count"]
+
+
+def test_iter_export_images_groups_rows(db):
+    images = list(iter_export_images(db, PROJECT_ID, (Annotation.class_id,), include_draft=True))
+
+    assert [image.image_id for image in images] == [f"train/{i:03d}.jpg" for i in range(12)]
+    assert sum(len(image.annotations) for image in images) == 40
+    first = images[1]
+    assert [row.id for row in first.annotations] == [2, 14, 26, 38]
+    assert first.annotations[0]._fields == ("id", "image_id", "class_id")  # Projected, no ORM objects
+    assert [label.id for label in first.text_labels] == [1, 3]
+    assert not images[0].text_labels
+
+
+def test_iter_export_images_text_label_only_images(db):
+    images = list(iter_export_images(db, PROJECT_ID, (), image_ids=["labels_only.jpg", "train/002.jpg"],
+                                     text_label_only_images=True))
+
+    assert [(image.image_id, len(image.annotations), len(image.text_labels)) for image in images] == [
+        ("labels_only.jpg", 0, 1),
+        ("train/002.jpg", 3, 1),  # Draft annotation 15 excluded
+    ]
+    assert not list(iter_export_images(db, PROJECT_ID, (), image_ids=["labels_only.jpg"]))
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
+
+
+def test_coco_export_from_streamed_rows(db):
+    coco = export_to_coco(db, None, PROJECT_ID, task_type="detection")
+
+    images = {image["id"]: image for image in coco["images"]}
+    assert [image["file_name"] for image in coco["images"]] == sorted(image["file_name"] for image in coco["images"])
+    assert images[4]["width"] == 1024  # train/003.jpg: stored dimensions
+    assert all(images[ann["image_id"]]["file_name"] == f"train/{(ann['id'] - 1) % 12:03d}.jpg"
+               for ann in coco["annotations"])
+    # Region label of annotation 2: 1-based position of that annotation in the export
+    position = [ann["id"] for ann in coco["annotations"]].index(2) + 1
+    assert [(r["annotation_id"], r["image_id"]) for r in coco["region_descriptions"]] == [(position, 2)]
+    assert [c["caption"] for c in coco["captions"]] == ["A cat"]
+    assert "labels_only.jpg" not in [image["file_name"] for image in coco["images"]]
+
+
+def test_yolo_export_from_streamed_rows(db):
+    labels, classes_txt, captions, regions, vqa = export_to_yolo(db, PROJECT_ID, task_type="detection")
+
+    assert classes_txt == "cat\ndog"
+    assert sorted(labels) == [f"train/{i:03d}.jpg" for i in range(12)]
+    assert labels["train/001.jpg"].split("\n")[0].startswith("0 ")
+    assert set(captions) == {"train/001.jpg", "labels_only.jpg"}
+    assert json.loads(regions["train/001.jpg"])[0]["annotation_id"] == "2"
+    assert json.loads(vqa["train/002.jpg"])[0]["answer"] == "Black"
+
+
+def _annotation_queries(db):
+    """Record the SELECTs on the annotations table."""
+    statements = []
+
+    @event.listens_for(db.get_bind(), "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith("SELECT") and "FROM annotations" in statement:
+            statements.append(statement)
+
+    return statements
+
+
+@pytest.mark.parametrize("include_draft", [False, True])
+def test_single_pass_publish_matches_separate_exports(db, include_draft):
+    # Other task types are not part of a detection publish
+    db.add(Annotation(
+        id=1000, project_id=PROJECT_ID, image_id="train/000.jpg", annotation_type="classification",
+        task_type="classification", geometry={"type": "classification"}, class_id="c_day",
+        created_by="u1", annotation_state="confirmed",
+    ))
+    db.commit()
+    filters = {"include_draft": include_draft, "task_type": "detection"}
+
+    expected_dice = export_to_dice(db, None, None, PROJECT_ID, version="v1.0", **filters)
+    expected_coco = export_to_coco(db, None, PROJECT_ID, version="v1.0", **filters)
+    expected_yolo = export_to_yolo(db, PROJECT_ID, **filters)
+
+    queries = _annotation_queries(db)
+    snapshots = AnnotationSnapshotWriter(db, project_id=PROJECT_ID, task_type="detection")
+    coco = CocoExportWriter(db, PROJECT_ID, task_type="detection", version="v1.0")
+    yolo = YoloExportWriter(db, PROJECT_ID, task_type="detection")
+    stream = DiceExportStream(db, None, PROJECT_ID, version="v1.0", writers=[snapshots, coco, yolo], **filters)
+    dice = json.loads(b"".join(stream))
+
+    assert len(queries) == 1
+    snapshots.write_members(version_id=7)
+    assert _without_timestamp(dice) == _without_timestamp(expected_dice)
+    coco_data = coco.result()
+    assert coco_data["info"].pop("date_created")
+    assert expected_coco["info"].pop("date_created")
+    assert coco_data == expected_coco
+    assert yolo.result() == expected_yolo
+
+    states = ["confirmed", "verified", "draft"] if include_draft else ["confirmed", "verified"]
+    annotations = db.query(Annotation).filter(
+        Annotation.task_type == "detection", Annotation.annotation_state.in_(states)
+    ).order_by(Annotation.id).all()
+    version = AnnotationVersion(id=7, project_id=PROJECT_ID, task_type="detection")
+    rows = list(iter_version_snapshots(db, version))
+    assert [annotation_id for annotation_id, _ in rows] == [annotation.id for annotation in annotations]
+    assert [snapshot_data for _, snapshot_data in rows] == [
+        json.loads(json.dumps(build_snapshot_data(annotation))) for annotation in annotations
+    ]
+    assert snapshots.changed_count == len(annotations)
+    assert snapshots.annotation_count == len(annotations) == stream.get_stats()["annotation_count"]
+    assert snapshots.image_count == len(dice["images"])
+
+
+def test_separate_exports_query_annotations_per_format(db):
+    queries = _annotation_queries(db)
+
+    b"".join(DiceExportStream(db, None, PROJECT_ID, task_type="detection"))
+    export_to_coco(db, None, PROJECT_ID, task_type="detection")
+    export_to_yolo(db, PROJECT_ID, task_type="detection")
+
+    assert len(queries) == 3
+
+
+@pytest.mark.parametrize("task_type", ["detection", "object_detection"])
+def test_published_set_is_selected_by_task_type_column(db, task_type):
+    # Selection is by Annotation.task_type (not annotation_type / no_object attributes)
+    db.add_all([
+        # no_object marker of the task: published
+        Annotation(id=1001, project_id=PROJECT_ID, image_id="empty.jpg", annotation_type="no_object",
+                   task_type="detection", geometry={}, attributes={"task_type": "detection"},
+                   created_by="u1", annotation_state="confirmed"),
+        # no_object marker whose column says another task: not published
+        Annotation(id=1002, project_id=PROJECT_ID, image_id="other.jpg", annotation_type="no_object",
+                   task_type="classification", geometry={}, attributes={"task_type": "detection"},
+                   created_by="u1", annotation_state="confirmed"),
+        # bbox stored under another task: not published
+        Annotation(id=1003, project_id=PROJECT_ID, image_id="train/000.jpg", annotation_type="bbox",
+                   task_type="segmentation", geometry={"type": "bbox", "bbox": [0, 0, 1, 1]},
+                   class_id="c_cat", created_by="u1", annotation_state="confirmed"),
+    ])
+    db.commit()
+
+    snapshots = AnnotationSnapshotWriter(db, project_id=PROJECT_ID, task_type="detection")
+    b"".join(DiceExportStream(db, None, PROJECT_ID, task_type=task_type, writers=[snapshots]))
+    snapshots.write_members(version_id=7)
+
+    published = [annotation_id for annotation_id, _ in
+                 iter_version_snapshots(db, AnnotationVersion(id=7, project_id=PROJECT_ID, task_type="detection"))]
+    expected = [annotation_id for annotation_id, in db.query(Annotation.id).filter(
+        Annotation.task_type == "detection", Annotation.annotation_state.in_(["confirmed", "verified"])
+    ).order_by(Annotation.id)]
+    assert published == expected
+    assert 1001 in published and 1002 not in published and 1003 not in published
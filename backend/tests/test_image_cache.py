@@ -0,0 +1,320 @@
+"""
+Tests for the image proxy: shared disk LRU cache, HTTP range/conditional
+helpers and the /images endpoint.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import images
+from app.core.file_response import RangeNotSatisfiable, etag_matches, parse_range
+from app.core.image_cache import DiskImageCache
+from app.core.storage import StorageClient
+from app.core.storage_backends import LocalStorageBackend, ObjectNotFoundError, StorageObject
+
+BUCKET = "datasets"
+
+
+def _fetcher(payload, etag="e1", calls=None, delay=0.0):
+    def fetch(out):
+        if calls is not None:
+            calls.append(1)
+        time.sleep(delay)
+        out.write(payload)
+        return StorageObject("k", len(payload), datetime(2025, 1, 1, tzinfo=timezone.utc), etag)
+    return fetch
+
+
+def _read(entry):
+    with entry.file as f:
+        return f.read()
+
+
+# =============================================================================
+# Range / ETag helpers
+# =============================================================================
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-9", (0, 9)),
+    ("bytes=10-", (10, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=50-500", (50, 99)),
+    ("bytes=0-1,5-6", None),  # Multi-range: serve the whole object
+    ("items=0-1", None),
+    ("bytes=9-3", None),
+    ("bytes=abc", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 100)
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', "abc")
+    assert etag_matches('W/"abc"', "abc")
+    assert etag_matches('"x", "abc"', "abc")
+    assert etag_matches("*", "abc")
+    assert not etag_matches('"abcd"', "abc")
+    assert not etag_matches(None, "abc")
+
+
+# =============================================================================
+# DiskImageCache
+# =============================================================================
+
+
+def test_miss_then_hit(tmp_path):
+    cache = DiskImageCache(str(tmp_path), max_bytes=10_000)
+    calls = []
+
+    assert _read(cache.open(BUCKET, "a.png", _fetcher(b"abc", calls=calls))) == b"abc"
+    entry = cache.open(BUCKET, "a.png", _fetcher(b"other", calls=calls))
+
+    assert _read(entry) == b"abc"
+    assert entry.etag == "e1" and entry.size == 3
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bytes"]) == (1, 1, 3)
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_counters_shared_between_instances(tmp_path):
+    DiskImageCache(str(tmp_path), max_bytes=10_000).open(BUCKET, "a.png", _fetcher(b"abc")).file.close()
+    other = DiskImageCache(str(tmp_path), max_bytes=10_000)
+
+    other.open(BUCKET, "a.png", _fetcher(b"never")).file.close()
+
+    assert other.stats()["misses"] == 1
+    assert other.stats()["hits"] == 1
+
+
+def test_missing_object_is_not_cached(tmp_path):
+    cache = DiskImageCache(str(tmp_path), max_bytes=10_000)
+
+    def fetch(out):
+        out.write(b"partial")
+        raise ObjectNotFoundError("k")
+
+    with pytest.raises(ObjectNotFoundError):
+        cache.open(BUCKET, "a.png", fetch)
+    assert os.listdir(tmp_path / "tmp") == []
+    assert _read(cache.open(BUCKET, "a.png", _fetcher(b"abc"))) == b"abc"
+
+
+def test_single_flight_threads(tmp_path):
+    cache = DiskImageCache(str(tmp_path), max_bytes=10_000)
+    calls, results = [], []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        results.append(_read(cache.open(BUCKET, "hot.png", _fetcher(b"x" * 1000, calls=calls, delay=0.2))))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [b"x" * 1000] * 8
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["hits"] == 7 and stats["coalesced"] == 7
+
+
+def _process_worker(root, calls_path, barrier):
+    cache = DiskImageCache(root, max_bytes=10_000)
+
+    def fetch(out):
+        with open(calls_path, "a") as f:
+            f.write("x")
+        time.sleep(0.3)
+        out.write(b"payload")
+        return StorageObject("k", 7, datetime(2025, 1, 1, tzinfo=timezone.utc), "e1")
+
+    barrier.wait()
+    entry = cache.open(BUCKET, "hot.png", fetch)
+    assert _read(entry) == b"payload"
+
+
+def test_single_flight_across_processes(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    barrier = ctx.Barrier(4)
+    calls_path = str(tmp_path / "calls.txt")
+    root = str(tmp_path / "cache")
+    DiskImageCache(root, max_bytes=10_000)  # Create directories up front
+
+    processes = [ctx.Process(target=_process_worker, args=(root, calls_path, barrier)) for _ in range(4)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(timeout=30)
+
+    assert [p.exitcode for p in processes] == [0] * 4
+    assert open(calls_path).read() == "x"
+    stats = DiskImageCache(root, max_bytes=10_000).stats()
+    assert (stats["misses"], stats["hits"]) == (1, 3)
+
+
+def test_lru_eviction(tmp_path):
+    clock = [1_700_000_000.0]
+    cache = DiskImageCache(str(tmp_path), max_bytes=350, revalidate_seconds=0, now=lambda: clock[0])
+
+    for name in ("a", "b", "c"):
+        cache.open(BUCKET, name, _fetcher(b"x" * 100)).file.close()
+        clock[0] += 120
+    # Touch "a" so "b" becomes the least recently used entry
+    cache.open(BUCKET, "a", _fetcher(b"never")).file.close()
+    clock[0] += 120
+
+    cache.open(BUCKET, "d", _fetcher(b"x" * 100)).file.close()  # 400 > 350 -> evict down to 315
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 300
+    calls = []
+    for name in ("a", "c", "d"):
+        cache.open(BUCKET, name, _fetcher(b"new", calls=calls)).file.close()
+    assert calls == []
+    assert _read(cache.open(BUCKET, "b", _fetcher(b"refetched"))) == b"refetched"
+
+
+def test_revalidation(tmp_path):
+    clock = [1_700_000_000.0]
+    cache = DiskImageCache(str(tmp_path), max_bytes=10_000, revalidate_seconds=60, now=lambda: clock[0])
+    cache.open(BUCKET, "a.png", _fetcher(b"v1", etag="e1")).file.close()
+    same = StorageObject("a.png", 2, datetime(2025, 1, 1, tzinfo=timezone.utc), "e1")
+    changed = same._replace(etag="e2")
+
+    clock[0] += 120
+    entry = cache.open(BUCKET, "a.png", _fetcher(b"v2", etag="e2"), validate=lambda: same)
+    assert _read(entry) == b"v1"
+
+    clock[0] += 120
+    entry = cache.open(BUCKET, "a.png", _fetcher(b"v2", etag="e2"), validate=lambda: changed)
+    assert (_read(entry), entry.etag) == (b"v2", "e2")
+    assert cache.stats()["bytes"] == 2  # Old version removed
+
+    clock[0] += 120
+    with pytest.raises(ObjectNotFoundError):
+        cache.open(BUCKET, "a.png", _fetcher(b"v3"), validate=lambda: None)
+    assert cache.stats()["revalidations"] == 3
+
+
+# =============================================================================
+# Endpoint
+# =============================================================================
+
+
+@pytest.fixture
+def proxy(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path / "storage"))
+    cache = DiskImageCache(str(tmp_path / "cache"), max_bytes=10 * 1024 * 1024)
+    app = FastAPI()
+    app.include_router(images.router, prefix="/images")
+    storage = StorageClient()
+
+    with patch.object(images.settings, "IMAGE_PROXY_ENABLED", True), \
+            patch.object(images.settings, "IMAGE_PROXY_URL_BASE", "/images"), \
+            patch.object(images, "storage_client", storage), \
+            patch.object(images, "_get_backend", return_value=backend), \
+            patch.object(images, "get_image_cache", return_value=cache):
+        payload = bytes(range(256)) * 8000  # ~2 MB, larger than one chunk
+        key = "datasets/ds_1/images/train/001.png"
+        backend.put_object(BUCKET, key, payload)
+        url = storage.generate_presigned_urls(BUCKET, [key])[key]
+        yield TestClient(app), url, payload, cache, backend
+
+
+def test_proxy_urls_only_for_originals():
+    storage = StorageClient()
+    with patch.object(images.settings, "IMAGE_PROXY_ENABLED", True), \
+            patch.object(images.settings, "IMAGE_PROXY_URL_BASE", "/api/v1/images"):
+        urls = storage._proxy_image_urls(
+            ["datasets/ds_1/images/a b.png", "datasets/ds_1/thumbnails/a.jpg"], 3600
+        )
+
+    assert list(urls) == ["datasets/ds_1/images/a b.png"]
+    assert urls["datasets/ds_1/images/a b.png"].startswith("/api/v1/images/ds_1/a%20b.png?expires=")
+
+
+def test_proxy_serves_and_caches(proxy):
+    client, url, payload, cache, _ = proxy
+
+    first = client.get(url)
+    second = client.get(url)
+
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content == payload
+    assert first.headers["content-type"] == "image/png"
+    assert first.headers["accept-ranges"] == "bytes"
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 1
+
+
+def test_proxy_range_requests(proxy):
+    client, url, payload, _, _ = proxy
+
+    partial = client.get(url, headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206
+    assert partial.content == payload[100:200]
+    assert partial.headers["content-range"] == f"bytes 100-199/{len(payload)}"
+
+    suffix = client.get(url, headers={"Range": "bytes=-10"})
+    assert suffix.content == payload[-10:]
+
+    assert client.get(url, headers={"Range": f"bytes={len(payload)}-"}).status_code == 416
+
+
+def test_proxy_if_none_match(proxy):
+    client, url, _, _, backend = proxy
+    etag = client.get(url).headers["etag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert client.get(url, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_proxy_rejects_bad_signature(proxy):
+    client, url, _, _, _ = proxy
+
+    assert client.get(url.replace("001.png", "002.png")).status_code == 403
+    assert client.get(url.split("&signature=")[0] + "&signature=00").status_code == 403
+
+
+def test_proxy_missing_image(proxy):
+    client, url, _, _, backend = proxy
+    backend.delete_objects(BUCKET, ["datasets/ds_1/images/train/001.png"])
+
+    assert client.get(url).status_code == 404
+
+
+def test_proxy_streams_without_cache(proxy):
+    client, url, payload, _, _ = proxy
+
+    with patch.object(images, "get_image_cache", return_value=None):
+        full = client.get(url)
+        partial = client.get(url, headers={"Range": "bytes=5-9"})
+        not_modified = client.get(url, headers={"If-None-Match": full.headers["etag"]})
+
+    assert full.content == payload
+    assert (partial.status_code, partial.content) == (206, payload[5:10])
+    assert not_modified.status_code == 304
@@ -0,0 +1,150 @@
+"""
+Tests for header-only image dimension probing and the dimension backfill.
+"""
+
+import io
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.storage_backends import LocalStorageBackend
+from app.db.models.labeler import ImageMetadata
+from app.services import image_dimension_service
+from app.services.coco_export_service import _build_images
+from app.services.image_dimension_service import (
+    backfill_dataset_dimensions,
+    get_image_dimensions,
+    probe_dimensions,
+    probe_object_dimensions,
+)
+
+BUCKET = "datasets"
+UPLOADED_AT = datetime(2024, 1, 1)
+
+
+def _image(fmt, size=(64, 48), **save_args) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (10, 20, 30)).save(buffer, fmt, **save_args)
+    return buffer.getvalue()
+
+
+def _rotated_jpeg(size=(64, 48)) -> bytes:
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotate 90 CW when displayed
+    return _image("JPEG", size, exif=exif)
+
+
+@pytest.mark.parametrize("fmt", ["PNG", "JPEG", "WEBP", "TIFF", "BMP", "GIF"])
+def test_probe_formats(fmt):
+    assert probe_dimensions(_image(fmt, (123, 45))) == (123, 45)
+
+
+def test_probe_follows_exif_orientation():
+    assert probe_dimensions(_rotated_jpeg((64, 48))) == (48, 64)
+
+
+def test_probe_never_decodes_pixels(tmp_path):
+    path = tmp_path / "a.png"
+    path.write_bytes(_image("PNG", (300, 200)))
+    jpeg = _rotated_jpeg((300, 200))
+
+    with patch.object(Image.Image, "load", side_effect=AssertionError("decoded")):
+        assert probe_dimensions(str(path)) == (300, 200)
+        assert probe_dimensions(jpeg) == (200, 300)
+
+
+def test_probe_rejects_non_images():
+    assert probe_dimensions(b"not an image") is None
+    assert probe_dimensions(b"") is None
+
+
+def test_probe_object_reads_only_the_header(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path))
+    # Large JPEG: the header is at the start, the scan data is not needed
+    big = _image("JPEG", (2000, 1500), quality=100) + b"\0" * (256 * 1024)
+    backend.put_object(BUCKET, "big.jpg", big)
+    reads = []
+    original_open = backend.open_object
+
+    def open_object(bucket, key, byte_range=None):
+        reads.append(byte_range)
+        return original_open(bucket, key, byte_range=byte_range)
+
+    with patch.object(backend, "open_object", side_effect=open_object), \
+            patch.object(backend, "get_object", side_effect=AssertionError("full read")):
+        assert probe_object_dimensions(backend, BUCKET, "big.jpg") == (2000, 1500)
+
+    assert reads == [(0, 64 * 1024 - 1)]
+
+
+def test_probe_object_falls_back_to_full_object(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path))
+    # APP segment padding pushes the SOF marker beyond the probed head
+    exif = Image.Exif()
+    exif[0x010E] = "x" * 60000  # ImageDescription
+    jpeg = _image("JPEG", (80, 60), exif=exif.tobytes(), icc_profile=b"\0" * 70000)
+    backend.put_object(BUCKET, "padded.jpg", jpeg)
+
+    with patch.object(image_dimension_service.settings, "IMAGE_PROBE_HEAD_KB", 1):
+        assert probe_object_dimensions(backend, BUCKET, "padded.jpg") == (80, 60)
+    assert probe_object_dimensions(backend, BUCKET, "missing.jpg") is None
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    ImageMetadata.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _add(db, image_id, dataset_id="ds_1", width=None, height=None):
+    db.add(ImageMetadata(
+        id=image_id, dataset_id=dataset_id, file_name=image_id,
+        s3_key=f"datasets/{dataset_id}/images/{image_id}", size=1, width=width, height=height,
+        last_modified=UPLOADED_AT
+    ))
+
+
+def test_backfill_dataset_dimensions(db, tmp_path):
+    backend = LocalStorageBackend(str(tmp_path))
+    for i in range(7):
+        _add(db, f"{i}.png")
+        backend.put_object(BUCKET, f"datasets/ds_1/images/{i}.png", _image("PNG", (10 + i, 20)))
+    _add(db, "broken.png")
+    backend.put_object(BUCKET, "datasets/ds_1/images/broken.png", b"garbage")
+    _add(db, "known.png", width=1, height=2)
+    _add(db, "other.png", dataset_id="ds_2")
+    db.commit()
+    batches = []
+
+    with patch.object(image_dimension_service.storage_client, "get_backend", return_value=backend):
+        updated, failed = backfill_dataset_dimensions(
+            db, SimpleNamespace(id="ds_1", storage_type="local"), workers=4, batch_size=3,
+            progress=lambda *counts: batches.append(counts)
+        )
+
+    assert (updated, failed) == (7, 1)
+    assert len(batches) == 3
+    dimensions = get_image_dimensions(db, "ds_1")
+    assert dimensions["3.png"] == (13, 20)
+    assert dimensions["known.png"] == (1, 2)  # Already known: not probed again
+    assert "broken.png" not in dimensions
+    assert get_image_dimensions(db, "ds_2") == {}
+    assert get_image_dimensions(db, "ds_1", ["0.png", "missing.png"]) == {"0.png": (10, 20)}
+    # Probed rows count as modified (export fingerprints), the others do not
+    assert db.get(ImageMetadata, "3.png").last_modified > UPLOADED_AT
+    assert db.get(ImageMetadata, "known.png").last_modified == UPLOADED_AT
+
+
+def test_coco_images_use_stored_dimensions():
+    images = _build_images(["a.png", "b.png"], {"a.png": (640, 480)})
+
+    assert [(image["width"], image["height"]) for image in images] == [(640, 480), (0, 0)]
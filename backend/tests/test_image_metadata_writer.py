@@ -0,0 +1,134 @@
+"""
+Tests for bulk ImageMetadata upserts (ImageMetadataWriter).
+
+Runs against an in-memory SQLite image_metadata table; the PostgreSQL COPY
+path is covered by its text encoding and the benchmark script.
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.models.labeler import ImageMetadata
+from app.services import image_metadata_writer
+from app.services.image_metadata_writer import ImageMetadataWriter, _copy_line
+
+T0 = datetime(2025, 1, 1, 12, 0, 0)
+T1 = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def _row(image_id, dataset_id="ds_1", size=100, at=T0, **extra):
+    return {
+        "id": image_id,
+        "dataset_id": dataset_id,
+        "file_name": image_id.split("/")[-1],
+        "s3_key": f"datasets/{dataset_id}/images/{image_id}",
+        "folder_path": image_id.rsplit("/", 1)[0] if "/" in image_id else None,
+        "size": size,
+        "uploaded_at": at,
+        "last_modified": at,
+        **extra,
+    }
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    ImageMetadata.__table__.create(engine)
+    return engine
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _statements(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_batches_rows(db, engine):
+    statements = _statements(engine)
+
+    with ImageMetadataWriter(db, batch_size=4) as writer:
+        for i in range(10):
+            writer.add(_row(f"train/{i:03d}.png"))
+        assert db.query(ImageMetadata).count() == 8  # Two full batches already committed
+
+    inserts = [s for s in statements if s.startswith("INSERT")]
+    assert len(inserts) == 3
+    assert writer.rows_written == 10
+    assert db.query(ImageMetadata).count() == 10
+
+
+def test_reupload_updates_existing_rows(db):
+    ImageMetadataWriter(db).write([_row("a.png", size=100, width=640, height=480), _row("b.png")])
+
+    written = ImageMetadataWriter(db).write([_row("a.png", size=250, at=T1), _row("c.png")])
+
+    assert written == 2
+    a = db.get(ImageMetadata, "a.png")
+    db.refresh(a)
+    assert a.size == 250
+    assert a.last_modified == T1
+    assert a.uploaded_at == T0  # First upload time is kept
+    assert (a.width, a.height) == (640, 480)  # Unknown dimensions do not erase known ones
+    assert db.query(ImageMetadata).count() == 3
+
+
+def test_duplicate_ids_in_one_batch_keep_last(db):
+    with ImageMetadataWriter(db, batch_size=100) as writer:
+        writer.add(_row("a.png", size=1))
+        writer.add(_row("a.png", size=2))
+
+    assert writer.rows_written == 1
+    assert db.get(ImageMetadata, "a.png").size == 2
+
+
+def test_other_dataset_rows_are_not_overwritten(db):
+    ImageMetadataWriter(db).write([_row("shared.png", dataset_id="ds_1", size=1)])
+    writer = ImageMetadataWriter(db)
+
+    written = writer.write([_row("shared.png", dataset_id="ds_2", size=2), _row("own.png", dataset_id="ds_2")])
+
+    assert (written, writer.rows_skipped) == (1, 1)
+    shared = db.get(ImageMetadata, "shared.png")
+    assert (shared.dataset_id, shared.size) == ("ds_1", 1)
+
+
+def test_large_batches_are_chunked(db, monkeypatch):
+    monkeypatch.setattr(image_metadata_writer, "INSERT_CHUNK_ROWS", 7)
+
+    written = ImageMetadataWriter(db).write(_row(f"{i}.png") for i in range(50))
+
+    assert written == 50
+    assert db.query(ImageMetadata).count() == 50
+
+
+def test_failed_batch_rolls_back(db):
+    bad = _row("bad.png")
+    bad["file_name"] = None  # NOT NULL
+
+    with pytest.raises(Exception):
+        ImageMetadataWriter(db).write([_row("ok.png"), bad])
+
+    assert db.query(ImageMetadata).count() == 0
+
+
+def test_copy_line_encoding():
+    row = image_metadata_writer._normalize(_row("dir/a\tb\\c.png", at=T0))
+    row["folder_path"] = None
+
+    fields = _copy_line(row).rstrip("\n").split("\t")
+
+    assert len(fields) == len(image_metadata_writer.COLUMNS)
+    assert fields[0] == "dir/a\\tb\\\\c.png"
+    assert fields[4] == "\\N"
+    assert fields[-1] == "2025-01-01 12:00:00"
@@ -0,0 +1,58 @@
+"""
+Tests for sign_image_urls(): batch signing with per-image fallback.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from app.services import image_url_service
+from app.services.image_url_service import sign_image_urls
+
+
+@pytest.fixture
+def storage():
+    with patch.object(image_url_service, "storage_client") as storage:
+        storage.generate_presigned_url.side_effect = lambda bucket, key, expiration, storage_type: f"single/{key}"
+        yield storage
+
+
+def test_batch_signed_urls_are_used(storage):
+    storage.generate_presigned_urls.side_effect = lambda bucket, keys, expiration, storage_type: {
+        key: f"batch/{key}" for key in keys
+    }
+
+    signed = sign_image_urls([("a.png", "thumb/a.webp"), ("b.png", None)], storage_type="local")
+
+    assert signed == {"a.png": ("batch/a.png", "batch/thumb/a.webp"), "b.png": ("batch/b.png", None)}
+    assert storage.generate_presigned_urls.call_args.kwargs["storage_type"] == "local"
+    storage.generate_presigned_url.assert_not_called()
+
+
+def test_keys_missing_from_batch_are_signed_one_by_one(storage):
+    storage.generate_presigned_urls.side_effect = lambda bucket, keys, expiration, storage_type: {"a.png": "batch/a.png"}
+
+    signed = sign_image_urls([("a.png", "thumb/a.webp"), ("b.png", None)])
+
+    assert signed == {"a.png": ("batch/a.png", "single/thumb/a.webp"), "b.png": ("single/b.png", None)}
+
+
+def test_failed_batch_only_drops_unsignable_images(storage):
+    storage.generate_presigned_urls.side_effect = Exception("batch signing failed")
+
+    def sign(bucket, key, expiration, storage_type):
+        if key in ("b.png", "thumb/a.webp"):
+            raise Exception("signing failed")
+        return f"single/{key}"
+
+    storage.generate_presigned_url.side_effect = sign
+
+    signed = sign_image_urls([("a.png", "thumb/a.webp"), ("b.png", None), ("c.png", None)])
+
+    # A thumbnail that cannot be signed is optional
+    assert signed == {"a.png": ("single/a.png", None), "c.png": ("single/c.png", None)}
+
+
+def test_empty_page(storage):
+    assert sign_image_urls([]) == {}
+    storage.generate_presigned_urls.assert_not_called()
@@ -0,0 +1,392 @@
+"""
+Tests for the concurrent dataset ingestion pipeline.
+
+Runs the real upload service against the local storage backend and an
+in-memory SQLite image_metadata table.
+"""
+
+import asyncio
+import io
+import os
+import threading
+import time
+import zipfile
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.datastructures import UploadFile
+
+from app.core.storage_backends import LocalStorageBackend
+from app.db.models.labeler import ImageMetadata, ThumbnailJob
+from app.services import dataset_upload_service, thumbnail_queue_service
+from app.services.ingest_pipeline import IngestItem, IngestPipeline
+from app.services.thumbnail_queue_service import ThumbnailWorker
+
+BUCKET = "datasets"
+DATASET_ID = "ds_ingest"
+
+
+def _png(color=(255, 0, 0), size=(64, 48)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _upload(name: str, content: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(content), filename=name)
+
+
+def _zip(members) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    ImageMetadata.__table__.create(engine)
+    ThumbnailJob.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path))
+    settings = dataset_upload_service.settings
+    with patch.object(dataset_upload_service.storage_client, "get_backend", return_value=backend), \
+            patch.object(dataset_upload_service.storage_client, "update_dataset_manifest", return_value=False), \
+            patch.object(settings, "INGEST_METADATA_BATCH_SIZE", 3):
+        yield backend
+
+
+async def test_upload_files_and_zip(db, backend):
+    image = _png()
+    files = [
+        _upload("train/cat/001.png", image),
+        _upload("train/cat/002.png", image),
+        _upload("notes.txt", b"not an image"),
+        _upload("extra.zip", _zip({
+            "val/dog/010.png": image,
+            "val/dog/011.jpg": image,
+            "val/__MACOSX/._010.png": b"junk",
+            "val/readme.md": b"skip",
+        })),
+        _upload("flat.png", image),
+    ]
+
+    result = await dataset_upload_service.upload_files_to_s3(DATASET_ID, files, db)
+
+    assert (result.images_count, result.new_images) == (5, 5)
+    assert result.total_bytes == 5 * len(image)
+    assert result.folder_structure == {"train/cat": 2, "val/dog": 2}
+    rows = {row.id: row for row in db.query(ImageMetadata).all()}
+    assert sorted(rows) == ["flat.png", "train/cat/001.png", "train/cat/002.png", "val/dog/010.png", "val/dog/011.jpg"]
+    assert rows["val/dog/010.png"].s3_key == f"datasets/{DATASET_ID}/images/val/dog/010.png"
+    assert rows["val/dog/010.png"].folder_path == "val/dog"
+    assert rows["flat.png"].folder_path is None
+    assert (rows["val/dog/011.jpg"].width, rows["val/dog/011.jpg"].height) == (64, 48)
+
+    assert backend.get_object(BUCKET, f"datasets/{DATASET_ID}/images/train/cat/001.png") == image
+
+    assert set(result.stage_stats) == {"read", "hash", "upload", "metadata", "total"}
+    assert result.duplicates_skipped == 4  # Same image under five names: stored once, copied four times
+    assert result.stage_stats["upload"]["items"] == 5
+    assert result.stage_stats["metadata"]["items"] == 5
+
+
+async def test_zip_upload_updates_manifest(db, backend):
+    members = {f"img_{i:03d}.png": _png((i, i, i)) for i in range(7)}
+
+    with patch.object(dataset_upload_service, "_update_manifest") as update_manifest:
+        result = await dataset_upload_service.upload_zip_with_structure(
+            DATASET_ID, _upload("all.zip", _zip(members)), db
+        )
+
+    assert result.images_count == 7
+    assert db.query(ImageMetadata).count() == 7
+    entries = update_manifest.call_args[0][1]
+    assert sorted(entry.key for entry in entries) == sorted(members)
+
+
+class SlowBackend(LocalStorageBackend):
+    """Records how many put_object calls run concurrently."""
+
+    def __init__(self, root, delay):
+        super().__init__(root)
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def put_object(self, bucket, key, data, content_type=None):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            return super().put_object(bucket, key, data, content_type)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _item(i):
+    return IngestItem(
+        image_id=f"{i}.png", s3_key=f"datasets/{DATASET_ID}/images/{i}.png",
+        file_name=f"{i}.png", folder_path=None, content_type="image/png"
+    )
+
+
+async def test_backpressure_and_concurrency(db, tmp_path):
+    backend = SlowBackend(str(tmp_path), delay=0.05)
+    in_flight_at_submit = []
+
+    async with IngestPipeline(
+        DATASET_ID, db, backend, upload_workers=8, max_in_flight=4, batch_size=10
+    ) as pipeline:
+        for i in range(20):
+            await pipeline.submit(_item(i), f"not an image {i}".encode())
+            in_flight_at_submit.append(4 - pipeline._slots._value)
+
+    assert max(in_flight_at_submit) <= 4
+    assert 1 < backend.peak <= 4
+    assert pipeline.result().images_count == 20
+    assert db.query(ImageMetadata).count() == 20
+    assert db.query(ThumbnailJob).count() == 20
+
+
+async def test_event_loop_stays_responsive(db, tmp_path):
+    backend = SlowBackend(str(tmp_path), delay=0.1)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    task = asyncio.create_task(ticker())
+    async with IngestPipeline(
+        DATASET_ID, db, backend, upload_workers=2, max_in_flight=2
+    ) as pipeline:
+        for i in range(6):
+            await pipeline.submit(_item(i), f"x{i}".encode())
+    task.cancel()
+
+    gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+    assert len(ticks) > 10
+    assert max(gaps) < 0.09  # Never stalled for a whole put_object
+
+
+async def test_upload_failure_propagates(db, tmp_path):
+    class FailingBackend(LocalStorageBackend):
+        def put_object(self, bucket, key, data, content_type=None):
+            if key.endswith("/3.png"):
+                raise RuntimeError("storage down")
+            return super().put_object(bucket, key, data, content_type)
+
+    with pytest.raises(RuntimeError, match="storage down"):
+        async with IngestPipeline(
+            DATASET_ID, db, FailingBackend(str(tmp_path)), max_in_flight=2, batch_size=100
+        ) as pipeline:
+            for i in range(10):
+                await pipeline.submit(_item(i), f"x{i}".encode())
+
+    assert db.query(ImageMetadata).count() == 0
+    assert db.query(ThumbnailJob).count() == 0
+
+
+async def test_upload_only_enqueues_thumbnails(db, backend):
+    image = _png(size=(800, 600))
+    with patch.object(thumbnail_queue_service, "create_thumbnail_pyramid", side_effect=AssertionError("inline")):
+        result = await dataset_upload_service.upload_files_to_s3(
+            DATASET_ID, [_upload("a/1.png", image), _upload("2.png", image)], db
+        )
+
+    assert result.images_count == 2
+    assert {row.thumbnail_sizes for row in db.query(ImageMetadata)} == {""}  # Listings use the original
+    assert sorted(job.image_id for job in db.query(ThumbnailJob)) == ["2.png", "a/1.png"]
+    assert not backend.exists(BUCKET, f"datasets/{DATASET_ID}/thumbnails/512/a/1.webp")
+
+    worker = ThumbnailWorker(session_factory=sessionmaker(bind=db.get_bind()), threads=2)
+    with patch.object(ThumbnailWorker, "_backend", return_value=backend):
+        assert worker.drain() == 2
+
+    db.expire_all()
+    assert db.query(ThumbnailJob).count() == 0
+    assert db.get(ImageMetadata, "a/1.png").thumbnail_sizes == "128,512,1024"
+    thumbnail = backend.get_object(BUCKET, f"datasets/{DATASET_ID}/thumbnails/512/a/1.webp")
+    assert Image.open(io.BytesIO(thumbnail)).size == (512, 384)
+
+
+def _drain_thumbnails(db, backend):
+    worker = ThumbnailWorker(session_factory=sessionmaker(bind=db.get_bind()), threads=2)
+    with patch.object(ThumbnailWorker, "_backend", return_value=backend):
+        return worker.drain()
+
+
+async def test_reupload_of_unchanged_folder_is_skipped(db, backend):
+    images = {f"set/{i}.png": _png(color=(i, 0, 0)) for i in range(3)}
+    await dataset_upload_service.upload_files_to_s3(
+        DATASET_ID, [_upload(name, data) for name, data in images.items()], db
+    )
+    _drain_thumbnails(db, backend)
+    first_hash = db.get(ImageMetadata, "set/0.png").content_hash
+
+    changed = _png(color=(0, 0, 255))
+    with patch.object(backend, "put_object", wraps=backend.put_object) as put_object:
+        result = await dataset_upload_service.upload_files_to_s3(
+            DATASET_ID,
+            [_upload(name, data) for name, data in images.items()] + [_upload("set/1.png", changed)],
+            db
+        )
+
+    # Only the file whose content changed is stored again
+    assert [c.args[1] for c in put_object.call_args_list] == [f"datasets/{DATASET_ID}/images/set/1.png"]
+    # A replacement, not a new image
+    assert (result.images_count, result.new_images, result.duplicates_skipped) == (1, 0, 3)
+    db.expire_all()
+    assert db.get(ImageMetadata, "set/0.png").content_hash == first_hash
+    assert db.get(ImageMetadata, "set/1.png").thumbnail_sizes == ""
+    assert [job.image_id for job in db.query(ThumbnailJob)] == ["set/1.png"]
+
+
+async def test_reupload_of_legacy_rows_is_not_counted_as_new(db, backend):
+    images = {f"legacy/{i}.png": _png(color=(0, i, 0)) for i in range(2)}
+    await dataset_upload_service.upload_files_to_s3(
+        DATASET_ID, [_upload(name, data) for name, data in images.items()], db
+    )
+    # Rows ingested before content hashes existed
+    db.query(ImageMetadata).update({ImageMetadata.content_hash: None})
+    db.commit()
+
+    result = await dataset_upload_service.upload_files_to_s3(
+        DATASET_ID, [_upload(name, data) for name, data in images.items()] + [_upload("legacy/new.png", _png())], db
+    )
+
+    assert (result.images_count, result.new_images, result.duplicates_skipped) == (3, 1, 0)
+    assert db.query(ImageMetadata).count() == 3
+
+
+async def test_duplicate_elsewhere_is_copied_with_thumbnails(db, backend):
+    image = _png(size=(800, 600))
+    await dataset_upload_service.upload_files_to_s3(DATASET_ID, [_upload("a/1.png", image)], db)
+    assert _drain_thumbnails(db, backend) == 1
+
+    with patch.object(backend, "copy_object", wraps=backend.copy_object) as copy_object:
+        result = await dataset_upload_service.upload_files_to_s3(DATASET_ID, [_upload("b/copy.png", image)], db)
+
+    assert (result.images_count, result.new_images, result.duplicates_skipped) == (1, 1, 1)
+    assert copy_object.call_count == 4  # Original + three pyramid levels, no PUT or decode
+    row = db.get(ImageMetadata, "b/copy.png")
+    assert (row.width, row.height, row.thumbnail_sizes) == (800, 600, "128,512,1024")
+    assert row.content_hash == db.get(ImageMetadata, "a/1.png").content_hash
+    assert db.query(ThumbnailJob).count() == 0
+    assert backend.get_object(BUCKET, f"datasets/{DATASET_ID}/images/b/copy.png") == image
+    assert backend.exists(BUCKET, f"datasets/{DATASET_ID}/thumbnails/512/b/copy.webp")
+
+
+# =============================================================================
+# Streaming ZIP ingestion
+# =============================================================================
+
+
+def _spooled_upload(name: str, write_members) -> UploadFile:
+    """UploadFile backed by a SpooledTemporaryFile, like Starlette's multipart parser."""
+    import tempfile
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    with zipfile.ZipFile(spooled, "w") as zf:
+        write_members(zf)
+    spooled.seek(0)
+    return UploadFile(spooled, filename=name)
+
+
+async def test_zip64_members_and_progress(db, backend):
+    image = _png()
+
+    def write_members(zf):
+        for i in range(4):
+            with zf.open(f"zip64/{i}.png", "w", force_zip64=True) as member:
+                member.write(image)
+        zf.writestr("../escape.png", image)
+        zf.writestr("/abs.png", image)
+
+    events = []
+    result = await dataset_upload_service.upload_zip_with_structure(
+        DATASET_ID, _spooled_upload("big.zip", write_members), db, progress=events.append
+    )
+
+    assert result.images_count == 4
+    assert sorted(row.id for row in db.query(ImageMetadata).all()) == [f"zip64/{i}.png" for i in range(4)]
+    assert [event.completed for event in events] == [1, 2, 3, 4]
+    assert {event.member for event in events} == {f"zip64/{i}.png" for i in range(4)}
+    assert events[-1].bytes_completed == events[-1].bytes_total == 4 * len(image)
+    assert all(event.total == 4 for event in events)
+
+
+async def test_large_members_are_spooled_to_disk(db, backend, tmp_path):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    large = _png(size=(1200, 900)) + b"\0" * (2 * 1024 * 1024)  # PNG with trailing padding
+    seen_sizes = []
+
+    def write_members(zf):
+        zf.writestr("large.png", large, compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("small.png", _png())
+
+    original_put = backend.put_object
+
+    def put_object(bucket, key, data, content_type=None):
+        seen_sizes.append((key, type(data).__name__))
+        return original_put(bucket, key, data, content_type)
+
+    settings = dataset_upload_service.settings
+    with patch.object(settings, "INGEST_SPOOL_THRESHOLD_MB", 1), \
+            patch.object(settings, "INGEST_SPOOL_DIR", str(spool_dir)), \
+            patch.object(backend, "put_object", side_effect=put_object):
+        result = await dataset_upload_service.upload_zip_with_structure(
+            DATASET_ID, _spooled_upload("large.zip", write_members), db
+        )
+
+    assert result.images_count == 2
+    assert backend.get_object(BUCKET, f"datasets/{DATASET_ID}/images/large.png") == large
+    assert db.get(ImageMetadata, "large.png").width == 1200  # Probed from the spooled file
+    types = dict(seen_sizes)
+    assert types[f"datasets/{DATASET_ID}/images/large.png"] == "BufferedReader"  # Streamed from the temp file
+    assert types[f"datasets/{DATASET_ID}/images/small.png"] == "bytes"
+    assert list(spool_dir.iterdir()) == []  # Temp files removed
+
+
+async def test_zip_ingest_memory_is_bounded(db, backend):
+    import tracemalloc
+
+    member_size = 512 * 1024
+    count = 40  # 20 MB of members
+
+    def write_members(zf):
+        for i in range(count):
+            zf.writestr(f"m/{i}.png", os.urandom(member_size))
+
+    upload = _spooled_upload("many.zip", write_members)
+    settings = dataset_upload_service.settings
+    tracemalloc.start()
+    try:
+        with patch.object(settings, "INGEST_MAX_IN_FLIGHT", 4):
+            result = await dataset_upload_service.upload_zip_with_structure(DATASET_ID, upload, db)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert result.images_count == count
+    assert peak < 12 * member_size  # A handful of members, never the whole archive
@@ -0,0 +1,89 @@
+"""
+Tests for the incremental JSON reader and writer.
+
+Streaming results must match json.loads for any chunking of the input, and
+written documents must parse to what json.dumps would have produced.
+"""
+
+import json
+
+import pytest
+
+from app.core.json_stream import StreamedArray, iter_json_items, iter_json_object
+
+DICE_DOC = {
+    "format_version": "1.0",
+    "info": {"description": "Ünïcode ✓ \"quoted\" \\ path", "year": 2025},
+    "categories": [{"id": 1, "name": "cat"}, {"id": 2, "name": "dog"}],
+    "annotations": [{"id": i, "image_id": i % 3, "bbox": [1.5, 2, 3e2, -4]} for i in range(20)],
+    "images": [
+        {"id": i, "file_name": f"train/한글/{i:03d}.png", "width": 640, "height": 480,
+         "annotations": [{"category_id": 1, "bbox": [0, 0, 10, 10]}] * (i % 3)}
+        for i in range(25)
+    ],
+    "count": 12345,
+    "empty": [],
+    "flag": None,
+}
+
+
+def _chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 100000])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_items_match_json_loads(chunk_size, indent):
+    data = json.dumps(DICE_DOC, indent=indent, ensure_ascii=False).encode("utf-8")
+
+    items = list(iter_json_items(_chunks(data, chunk_size), paths=("images", "categories", "count", "empty")))
+
+    assert [item for path, item in items if path == "images"] == DICE_DOC["images"]
+    assert [item for path, item in items if path == "categories"] == DICE_DOC["categories"]
+    assert [item for path, item in items if path == "count"] == [12345]
+    assert not [item for path, item in items if path == "empty"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 4096])
+def test_root_array(chunk_size):
+    doc = [{"image_id": "a.png", "v": 1}, 2, "three", [4], None, 6.5]
+    data = json.dumps(doc).encode("utf-8")
+
+    assert [item for _, item in iter_json_items(_chunks(data, chunk_size), paths=("",))] == doc
+    assert list(iter_json_items(_chunks(data, chunk_size), paths=("images",))) == []
+
+
+@pytest.mark.parametrize("document", [b'{"images": [1, 2', b'{"images": [1 2]}', b'{"a" 1}', b''])
+def test_invalid_json_raises(document):
+    with pytest.raises(ValueError):
+        list(iter_json_items(_chunks(document, 3), paths=("images",)))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 64, 100000])
+def test_written_object_matches_json_dumps(chunk_size):
+    consumed = []
+
+    def images():
+        for image in DICE_DOC["images"]:
+            consumed.append(image)
+            yield image
+
+    members = [(key, value) for key, value in DICE_DOC.items() if key not in ("images", "count")]
+    members += [
+        ("images", StreamedArray(images())),
+        ("count", lambda: len(consumed)),  # Evaluated after the images were written
+    ]
+    chunks = list(iter_json_object(members, chunk_size=chunk_size))
+    data = b"".join(chunks)
+
+    assert json.loads(data) == {**DICE_DOC, "count": 25}
+    assert list(json.loads(data)) == list(dict(members))
+    assert b"\n" not in data and b", " not in data  # Compact
+    assert all(len(chunk) >= chunk_size for chunk in chunks[:-1])
+    # Round trip through the reader
+    assert [item for _, item in iter_json_items(chunks, paths=("images",))] == DICE_DOC["images"]
+
+
+def test_written_empty_object_and_array():
+    assert b"".join(iter_json_object([])) == b"{}"
+    assert json.loads(b"".join(iter_json_object([("images", StreamedArray(iter(())))]))) == {"images": []}
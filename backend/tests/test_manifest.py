@@ -0,0 +1,260 @@
+"""
+Tests for dataset object manifests and keyset-paginated image listing.
+
+Listing pages must be identical whether they come from S3 (StartAfter +
+continuation tokens) or from the persisted manifest.
+"""
+
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.core.config import settings
+from app.core.manifest import DatasetManifest, ManifestEntry
+from app.core.storage import StorageClient
+from app.core.storage_backends import LOCAL_STORAGE_TYPE, LocalStorageBackend
+
+DATASET_ID = "ds_test"
+IMAGES_PREFIX = f"datasets/{DATASET_ID}/images/"
+
+
+class FakeS3:
+    """Minimal in-memory list_objects_v2/head/get/put/delete implementation."""
+
+    def __init__(self, keys):
+        self.objects = {
+            key: {
+                "Key": key,
+                "Size": 100 + i,
+                "ETag": f'"etag{i}"',
+                "LastModified": datetime(2025, 1, 1, tzinfo=timezone.utc),
+            }
+            for i, key in enumerate(keys)
+        }
+        self.list_calls = 0
+        self.puts = 0
+
+    def _sorted_keys(self, prefix):
+        return sorted((k for k in self.objects if k.startswith(prefix)), key=lambda k: k.encode("utf-8"))
+
+    def list_objects_v2(self, Bucket, Prefix, MaxKeys=1000, StartAfter=None, ContinuationToken=None):
+        self.list_calls += 1
+        keys = self._sorted_keys(Prefix)
+        start_after = ContinuationToken or StartAfter
+        if start_after:
+            keys = [k for k in keys if k.encode("utf-8") > start_after.encode("utf-8")]
+        page = keys[:MaxKeys]
+        response = {"Contents": [self.objects[k] for k in page], "IsTruncated": len(keys) > MaxKeys}
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def get_paginator(self, operation):
+        fake = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                token = None
+                while True:
+                    page = fake.list_objects_v2(Bucket=Bucket, Prefix=Prefix, ContinuationToken=token)
+                    yield page
+                    if not page["IsTruncated"]:
+                        break
+                    token = page["NextContinuationToken"]
+
+        return Paginator()
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body = self.objects[Key]["Body"]
+
+        class Body:
+            def read(self):
+                return body
+
+            def close(self):
+                pass
+
+        return {"Body": Body()}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        obj = self.objects[Key]
+        return {"ContentLength": obj["Size"], "LastModified": obj["LastModified"], "ETag": obj["ETag"]}
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, **kwargs):
+        if IfMatch is not None and (Key not in self.objects or self.objects[Key]["ETag"] != IfMatch):
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        self.puts += 1
+        etag = f'"put{self.puts}"'
+        self.objects[Key] = {
+            "Key": Key,
+            "Size": len(Body),
+            "ETag": etag,
+            "LastModified": datetime.now(timezone.utc),
+            "Body": Body,
+        }
+        return {"ETag": etag}
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.objects.pop(obj["Key"], None)
+        return {}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://example.com/{Params['Key']}"
+
+
+def _storage(keys):
+    client = StorageClient()
+    client._client = FakeS3(keys)
+    client._buckets_verified = True
+    return client
+
+
+def _all_pages(client, page_size, use_manifest):
+    pages, cursor = [], None
+    while True:
+        result = client.list_dataset_images_page(
+            DATASET_ID, page_size=page_size, cursor=cursor, use_manifest=use_manifest
+        )
+        pages.append([image["id"] for image in result["images"]])
+        cursor = result["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+KEYS = [IMAGES_PREFIX + name for name in (
+    "a/001.png", "a/002.png", "a/notes.txt", "b/001.jpg", "b/Ä.jpg", "b/z.jpg", "c.png",
+)]
+
+
+def test_manifest_roundtrip_and_page():
+    entries = [ManifestEntry(key, i, f"e{i}", 1700000000 + i) for i, key in enumerate(["b", "é", "a", "c"])]
+    manifest = DatasetManifest.from_bytes(DatasetManifest(DATASET_ID, entries).to_bytes())
+
+    assert [e.key for e in manifest.entries] == ["a", "b", "c", "é"]
+    assert manifest.entries[0] == entries[2]
+    assert [e.key for e in manifest.page(start_after="a", limit=2)] == ["b", "c"]
+    assert [e.key for e in manifest.page(start_after="bb")] == ["c", "é"]
+    assert manifest.page(start_after="é") == []
+
+
+def test_manifest_merge():
+    manifest = DatasetManifest(DATASET_ID, [ManifestEntry("a", 1, "x", 0), ManifestEntry("b", 1, "x", 0)])
+    merged = manifest.merge(upserts=[ManifestEntry("b", 2, "y", 1), ManifestEntry("0", 3, "z", 2)], deletes=["a"])
+
+    assert [(e.key, e.size) for e in merged.entries] == [("0", 3), ("b", 2)]
+    assert len(manifest) == 2  # Original untouched
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 3, 10])
+def test_keyset_pages_match_offset_listing(page_size):
+    client = _storage(KEYS)
+    expected = [image["id"] for image in client.list_dataset_images(DATASET_ID)["images"]]
+
+    pages = _all_pages(client, page_size, use_manifest=False)
+
+    assert [image_id for page in pages for image_id in page] == expected
+    assert all(0 < len(page) <= page_size for page in pages)
+    assert "images/a/notes.txt" not in expected
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 4])
+def test_manifest_pages_match_s3_pages(page_size):
+    client = _storage(KEYS)
+    s3_pages = _all_pages(client, page_size, use_manifest=False)
+
+    client.build_dataset_manifest(DATASET_ID)
+    client._client.list_calls = 0
+
+    assert _all_pages(client, page_size, use_manifest=True) == s3_pages
+    assert client.list_dataset_images(DATASET_ID)["total"] == 6
+    assert client._client.list_calls == 0
+
+
+def test_update_manifest_requires_existing_manifest():
+    client = _storage(KEYS)
+    assert client.update_dataset_manifest(DATASET_ID, upserts=[ManifestEntry("d.png", 1, "e", 0)]) is False
+
+    client.build_dataset_manifest(DATASET_ID)
+    assert client.update_dataset_manifest(
+        DATASET_ID, upserts=[ManifestEntry("d.png", 1, "e", 0)], deletes=["c.png"]
+    ) is True
+
+    client.invalidate_manifest_cache(DATASET_ID)
+    keys = [entry.key for entry in client.get_dataset_manifest(DATASET_ID).entries]
+    assert "d.png" in keys and "c.png" not in keys
+
+
+def _manifest_keys(client):
+    client.invalidate_manifest_cache(DATASET_ID)
+    return [entry.key for entry in client.get_dataset_manifest(DATASET_ID).entries]
+
+
+def test_concurrent_manifest_updates_keep_both_changes():
+    client = _storage(KEYS)
+    client.build_dataset_manifest(DATASET_ID)
+    # Another process sharing the same bucket
+    other_writer = StorageClient()
+    other_writer._client = client._client
+    other_writer._buckets_verified = True
+    fake_get = client._client.get_object
+    raced = []
+
+    def get_then_race(Bucket, Key):
+        # The other process merges its upload between our read and our write
+        response = fake_get(Bucket, Key)
+        if not raced:
+            raced.append(True)
+            other_writer.update_dataset_manifest(DATASET_ID, upserts=[ManifestEntry("e.png", 1, "f", 0)])
+        return response
+
+    client._client.get_object = get_then_race
+
+    assert client.update_dataset_manifest(DATASET_ID, upserts=[ManifestEntry("d.png", 1, "e", 0)]) is True
+    keys = _manifest_keys(client)
+    assert "d.png" in keys and "e.png" in keys
+
+
+def test_manifest_is_deleted_when_updates_keep_conflicting():
+    client = _storage(KEYS)
+    client.build_dataset_manifest(DATASET_ID)
+    fake_put = client._client.put_object
+
+    def always_conflict(Bucket, Key, Body, IfMatch=None, **kwargs):
+        if IfMatch is not None:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        return fake_put(Bucket, Key, Body, **kwargs)
+
+    client._client.put_object = always_conflict
+
+    assert client.update_dataset_manifest(DATASET_ID, upserts=[ManifestEntry("d.png", 1, "e", 0)]) is False
+    assert client.get_dataset_manifest(DATASET_ID) is None
+    # Listings fall back to the backend and still see every image
+    assert client.list_dataset_images(DATASET_ID)["total"] == 6
+
+
+def test_listing_and_urls_use_the_dataset_backend(tmp_path):
+    # S3 deployment default, one dataset stored on the local backend
+    client = _storage(KEYS)
+    local = LocalStorageBackend(str(tmp_path), url_secret="test-secret", now=lambda: 1_700_000_000)
+    client._backends[LOCAL_STORAGE_TYPE] = local
+    local.put_object(client.datasets_bucket, f"{IMAGES_PREFIX}local.png", b"png")
+
+    with patch.object(settings, "STORAGE_BACKEND", "s3"), patch.object(settings, "IMAGE_PROXY_ENABLED", False):
+        local_page = client.list_dataset_images_page(DATASET_ID, storage_type=LOCAL_STORAGE_TYPE)
+        s3_page = client.list_dataset_images_page(DATASET_ID, storage_type="s3")
+        url = client.generate_presigned_url(
+            client.datasets_bucket, f"{IMAGES_PREFIX}local.png", storage_type=LOCAL_STORAGE_TYPE
+        )
+
+    assert [image["id"] for image in local_page["images"]] == ["images/local.png"]
+    assert local_page["images"][0]["url"].startswith(local.url_base)
+    assert url.startswith(local.url_base)
+    assert "images/local.png" not in [image["id"] for image in s3_page["images"]]
+    assert not s3_page["images"][0]["url"].startswith(local.url_base)
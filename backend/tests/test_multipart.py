@@ -0,0 +1,98 @@
+"""
+Tests for the streaming multipart upload writer.
+"""
+
+import io
+import threading
+
+import pytest
+
+from app.core.multipart import MIN_PART_SIZE, MultipartUploadWriter
+
+
+class FakeS3:
+    """Records multipart calls and reassembles the uploaded object."""
+
+    def __init__(self, fail_part=None):
+        self.objects = {}
+        self.parts = {}
+        self.aborted = []
+        self.put_calls = 0
+        self.fail_part = fail_part
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.put_calls += 1
+        self.objects[Key] = Body
+        return {"ETag": '"single"'}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.parts["upload-1"] = {}
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.fail_part:
+            raise RuntimeError("part failed")
+        with self._lock:
+            self.parts[UploadId][PartNumber] = Body
+        return {"ETag": f'"part{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(numbers)
+        self.objects[Key] = b"".join(self.parts[UploadId][n] for n in numbers)
+        return {"ETag": '"multi"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+
+
+def test_small_object_uses_single_put():
+    s3 = FakeS3()
+    with MultipartUploadWriter(s3, "bucket", "small.json") as writer:
+        writer.write(b'{"a": ')
+        writer.write('1}')
+
+    assert s3.objects["small.json"] == b'{"a": 1}'
+    assert s3.put_calls == 1
+    assert writer.etag == '"single"'
+
+
+def test_large_object_is_uploaded_in_parts():
+    s3 = FakeS3()
+    payload = bytes(range(256)) * (MIN_PART_SIZE * 3 // 256 + 1000)
+
+    with MultipartUploadWriter(s3, "bucket", "big.bin", part_size=MIN_PART_SIZE, max_concurrency=2) as writer:
+        stream = io.BytesIO(payload)
+        while chunk := stream.read(1024 * 1024):
+            writer.write(chunk)
+
+    assert s3.objects["big.bin"] == payload
+    assert len(s3.parts["upload-1"]) == 4
+    assert all(len(s3.parts["upload-1"][n]) == MIN_PART_SIZE for n in (1, 2, 3))
+    assert s3.put_calls == 0
+    assert writer.bytes_written == len(payload)
+
+
+def test_failed_part_aborts_upload():
+    s3 = FakeS3(fail_part=2)
+
+    with pytest.raises(RuntimeError):
+        with MultipartUploadWriter(s3, "bucket", "broken.bin", part_size=MIN_PART_SIZE) as writer:
+            for _ in range(3):
+                writer.write(b"x" * MIN_PART_SIZE)
+
+    assert s3.aborted == ["upload-1"]
+    assert "broken.bin" not in s3.objects
+
+
+def test_exception_in_block_aborts_without_completing():
+    s3 = FakeS3()
+
+    with pytest.raises(ValueError):
+        with MultipartUploadWriter(s3, "bucket", "partial.bin", part_size=MIN_PART_SIZE) as writer:
+            writer.write(b"x" * (MIN_PART_SIZE + 1))
+            raise ValueError("serializer failed")
+
+    assert s3.aborted == ["upload-1"]
+    assert "partial.bin" not in s3.objects
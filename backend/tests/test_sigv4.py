@@ -0,0 +1,135 @@
+"""
+Tests for the local SigV4 presigner.
+
+The presigner must produce URLs byte-identical to boto3's
+generate_presigned_url('get_object', ...) for the same signing time.
+"""
+
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import boto3
+import pytest
+from botocore.config import Config
+
+from app.core.sigv4 import PresignedUrlCache, SigV4Presigner, signing_window
+
+TEST_KEYS = [
+    "datasets/ds_001/images/train/good/001.png",
+    "datasets/ds 002/images/a+b/ü~x(1).jpg",
+    "datasets/ds_003/thumbnails/!@#$%^&*=.jpg",
+]
+
+
+def _boto_client(endpoint_url: str, region: str, session_token=None):
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        aws_access_key_id="AKTEST",
+        aws_secret_access_key="secret/key+value",
+        aws_session_token=session_token,
+        region_name=region,
+        config=Config(signature_version="s3v4"),
+    )
+
+
+def _signing_time(url: str) -> datetime:
+    timestamp = parse_qs(urlsplit(url).query)["X-Amz-Date"][0]
+    return datetime.strptime(timestamp, "%Y%m%dT%H%M%SZ")
+
+
+@pytest.mark.parametrize(
+    "endpoint_url,region,session_token",
+    [
+        ("http://localhost:9000", "us-east-1", None),
+        ("https://account.r2.cloudflarestorage.com", "auto", None),
+        ("https://minio.internal:443", "us-east-1", "session/token+="),
+    ],
+)
+@pytest.mark.parametrize("key", TEST_KEYS)
+def test_presign_matches_boto(endpoint_url, region, session_token, key):
+    client = _boto_client(endpoint_url, region, session_token)
+    presigner = SigV4Presigner(
+        endpoint_url=endpoint_url,
+        access_key="AKTEST",
+        secret_key="secret/key+value",
+        region=region,
+        session_token=session_token,
+    )
+
+    expected = client.generate_presigned_url(
+        "get_object", Params={"Bucket": "datasets", "Key": key}, ExpiresIn=3600
+    )
+    actual = presigner.presign_get("datasets", key, expires=3600, now=_signing_time(expected))
+
+    assert actual == expected
+
+
+def test_presign_get_many_preserves_order():
+    presigner = SigV4Presigner("http://localhost:9000", "AKTEST", "secret", "us-east-1")
+    now = datetime(2025, 1, 1, 12, 0, 0)
+
+    urls = presigner.presign_get_many("datasets", TEST_KEYS, expires=600, now=now)
+
+    assert len(urls) == len(TEST_KEYS)
+    for key, url in zip(TEST_KEYS, urls):
+        assert url == presigner.presign_get("datasets", key, expires=600, now=now)
+
+
+def test_signing_key_cached_per_day():
+    presigner = SigV4Presigner("http://localhost:9000", "AKTEST", "secret", "us-east-1")
+
+    presigner.presign_get_many("datasets", TEST_KEYS, now=datetime(2025, 1, 1, 0, 0, 1))
+    presigner.presign_get_many("datasets", TEST_KEYS, now=datetime(2025, 1, 1, 23, 59, 59))
+    assert len(presigner._signing_keys) == 1
+
+    presigner.presign_get("datasets", TEST_KEYS[0], now=datetime(2025, 1, 2, 0, 0, 0))
+    assert len(presigner._signing_keys) == 2
+
+
+def test_presign_rejects_invalid_expiry():
+    presigner = SigV4Presigner("http://localhost:9000", "AKTEST", "secret", "us-east-1")
+
+    with pytest.raises(ValueError):
+        presigner.presign_get("datasets", "a.jpg", expires=8 * 24 * 3600)
+
+
+def test_signing_window_rounds_down():
+    assert signing_window(1800, datetime(2025, 1, 1, 12, 29, 59)) == datetime(2025, 1, 1, 12, 0, 0)
+    assert signing_window(1800, datetime(2025, 1, 1, 12, 30, 0)) == datetime(2025, 1, 1, 12, 30, 0)
+    assert signing_window(1800, datetime(2025, 1, 1, 12, 59, 1)) == datetime(2025, 1, 1, 12, 30, 0)
+
+
+def test_same_window_yields_same_url():
+    presigner = SigV4Presigner("http://localhost:9000", "AKTEST", "secret", "us-east-1")
+    key = TEST_KEYS[0]
+
+    first = presigner.presign_get(
+        "datasets", key, expires=5400, now=signing_window(1800, datetime(2025, 1, 1, 12, 1, 0))
+    )
+    second = presigner.presign_get(
+        "datasets", key, expires=5400, now=signing_window(1800, datetime(2025, 1, 1, 12, 29, 0))
+    )
+    next_window = presigner.presign_get(
+        "datasets", key, expires=5400, now=signing_window(1800, datetime(2025, 1, 1, 12, 31, 0))
+    )
+
+    assert first == second
+    assert first != next_window
+
+
+def test_presigned_url_cache_evicts_least_recently_used():
+    cache = PresignedUrlCache(max_size=2)
+    window = datetime(2025, 1, 1, 12, 0, 0)
+
+    cache.put(("datasets", "a.jpg", window, 5400), "url-a")
+    cache.put(("datasets", "b.jpg", window, 5400), "url-b")
+    assert cache.get(("datasets", "a.jpg", window, 5400)) == "url-a"
+
+    cache.put(("datasets", "c.jpg", window, 5400), "url-c")
+
+    assert len(cache) == 2
+    assert cache.get(("datasets", "b.jpg", window, 5400)) is None
+    assert cache.get(("datasets", "a.jpg", window, 5400)) == "url-a"
+    assert cache.hits == 2
+    assert cache.misses == 1
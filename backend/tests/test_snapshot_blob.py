@@ -0,0 +1,119 @@
+"""
+Tests for version snapshot blobs.
+
+Any image's snapshots must be readable from the single block the index
+points to, and the whole blob must stream as one gzip file.
+"""
+
+import io
+from unittest.mock import patch
+
+import pytest
+
+from app.core.snapshot_blob import (
+    SnapshotBlobBuilder,
+    SnapshotBlobIndex,
+    SnapshotRow,
+    iter_blob_rows,
+    parse_block,
+    snapshot_blob_key,
+)
+from app.core.storage import StorageClient
+from app.core.storage_backends import LocalStorageBackend, ObjectNotFoundError
+
+IMAGES = [None, "a/001.jpg", "a/002.jpg", "b/z.jpg", "b/Ä.jpg", "c.jpg"]
+
+
+def _snapshots(image_index):
+    return [
+        (image_index * 10 + i, {"class_id": f"c{i}", "geometry": {"bbox": [image_index, i, 5, 5]}})
+        for i in range(image_index + 1)
+    ]
+
+
+def _build(block_size=200):
+    blob = io.BytesIO()
+    builder = SnapshotBlobBuilder(blob, block_size=block_size)
+    for image_index, image_id in enumerate(IMAGES):
+        builder.add_image(image_id, _snapshots(image_index))
+    index = builder.finish()
+    return blob.getvalue(), index
+
+
+def _rows(image_index):
+    return [SnapshotRow(IMAGES[image_index], *snapshot) for snapshot in _snapshots(image_index)]
+
+
+def test_blocks_hold_whole_images():
+    blob, index = _build()
+
+    assert len(index.blocks) > 2
+    assert (index.image_count, index.annotation_count) == (6, 21)
+    assert index.blocks[0].offset == 0
+    assert sum(block.length for block in index.blocks) == len(blob)
+
+    for image_index, image_id in enumerate(IMAGES[1:], start=1):
+        block = index.find_block(image_id)
+        data = blob[block.offset:block.offset + block.length]
+        assert parse_block(data, image_id=image_id) == _rows(image_index)
+
+    # Images the version does not have
+    for image_id in ("0.jpg", "b/m.jpg", "d.jpg"):
+        block = index.find_block(image_id)
+        assert parse_block(blob[block.offset:block.offset + block.length], image_id=image_id) == []
+
+
+def test_whole_blob_streams_in_image_order():
+    blob, index = _build()
+
+    rows = list(iter_blob_rows(io.BytesIO(blob)))
+    assert rows == [row for image_index in range(len(IMAGES)) for row in _rows(image_index)]
+    assert SnapshotBlobIndex.from_bytes(index.to_bytes()).blocks == index.blocks
+
+
+def test_builder_rejects_unsorted_images():
+    builder = SnapshotBlobBuilder(io.BytesIO())
+    builder.add_image("b.jpg", [(1, {})])
+
+    with pytest.raises(ValueError):
+        builder.add_image("a.jpg", [(2, {})])
+    with pytest.raises(ValueError):
+        builder.add_image("b.jpg", [(3, {})])
+
+
+def test_empty_blob():
+    blob = io.BytesIO()
+    index = SnapshotBlobBuilder(blob).finish()
+
+    assert index.blocks == []
+    assert index.find_block("a.jpg") is None
+    assert list(iter_blob_rows(io.BytesIO(blob.getvalue()))) == []
+
+
+def test_storage_reads_one_block_per_image(tmp_path):
+    client = StorageClient()
+    backend = LocalStorageBackend(str(tmp_path), url_secret="test-secret")
+    blob, index = _build()
+    key = snapshot_blob_key("proj_1", "detection", "v1.0")
+
+    with patch.object(client, "get_backend", return_value=backend):
+        with pytest.raises(ObjectNotFoundError):
+            client.read_snapshot_blob_image(key, "a/001.jpg")
+
+        client.save_snapshot_blob(key, io.BytesIO(blob), index)
+        assert client.get_snapshot_blob_index(key).blocks == index.blocks
+
+        ranges = []
+        open_object = backend.open_object
+
+        def record(bucket, object_key, byte_range=None):
+            if object_key == key:
+                ranges.append(byte_range)
+            return open_object(bucket, object_key, byte_range)
+
+        with patch.object(backend, "open_object", side_effect=record):
+            assert client.read_snapshot_blob_image(key, "b/Ä.jpg") == _rows(4)
+        block = index.find_block("b/Ä.jpg")
+        assert ranges == [(block.offset, block.offset + block.length - 1)]
+
+        assert list(client.iter_snapshot_blob(key)) == list(iter_blob_rows(io.BytesIO(blob)))
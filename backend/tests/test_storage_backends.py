@@ -0,0 +1,286 @@
+"""
+Shared test suite for storage backends.
+
+Every backend must behave the same: the local filesystem backend runs against
+a temp directory, the S3 backend against moto's in-memory S3.
+"""
+
+import io
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import storage_files
+from app.core.storage_backends import (
+    LocalStorageBackend,
+    ObjectNotFoundError,
+    PreconditionFailedError,
+    S3StorageBackend,
+    UploadNotFoundError,
+    UploadVerificationError,
+)
+
+BUCKET = "datasets"
+KEYS = [
+    "datasets/ds_1/images/a/001.png",
+    "datasets/ds_1/images/a/002.png",
+    "datasets/ds_1/images/a.png",
+    "datasets/ds_1/images/b/Ä 1.jpg",
+    "datasets/ds_1/images/c.png",
+    "datasets/ds_2/images/x.png",
+]
+
+
+@pytest.fixture(params=["local", "s3"])
+def backend(request, tmp_path):
+    if request.param == "local":
+        yield LocalStorageBackend(str(tmp_path), url_secret="test-secret", now=lambda: 1_700_000_000)
+        return
+
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield S3StorageBackend(lambda: client)
+
+
+@pytest.fixture
+def populated(backend):
+    for i, key in enumerate(KEYS):
+        backend.put_object(BUCKET, key, f"content-{i}".encode(), content_type="image/png")
+    return backend
+
+
+def test_put_get_head(backend):
+    etag = backend.put_object(BUCKET, "datasets/ds_1/images/a.png", b"hello", content_type="image/png")
+
+    assert backend.get_object(BUCKET, "datasets/ds_1/images/a.png") == b"hello"
+    obj = backend.head_object(BUCKET, "datasets/ds_1/images/a.png")
+    assert obj.size == 5
+    assert obj.etag == etag
+    assert obj.last_modified.tzinfo is not None
+
+
+def test_conditional_put(backend):
+    key = "datasets/ds_1/.manifest/images.jsonl.gz"
+    with pytest.raises(PreconditionFailedError):
+        backend.put_object(BUCKET, key, b"v1", if_match="missing")
+
+    etag = backend.put_object(BUCKET, key, b"v1")
+    new_etag = backend.put_object(BUCKET, key, b"v2-longer", if_match=etag)
+
+    with pytest.raises(PreconditionFailedError):
+        backend.put_object(BUCKET, key, b"v3", if_match=etag)
+    assert backend.get_object(BUCKET, key) == b"v2-longer"
+    assert backend.head_object(BUCKET, key).etag == new_etag
+
+
+def test_put_file_object_and_overwrite(backend):
+    backend.put_object(BUCKET, "k/file.bin", b"old")
+    backend.put_object(BUCKET, "k/file.bin", io.BytesIO(b"x" * 300_000))
+
+    assert backend.get_object(BUCKET, "k/file.bin") == b"x" * 300_000
+    assert backend.head_object(BUCKET, "k/file.bin").size == 300_000
+
+
+def test_copy_object(backend):
+    backend.put_object(BUCKET, "datasets/ds_1/images/a.png", b"same bytes", content_type="image/png")
+
+    etag = backend.copy_object(BUCKET, "datasets/ds_1/images/a.png", "datasets/ds_1/images/b/a.png")
+
+    assert backend.get_object(BUCKET, "datasets/ds_1/images/b/a.png") == b"same bytes"
+    assert backend.head_object(BUCKET, "datasets/ds_1/images/b/a.png").etag == etag
+    with pytest.raises(ObjectNotFoundError):
+        backend.copy_object(BUCKET, "datasets/ds_1/images/missing.png", "datasets/ds_1/images/c.png")
+
+
+def test_open_byte_range(backend):
+    backend.put_object(BUCKET, "k/range.bin", bytes(range(100)))
+
+    f = backend.open_object(BUCKET, "k/range.bin", byte_range=(10, 19))
+    try:
+        assert f.read() == bytes(range(10, 20))
+    finally:
+        f.close()
+
+
+def test_missing_objects(backend):
+    assert backend.head_object(BUCKET, "nope/missing.png") is None
+    assert not backend.exists(BUCKET, "nope/missing.png")
+    with pytest.raises(ObjectNotFoundError):
+        backend.get_object(BUCKET, "nope/missing.png")
+
+
+def test_list_prefix_order(populated):
+    keys = [obj.key for obj in populated.list_objects(BUCKET, prefix="datasets/ds_1/images/")]
+
+    assert keys == sorted(KEYS[:5], key=lambda k: k.encode("utf-8"))
+    assert [obj.key for obj in populated.list_objects(BUCKET, prefix="datasets/ds_1/images/a")] == [
+        "datasets/ds_1/images/a.png",
+        "datasets/ds_1/images/a/001.png",
+        "datasets/ds_1/images/a/002.png",
+    ]
+    assert list(populated.list_objects(BUCKET, prefix="datasets/ds_9/")) == []
+
+
+def test_list_start_after(populated):
+    objects = populated.list_objects(
+        BUCKET, prefix="datasets/ds_1/images/", start_after="datasets/ds_1/images/a/002.png"
+    )
+
+    assert [obj.key for obj in objects] == ["datasets/ds_1/images/b/Ä 1.jpg", "datasets/ds_1/images/c.png"]
+
+
+def test_delete_objects(populated):
+    assert populated.delete_objects(BUCKET, KEYS[:3] + ["datasets/ds_1/images/missing.png"]) == 4
+
+    remaining = [obj.key for obj in populated.list_objects(BUCKET, prefix="datasets/")]
+    assert remaining == sorted(KEYS[3:], key=lambda k: k.encode("utf-8"))
+    assert populated.head_object(BUCKET, KEYS[0]) is None
+
+
+def test_presigned_urls(populated):
+    urls = populated.presign_get_many(BUCKET, KEYS[:2] + KEYS[:1], expiration=600)
+
+    assert set(urls) == set(KEYS[:2])
+    assert all(url for url in urls.values())
+
+
+def test_multipart_upload(backend):
+    key = "datasets/ds_1/images/big.png"
+    part_size = 5 * 1024 * 1024  # S3 minimum for all but the last part
+    payload = b"a" * part_size + b"b" * part_size + b"tail"
+    upload_id = backend.create_multipart_upload(BUCKET, key, "image/png")
+
+    urls = backend.presign_upload_parts(BUCKET, key, upload_id, [1, 2, 3])
+    assert sorted(urls) == [1, 2, 3] and len(set(urls.values())) == 3
+
+    etags = {}
+    for number in (3, 1, 2):  # Any order
+        start = (number - 1) * part_size
+        etags[number] = backend.upload_part(BUCKET, key, upload_id, number, payload[start:start + part_size])
+
+    listed = backend.list_parts(BUCKET, key, upload_id)
+    assert [(part.part_number, part.etag, part.size) for part in listed] == [
+        (1, etags[1], part_size), (2, etags[2], part_size), (3, etags[3], 4)
+    ]
+
+    with pytest.raises(UploadVerificationError):
+        backend.complete_multipart_upload(BUCKET, key, upload_id, [(1, etags[1]), (2, etags[1]), (3, etags[3])])
+
+    backend.complete_multipart_upload(BUCKET, key, upload_id, [(n, f'"{etags[n]}"') for n in (1, 2, 3)])
+    assert backend.get_object(BUCKET, key) == payload
+    with pytest.raises(UploadNotFoundError):
+        backend.list_parts(BUCKET, key, upload_id)
+
+
+def test_abort_multipart_upload(backend):
+    key = "datasets/ds_1/images/big.png"
+    upload_id = backend.create_multipart_upload(BUCKET, key)
+    backend.upload_part(BUCKET, key, upload_id, 1, b"part")
+
+    backend.abort_multipart_upload(BUCKET, key, upload_id)
+
+    with pytest.raises(UploadNotFoundError):
+        backend.list_parts(BUCKET, key, upload_id)
+    assert backend.head_object(BUCKET, key) is None
+
+
+def test_presign_put(backend):
+    assert backend.presign_put(BUCKET, "datasets/ds_1/images/new.png", "image/png", expiration=600)
+
+
+# =============================================================================
+# Local backend specifics
+# =============================================================================
+
+
+@pytest.mark.parametrize("key", ["../escape.png", "a/../../b.png", "/abs.png", "a//b.png", ""])
+def test_local_rejects_unsafe_keys(tmp_path, key):
+    backend = LocalStorageBackend(str(tmp_path))
+    with pytest.raises(ValueError):
+        backend.put_object(BUCKET, key, b"x")
+
+
+def test_local_window_urls_are_stable(tmp_path):
+    clock = [1_700_000_010]
+    backend = LocalStorageBackend(str(tmp_path), url_secret="s", window_seconds=1800, now=lambda: clock[0])
+
+    first = backend.presign_get_many(BUCKET, ["k.png"])["k.png"]
+    clock[0] += 60
+    assert backend.presign_get_many(BUCKET, ["k.png"])["k.png"] == first
+
+
+@pytest.fixture
+def local_client(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path), url_base="/storage", url_secret="test-secret")
+    app = FastAPI()
+    app.include_router(storage_files.router, prefix="/storage")
+    with patch.object(storage_files.storage_client, "get_backend", return_value=backend):
+        yield backend, TestClient(app)
+
+
+def test_local_endpoint_streams_file(local_client):
+    backend, client = local_client
+    payload = bytes(range(256)) * 10_000  # Larger than one mmap chunk
+    backend.put_object(BUCKET, "datasets/ds_1/images/big.png", payload)
+
+    url = backend.presign_get_many(BUCKET, ["datasets/ds_1/images/big.png"])["datasets/ds_1/images/big.png"]
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response.content == payload
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["etag"] == f'"{backend.head_object(BUCKET, "datasets/ds_1/images/big.png").etag}"'
+
+
+def test_local_endpoint_rejects_bad_signature(local_client):
+    backend, client = local_client
+    backend.put_object(BUCKET, "datasets/ds_1/images/a.png", b"x")
+    url = backend.presign_get_many(BUCKET, ["datasets/ds_1/images/a.png"])["datasets/ds_1/images/a.png"]
+
+    assert client.get(url.replace("a.png?", "b.png?")).status_code == 403
+    assert client.get(url[:-1] + ("0" if url[-1] != "0" else "1")).status_code == 403
+
+
+def test_local_endpoint_missing_file(local_client):
+    backend, client = local_client
+    url = backend.presign_get_many(BUCKET, ["datasets/ds_1/images/none.png"])["datasets/ds_1/images/none.png"]
+
+    assert client.get(url).status_code == 404
+
+
+def test_local_endpoint_put(local_client):
+    backend, client = local_client
+    key = "datasets/ds_1/images/new.png"
+    url = backend.presign_put(BUCKET, key, "image/png")
+
+    response = client.put(url, content=b"png-bytes", headers={"Content-Type": "image/png"})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{backend.head_object(BUCKET, key).etag}"'
+    assert backend.get_object(BUCKET, key) == b"png-bytes"
+
+    # A GET URL or a URL for another key does not allow writes
+    get_url = backend.presign_get_many(BUCKET, [key])[key]
+    assert client.put(get_url, content=b"x").status_code == 403
+    assert client.put(url.replace("new.png?", "other.png?"), content=b"x").status_code == 403
+
+
+def test_local_endpoint_put_parts(local_client):
+    backend, client = local_client
+    key = "datasets/ds_1/images/big.png"
+    upload_id = backend.create_multipart_upload(BUCKET, key)
+    urls = backend.presign_upload_parts(BUCKET, key, upload_id, [1, 2])
+
+    etags = [client.put(urls[n], content=data).headers["etag"] for n, data in ((1, b"first-"), (2, b"second"))]
+    # A part URL is bound to its part number
+    assert client.put(urls[1].replace("partNumber=1", "partNumber=2"), content=b"x").status_code == 403
+
+    backend.complete_multipart_upload(BUCKET, key, upload_id, list(zip((1, 2), etags)))
+    assert backend.get_object(BUCKET, key) == b"first-second"
+    assert client.put(urls[1], content=b"late").status_code == 404
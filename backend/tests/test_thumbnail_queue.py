@@ -0,0 +1,199 @@
+"""
+Tests for the thumbnail job queue: idempotent enqueue, leased claims,
+retries with backoff and batch processing by ThumbnailWorker.
+"""
+
+import io
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.storage_backends import LocalStorageBackend
+from app.db.models.labeler import ImageMetadata, ThumbnailJob
+from app.services import thumbnail_queue_service
+from app.services.thumbnail_queue_service import (
+    FAILED,
+    PENDING,
+    ThumbnailWorker,
+    claim_statement,
+    claim_thumbnail_jobs,
+    complete_thumbnail_jobs,
+    enqueue_thumbnail_jobs,
+)
+
+BUCKET = "datasets"
+DATASET_ID = "ds_1"
+
+
+def _png(size=(640, 480)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (0, 128, 255)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    ImageMetadata.__table__.create(engine)
+    ThumbnailJob.__table__.create(engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return LocalStorageBackend(str(tmp_path))
+
+
+def _add_image(db, backend, image_id, content=None):
+    s3_key = f"datasets/{DATASET_ID}/images/{image_id}"
+    backend.put_object(BUCKET, s3_key, content if content is not None else _png())
+    db.add(ImageMetadata(
+        id=image_id, dataset_id=DATASET_ID, file_name=image_id, s3_key=s3_key, size=1, thumbnail_sizes=""
+    ))
+    db.commit()
+
+
+def _worker(session_factory, backend, **kwargs):
+    worker = ThumbnailWorker(session_factory=session_factory, threads=2, **kwargs)
+    patcher = patch.object(ThumbnailWorker, "_backend", return_value=backend)
+    patcher.start()
+    return worker, patcher
+
+
+def test_enqueue_is_idempotent(db):
+    assert enqueue_thumbnail_jobs(db, DATASET_ID, ["a.png", "b.png", "a.png"]) == 2
+    job = db.query(ThumbnailJob).filter_by(image_id="a.png").one()
+    job.status, job.attempts, job.last_error = FAILED, 5, "boom"
+    db.commit()
+
+    enqueue_thumbnail_jobs(db, DATASET_ID, ["a.png"])
+
+    db.expire_all()
+    assert db.query(ThumbnailJob).count() == 2
+    job = db.query(ThumbnailJob).filter_by(image_id="a.png").one()
+    assert (job.status, job.attempts, job.last_error) == (PENDING, 0, None)
+
+
+def test_claim_uses_skip_locked():
+    now = datetime.utcnow()
+    sql = str(claim_statement(10, now, now).compile(dialect=postgresql.dialect()))
+
+    assert "FOR UPDATE SKIP LOCKED" in sql
+    assert "RETURNING" in sql
+
+
+def test_claimed_jobs_are_leased(db):
+    enqueue_thumbnail_jobs(db, DATASET_ID, [f"{i}.png" for i in range(5)])
+
+    first = claim_thumbnail_jobs(db, 3)
+    second = claim_thumbnail_jobs(db, 3)
+
+    assert len(first) == 3 and len(second) == 2
+    assert not {job.id for job in first} & {job.id for job in second}
+    assert claim_thumbnail_jobs(db, 3) == []
+    assert all(job.attempts == 1 for job in first)
+
+    # Lease expired (worker died): the job becomes due again
+    db.query(ThumbnailJob).filter_by(id=first[0].id).update({"run_after": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    again = claim_thumbnail_jobs(db, 3)
+    assert [(job.id, job.attempts) for job in again] == [(first[0].id, 2)]
+
+    # The first worker lost its lease and can no longer complete the job
+    counts = complete_thumbnail_jobs(db, [(first[0], "128", None), (again[0], "128", None)])
+    assert (counts["done"], counts["lost"]) == (1, 1)
+
+
+def test_worker_generates_batch(db, session_factory, backend):
+    for i in range(5):
+        _add_image(db, backend, f"img/{i}.png")
+    _add_image(db, backend, "broken.png", b"not an image")
+    enqueue_thumbnail_jobs(db, DATASET_ID, [f"img/{i}.png" for i in range(5)] + ["broken.png", "deleted.png"])
+
+    worker, patcher = _worker(session_factory, backend, batch_size=4)
+    try:
+        assert worker.drain() == 7
+    finally:
+        patcher.stop()
+
+    db.expire_all()
+    assert db.query(ThumbnailJob).count() == 0
+    assert db.get(ImageMetadata, "img/3.png").thumbnail_sizes == "128,512,1024"
+    assert db.get(ImageMetadata, "broken.png").thumbnail_sizes == ""  # Not decodable: no retry
+    for size in (128, 512, 1024):
+        assert backend.exists(BUCKET, f"datasets/{DATASET_ID}/thumbnails/{size}/img/3.webp")
+
+
+def test_failed_jobs_are_retried_with_backoff(db, session_factory, backend):
+    _add_image(db, backend, "a.png")
+    enqueue_thumbnail_jobs(db, DATASET_ID, ["a.png"])
+    worker, patcher = _worker(session_factory, backend)
+    settings = thumbnail_queue_service.settings
+    try:
+        with patch.object(backend, "get_object", side_effect=OSError("storage down")), \
+                patch.object(settings, "THUMBNAIL_JOB_MAX_ATTEMPTS", 2):
+            assert worker.run_once() == 1
+            db.expire_all()
+            job = db.query(ThumbnailJob).one()
+            assert (job.status, job.attempts) == (PENDING, 1)
+            assert job.last_error == "OSError: storage down"
+            assert job.run_after > datetime.utcnow() + timedelta(seconds=settings.THUMBNAIL_JOB_RETRY_SECONDS - 5)
+            assert worker.run_once() == 0  # Backing off
+
+            job.run_after = datetime.utcnow()
+            db.commit()
+            assert worker.run_once() == 1
+            db.expire_all()
+            job = db.query(ThumbnailJob).one()
+            assert (job.status, job.attempts) == (FAILED, 2)
+
+        # Failed jobs stay until re-enqueued, then succeed
+        assert worker.run_once() == 0
+        enqueue_thumbnail_jobs(db, DATASET_ID, ["a.png"])
+        assert worker.run_once() == 1
+    finally:
+        patcher.stop()
+
+    db.expire_all()
+    assert db.query(ThumbnailJob).count() == 0
+    assert db.get(ImageMetadata, "a.png").thumbnail_sizes == "128,512,1024"
+
+
+def test_reenqueued_job_runs_again(db, session_factory, backend):
+    _add_image(db, backend, "a.png")
+    enqueue_thumbnail_jobs(db, DATASET_ID, ["a.png"])
+    jobs = claim_thumbnail_jobs(db, 10)
+
+    # Re-uploaded while the worker was busy: the old outcome must not drop the new job
+    enqueue_thumbnail_jobs(db, DATASET_ID, ["a.png"])
+    counts = complete_thumbnail_jobs(db, [(jobs[0], "128,512,1024", None)])
+
+    assert counts["lost"] == 1
+    assert db.query(ThumbnailJob).one().attempts == 0
+
+
+def test_legacy_dataset_uses_configured_backend(session_factory):
+    worker = ThumbnailWorker(session_factory=session_factory, threads=1)
+    db = MagicMock()
+    db.query.return_value.filter.return_value.scalar.return_value = None  # Dataset.storage_type is NULL
+
+    with patch.object(thumbnail_queue_service.storage_client, "get_backend") as get_backend:
+        worker._backend(db, DATASET_ID)
+        worker._backend(db, DATASET_ID)
+
+    # None = settings.STORAGE_BACKEND, looked up once per dataset
+    assert [c.args for c in get_backend.call_args_list] == [(None,), (None,)]
+    assert db.query.call_count == 1
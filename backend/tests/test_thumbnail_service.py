@@ -0,0 +1,98 @@
+"""
+Tests for the thumbnail pyramid (single reduced decode, multiple WebP levels)
+and thumbnail key selection for image listings.
+"""
+
+import io
+from unittest.mock import patch
+
+import pytest
+from PIL import Image, ImageFile
+
+from app.services.thumbnail_service import (
+    create_thumbnail_pyramid,
+    get_image_thumbnail_key,
+    get_thumbnail_path,
+    select_thumbnail_size,
+)
+
+
+def _image(fmt="JPEG", size=(4000, 3000), mode="RGB", color=(200, 30, 30), **save_args) -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, size, color).save(buffer, fmt, **save_args)
+    return buffer.getvalue()
+
+
+def _open(data):
+    img = Image.open(io.BytesIO(data))
+    return img.format, img.size
+
+
+def test_pyramid_levels():
+    pyramid = create_thumbnail_pyramid(_image(size=(4000, 3000)))
+
+    assert {size: _open(data) for size, data in pyramid.items()} == {
+        128: ("WEBP", (128, 96)),
+        512: ("WEBP", (512, 384)),
+        1024: ("WEBP", (1024, 768)),
+    }
+
+
+def test_jpeg_is_decoded_once_at_reduced_scale():
+    decoded = []
+    original_load = ImageFile.ImageFile.load
+
+    def load(img):
+        if img.tile:  # Not decoded yet
+            decoded.append(img.size)
+        return original_load(img)
+
+    with patch.object(ImageFile.ImageFile, "load", load):
+        create_thumbnail_pyramid(_image(size=(4000, 3000)))
+
+    # One DCT-scaled decode (1/2) that still covers the 1024 level
+    assert decoded == [(2000, 1500)]
+
+
+def test_small_images_are_not_upscaled():
+    pyramid = create_thumbnail_pyramid(_image("PNG", size=(300, 200)))
+
+    assert _open(pyramid[128])[1] == (128, 85)
+    assert _open(pyramid[512])[1] == (300, 200)
+    assert pyramid[1024] is pyramid[512]  # Encoded once
+
+
+def test_exif_orientation_and_transparency():
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    rotated = create_thumbnail_pyramid(_image(size=(800, 400), exif=exif))
+    assert _open(rotated[512])[1] == (256, 512)
+
+    transparent = create_thumbnail_pyramid(_image("PNG", size=(64, 64), mode="RGBA", color=(0, 0, 0, 0)))
+    assert Image.open(io.BytesIO(transparent[128])).convert("RGB").getpixel((5, 5)) == (255, 255, 255)
+
+
+def test_unreadable_image():
+    assert create_thumbnail_pyramid(b"not an image") is None
+
+
+def test_thumbnail_paths():
+    key = "datasets/ds_1/images/train/images/001.png"
+
+    assert get_thumbnail_path(key, 512) == "datasets/ds_1/thumbnails/512/train/images/001.webp"
+    assert get_thumbnail_path("datasets/ds_1/images/a.b/noext", 128) == "datasets/ds_1/thumbnails/128/a.b/noext.webp"
+    assert get_thumbnail_path("datasets/ds_1/images/001.png") == "datasets/ds_1/thumbnails/001.jpg"  # Legacy
+
+
+@pytest.mark.parametrize("requested, expected", [(None, 512), (100, 128), (128, 128), (300, 512), (2000, 1024)])
+def test_select_thumbnail_size(requested, expected):
+    assert select_thumbnail_size(requested) == expected
+
+
+def test_image_thumbnail_key():
+    key = "datasets/ds_1/images/a.png"
+
+    assert get_image_thumbnail_key(key, "128,512,1024", 100) == "datasets/ds_1/thumbnails/128/a.webp"
+    assert get_image_thumbnail_key(key, "128", 1000) == "datasets/ds_1/thumbnails/128/a.webp"
+    assert get_image_thumbnail_key(key, None) == "datasets/ds_1/thumbnails/a.jpg"
+    assert get_image_thumbnail_key(key, "") is None
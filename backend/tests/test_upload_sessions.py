@@ -0,0 +1,225 @@
+"""
+Tests for direct-to-storage upload sessions: presigned targets, resumable
+multipart uploads, completion verification and bulk registration.
+"""
+
+import io
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.storage import storage_client
+from app.core.storage_backends import LocalStorageBackend
+from app.db.models.labeler import ImageMetadata, ThumbnailJob, UploadSession, UploadSessionFile
+from app.services import upload_session_service
+from app.services.upload_session_service import (
+    FILE_COMPLETED,
+    FILE_PENDING,
+    SESSION_ABORTED,
+    SESSION_COMPLETED,
+    CompletedUpload,
+    UploadFileSpec,
+    abort_upload_session,
+    add_upload_session_files,
+    complete_upload_session_files,
+    create_upload_session,
+    get_upload_targets,
+    list_pending_files,
+    normalize_upload_path,
+)
+
+BUCKET = storage_client.datasets_bucket
+DATASET_ID = "ds_1"
+MB = 1024 * 1024
+
+
+def _png(size=(64, 48)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (0, 128, 255)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (ImageMetadata, ThumbnailJob, UploadSession, UploadSessionFile):
+        model.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return LocalStorageBackend(str(tmp_path), url_secret="test-secret")
+
+
+@pytest.fixture(autouse=True)
+def small_parts():
+    settings = upload_session_service.settings
+    with patch.object(settings, "UPLOAD_MULTIPART_THRESHOLD_MB", 1), \
+            patch.object(settings, "UPLOAD_PART_SIZE_MB", 1), \
+            patch.object(storage_client, "update_dataset_manifest") as manifest:
+        yield manifest
+
+
+def _put(backend, target, data):
+    """Upload like the browser would; returns the completion report."""
+    key = f"datasets/{DATASET_ID}/images/{target['path']}"
+    if target["method"] == "put":
+        etag = backend.put_object(BUCKET, key, data, target["headers"].get("Content-Type"))
+        return CompletedUpload(target["path"], f'"{etag}"')
+    size = target["part_size"]
+    parts = {part["part_number"]: part["etag"] for part in target["uploaded_parts"]}
+    for part in target["parts"]:
+        n = part["part_number"]
+        parts[n] = backend.upload_part(BUCKET, key, target["upload_id"], n, data[(n - 1) * size:n * size])
+    return CompletedUpload(target["path"], parts=sorted(parts.items()))
+
+
+@pytest.mark.parametrize("path", ["../x.png", "/abs.png", "a//b.png", "a/./b.png", "notes.txt", ""])
+def test_rejects_invalid_paths(path):
+    with pytest.raises(ValueError):
+        normalize_upload_path(path)
+
+
+def test_normalizes_paths():
+    assert normalize_upload_path("./train\\cat\\1.JPG") == "train/cat/1.JPG"
+
+
+def test_single_put_upload(db, backend, small_parts):
+    images = {"train/a.png": _png((64, 48)), "train/b.png": _png((10, 20)), "c.png": _png()}
+    session = create_upload_session(
+        db, DATASET_ID, "user-1", [UploadFileSpec(path, len(data)) for path, data in images.items()]
+    )
+    assert (session.total_files, session.total_bytes) == (3, sum(map(len, images.values())))
+
+    targets, next_after = get_upload_targets(db, session, backend)
+    assert next_after is None
+    assert [t["path"] for t in targets] == ["c.png", "train/a.png", "train/b.png"]
+    assert all(t["method"] == "put" and t["headers"] == {"Content-Type": "image/png"} for t in targets)
+
+    completions = [_put(backend, target, images[target["path"]]) for target in targets]
+    result = complete_upload_session_files(db, session, backend, completions)
+
+    assert sorted(result.completed) == sorted(images)
+    assert (result.new_images, result.failed) == (3, {})
+    assert result.folder_structure == {"train": 2}
+    assert session.status == SESSION_COMPLETED
+    image = db.get(ImageMetadata, "train/b.png")
+    assert (image.width, image.height, image.thumbnail_sizes) == (10, 20, "")
+    assert image.s3_key == f"datasets/{DATASET_ID}/images/train/b.png"
+    assert db.query(ThumbnailJob).count() == 3
+    assert [e.key for e in small_parts.call_args.kwargs["upserts"]] == result.completed
+
+    # Completing again is harmless
+    again = complete_upload_session_files(db, session, backend, completions[:1])
+    assert (again.completed, again.already_completed, again.new_images) == ([], 1, 0)
+
+
+def test_verification_failures_stay_pending(db, backend):
+    data = _png()
+    session = create_upload_session(db, DATASET_ID, "user-1", [
+        UploadFileSpec("ok.png", len(data)),
+        UploadFileSpec("short.png", len(data) + 1),
+        UploadFileSpec("missing.png", len(data)),
+        UploadFileSpec("tampered.png", len(data)),
+    ])
+    completions = [_put(backend, t, data) for t in get_upload_targets(db, session, backend)[0]
+                   if t["path"] != "missing.png"]
+    completions += [
+        CompletedUpload("missing.png", "abc"),
+        CompletedUpload("other.png", "abc"),
+    ]
+    completions = [c._replace(etag="0" * 32) if c.path == "tampered.png" else c for c in completions]
+
+    result = complete_upload_session_files(db, session, backend, completions)
+
+    assert result.completed == ["ok.png"]
+    assert set(result.failed) == {"short.png", "missing.png", "tampered.png", "other.png"}
+    assert "size mismatch" in result.failed["short.png"]
+    assert "ETag" in result.failed["tampered.png"]
+    assert list_pending_files(db, session) == ["missing.png", "short.png", "tampered.png"]
+    assert (session.completed_files, session.total_files) == (1, 4)
+    assert db.query(ImageMetadata).count() == 1
+
+
+def test_multipart_upload_resumes(db, backend):
+    data = _png() + bytes(range(256)) * 10_000  # ~2.5 MB: 3 parts of 1 MB
+    session = create_upload_session(db, DATASET_ID, "user-1", [UploadFileSpec("big.png", len(data))])
+
+    target = get_upload_targets(db, session, backend)[0][0]
+    assert target["method"] == "multipart"
+    assert [p["part_number"] for p in target["parts"]] == [1, 2, 3]
+
+    # Interrupted after the first part
+    key = f"datasets/{DATASET_ID}/images/big.png"
+    backend.upload_part(BUCKET, key, target["upload_id"], 1, data[:MB])
+
+    resumed = get_upload_targets(db, session, backend, paths=["big.png"])[0][0]
+    assert resumed["upload_id"] == target["upload_id"]
+    assert [p["part_number"] for p in resumed["parts"]] == [2, 3]
+    assert [p["part_number"] for p in resumed["uploaded_parts"]] == [1]
+
+    completion = _put(backend, resumed, data)
+    missing_part = complete_upload_session_files(db, session, backend, [completion._replace(parts=completion.parts[:2])])
+    assert "big.png" in missing_part.failed
+
+    result = complete_upload_session_files(db, session, backend, [completion])
+    assert result.completed == ["big.png"]
+    assert backend.get_object(BUCKET, key) == data
+    assert db.get(ImageMetadata, "big.png").width == 64
+
+
+def test_expired_multipart_upload_restarts(db, backend):
+    session = create_upload_session(db, DATASET_ID, "user-1", [UploadFileSpec("big.png", 2 * MB)])
+    target = get_upload_targets(db, session, backend)[0][0]
+    backend.abort_multipart_upload(BUCKET, f"datasets/{DATASET_ID}/images/big.png", target["upload_id"])
+
+    restarted = get_upload_targets(db, session, backend)[0][0]
+
+    assert restarted["upload_id"] != target["upload_id"]
+    assert len(restarted["parts"]) == 2
+
+
+def test_add_files_keeps_completed(db, backend):
+    data = _png()
+    session = create_upload_session(db, DATASET_ID, "user-1", [UploadFileSpec("a.png", len(data))])
+    complete_upload_session_files(db, session, backend, [_put(backend, get_upload_targets(db, session, backend)[0][0], data)])
+    assert session.status == SESSION_COMPLETED
+
+    # A resuming browser re-sends its whole list
+    add_upload_session_files(db, session, [UploadFileSpec("a.png", 1), UploadFileSpec("b.png", 5)])
+
+    assert db.query(UploadSessionFile).filter_by(image_id="a.png").one().status == FILE_COMPLETED
+    assert db.query(UploadSessionFile).filter_by(image_id="b.png").one().status == FILE_PENDING
+    assert (session.total_files, session.completed_files) == (2, 1)
+    with pytest.raises(ValueError):
+        add_upload_session_files(db, session, [UploadFileSpec("c.png", 1), UploadFileSpec("../d.png", 1)])
+    assert session.total_files == 2
+
+
+def test_target_pagination(db, backend):
+    session = create_upload_session(db, DATASET_ID, "user-1", [UploadFileSpec(f"{i}.png", 10) for i in range(5)])
+
+    first, cursor = get_upload_targets(db, session, backend, limit=2)
+    second, cursor = get_upload_targets(db, session, backend, after=cursor, limit=2)
+    third, cursor = get_upload_targets(db, session, backend, after=cursor, limit=2)
+
+    assert [t["path"] for t in first + second + third] == [f"{i}.png" for i in range(5)]
+    assert cursor is None
+
+
+def test_abort_discards_multipart_uploads(db, backend):
+    session = create_upload_session(db, DATASET_ID, "user-1", [UploadFileSpec("big.png", 2 * MB)])
+    target = get_upload_targets(db, session, backend)[0][0]
+
+    assert abort_upload_session(db, session, backend) == 1
+
+    assert session.status == SESSION_ABORTED
+    with pytest.raises(Exception):
+        backend.list_parts(BUCKET, f"datasets/{DATASET_ID}/images/big.png", target["upload_id"])
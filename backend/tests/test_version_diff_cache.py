@@ -0,0 +1,224 @@
+"""
+Tests for the version diff cache.
+
+A cached diff must always equal a diff computed from scratch, while reading
+published versions only once and re-reading only the touched images of the
+Working version.
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+from app.db.models.labeler import Annotation, AnnotationVersion, VersionDiff, VersionDiffImage
+from app.services.version_diff_cache_service import delete_project_diffs
+from app.services.version_diff_service import VersionDiffService
+
+PROJECT_ID = "proj_1"
+TASK_TYPE = "detection"
+
+
+def _snapshot(annotation_id, image_id, x, class_name="cat"):
+    return {
+        'annotation_id': annotation_id,
+        'image_id': image_id,
+        'annotation_type': 'bbox',
+        'geometry': {'x': x, 'y': 10, 'width': 20, 'height': 20},
+        'class_id': class_name,
+        'class_name': class_name,
+        'attributes': {},
+        'confidence': None,
+    }
+
+
+# Published annotations per version number (read through the snapshot blob path)
+PUBLISHED = {
+    "v1.0": [_snapshot(1, "a.jpg", 0), _snapshot(2, "a.jpg", 100), _snapshot(3, "b.jpg", 0),
+             _snapshot(4, "c.jpg", 0), _snapshot(5, "d.jpg", 0)],
+    "v2.0": [_snapshot(1, "a.jpg", 0), _snapshot(2, "a.jpg", 103), _snapshot(3, "b.jpg", 0, "dog"),
+             _snapshot(4, "c.jpg", 0), _snapshot(6, "e.jpg", 0)],
+}
+
+
+@pytest.fixture
+def db(sqlite_db):
+    session = sqlite_db
+
+    for version_id, version_number in ((1, "v1.0"), (2, "v2.0")):
+        session.add(AnnotationVersion(
+            id=version_id, project_id=PROJECT_ID, task_type=TASK_TYPE, version_number=version_number,
+            version_type="published", created_at=datetime(2026, 1, version_id), created_by="u1",
+            snapshot_path=f"snapshots/{PROJECT_ID}/{TASK_TYPE}/{version_number}/annotations.jsonl.gz",
+        ))
+    # Working: v2.0 as published
+    for snapshot in PUBLISHED["v2.0"]:
+        session.add(Annotation(
+            id=snapshot['annotation_id'], project_id=PROJECT_ID, image_id=snapshot['image_id'],
+            annotation_type='bbox', task_type=TASK_TYPE, geometry=snapshot['geometry'],
+            class_id=snapshot['class_id'], class_name=snapshot['class_name'], attributes={},
+            created_by="u1", updated_at=datetime(2026, 1, 2),
+        ))
+    session.commit()
+    return session
+
+
+@pytest.fixture
+def published_reads():
+    """Image IDs (None = whole version) of every published version read."""
+    reads = []
+
+    def read(version, image_id=None):
+        reads.append((version.version_number, image_id))
+        grouped = {}
+        for snapshot in PUBLISHED[version.version_number]:
+            if image_id is None or snapshot['image_id'] == image_id:
+                grouped.setdefault(snapshot['image_id'], []).append(dict(snapshot))
+        return grouped
+
+    with patch.object(VersionDiffService, 'get_version_annotations_from_snapshot_blob', side_effect=read):
+        yield reads
+
+
+def _uncached_diff(db, version_a_id, version_b_id):
+    """Diff computed from scratch, as the endpoint did before caching."""
+    version_a, version_b = VersionDiffService.resolve_versions(db, version_a_id, version_b_id)
+    snapshots_a = VersionDiffService.get_version_annotations(db, version_a)
+    snapshots_b = VersionDiffService.get_version_annotations(db, version_b)
+    image_diffs = {}
+    for image_id in sorted(set(snapshots_a) | set(snapshots_b)):
+        diff = VersionDiffService.calculate_diff_for_image(
+            snapshots_a.get(image_id, []), snapshots_b.get(image_id, [])
+        )
+        if diff['summary']['total_changes'] > 0:
+            image_diffs[image_id] = diff
+    return {
+        'image_diffs': image_diffs,
+        'summary': VersionDiffService.summarize_image_diffs(
+            image_diffs, total_images=len(set(snapshots_a) | set(snapshots_b))
+        ),
+        'class_stats': VersionDiffService._calculate_class_stats(image_diffs),
+    }
+
+
+def _assert_same_diff(result, expected):
+    assert result['image_diffs'] == expected['image_diffs']
+    assert result['summary'] == expected['summary']
+    assert result['class_stats'] == expected['class_stats']
+
+
+def test_published_diff_is_computed_once_and_paged(db, published_reads):
+    expected = _uncached_diff(db, 2, 1)
+    published_reads.clear()
+
+    result = VersionDiffService.calculate_version_diff(db, 2, 1)
+
+    # Older version first, whatever the argument order
+    assert (result['version_a']['id'], result['version_b']['id']) == (1, 2)
+    _assert_same_diff(result, expected)
+    assert list(result['image_diffs']) == ["a.jpg", "b.jpg", "d.jpg", "e.jpg"]
+    assert result['summary']['total_images'] == 5
+    assert result['page'] == {'offset': 0, 'limit': None, 'total': 4, 'next_offset': None}
+    assert published_reads == [("v1.0", None), ("v2.0", None)]
+
+    first = VersionDiffService.calculate_version_diff(db, 1, 2, limit=3)
+    second = VersionDiffService.calculate_version_diff(db, 1, 2, offset=3, limit=3)
+    assert published_reads == [("v1.0", None), ("v2.0", None)]
+    assert first['page'] == {'offset': 0, 'limit': 3, 'total': 4, 'next_offset': 3}
+    assert second['page'] == {'offset': 3, 'limit': 3, 'total': 4, 'next_offset': None}
+    assert {**first['image_diffs'], **second['image_diffs']} == expected['image_diffs']
+    assert first['summary'] == second['summary'] == expected['summary']
+
+    summary_only = VersionDiffService.calculate_version_diff(db, 1, 2, limit=0)
+    assert summary_only['image_diffs'] == {} and summary_only['summary'] == expected['summary']
+
+
+def test_working_diff_rediffs_only_touched_images(db, published_reads):
+    VersionDiffService.calculate_version_diff(db, 2, -1)
+    assert db.query(VersionDiff).one().summary['total_changes'] == 0
+
+    # Unchanged Working version: served without reading any annotations
+    published_reads.clear()
+    with patch.object(VersionDiffService, 'get_annotations_from_db', wraps=VersionDiffService.get_annotations_from_db) as db_reads:
+        result = VersionDiffService.calculate_version_diff(db, 2, -1)
+    assert result['image_diffs'] == {} and published_reads == [] and not db_reads.called
+
+    # Edit a.jpg, empty c.jpg, annotate the new f.jpg
+    edited = db.get(Annotation, 2)
+    edited.geometry = {'x': 150, 'y': 10, 'width': 20, 'height': 20}
+    edited.updated_at = datetime(2026, 1, 2) + timedelta(hours=1)
+    edited.version = 2
+    db.delete(db.get(Annotation, 4))
+    db.add(Annotation(
+        id=7, project_id=PROJECT_ID, image_id="f.jpg", annotation_type='bbox', task_type=TASK_TYPE,
+        geometry={'x': 0, 'y': 0, 'width': 5, 'height': 5}, class_id="bird", class_name="bird",
+        attributes={}, created_by="u1",
+    ))
+    db.commit()
+
+    with patch.object(VersionDiffService, 'get_annotations_from_db', wraps=VersionDiffService.get_annotations_from_db) as db_reads:
+        result = VersionDiffService.calculate_version_diff(db, 2, -1)
+
+    touched = ["a.jpg", "c.jpg", "f.jpg"]
+    assert [call.kwargs['image_ids'] for call in db_reads.call_args_list] == [touched]
+    # Published side: one ranged blob read per touched image, never the whole version
+    assert published_reads == [("v2.0", image_id) for image_id in touched]
+
+    _assert_same_diff(result, _uncached_diff(db, 2, -1))
+    assert set(result['image_diffs']) == {"a.jpg", "c.jpg", "f.jpg"}
+    assert result['class_stats'] == {
+        'cat': {'added': 0, 'removed': 1, 'modified': 1},
+        'bird': {'added': 1, 'removed': 0, 'modified': 0},
+    }
+
+    # Reverting the edit brings the header back
+    edited.geometry = {'x': 103, 'y': 10, 'width': 20, 'height': 20}
+    edited.version = 3
+    db.commit()
+    result = VersionDiffService.calculate_version_diff(db, -1, 2)
+    _assert_same_diff(result, _uncached_diff(db, 2, -1))
+    assert 'a.jpg' not in result['image_diffs'] and 'cat' in result['class_stats']
+
+
+def test_single_image_diff(db, published_reads):
+    # Not cached yet: computed directly for that image, nothing stored
+    result = VersionDiffService.calculate_version_diff(db, 1, 2, image_id="b.jpg")
+    assert list(result['image_diffs']) == ["b.jpg"]
+    assert result['summary']['total_images'] == 1 and result['summary']['total_modified'] == 1
+    assert 'page' not in result
+    assert published_reads == [("v1.0", "b.jpg"), ("v2.0", "b.jpg")]
+    assert db.query(VersionDiff).count() == 0
+
+    full = VersionDiffService.calculate_version_diff(db, 1, 2)
+    published_reads.clear()
+    cached = VersionDiffService.calculate_version_diff(db, 1, 2, image_id="b.jpg")
+    assert cached['image_diffs'] == {"b.jpg": full['image_diffs']["b.jpg"]}
+    assert cached['summary'] == result['summary']
+    assert VersionDiffService.calculate_version_diff(db, 1, 2, image_id="c.jpg")['image_diffs'] == {}
+    assert published_reads == []
+
+
+def test_stale_format_is_recomputed_and_projects_clean_up(db, published_reads):
+    VersionDiffService.calculate_version_diff(db, 1, 2)
+    VersionDiffService.calculate_version_diff(db, 1, -1)
+    db.query(VersionDiff).update({VersionDiff.format_version: 0})
+    db.commit()
+    published_reads.clear()
+
+    result = VersionDiffService.calculate_version_diff(db, 1, 2)
+
+    assert published_reads == [("v1.0", None), ("v2.0", None)]
+    _assert_same_diff(result, _uncached_diff(db, 1, 2))
+    # a.jpg to e.jpg in both diffs (Working = v2.0)
+    assert db.query(VersionDiffImage).count() == 10
+
+    assert delete_project_diffs(db, [PROJECT_ID]) == 2
+    db.commit()
+    assert db.query(VersionDiff).count() == 0 and db.query(VersionDiffImage).count() == 0
+
+
+def test_missing_version_is_rejected(db):
+    with pytest.raises(ValueError, match="Version not found"):
+        VersionDiffService.calculate_version_diff(db, 1, 99)
+    with pytest.raises(ValueError, match="published version"):
+        VersionDiffService.calculate_version_diff(db, -1, -1)
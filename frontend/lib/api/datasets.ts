@@ -150,11 +150,14 @@ export interface DeleteDatasetResponse {
     image_statuses: number;
     annotation_versions: number;
     annotation_snapshots: number;
+    version_diffs: number;
+    export_artifacts: number;
     projects: number;
   };
   s3_deletions: {
     dataset_files: number;
     export_files: number;
+    snapshot_files: number;
   };
   impact: DeletionImpact;
 }
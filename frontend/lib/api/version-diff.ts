@@ -56,6 +56,7 @@ export interface AnnotationChanges {
   geometry_changed?: boolean;
   position_changed?: boolean;
   size_changed?: boolean;
+  shape_changed?: boolean;
   old_geometry?: any;
   new_geometry?: any;
   confidence_changed?: boolean;
@@ -94,6 +95,14 @@ export interface VersionDiffResponse {
   image_diffs: Record<string, ImageDiff>;  // image_id -> diff data
   summary: VersionDiffSummary;
   class_stats: Record<string, ClassStats>;  // class_name -> stats
+  page?: VersionDiffPage;  // which changed images image_diffs holds
+}
+
+export interface VersionDiffPage {
+  offset: number;
+  limit: number | null;
+  total: number;  // images with changes
+  next_offset: number | null;
 }
 
 export interface VersionDiffSummaryResponse {
@@ -115,17 +124,27 @@ export interface VersionDiffSummaryResponse {
  * @param versionAId - Old version ID
  * @param versionBId - New version ID
  * @param imageId - Optional: compare only specific image
+ * @param offset - Optional: skip this many changed images
+ * @param limit - Optional: return at most this many changed images
  * @returns Complete diff data with per-image changes and summary statistics
  */
 export async function compareVersions(
   versionAId: number,
   versionBId: number,
-  imageId?: string
+  imageId?: string,
+  offset?: number,
+  limit?: number
 ): Promise<VersionDiffResponse> {
   const params = new URLSearchParams();
   if (imageId) {
     params.set('image_id', imageId);
   }
+  if (offset) {
+    params.set('offset', String(offset));
+  }
+  if (limit) {
+    params.set('limit', String(limit));
+  }
 
   const queryString = params.toString();
   const url = `/api/v1/version-diff/versions/${versionAId}/compare/${versionBId}${